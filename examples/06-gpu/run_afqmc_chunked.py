@@ -54,22 +54,15 @@ srank = rank % nmembers
 from ipie.utils.mpi import MPIHandler, make_splits_displacements
 handler = MPIHandler(nmembers=nmembers)
 
-from ipie.utils.pack_numba import pack_cholesky
-
 num_basis = hcore.shape[-1]
+# split_cholesky writes the packed vectors of each member alongside.
 with h5py.File(f"chol_{srank}.h5") as fa:
     chol_chunk = fa["chol"][()]
+    chol_packed_chunk = fa["chol_packed"][()]
 
 chunked_chols = chol_chunk.shape[-1]
 num_chol = handler.scomm.allreduce(chunked_chols, op=MPI.SUM)
 
-chol_chunk_view = chol_chunk.reshape((num_basis, num_basis, -1))
-cp_shape = (num_basis * (num_basis + 1) // 2, chol_chunk_view.shape[-1])
-chol_packed_chunk = numpy.zeros(cp_shape, dtype=chol_chunk_view.dtype)
-sym_idx = numpy.triu_indices(num_basis)
-pack_cholesky(sym_idx[0], sym_idx[1], chol_packed_chunk, chol_chunk_view)
-del chol_chunk_view
-
 split_size = make_splits_displacements(num_chol, nmembers)[0]
 assert chunked_chols == split_size[srank]
 
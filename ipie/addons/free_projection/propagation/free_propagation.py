@@ -10,7 +10,7 @@ from ipie.propagation.phaseless_base import (
 )
 from ipie.propagation.phaseless_generic import PhaselessGeneric
 from ipie.utils.backend import arraylib as xp
-from ipie.utils.backend import synchronize
+from ipie.utils.profiler import profiler
 
 
 class FreePropagation(PhaselessGeneric):
@@ -66,11 +66,8 @@ class FreePropagation(PhaselessGeneric):
         return cmf, ceshift
 
     def propagate_walkers(self, walkers, hamiltonian, trial, eshift):
-        synchronize()
-        start_time = time.time()
-        ovlp = trial.calc_greens_function(walkers)
-        synchronize()
-        self.timer.tgf += time.time() - start_time
+        with profiler.region("greens_function"):
+            ovlp = trial.calc_greens_function(walkers)
 
         # 2. Update Slater matrix
         # 2.a Apply one-body
@@ -82,15 +79,11 @@ class FreePropagation(PhaselessGeneric):
         # 2.c Apply one-body
         self.propagate_walkers_one_body(walkers)
 
-        start_time = time.time()
-        ovlp_new = trial.calc_overlap(walkers)
-        synchronize()
-        self.timer.tovlp += time.time() - start_time
+        with profiler.region("overlap"):
+            ovlp_new = trial.calc_overlap(walkers)
 
-        start_time = time.time()
-        self.update_weight(walkers, ovlp, ovlp_new, ceshift, cmf, eshift)
-        synchronize()
-        self.timer.tupdate += time.time() - start_time
+        with profiler.region("update_weight"):
+            self.update_weight(walkers, ovlp, ovlp_new, ceshift, cmf, eshift)
 
     def update_weight(self, walkers, ovlp, ovlp_new, cfb, cmf, eshift):
         # weights in fp keep track of the walker normalization
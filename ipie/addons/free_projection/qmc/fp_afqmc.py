@@ -31,7 +31,9 @@ from ipie.qmc.afqmc import AFQMC
 from ipie.trial_wavefunction.utils import get_trial_wavefunction
 from ipie.utils.backend import synchronize
 from ipie.utils.io import to_json
+from ipie.utils.memory_planner import memory_plan_options
 from ipie.utils.mpi import MPIHandler
+from ipie.utils.profiler import profiler
 from ipie.walkers.base_walkers import WalkerAccumulator
 from ipie.walkers.walkers_dispatch import get_initial_walker
 
@@ -149,6 +151,7 @@ class FPAFQMC(AFQMC):
             mpi_handler,
             params,
             verbose=(verbose and comm.rank == 0),
+            memory_plan=driver.memory_plan,
         )
 
     @staticmethod
@@ -286,11 +289,25 @@ class FPAFQMC(AFQMC):
         additional_estimators : dict
             Dictionary of additional estimators to evaluate.
         """
+        with memory_plan_options(self.memory_plan):
+            self._run(
+                walkers=walkers,
+                estimator_filename=estimator_filename,
+                verbose=verbose,
+                additional_estimators=additional_estimators,
+            )
+
+    def _run(
+        self,
+        walkers=None,
+        estimator_filename="estimate.h5",
+        verbose=True,
+        additional_estimators: Optional[Dict[str, EstimatorBase]] = None,
+    ):
         self.setup_timers()
         tzero_setup = time.time()
         if walkers is not None:
             self.walkers = walkers
-        self.setup_timers()
         eshift = 0.0
         self.walkers.orthogonalise()
 
@@ -303,7 +320,7 @@ class FPAFQMC(AFQMC):
 
         synchronize()
         comm = self.mpi_handler.comm
-        self.tsetup += time.time() - tzero_setup
+        profiler.add("setup", time.time() - tzero_setup)
 
         for iter in range(self.params.num_iterations_fp):
             block_number = 0
@@ -322,52 +339,35 @@ class FPAFQMC(AFQMC):
             initial_walkers.build(self.trial)
             self.walkers = initial_walkers
             for step in range(1, total_steps + 1):
-                synchronize()
-                start_step = time.time()
-                if step % self.params.num_stblz == 0:
-                    start = time.time()
-                    self.walkers.orthogonalise()
-                    synchronize()
-                    self.tortho += time.time() - start
-                start = time.time()
-
-                self.propagator.propagate_walkers(
-                    self.walkers, self.hamiltonian, self.trial, eshift
-                )
+                with profiler.region("step"):
+                    if step % self.params.num_stblz == 0:
+                        with profiler.region("orthogonalise"):
+                            self.walkers.orthogonalise()
 
-                self.tprop_ovlp = self.propagator.timer.tovlp
-                self.tprop_update = self.propagator.timer.tupdate
-                self.tprop_gf = self.propagator.timer.tgf
-                self.tprop_vhs = self.propagator.timer.tvhs
-                self.tprop_gemm = self.propagator.timer.tgemm
+                    with profiler.region("propagate"):
+                        self.propagator.propagate_walkers(
+                            self.walkers, self.hamiltonian, self.trial, eshift
+                        )
 
-                # accumulate weight, hybrid energy etc. across block
-                start = time.time()
-                # self.accumulators.update(self.walkers)
-                synchronize()
-                self.testim += time.time() - start  # we dump this time into estimator
-                # calculate estimators
-                start = time.time()
-                if step % self.params.num_steps_per_block == 0:
-                    self.estimators[block_number].compute_estimators(
-                        system=self.system,
-                        hamiltonian=self.hamiltonian,
-                        trial=self.trial,
-                        walker_batch=self.walkers,
-                    )
-                    self.estimators[block_number].print_block(
-                        comm,
-                        iter,
-                        self.accumulators,
-                        time_step=block_number,
-                    )
-                    block_number += 1
-                synchronize()
-                self.testim += time.time() - start
+                    # calculate estimators
+                    if step % self.params.num_steps_per_block == 0:
+                        with profiler.region("estimators"):
+                            self.estimators[block_number].compute_estimators(
+                                system=self.system,
+                                hamiltonian=self.hamiltonian,
+                                trial=self.trial,
+                                walker_batch=self.walkers,
+                            )
+                            self.estimators[block_number].print_block(
+                                comm,
+                                iter,
+                                self.accumulators,
+                                time_step=block_number,
+                            )
+                        block_number += 1
 
-                # restart write features disabled
-                # if self.walkers.write_restart and step % self.walkers.write_freq == 0:
-                #     self.walkers.write_walkers_batch(comm)
-                # self.accumulators.zero()
-                synchronize()
-                self.tstep += time.time() - start_step
+                    # restart write features disabled
+                    # if self.walkers.write_restart and step % self.walkers.write_freq == 0:
+                    #     self.walkers.write_walkers_batch(comm)
+                    # self.accumulators.zero()
+        self.collect_profile()
@@ -92,6 +92,14 @@ class ThermalEstimatorHandler(EstimatorHandler):
         else:
             self.filename = None
         self.buffer_size = config.get_option("estimator_buffer_size")
+        self.flush_freq = config.get_option("estimator_flush_freq")
+        self.compression = config.get_option("estimator_compression")
+        self.async_output = config.get_option("estimator_async_output")
+        self.shift_lag = config.get_option("estimator_shift_lag")
+        self.output = None
+        self._async = None
+        self.reblocker = None
+        self.print_to_stdout = True
         if walker_state is not None:
             self.num_walker_props = walker_state.size
             self.walker_header = walker_state.names
@@ -25,6 +25,7 @@ import scipy.linalg
 
 from abc import abstractmethod
 from ipie.utils.backend import arraylib as xp
+from ipie.utils.profiler import profiler
 from ipie.propagation.continuous_base import ContinuousBase
 from ipie.propagation.operations import apply_exponential
 from ipie.hamiltonians.generic import GenericRealChol, GenericComplexChol
@@ -185,10 +186,9 @@ class PhaselessBase(ContinuousBase):
         """
         # Optimal force bias
         xbar = xp.zeros((walkers.nwalkers, hamiltonian.nfields))
-        start_time = time.time()
-        self.vbias = construct_force_bias(hamiltonian, walkers)
-        xbar = -self.sqrt_dt * (1j * self.vbias - self.mf_shift)
-        self.timer.tfbias += time.time() - start_time
+        with profiler.region("force_bias"):
+            self.vbias = construct_force_bias(hamiltonian, walkers)
+            xbar = -self.sqrt_dt * (1j * self.vbias - self.mf_shift)
 
         # Force bias bounding
         xbar = self.apply_bound_force_bias(xbar, self.fbbound)
@@ -220,15 +220,13 @@ class PhaselessBase(ContinuousBase):
         pass
 
     def propagate_walkers(self, walkers, hamiltonian, trial, eshift=0.0, debug=False):
-        start_time = time.time()
-        cmf, cfb, xshifted, VHS = self.construct_two_body_propagator(
-            walkers, hamiltonian, trial, debug=debug
-        )
+        with profiler.region("construct_vhs"):
+            cmf, cfb, xshifted, VHS = self.construct_two_body_propagator(
+                walkers, hamiltonian, trial, debug=debug
+            )
         assert walkers.nwalkers == xshifted.shape[-1]
-        self.timer.tvhs += time.time() - start_time
         assert len(VHS.shape) == 3
 
-        start_time = time.time()
         for iw in range(walkers.nwalkers):
             stack = walkers.stack[iw]
             phi = xp.identity(VHS[iw].shape[-1], dtype=xp.complex128)
@@ -239,22 +237,19 @@ class PhaselessBase(ContinuousBase):
             # Compute determinant ratio det(1+A')/det(1+A).
             # 1. Current walker's Green's function.
             tix = stack.nslice
-            start_time = time.time()
-            G = walkers.calc_greens_function(iw, slice_ix=tix, inplace=False)
-            self.timer.tgf += time.time() - start_time
-
-            # 2. Compute updated Green's function.
-            start_time = time.time()
-            stack.update_new(B)
-            walkers.calc_greens_function(iw, slice_ix=tix, inplace=True)
-
-            # 3. Compute det(G/G')
-            # Now apply phaseless approximation.
-            # Use legacy thermal weight update for now.
-            self.update_weight_legacy(walkers, iw, G, cfb, cmf, eshift)
-            # self.update_weight(walkers, iw, G, cfb, cmf, eshift)
-
-            self.timer.tupdate += time.time() - start_time
+            with profiler.region("greens_function"):
+                G = walkers.calc_greens_function(iw, slice_ix=tix, inplace=False)
+
+            with profiler.region("update_weight"):
+                # 2. Compute updated Green's function.
+                stack.update_new(B)
+                walkers.calc_greens_function(iw, slice_ix=tix, inplace=True)
+
+                # 3. Compute det(G/G')
+                # Now apply phaseless approximation.
+                # Use legacy thermal weight update for now.
+                self.update_weight_legacy(walkers, iw, G, cfb, cmf, eshift)
+                # self.update_weight(walkers, iw, G, cfb, cmf, eshift)
 
     def update_weight(self, walkers, iw, G, cfb, cmf, eshift):
         """Update weight for walker `iw`."""
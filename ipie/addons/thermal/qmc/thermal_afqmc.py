@@ -33,6 +33,7 @@ from ipie.utils.backend import arraylib as xp
 from ipie.utils.backend import synchronize
 from ipie.utils.io import to_json
 from ipie.utils.mpi import MPIHandler
+from ipie.utils.profiler import profiler
 from ipie.walkers.base_walkers import WalkerAccumulator
 
 
@@ -226,7 +227,7 @@ class ThermalAFQMC(AFQMCBase):
 
         synchronize()
         comm = self.mpi_handler.comm
-        self.tsetup += time.time() - ft_setup
+        profiler.add("setup", time.time() - ft_setup)
 
         # Propagate.
         total_steps = self.params.num_steps_per_block * self.params.num_blocks
@@ -237,87 +238,70 @@ class ThermalAFQMC(AFQMCBase):
         nslices = numpy.rint(self.params.beta / self.params.timestep).astype(int)
 
         for step in range(1, total_steps + 1):
-            synchronize()
-            start_step = time.time()
-
-            for t in range(nslices):
-                if self.verbosity >= 2 and comm.rank == 0:
-                    print(" # Timeslice %d of %d." % (t, nslices))
-
-                start = time.time()
-                self.propagator.propagate_walkers(
-                    self.walkers, self.hamiltonian, self.trial, eshift, debug=self.debug
-                )
-
-                self.tprop_fbias = self.propagator.timer.tfbias
-                self.tprop_update = self.propagator.timer.tupdate
-                self.tprop_vhs = self.propagator.timer.tvhs
-                self.tprop_gemm = self.propagator.timer.tgemm
-
-                start_clip = time.time()
-                if t > 0:
-                    wbound = self.pcontrol.total_weight * 0.10
-                    xp.clip(
-                        self.walkers.weight, a_min=-wbound, a_max=wbound, out=self.walkers.weight
-                    )  # In-place clipping.
-
-                synchronize()
-                self.tprop_clip += time.time() - start_clip
-
-                start_barrier = time.time()
-                if t % self.params.pop_control_freq == 0:
-                    comm.Barrier()
-
-                self.tprop_barrier += time.time() - start_barrier
-                self.tprop += time.time() - start
-
-                if (t > 0) and (t % self.params.pop_control_freq == 0):
-                    start = time.time()
-                    self.pcontrol.pop_control(self.walkers, comm)
-                    synchronize()
-                    self.tpopc += time.time() - start
-                    self.tpopc_send = self.pcontrol.timer.send_time
-                    self.tpopc_recv = self.pcontrol.timer.recv_time
-                    self.tpopc_comm = self.pcontrol.timer.communication_time
-                    self.tpopc_non_comm = self.pcontrol.timer.non_communication_time
-
-                # Print estimators at each time slice.
-                if print_time_slice:
-                    self.estimators.compute_estimators(
-                        hamiltonian=self.hamiltonian, trial=self.trial, walker_batch=self.walkers
-                    )
-                    self.estimators.print_time_slice(comm, t, self.accumulators)
-
-            # Accumulate weight, hybrid energy etc. across block.
-            start = time.time()
-            self.accumulators.update(self.walkers)
-            self.testim += time.time() - start
-
-            # Calculate estimators.
-            start = time.time()
-            if step % self.params.num_steps_per_block == 0:
-                self.estimators.compute_estimators(
-                    hamiltonian=self.hamiltonian, trial=self.trial, walker_batch=self.walkers
-                )
-
-                self.estimators.print_block(
-                    comm, step // self.params.num_steps_per_block, self.accumulators
-                )
-                self.accumulators.zero()
-
-            synchronize()
-            self.testim += time.time() - start
-
-            if step < neqlb_steps:
-                eshift = self.accumulators.eshift
-
-            else:
-                eshift += self.accumulators.eshift - eshift
-
-            self.walkers.reset(self.trial)  # Reset stack, weights, phase.
-
-            synchronize()
-            self.tstep += time.time() - start_step
+            with profiler.region("step"):
+                for t in range(nslices):
+                    if self.verbosity >= 2 and comm.rank == 0:
+                        print(" # Timeslice %d of %d." % (t, nslices))
+
+                    with profiler.region("propagate"):
+                        self.propagator.propagate_walkers(
+                            self.walkers, self.hamiltonian, self.trial, eshift, debug=self.debug
+                        )
+
+                        with profiler.region("clip"):
+                            if t > 0:
+                                wbound = self.pcontrol.total_weight * 0.10
+                                xp.clip(
+                                    self.walkers.weight,
+                                    a_min=-wbound,
+                                    a_max=wbound,
+                                    out=self.walkers.weight,
+                                )  # In-place clipping.
+
+                        if t % self.params.pop_control_freq == 0:
+                            with profiler.region("barrier"):
+                                comm.Barrier()
+
+                    if (t > 0) and (t % self.params.pop_control_freq == 0):
+                        with profiler.region("pop_control"):
+                            self.pcontrol.pop_control(self.walkers, comm)
+
+                    # Print estimators at each time slice.
+                    if print_time_slice:
+                        self.estimators.compute_estimators(
+                            hamiltonian=self.hamiltonian,
+                            trial=self.trial,
+                            walker_batch=self.walkers,
+                        )
+                        self.estimators.print_time_slice(comm, t, self.accumulators)
+
+                with profiler.region("estimators"):
+                    # Accumulate weight, hybrid energy etc. across block.
+                    self.accumulators.update(self.walkers)
+
+                    # Calculate estimators.
+                    if step % self.params.num_steps_per_block == 0:
+                        self.estimators.compute_estimators(
+                            hamiltonian=self.hamiltonian,
+                            trial=self.trial,
+                            walker_batch=self.walkers,
+                        )
+
+                        self.estimators.print_block(
+                            comm, step // self.params.num_steps_per_block, self.accumulators
+                        )
+                        self.accumulators.zero()
+
+                if step < neqlb_steps:
+                    eshift = self.accumulators.eshift
+
+                else:
+                    eshift += self.accumulators.eshift - eshift
+
+                self.walkers.reset(self.trial)  # Reset stack, weights, phase.
+
+        self.estimators.close()
+        self.collect_profile()
 
     def setup_estimators(
         self, filename, additional_estimators: Optional[Dict[str, EstimatorBase]] = None
@@ -131,6 +131,7 @@ class UHFThermalWalkers(BaseWalkers):
                 print(f"# Trial electron number for {iw}-th walker: {nav}")
 
         self.buff_names += ["Ga", "Gb"]
+        self.walker_names += ["M0a", "M0b"]
         self.buff_size = round(self.set_buff_size_single_walker() / float(self.nwalkers))
         self.walker_buffer = numpy.zeros(self.buff_size, dtype=numpy.complex128)
 
@@ -28,23 +28,30 @@ from ipie.utils.misc import get_from_dict
 def extract_hdf5_data(filename, block_idx=1):
     shapes = {}
     with h5py.File(filename, "r") as fh5:
-        keys = fh5[f"block_size_{block_idx}/data/"].keys()
-        shape_keys = fh5[f"block_size_{block_idx}/shape/"].keys()
-        data = numpy.concatenate([fh5[f"block_size_{block_idx}/data/{d}"][:].real for d in keys])
-        for k in shape_keys:
+        base = fh5[f"block_size_{block_idx}"]
+        if isinstance(base["data"], h5py.Dataset):
+            # Single resizable dataset written by H5EstimatorWriter.
+            data = base["data"][:].real
+            num_blocks = data.shape[0]
+        else:
+            # Legacy layout: padded fixed size chunks plus a block counter.
+            keys = base["data"].keys()
+            data = numpy.concatenate([base[f"data/{d}"][:].real for d in keys])
+            # max_block stores the last filled row of each chunk.
+            size_keys = base["max_block"].keys()
+            num_blocks = sum(base[f"max_block/{d}"][()] + 1 for d in size_keys)
+        for k in base["shape"].keys():
             shapes[k] = {
-                "names": fh5[f"block_size_{block_idx}/names/{k}"][()],
-                "shape": fh5[f"block_size_{block_idx}/shape/{k}"][:],
-                "offset": fh5[f"block_size_{block_idx}/offset/{k}"][()],
-                "size": fh5[f"block_size_{block_idx}/size/{k}"][()],
-                "scalar": bool(fh5[f"block_size_{block_idx}/scalar/{k}"][()]),
-                "num_walker_props": fh5[f"block_size_{block_idx}/num_walker_props"][()],
-                "walker_header": fh5[f"block_size_{block_idx}/walker_prop_header"][()],
+                "names": base[f"names/{k}"][()],
+                "shape": base[f"shape/{k}"][:],
+                "offset": base[f"offset/{k}"][()],
+                "size": base[f"size/{k}"][()],
+                "scalar": bool(base[f"scalar/{k}"][()]),
+                "num_walker_props": base["num_walker_props"][()],
+                "walker_header": base["walker_prop_header"][()],
             }
-        size_keys = fh5[f"block_size_{block_idx}/max_block"].keys()
-        max_block = sum(fh5[f"block_size_{block_idx}/max_block/{d}"][()] for d in size_keys)
 
-    return data[: max_block + 1], shapes
+    return data[:num_blocks], shapes
 
 
 def extract_observable(filename, name="energy", block_idx=1):
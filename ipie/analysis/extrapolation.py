@@ -0,0 +1,65 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Timestep extrapolation of AFQMC energies."""
+
+from typing import Sequence, Tuple
+
+import numpy
+
+
+def extrapolate_timestep(
+    timesteps: Sequence[float],
+    energies: Sequence[float],
+    errors: Sequence[float],
+    order: int = 1,
+) -> Tuple[float, float]:
+    """Extrapolate energies to zero timestep with a weighted polynomial fit.
+
+    Parameters
+    ----------
+    timesteps : list of float
+        Timesteps used. Repeated timesteps (e.g. different seeds) are allowed.
+    energies : list of float
+        Mean energy for each timestep.
+    errors : list of float
+        Standard error of each energy, used to weight the fit. If any error is
+        zero or not finite an unweighted fit is performed.
+    order : int
+        Order of the polynomial in the timestep. Reduced if there are not
+        enough distinct timesteps, so a single timestep yields the weighted
+        mean of the energies.
+
+    Returns
+    -------
+    energy : float
+        Extrapolated energy at dt = 0.
+    error : float
+        Standard error of the extrapolated energy (nan for an unweighted fit).
+    """
+    timesteps = numpy.asarray(timesteps, dtype=numpy.float64)
+    energies = numpy.asarray(energies, dtype=numpy.float64)
+    errors = numpy.asarray(errors, dtype=numpy.float64)
+    order = min(order, len(numpy.unique(timesteps)) - 1)
+    weighted = numpy.all(numpy.isfinite(errors)) and numpy.all(errors > 0)
+    if weighted:
+        weights = 1.0 / errors**2
+    else:
+        weights = numpy.ones_like(energies)
+    design = numpy.vander(timesteps, order + 1, increasing=True)
+    normal = design.T.dot(weights[:, None] * design)
+    cov = numpy.linalg.inv(normal)
+    coeffs = cov.dot(design.T.dot(weights * energies))
+    error = numpy.sqrt(cov[0, 0]) if weighted else numpy.nan
+    return coeffs[0], error
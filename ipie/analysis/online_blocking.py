@@ -0,0 +1,208 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""On-the-fly reblocking analysis of a scalar time series."""
+
+import numpy
+
+
+class OnlineReblocker(object):
+    """Flyvbjerg-Petersen reblocking accumulated one sample at a time.
+
+    Samples are repeatedly averaged in pairs, so only O(log N) running sums
+    are stored. The error bar is taken from the smallest blocking level
+    satisfying the Wolff / Lee criterion used by pyblock. Before any data is
+    accumulated an equilibration phase is detected by requiring the means of
+    three consecutive chunks of a short sliding window of samples to agree.
+    The first chunk is then discarded.
+
+    Parameters
+    ----------
+    equilibration_window : int
+        Number of samples used to detect equilibration. Set to zero to treat
+        all samples as equilibrated.
+    equilibration_tol : float
+        Number of standard errors the means of the chunks of the window may
+        differ by for the series to be considered equilibrated.
+    min_samples : int
+        Minimum number of blocks required at the optimal level before an
+        error bar is considered reliable.
+
+    Attributes
+    ----------
+    equilibration_index : int
+        Index of the first sample included in the statistics or -1 if the
+        series has not equilibrated yet.
+    """
+
+    def __init__(self, equilibration_window=24, equilibration_tol=2.0, min_samples=8):
+        self.equilibration_window = 3 * (equilibration_window // 3)
+        self.equilibration_tol = equilibration_tol
+        self.min_samples = min_samples
+        self.reset()
+
+    def reset(self):
+        self.num_pushed = 0
+        self.equilibration_index = -1 if self.equilibration_window > 0 else 0
+        self._window = []
+        self._sum = []
+        self._sum_sq = []
+        self._count = []
+        self._pending = []
+
+    def get_state(self):
+        """Accumulated statistics as a dictionary of arrays (for checkpoints)."""
+        pending = [numpy.nan if p is None else p for p in self._pending]
+        return {
+            "num_pushed": numpy.array(self.num_pushed),
+            "equilibration_index": numpy.array(self.equilibration_index),
+            "window": numpy.array(self._window, dtype=numpy.float64),
+            "sum": numpy.array(self._sum, dtype=numpy.float64),
+            "sum_sq": numpy.array(self._sum_sq, dtype=numpy.float64),
+            "count": numpy.array(self._count, dtype=numpy.int64),
+            "pending": numpy.array(pending, dtype=numpy.float64),
+            "has_pending": numpy.array([p is not None for p in self._pending], dtype=bool),
+        }
+
+    def set_state(self, state):
+        """Restore statistics from the output of get_state."""
+        self.num_pushed = int(state["num_pushed"])
+        self.equilibration_index = int(state["equilibration_index"])
+        self._window = [float(v) for v in state["window"]]
+        self._sum = [float(v) for v in state["sum"]]
+        self._sum_sq = [float(v) for v in state["sum_sq"]]
+        self._count = [int(v) for v in state["count"]]
+        self._pending = [
+            float(v) if has else None for v, has in zip(state["pending"], state["has_pending"])
+        ]
+
+    @property
+    def equilibrated(self):
+        return self.equilibration_index >= 0
+
+    @property
+    def num_samples(self):
+        return self._count[0] if self._count else 0
+
+    def push(self, value):
+        """Add a sample to the series.
+
+        Parameters
+        ----------
+        value : float
+            Sample (real part is used).
+        """
+        value = float(numpy.real(value))
+        self.num_pushed += 1
+        if self.equilibrated:
+            self._accumulate(value, 0)
+            return
+        self._window.append(value)
+        if len(self._window) < self.equilibration_window:
+            return
+        nchunk = self.equilibration_window // 3
+        chunks = numpy.array(self._window).reshape((3, nchunk))
+        means = chunks.mean(axis=1)
+        errors = numpy.sqrt(chunks.var(axis=1, ddof=1) / nchunk)
+        consistent = all(
+            abs(means[i] - means[j])
+            <= self.equilibration_tol * numpy.sqrt(errors[i] ** 2 + errors[j] ** 2)
+            for i, j in ((0, 1), (1, 2), (0, 2))
+        )
+        if consistent:
+            self.equilibration_index = self.num_pushed - 2 * nchunk
+            for v in chunks[1:].ravel():
+                self._accumulate(v, 0)
+            self._window = []
+        else:
+            # Slide the window.
+            self._window = self._window[nchunk:]
+
+    def _accumulate(self, value, level):
+        while True:
+            if level == len(self._count):
+                self._sum.append(0.0)
+                self._sum_sq.append(0.0)
+                self._count.append(0)
+                self._pending.append(None)
+            self._sum[level] += value
+            self._sum_sq[level] += value * value
+            self._count[level] += 1
+            if self._pending[level] is None:
+                self._pending[level] = value
+                return
+            value = 0.5 * (self._pending[level] + value)
+            self._pending[level] = None
+            level += 1
+
+    def reblock(self):
+        """Mean and standard error at each blocking level.
+
+        Returns
+        -------
+        levels : list of tuple
+            (number of blocks, mean, standard error) for each level.
+        """
+        levels = []
+        for s, s2, n in zip(self._sum, self._sum_sq, self._count):
+            if n < 2:
+                break
+            mean = s / n
+            var = max(s2 / n - mean * mean, 0.0) * n / (n - 1)
+            levels.append((n, mean, numpy.sqrt(var / n)))
+        return levels
+
+    def optimal_level(self):
+        """Smallest blocking level satisfying B^3 > 2 N (sigma_B / sigma_0)^4.
+
+        Returns
+        -------
+        level : int
+            Optimal level or -1 if no level satisfies the criterion.
+        """
+        levels = self.reblock()
+        if len(levels) == 0 or levels[0][2] == 0.0:
+            return -1
+        num_samples, _, err0 = levels[0]
+        for ilevel, (n, _, err) in enumerate(levels):
+            block_size = 2**ilevel
+            if block_size**3 > 2 * num_samples * (err / err0) ** 4:
+                if n < self.min_samples:
+                    return -1
+                return ilevel
+        return -1
+
+    def estimate(self):
+        """Current mean and error bar.
+
+        Returns
+        -------
+        mean : float
+            Mean of the equilibrated samples (nan if none).
+        error : float
+            Standard error from the optimal blocking level. nan if the error
+            can not be reliably estimated yet.
+        """
+        if self.num_samples == 0:
+            return numpy.nan, numpy.nan
+        mean = self._sum[0] / self._count[0]
+        level = self.optimal_level()
+        if level < 0:
+            return mean, numpy.nan
+        return mean, self.reblock()[level][2]
+
+    def converged(self, target_error):
+        """Check whether the error bar is below target_error."""
+        _, error = self.estimate()
+        return bool(error <= target_error)
@@ -0,0 +1,38 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from ipie.analysis.extrapolation import extrapolate_timestep
+
+
+@pytest.mark.unit
+def test_extrapolate_timestep():
+    timesteps = [0.02, 0.01, 0.005]
+    energies = [-1.0 + 2.0 * dt for dt in timesteps]
+    errors = [1e-3, 1e-3, 1e-3]
+    energy, error = extrapolate_timestep(timesteps, energies, errors)
+    assert energy == pytest.approx(-1.0)
+    # Error propagation of a weighted linear fit.
+    design = np.vander(timesteps, 2, increasing=True)
+    cov = np.linalg.inv(design.T.dot(design) / 1e-6)
+    assert error == pytest.approx(np.sqrt(cov[0, 0]))
+    energies = [-1.0 + 2.0 * dt + 30 * dt**2 for dt in timesteps]
+    energy, _ = extrapolate_timestep(timesteps, energies, errors, order=2)
+    assert energy == pytest.approx(-1.0)
+    # Single timestep (e.g. different seeds) reduces to the weighted mean.
+    energy, error = extrapolate_timestep([0.01, 0.01], [-1.0, -2.0], [1.0, 2.0])
+    assert energy == pytest.approx((-1.0 - 2.0 / 4) / (1 + 1 / 4))
+    assert error == pytest.approx(1.0 / np.sqrt(1 + 1 / 4))
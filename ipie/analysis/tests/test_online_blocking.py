@@ -0,0 +1,105 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from ipie.analysis.online_blocking import OnlineReblocker
+
+
+def _ar1(n, phi=0.9):
+    x = np.zeros(n)
+    noise = np.random.normal(size=n)
+    for i in range(1, n):
+        x[i] = phi * x[i - 1] + noise[i]
+    return x
+
+
+@pytest.mark.unit
+def test_online_reblocking_levels():
+    np.random.seed(7)
+    n = 2**10
+    data = np.random.random(n)
+    reblocker = OnlineReblocker(equilibration_window=0)
+    for d in data:
+        reblocker.push(d)
+    assert reblocker.equilibration_index == 0
+    assert reblocker.num_samples == n
+    levels = reblocker.reblock()
+    for ilevel, (nblocks, mean, error) in enumerate(levels):
+        blocked = data.reshape((-1, 2**ilevel)).mean(axis=1)
+        assert nblocks == len(blocked)
+        assert mean == pytest.approx(blocked.mean())
+        assert error == pytest.approx(blocked.std(ddof=1) / np.sqrt(len(blocked)))
+    errors = np.array([level[2] for level in levels])
+    crit = (2 ** np.arange(len(levels))) ** 3 > 2 * n * (errors / errors[0]) ** 4
+    opt = np.argmax(crit)
+    assert reblocker.optimal_level() == opt
+    mean, error = reblocker.estimate()
+    assert mean == pytest.approx(data.mean())
+    assert error == pytest.approx(levels[opt][2])
+    # Uncorrelated data so all levels should roughly agree.
+    assert error == pytest.approx(levels[0][2], rel=0.2)
+    assert reblocker.converged(error)
+    assert not reblocker.converged(0.5 * error)
+
+
+@pytest.mark.unit
+def test_online_reblocking_equilibration():
+    np.random.seed(7)
+    n = 2**13
+    phi = 0.5
+    transient = 20 * np.exp(-np.arange(n) / 20.0)
+    reblocker = OnlineReblocker()
+    for d in _ar1(n, phi=phi) + transient:
+        reblocker.push(d)
+    assert reblocker.equilibrated
+    assert reblocker.equilibration_index >= 40
+    mean, error = reblocker.estimate()
+    assert reblocker.optimal_level() > 0
+    # Exact error for an AR(1) process with unit noise.
+    nsamp = n - reblocker.equilibration_index
+    exact = np.sqrt((1 + phi) / (1 - phi) / (1 - phi**2) / nsamp)
+    assert error == pytest.approx(exact, rel=0.25)
+    assert abs(mean) < 3 * exact
+
+
+@pytest.mark.unit
+def test_online_reblocking_insufficient_data():
+    reblocker = OnlineReblocker(equilibration_window=6)
+    for d in [10.0, 5.0, 1.0, 0.5, 0.2]:
+        reblocker.push(d)
+    assert not reblocker.equilibrated
+    mean, error = reblocker.estimate()
+    assert np.isnan(mean)
+    assert np.isnan(error)
+    assert not reblocker.converged(1e10)
+
+
+@pytest.mark.unit
+def test_online_reblocking_state():
+    np.random.seed(7)
+    data = _ar1(1001)
+    reblocker = OnlineReblocker()
+    for d in data[:501]:
+        reblocker.push(d)
+    restarted = OnlineReblocker()
+    restarted.set_state(reblocker.get_state())
+    for d in data[501:]:
+        reblocker.push(d)
+        restarted.push(d)
+    assert restarted.num_pushed == reblocker.num_pushed
+    assert restarted.equilibration_index == reblocker.equilibration_index
+    assert restarted.optimal_level() == reblocker.optimal_level()
+    assert restarted.estimate() == reblocker.estimate()
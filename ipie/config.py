@@ -45,9 +45,11 @@ MPI, CommType = _select_mpi()
 class Config:
     def __init__(self):
         self.options = {}
+        self.defaults = {}
 
     def add_option(self, key, val):
         self.options[key] = val
+        self.defaults[key] = val
 
     def update_option(self, key, val):
         _val = self.options.get(key)
@@ -61,6 +63,10 @@ class Config:
             raise KeyError(f"config option not found: {_val}")
         return _val
 
+    def is_default(self, key):
+        """True if option key still has the value it was added with."""
+        return self.get_option(key) == self.defaults[key]
+
     def __str__(self):
         _str = ""
         for k, v in self.options.items():
@@ -80,8 +86,62 @@ IPIE_USE_GPU = os.environ.get("IPIE_USE_GPU", False)
 IPIE_USE_MIXED_PRECISION = os.environ.get("IPIE_USE_MIXED_PRECISION", False)
 # Default to not using for the moment.
 config.add_option("use_gpu", bool(int(IPIE_USE_GPU)))
+# Store the packed Cholesky vectors in float32 and build and apply the HS
+# potential in complex64. Walkers, overlaps, weights and energies stay double.
 config.add_option("mixed_precision", bool(int(IPIE_USE_MIXED_PRECISION)))
 # Memory limits should be in GB
 config.add_option("max_memory_for_wicks", 2.0)
 config.add_option("max_memory_sd_energy_gpu", 2.0)
+# Size of the chunks of Cholesky vectors read at once when loading the Hamiltonian.
+config.add_option("max_memory_hamiltonian_read", 0.25)
+# Directory of processed Hamiltonians keyed by a hash of the integral file and
+# of half-rotated trial integrals (see ipie.hamiltonians.cache). Disabled if empty.
+config.add_option("hamiltonian_cache_dir", "")
+# Size chunks and memory limits above from a per-task budget when building the driver.
+config.add_option("memory_planner", True)
+# Memory budget per MPI task in GB used by the planner (0 = node memory / tasks per node).
+config.add_option("max_memory_per_task", 0.0)
 config.add_option("estimator_buffer_size", 1000)
+# Number of blocks buffered in memory before estimates are written to disk.
+config.add_option("estimator_flush_freq", 1)
+# hdf5 compression filter for estimates (none, gzip or lzf).
+config.add_option("estimator_compression", "none")
+# Reduce and write block estimates in the background.
+config.add_option("estimator_async_output", False)
+# Apply the energy shift from the previous block when writing asynchronously.
+config.add_option("estimator_shift_lag", False)
+# Overlap the population control weight reduction with the next propagation step.
+config.add_option("async_pop_control", False)
+# Draw auxiliary fields from a counter-based generator keyed by global walker
+# ID and step so trajectories do not depend on the MPI decomposition.
+config.add_option("counter_based_rng", False)
+# Vary the number of walkers per task to balance the measured propagation
+# time (uses distributed_comb population control and the profiler timings).
+config.add_option("load_balance", False)
+# Keep the walker matrices of all tasks on a node in MPI shared memory so
+# population control copies walkers within a node directly.
+config.add_option("shared_memory_walkers", False)
+# CPU implementation of the walker propagation: "loop" over walkers,
+# "batched" matrix products, "numba" (two-body only, parallel over walkers)
+# or "auto" to time them on first use. The kernels round differently, so
+# "auto" is tuned on rank 0 and the choice broadcast to all tasks, which must
+# then propagate together. It is not stored in checkpoints.
+config.add_option("cpu_propagation_kernel", "loop")
+# Exponential of the HS potential: "taylor" (fixed exp_nmax terms), "adaptive"
+# (Taylor series truncated per walker) or "krylov" (block Krylov, CPU only).
+config.add_option("propagator_exponential", "taylor")
+# Relative error tolerance of the adaptive and Krylov exponentials.
+config.add_option("propagator_exponential_tol", 1e-8)
+# Number of walkers the HS potential is built and applied for at once (0 = all
+# walkers, or the size chosen by the memory planner).
+config.add_option("vhs_walker_block_size", 0)
+# Walker reorthogonalisation: "loop" (QR of one walker at a time), batched
+# Householder "qr" or "cholesky_qr2" (CPU and GPU).
+config.add_option("reortho_method", "qr")
+# Only reorthogonalise walkers whose estimated condition number exceeds this
+# value or whose norm has drifted by more than this factor (0 = all walkers).
+config.add_option("reortho_cond_thresh", 0.0)
+# Record timings of code regions (see ipie.utils.profiler).
+config.add_option("profile", True)
+# Write a Chrome trace of all profiled regions to this file if not empty.
+config.add_option("profile_trace_file", "")
@@ -36,6 +36,7 @@ from ipie.estimators.local_energy_wicks import (
 )
 from ipie.hamiltonians.generic import GenericComplexChol, GenericRealChol
 from ipie.hamiltonians.generic_chunked import GenericRealCholChunked
+from ipie.hamiltonians.thc import GenericRealTHC
 from ipie.systems.generic import Generic
 from ipie.trial_wavefunction.noci import NOCI
 from ipie.trial_wavefunction.particle_hole import (
@@ -71,6 +72,16 @@ def local_energy(
     return local_energy_single_det_uhf_batch(system, hamiltonian, walkers, trial)
 
 
+@plum.dispatch
+def local_energy(
+    system: Generic,
+    hamiltonian: GenericRealTHC,
+    walkers: UHFWalkers,
+    trial: SingleDet,
+):
+    return local_energy_single_det_uhf_batch(system, hamiltonian, walkers, trial)
+
+
 @plum.dispatch
 def local_energy(
     system: Generic,
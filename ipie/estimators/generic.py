@@ -21,6 +21,7 @@ import numpy
 from numba import jit
 
 from ipie.hamiltonians.generic import GenericComplexChol, GenericRealChol
+from ipie.hamiltonians.thc import GenericRealTHC
 from ipie.utils.backend import arraylib as xp
 from ipie.utils.backend import synchronize
 
@@ -441,6 +442,109 @@ def half_rotated_cholesky_jk_uhf(trial, hamiltonian: GenericComplexChol, Ghalf):
     return ecoul, exx  # JK energy
 
 
+def thc_density_batch(rX, X, Ghalf):
+    """Walkers' densities at the THC interpolation points.
+
+    Parameters
+    ----------
+    rX : :class:`numpy.ndarray`
+        Half-rotated collocation matrix of shape (nocc, nthc).
+    X : :class:`numpy.ndarray`
+        Collocation matrix of shape (nbasis, nthc).
+    Ghalf : :class:`numpy.ndarray`
+        Walkers' half-rotated Green's functions of shape (nwalkers, nocc, nbasis).
+
+    Returns
+    -------
+    GX : :class:`numpy.ndarray`
+        Ghalf X of shape (nwalkers, nocc, nthc).
+    density : :class:`numpy.ndarray`
+        sum_i rX_iP (Ghalf X)_iP of shape (nwalkers, nthc).
+    """
+    nwalkers, nocc, nbasis = Ghalf.shape
+    # X is real so avoid promoting it to complex.
+    Ghalf = Ghalf.reshape(nwalkers * nocc, nbasis)
+    GX = Ghalf.real.dot(X) + 1j * Ghalf.imag.dot(X)
+    GX = GX.reshape(nwalkers, nocc, X.shape[1])
+    density = (rX[None, :, :] * GX).sum(axis=1)
+    return GX, density
+
+
+def thc_jk_batch_uhf(hamiltonian, rXa, rXb, Ghalfa, Ghalfb):
+    r"""Compute Coulomb and exchange energies from THC factors.
+
+    With :math:`L_{pq,n} = \sum_P X_{pP} X_{qP} U_{Pn}` the Coulomb term only
+    needs the density at the interpolation points and the exchange term
+
+    .. math::
+
+        E_x = \frac{1}{2} \sum_{\sigma PQ} Z_{PQ} M^{\sigma}_{PQ} M^{\sigma}_{QP},
+        \quad M^{\sigma}_{PQ} = \sum_i (rX^{\sigma})_{iP} (G^{\sigma} X)_{iQ},
+
+    i.e. O(N nthc^2) per walker rather than O(N^2 M nchol).
+
+    Parameters
+    ----------
+    hamiltonian : :class:`GenericRealTHC`
+        Hamiltonian.
+    rXa, rXb : :class:`numpy.ndarray`
+        Half-rotated collocation matrices for each spin.
+    Ghalfa, Ghalfb : :class:`numpy.ndarray`
+        Walkers' half-rotated Green's functions of shape (nwalkers, nocc, nbasis).
+
+    Returns
+    -------
+    ecoul : :class:`numpy.ndarray`
+        Coulomb energy of each walker.
+    exx : :class:`numpy.ndarray`
+        Exchange energy of each walker.
+    """
+    nwalkers = Ghalfa.shape[0]
+    X_field = xp.zeros((nwalkers, hamiltonian.nchol), dtype=numpy.complex128)
+    exx = xp.zeros(nwalkers, dtype=numpy.complex128)
+    for rX, Ghalf in ((rXa, Ghalfa), (rXb, Ghalfb)):
+        if rX.shape[0] == 0:
+            continue
+        GX, density = thc_density_batch(rX, hamiltonian.X, Ghalf)
+        X_field += density.dot(hamiltonian.U)
+        # Loop over walkers so only one (nthc, nthc) intermediate is held.
+        rXT = rX.T.copy()
+        for iw in range(nwalkers):
+            M = rXT.dot(GX[iw].real) + 1j * rXT.dot(GX[iw].imag)
+            exx[iw] += 0.5 * xp.sum(hamiltonian.Z * M * M.T)
+    ecoul = 0.5 * xp.einsum("wn,wn->w", X_field, X_field)
+    synchronize()
+    return ecoul, exx
+
+
+@plum.dispatch
+def half_rotated_cholesky_jk_uhf(trial, hamiltonian: GenericRealTHC, Ghalf):
+    """Compute exchange and coulomb contributions from THC factors.
+
+    Parameters
+    ----------
+    trial : ipie trial object
+        Trial wavefunction
+    hamiltonian : ipie hamiltonian object.
+        Hamiltonian.
+    Ghalf : list of :class:`numpy.ndarray`
+        Walker's half-rotated Green's function, stored as a list of arrays with
+        shape (nsigma, nbasis) for each spin sigma.
+
+    Returns
+    -------
+    ecoul : :class:`numpy.ndarray`
+        Coulomb energy.
+    exx : :class:`numpy.ndarray`
+        Exchange energy.
+    """
+    Ghalfa, Ghalfb = Ghalf
+    ecoul, exx = thc_jk_batch_uhf(
+        hamiltonian, trial._rXa, trial._rXb, Ghalfa[None, :, :], Ghalfb[None, :, :]
+    )
+    return ecoul[0], exx[0]
+
+
 @jit(nopython=True, fastmath=True)
 def ecoul_kernel_real_rchol_ghf(chol, Gaa, Gbb):
     """Compute Coulomb contribution for real Choleskies.
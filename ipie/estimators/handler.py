@@ -21,16 +21,19 @@
 from __future__ import print_function
 
 import os
+import queue
+import threading
 from typing import Tuple, Union
 
 import h5py
 import numpy
 
+from ipie.analysis.online_blocking import OnlineReblocker
 from ipie.config import config, MPI
 from ipie.estimators.energy import EnergyEstimator
 from ipie.estimators.estimator_base import EstimatorBase
-from ipie.estimators.utils import H5EstimatorHelper
-from ipie.utils.io import format_fixed_width_strings
+from ipie.estimators.utils import H5EstimatorWriter
+from ipie.utils.io import format_fixed_width_floats, format_fixed_width_strings
 
 # Some supported (non-custom) estimators
 _predefined_estimators = {
@@ -54,6 +57,8 @@ class EstimatorHandler(object):
     options: dict
         input options detailing which estimators to calculate. By default only
         mixed options will be calculated.
+    print_to_stdout : bool
+        Print the header and block estimates to stdout (on rank 0). Default True.
 
     Attributes
     ----------
@@ -75,9 +80,12 @@ class EstimatorHandler(object):
         overwrite=True,
         observables: Tuple[str] = ("energy",),  # TODO: Use factory method!
         index: int = 0,
+        online_reblock: bool = False,
+        print_to_stdout: bool = True,
     ):
         if verbose:
             print("# Setting up estimator object.")
+        self.print_to_stdout = print_to_stdout
         if comm.rank == 0:
             self.basename = basename
             self.filename = filename
@@ -93,6 +101,16 @@ class EstimatorHandler(object):
         else:
             self.filename = None
         self.buffer_size = config.get_option("estimator_buffer_size")
+        self.flush_freq = config.get_option("estimator_flush_freq")
+        self.compression = config.get_option("estimator_compression")
+        self.async_output = config.get_option("estimator_async_output")
+        self.shift_lag = config.get_option("estimator_shift_lag")
+        self.output = None
+        self._async = None
+        if online_reblock:
+            self.reblocker = OnlineReblocker()
+        else:
+            self.reblocker = None
         if walker_state is not None:
             self.num_walker_props = walker_state.size
             self.walker_header = walker_state.names
@@ -146,7 +164,17 @@ class EstimatorHandler(object):
     def size(self):
         return sum(o.size for k, o in self._estimators.items())
 
-    def initialize(self, comm):
+    def initialize(self, comm, restart_block=None):
+        """Set up buffers and the output file.
+
+        Parameters
+        ----------
+        comm : MPI communicator
+            Communicator.
+        restart_block : int
+            Optional. Last block in the checkpoint the run is restarted from.
+            The existing output file is kept and truncated after this block.
+        """
         self.local_estimates = numpy.zeros(
             (self.size + self.num_walker_props), dtype=numpy.complex128
         )
@@ -159,17 +187,24 @@ class EstimatorHandler(object):
         for k, e in self.items():
             if e.print_to_stdout:
                 header += e.header_to_text
-        if comm.rank == 0:
+        if self.reblocker is not None:
+            assert "energy" in self._estimators, "Online reblocking requires energy estimator."
+            header += " " + format_fixed_width_strings(["ETotalMean", "ETotalError"])
+        if comm.rank == 0 and restart_block is not None:
+            # Block 0 is the initial walker distribution.
+            self.output = H5EstimatorWriter(
+                self.filename,
+                base="block_size_1",
+                shape=(self.size + self.num_walker_props,),
+                chunk_size=self.buffer_size,
+                flush_freq=self.flush_freq,
+                compression=self.compression,
+                num_rows=restart_block + 1,
+            )
+        elif comm.rank == 0:
             with h5py.File(self.filename, "w") as fh5:
                 pass
             self.dump_metadata()
-        self.output = H5EstimatorHelper(
-            self.filename,
-            base="block_size_1",
-            chunk_size=self.buffer_size,
-            shape=(self.size + self.num_walker_props,),
-        )
-        if comm.rank == 0:
             with h5py.File(self.filename, "r+") as fh5:
                 fh5["block_size_1/num_walker_props"] = self.num_walker_props
                 fh5["block_size_1/walker_prop_header"] = self.walker_header
@@ -179,8 +214,18 @@ class EstimatorHandler(object):
                     fh5[f"block_size_1/scalar/{k}"] = int(o.scalar_estimator)
                     fh5[f"block_size_1/names/{k}"] = " ".join(name for name in o.names)
                     fh5[f"block_size_1/offset/{k}"] = self.num_walker_props + self.get_offset(k)
-        if comm.rank == 0:
+            self.output = H5EstimatorWriter(
+                self.filename,
+                base="block_size_1",
+                shape=(self.size + self.num_walker_props,),
+                chunk_size=self.buffer_size,
+                flush_freq=self.flush_freq,
+                compression=self.compression,
+            )
+        if comm.rank == 0 and self.print_to_stdout:
             print(header)
+        if self.async_output:
+            self._async = _AsyncBlockOutput(self, comm)
 
     def dump_metadata(self):
         with h5py.File(self.filename, "a") as fh5:
@@ -209,40 +254,232 @@ class EstimatorHandler(object):
             self.local_estimates[start:end] += e.data
 
     def print_block(self, comm, block, walker_factors, div_factor=None):
+        if self._async is not None:
+            self._async.print_block(comm, block, walker_factors)
+            self.zero()
+            return
         self.local_estimates[: walker_factors.size] = walker_factors.buffer
         comm.Reduce(self.local_estimates, self.global_estimates, op=MPI.SUM)
+        if comm.rank == 0:
+            shift = self.write_block(block, walker_factors, self.global_estimates)
+        else:
+            shift = None
+        walker_factors.eshift = comm.bcast(shift)
+        self.zero()
+
+    def write_block(self, block, walker_factors, global_estimates):
+        """Post process reduced estimates and write them to file / stdout.
+
+        Parameters
+        ----------
+        block : int
+            Block number.
+        walker_factors : :class:`WalkerAccumulator`
+            Walker accumulator used to post process the walker properties.
+        global_estimates : :class:`numpy.ndarray`
+            Estimates summed over all MPI tasks. Modified in place.
+
+        Returns
+        -------
+        shift : complex
+            Hybrid energy estimate for this block.
+        """
         output_string = " "
         # Get walker data.
         offset = walker_factors.size
-        if comm.rank == 0:
-            walker_factors.post_reduce_hook(self.global_estimates[:offset], block)
-        output_string += walker_factors.to_text(self.global_estimates[:offset])
+        walker_factors.post_reduce_hook(global_estimates[:offset], block)
+        output_string += walker_factors.to_text(global_estimates[:offset])
         output_string += " "
         for k, e in self.items():
-            if comm.rank == 0:
-                start = offset + self.get_offset(k)
-                end = start + int(self[k].size)
-                est_data = self.global_estimates[start:end]
-                e.post_reduce_hook(est_data)
-                est_string = e.data_to_text(est_data)
-                e.to_ascii_file(est_string)
-                if e.print_to_stdout:
-                    output_string += est_string
-        if comm.rank == 0:
-            shift = self.global_estimates[walker_factors.get_index("HybridEnergy")]
-
-        else:
-            shift = None
-        walker_factors.eshift = comm.bcast(shift)
-        if comm.rank == 0:
-            self.output.push_to_chunk(self.global_estimates, f"data")
-            self.output.increment()
-        if comm.rank == 0:
+            start = offset + self.get_offset(k)
+            end = start + int(self[k].size)
+            est_data = global_estimates[start:end]
+            e.post_reduce_hook(est_data)
+            est_string = e.data_to_text(est_data)
+            e.to_ascii_file(est_string)
+            if e.print_to_stdout:
+                output_string += est_string
+        if self.reblocker is not None:
+            # Block 0 is the initial walker distribution.
+            if block > 0:
+                ix = list(self["energy"].names).index("ETotal")
+                self.reblocker.push(global_estimates[offset + self.get_offset("energy") + ix])
+            output_string += " " + format_fixed_width_floats(self.reblocker.estimate())
+        shift = global_estimates[walker_factors.get_index("HybridEnergy")]
+        self.output.push(global_estimates)
+        if self.print_to_stdout:
             print(f"{block:>17d} " + output_string)
-        self.zero()
+        return shift
+
+    def target_error_reached(self, target_error: float) -> bool:
+        """Check if the online error bar on ETotal is below target_error.
+
+        Only meaningful on rank 0. If estimates are written asynchronously
+        the most recent block may not have been included yet.
+        """
+        if self.reblocker is None or target_error <= 0:
+            return False
+        return self.reblocker.equilibrated and self.reblocker.converged(target_error)
+
+    def get_state(self):
+        """State required to continue the output after a restart.
+
+        Pending (asynchronous) output is completed and written to disk first.
+        Collective if the output is asynchronous.
+
+        Returns
+        -------
+        state : dict
+            Online reblocking accumulators (empty if not reblocking).
+        """
+        if self._async is not None:
+            self._async.wait()
+        if self.output is not None:
+            self.output.flush()
+        if self.reblocker is None:
+            return {}
+        return {"reblocker": self.reblocker.get_state()}
+
+    def set_state(self, state):
+        """Restore the output of get_state."""
+        if self.reblocker is not None and "reblocker" in state:
+            self.reblocker.set_state(state["reblocker"])
+
+    def close(self):
+        """Flush remaining estimates to disk and close the output file."""
+        if self._async is not None:
+            self._async.close()
+            self._async = None
+        if self.output is not None:
+            self.output.close()
 
     def zero(self):
         self.local_estimates[:] = 0.0
         self.global_estimates[:] = 0.0
         for _, e in self.items():
             e.zero()
+
+
+class _AsyncBlockOutput(object):
+    """Overlap the reduction and output of block estimates with propagation.
+
+    The full estimator buffer is reduced with a non-blocking Ireduce which
+    is only completed on the following block, after which rank 0 hands the
+    result to a worker thread for post processing and output. Only the
+    (small) walker property buffer required for the energy shift is reduced
+    synchronously, or with a one block lag if shift_lag is set. The worker
+    thread makes no MPI calls.
+
+    Parameters
+    ----------
+    handler : :class:`EstimatorHandler`
+        Parent estimator handler.
+    comm : MPI communicator
+        Communicator used for the reduction.
+    """
+
+    def __init__(self, handler, comm):
+        self.handler = handler
+        self.comm = comm
+        self.shift_lag = handler.shift_lag
+        size = handler.local_estimates.size
+        self.send = [numpy.zeros(size, dtype=numpy.complex128) for _ in range(2)]
+        self.recv = [numpy.zeros(size, dtype=numpy.complex128) for _ in range(2)]
+        self.free = [threading.Event(), threading.Event()]
+        for event in self.free:
+            event.set()
+        self.current = 0
+        self.pending = None
+        self.shift_send = None
+        self.shift_recv = None
+        self.shift_pending = None
+        self.error = None
+        self.thread = None
+        if comm.rank == 0:
+            self.queue = queue.Queue()
+            self.thread = threading.Thread(target=self._worker, daemon=True)
+            self.thread.start()
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            ix, block, walker_factors = item
+            try:
+                self.handler.write_block(block, walker_factors, self.recv[ix])
+            except Exception as error:  # surfaced on the next call to print_block / close
+                self.error = error
+            self.free[ix].set()
+
+    def _check_error(self):
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise RuntimeError("Failed to write block estimates") from error
+
+    def _complete_pending(self):
+        if self.pending is None:
+            return
+        req, ix, block, walker_factors = self.pending
+        req.Wait()
+        if self.comm.rank == 0:
+            self.queue.put((ix, block, walker_factors))
+        self.pending = None
+
+    def _compute_shift(self, vals, block, walker_factors):
+        vals = vals.copy()
+        walker_factors.post_reduce_hook(vals, block)
+        return vals[walker_factors.get_index("HybridEnergy")]
+
+    def _update_shift(self, comm, block, walker_factors):
+        nprops = walker_factors.size
+        if self.shift_send is None:
+            self.shift_send = numpy.zeros(nprops, dtype=numpy.complex128)
+            self.shift_recv = numpy.zeros(nprops, dtype=numpy.complex128)
+        if not self.shift_lag or block == 0:
+            comm.Allreduce(walker_factors.buffer, self.shift_recv, op=MPI.SUM)
+            walker_factors.eshift = self._compute_shift(self.shift_recv, block, walker_factors)
+            return
+        if self.shift_pending is not None:
+            req, prev_block = self.shift_pending
+            req.Wait()
+            walker_factors.eshift = self._compute_shift(self.shift_recv, prev_block, walker_factors)
+        self.shift_send[:] = walker_factors.buffer
+        req = comm.Iallreduce(self.shift_send, self.shift_recv, op=MPI.SUM)
+        self.shift_pending = (req, block)
+
+    def print_block(self, comm, block, walker_factors):
+        self._check_error()
+        handler = self.handler
+        ix = self.current
+        if comm.rank == 0:
+            # Wait for the worker to finish with this receive buffer.
+            self.free[ix].wait()
+            self.free[ix].clear()
+        self.send[ix][:] = handler.local_estimates
+        self.send[ix][: walker_factors.size] = walker_factors.buffer
+        req = comm.Ireduce(self.send[ix], self.recv[ix], op=MPI.SUM, root=0)
+        self._update_shift(comm, block, walker_factors)
+        self._complete_pending()
+        self.pending = (req, ix, block, walker_factors)
+        self.current = (ix + 1) % 2
+
+    def wait(self):
+        """Complete the pending reduction and wait for the output thread."""
+        self._complete_pending()
+        if self.thread is not None:
+            for event in self.free:
+                event.wait()
+        self._check_error()
+
+    def close(self):
+        self._complete_pending()
+        if self.shift_pending is not None:
+            self.shift_pending[0].Wait()
+            self.shift_pending = None
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        self._check_error()
@@ -55,12 +55,15 @@ def local_energy_batch(system, hamiltonian, walkers, trial):
 
     if isinstance(walkers, UHFWalkers):
         if config.get_option("use_gpu"):
+            max_mem = config.get_option("max_memory_sd_energy_gpu")
             if hamiltonian.chunked:
                 return local_energy_single_det_uhf_batch_chunked_gpu(
-                    system, hamiltonian, walkers, trial
+                    system, hamiltonian, walkers, trial, max_mem=max_mem
                 )
             else:
-                return local_energy_single_det_batch_gpu(system, hamiltonian, walkers, trial)
+                return local_energy_single_det_batch_gpu(
+                    system, hamiltonian, walkers, trial, max_mem=max_mem
+                )
         elif walkers.rhf:
             return local_energy_single_det_rhf_batch(system, hamiltonian, walkers, trial)
         else:
@@ -26,7 +26,9 @@ from ipie.utils.backend import arraylib as xp
 from ipie.utils.backend import synchronize
 
 from ipie.systems.generic import Generic
+from ipie.estimators.generic import thc_jk_batch_uhf
 from ipie.hamiltonians.generic import GenericRealChol, GenericComplexChol
+from ipie.hamiltonians.thc import GenericRealTHC
 from ipie.walkers.uhf_walkers import UHFWalkers
 from ipie.walkers.ghf_walkers import GHFWalkers
 from ipie.trial_wavefunction.single_det import SingleDet
@@ -459,6 +461,50 @@ def local_energy_single_det_uhf_batch(
     return energy
 
 
+@plum.dispatch
+def local_energy_single_det_uhf_batch(
+    system: Generic, hamiltonian: GenericRealTHC, walkers: UHFWalkers, trial: SingleDet
+):
+    """Compute local energy for walker batch (all walkers at once).
+
+    Single determinant UHF case with THC factorized integrals.
+
+    Parameters
+    ----------
+    system : system object
+        System being studied.
+    hamiltonian : hamiltonian object
+        Hamiltonian being studied.
+    walkers : WalkerBatch
+        Walkers object.
+    trial : trial object
+        Trial wavefunctioni.
+
+    Returns
+    -------
+    local_energy : np.ndarray
+        Total, one-body and two-body energies.
+    """
+    nwalkers = walkers.Ghalfa.shape[0]
+    Ghalfb = walkers.Ghalfa if walkers.rhf else walkers.Ghalfb
+
+    Ghalfa_batch = walkers.Ghalfa.reshape((nwalkers, -1))
+    Ghalfb_batch = Ghalfb.reshape((nwalkers, -1))
+
+    e1b = Ghalfa_batch.dot(trial._rH1a.ravel())
+    e1b += Ghalfb_batch.dot(trial._rH1b.ravel())
+    e1b += hamiltonian.ecore
+
+    ecoul, exx = thc_jk_batch_uhf(hamiltonian, trial._rXa, trial._rXb, walkers.Ghalfa, Ghalfb)
+    e2b = ecoul - exx
+
+    energy = xp.zeros((nwalkers, 3), dtype=numpy.complex128)
+    energy[:, 0] = e1b + e2b
+    energy[:, 1] = e1b
+    energy[:, 2] = e2b
+    return energy
+
+
 def two_body_energy_uhf(trial, walkers):
     """Compute two body energy only.
 
@@ -1398,15 +1398,16 @@ def local_energy_multi_det_trial_wicks_batch_opt_chunked_gpu(
     return walker_energies
 
 
-def local_energy_multi_det_trial_wicks_batch_opt_chunked(system, ham, walkers, trial, max_mem=2.0):
-
+def local_energy_multi_det_trial_wicks_batch_opt_chunked(system, ham, walkers, trial, max_mem=None):
+    if max_mem is None:
+        max_mem = config.get_option("max_memory_for_wicks")
     if config.get_option("use_gpu"):
         return local_energy_multi_det_trial_wicks_batch_opt_chunked_gpu(
-            system, ham, walkers, trial, max_mem=2.0
+            system, ham, walkers, trial, max_mem=max_mem
         )
     else:
         return local_energy_multi_det_trial_wicks_batch_opt_chunked_cpu(
-            system, ham, walkers, trial, max_mem=2.0
+            system, ham, walkers, trial, max_mem=max_mem
         )
 
 
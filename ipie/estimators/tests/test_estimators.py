@@ -17,10 +17,14 @@
 
 import tempfile
 
+import h5py
+import numpy
 import pytest
 
+from ipie.analysis.extraction import extract_hdf5_data
 from ipie.estimators.energy import EnergyEstimator
 from ipie.estimators.handler import EstimatorHandler
+from ipie.estimators.utils import H5EstimatorHelper, H5EstimatorWriter
 from ipie.utils.testing import gen_random_test_instances
 
 
@@ -74,3 +78,49 @@ def test_estimator_handler():
         handler.initialize(comm)
         handler.compute_estimators(system, ham, trial, walker_batch)
         handler.compute_estimators(system, ham, trial, walker_batch)
+
+
+def _write_layout_metadata(filename, base, shape):
+    with h5py.File(filename, "a") as fh5:
+        fh5[f"{base}/num_walker_props"] = 1
+        fh5[f"{base}/walker_prop_header"] = ["Weight"]
+        fh5[f"{base}/shape/energy"] = (shape[0] - 1,)
+        fh5[f"{base}/size/energy"] = shape[0] - 1
+        fh5[f"{base}/scalar/energy"] = 1
+        fh5[f"{base}/names/energy"] = "E"
+        fh5[f"{base}/offset/energy"] = 1
+
+
+@pytest.mark.unit
+def test_estimator_writer():
+    numpy.random.seed(7)
+    nblock = 23
+    shape = (4,)
+    data = numpy.random.random((nblock,) + shape) + 1j * numpy.random.random((nblock,) + shape)
+    with tempfile.NamedTemporaryFile() as tmp1, tempfile.NamedTemporaryFile() as tmp2:
+        with h5py.File(tmp1.name, "w"):
+            pass
+        _write_layout_metadata(tmp1.name, "block_size_1", shape)
+        writer = H5EstimatorWriter(
+            tmp1.name, "block_size_1", shape=shape, chunk_size=5, flush_freq=3, compression="gzip"
+        )
+        for i in range(nblock):
+            writer.push(data[i])
+            # Only full buffers have been written so far.
+            with h5py.File(tmp1.name, "r") as fh5:
+                assert fh5["block_size_1/data"].shape[0] == 3 * ((i + 1) // 3)
+        writer.close()
+        writer.close()
+        new, shapes = extract_hdf5_data(tmp1.name)
+        assert numpy.allclose(new, data.real)
+        assert shapes["energy"]["offset"] == 1
+        # Old padded chunk layout is still readable.
+        with h5py.File(tmp2.name, "w"):
+            pass
+        helper = H5EstimatorHelper(tmp2.name, base="block_size_1", chunk_size=5, shape=shape)
+        _write_layout_metadata(tmp2.name, "block_size_1", shape)
+        for i in range(nblock):
+            helper.push_to_chunk(data[i], "data")
+            helper.increment()
+        old, _ = extract_hdf5_data(tmp2.name)
+        assert numpy.allclose(old, new)
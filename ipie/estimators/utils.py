@@ -16,6 +16,8 @@
 #          Joonho Lee
 #
 
+import atexit
+
 import h5py
 import numpy
 import scipy
@@ -97,6 +99,114 @@ class H5EstimatorHelper(object):
         self.index = 0
 
 
+class H5EstimatorWriter(object):
+    """Append-only writer for block estimates.
+
+    Unlike :class:`H5EstimatorHelper` the file is opened once and kept open
+    for the whole run. Estimates are appended to a single resizable, chunked
+    dataset ``base/data`` of shape (num_blocks,) + shape.
+
+    Parameters
+    ----------
+    filename : str
+        Output file name. The file must already exist.
+    base : str
+        Group name under which the dataset is created.
+    shape : tuple
+        Shape of the data pushed every block.
+    chunk_size : int
+        Maximum number of blocks stored in a single hdf5 chunk.
+    flush_freq : int
+        Number of blocks buffered in memory before they are written and the
+        file is flushed.
+    compression : str
+        hdf5 compression filter ("gzip", "lzf" or "none").
+    num_rows : int
+        Optional. Append to the existing dataset after truncating it to the
+        first num_rows blocks (e.g. when restarting from a checkpoint).
+
+    Attributes
+    ----------
+    index : int
+        Number of blocks pushed so far.
+    """
+
+    def __init__(
+        self,
+        filename,
+        base,
+        shape=(1,),
+        chunk_size=1000,
+        flush_freq=1,
+        compression="none",
+        num_rows=None,
+    ):
+        self.filename = filename
+        self.base = base
+        self.shape = shape
+        self.index = 0
+        self.flush_freq = max(int(flush_freq), 1)
+        dtype = numpy.dtype(numpy.complex128)
+        # Keep individual chunks at around 1 MB at most.
+        row_bytes = max(int(numpy.prod(shape)) * dtype.itemsize, 1)
+        chunk_rows = max(1, min(chunk_size, (1024**2) // row_bytes))
+        if compression is None or compression == "none":
+            compression = None
+        self.fh5 = h5py.File(filename, "a")
+        if num_rows is not None:
+            self.dset = self.fh5[f"{base}/data"]
+            num_rows = min(num_rows, self.dset.shape[0])
+            self.dset.resize(num_rows, axis=0)
+            self.index = num_rows
+        else:
+            self.dset = self.fh5.create_dataset(
+                f"{base}/data",
+                shape=(0,) + shape,
+                maxshape=(None,) + shape,
+                chunks=(chunk_rows,) + shape,
+                dtype=dtype,
+                compression=compression,
+            )
+        self._buffer = numpy.zeros((self.flush_freq,) + shape, dtype=dtype)
+        self._num_buffered = 0
+        atexit.register(self.close)
+
+    def push(self, data):
+        """Append a block of data.
+
+        Parameters
+        ----------
+        data : :class:`numpy.ndarray`
+            Data to push.
+        """
+        self._buffer[self._num_buffered] = data
+        self._num_buffered += 1
+        self.index += 1
+        if self._num_buffered == self.flush_freq:
+            self.flush()
+
+    def flush(self):
+        """Write buffered blocks to the dataset and flush the file."""
+        if self.fh5 is None:
+            return
+        if self._num_buffered > 0:
+            start = self.dset.shape[0]
+            end = start + self._num_buffered
+            self.dset.resize(end, axis=0)
+            self.dset[start:end] = self._buffer[: self._num_buffered]
+            self._num_buffered = 0
+        self.fh5.flush()
+
+    def close(self):
+        if self.fh5 is None:
+            return
+        self.flush()
+        self.fh5.close()
+        self.fh5 = None
+        self.dset = None
+        atexit.unregister(self.close)
+
+
 def gab_mod(A, B):
     r"""One-particle Green's function.
 
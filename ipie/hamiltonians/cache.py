@@ -0,0 +1,277 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""On-disk cache of processed Cholesky Hamiltonians.
+
+The transposed and packed Cholesky vectors and the modified one-body
+Hamiltonian are written to an hdf5 file in the cache directory named after a
+hash of the integral file and the processing options. The datasets are stored
+contiguously so later runs memory-map them read-only, which also shares them
+between the tasks of a node through the page cache.
+
+Half-rotated integrals of a trial wavefunction are stored next to them, keyed
+by the Hamiltonian and the trial orbitals, and read back into shared memory.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from typing import Optional
+
+import h5py
+import numpy
+
+from ipie.config import config
+from ipie.utils.mpi import get_shared_array
+
+_HASH_BLOCK_SIZE = 64 * 1024**2
+
+
+def _tmp_filename(filename: str) -> str:
+    # Unique across hosts sharing the file system.
+    return f"{filename}.{uuid.uuid4().hex}.tmp"
+
+
+def _file_hash(filename: str, cache_dir: str) -> str:
+    # Hashing is as expensive as reading the file so the hash is remembered
+    # for a given path, size and modification time.
+    stat = os.stat(filename)
+    stat_key = f"{os.path.abspath(filename)}:{stat.st_size}:{stat.st_mtime_ns}"
+    index_file = os.path.join(cache_dir, "hashes.json")
+    index = {}
+    if os.path.exists(index_file):
+        try:
+            with open(index_file, "r") as f:
+                index = json.load(f)
+        except ValueError:
+            index = {}
+    if stat_key in index:
+        return index[stat_key]
+    digest = hashlib.blake2b(digest_size=20)
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    index[stat_key] = digest.hexdigest()
+    tmp_file = _tmp_filename(index_file)
+    with open(tmp_file, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_file, index_file)
+    return index[stat_key]
+
+
+def get_cache_key(filename: str, cache_dir: str, pack_chol: bool = True) -> str:
+    """Hash of the integrals in filename and the processing options.
+
+    Parameters
+    ----------
+    filename : str
+        Hamiltonian file.
+    cache_dir : str
+        Cache directory. Created if it does not exist.
+    pack_chol : bool
+        Whether the packed Cholesky vectors are built (see get_hamiltonian).
+
+    Returns
+    -------
+    key : str
+        Hex digest identifying the processed integrals.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    # Options which change the processed integrals.
+    options = {
+        "mixed_precision": bool(config.get_option("mixed_precision")),
+        "pack_chol": bool(pack_chol),
+    }
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(_file_hash(filename, cache_dir).encode())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def get_cache_filename(filename: str, cache_dir: str, pack_chol: bool = True) -> str:
+    """Cache file for the processed integrals in filename.
+
+    Parameters
+    ----------
+    filename : str
+        Hamiltonian file.
+    cache_dir : str
+        Cache directory. Created if it does not exist.
+    pack_chol : bool
+        Whether the packed Cholesky vectors are built (see get_hamiltonian).
+
+    Returns
+    -------
+    cache_file : str
+        Path of the (possibly not yet existing) cache file.
+    """
+    key = get_cache_key(filename, cache_dir, pack_chol=pack_chol)
+    return os.path.join(cache_dir, f"hamiltonian_{key}.h5")
+
+
+def write_cached_hamiltonian(cache_file: str, ham) -> None:
+    """Write the processed integrals of a GenericRealChol object.
+
+    The file is written to a temporary file first which then atomically
+    replaces cache_file, so concurrent writers and failures are harmless.
+    """
+    tmp_file = _tmp_filename(cache_file)
+    with h5py.File(tmp_file, "w") as fh5:
+        fh5["H1"] = ham.H1
+        fh5["h1e_mod"] = numpy.asarray(ham.h1e_mod)
+        fh5["ecore"] = ham.ecore
+        # Contiguous (unchunked, uncompressed) so the data can be memory-mapped.
+        fh5.create_dataset("chol", data=ham.chol, chunks=None)
+        fh5.create_dataset("chol_packed", data=ham.chol_packed, chunks=None)
+    os.replace(tmp_file, cache_file)
+
+
+def _memmap_dataset(filename, dset):
+    offset = dset.id.get_offset()
+    if offset is None:
+        # Empty datasets have no storage.
+        return numpy.zeros(dset.shape, dtype=dset.dtype)
+    return numpy.memmap(filename, dtype=dset.dtype, mode="r", offset=offset, shape=dset.shape)
+
+
+def read_cached_hamiltonian(cache_file: str) -> Optional[dict]:
+    """Read cached integrals, memory-mapping the Cholesky vectors.
+
+    Returns
+    -------
+    data : dict or None
+        H1, h1e_mod, ecore, chol and chol_packed, or None if there is no
+        valid cache file.
+    """
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with h5py.File(cache_file, "r") as fh5:
+            data = {
+                "H1": fh5["H1"][()],
+                "h1e_mod": fh5["h1e_mod"][()],
+                "ecore": float(fh5["ecore"][()]),
+            }
+            for name in ("chol", "chol_packed"):
+                data[name] = _memmap_dataset(cache_file, fh5[name])
+    except (OSError, KeyError):
+        return None
+    return data
+
+
+def array_hash(*arrays) -> str:
+    """Hash of the shapes, types and contents of a sequence of arrays."""
+    digest = hashlib.blake2b(digest_size=20)
+    for array in arrays:
+        array = numpy.ascontiguousarray(array)
+        digest.update(f"{array.shape}:{array.dtype.str}".encode())
+        digest.update(memoryview(array.reshape(-1)).cast("B"))
+    return digest.hexdigest()
+
+
+def get_half_rotation_cache_filename(hamiltonian, orbsa, orbsb, cache_dir: str) -> str:
+    """Cache file for the half-rotated integrals of a trial wavefunction.
+
+    Parameters
+    ----------
+    hamiltonian : object
+        Cholesky Hamiltonian with the cache_key set by get_hamiltonian when the
+        Hamiltonian cache is enabled.
+    orbsa : :class:`numpy.ndarray`
+        Alpha orbitals of shape (ndets, nbasis, nalpha).
+    orbsb : :class:`numpy.ndarray`
+        Beta orbitals of shape (ndets, nbasis, nbeta).
+    cache_dir : str
+        Cache directory. Created if it does not exist.
+
+    Returns
+    -------
+    cache_file : str
+        Path of the (possibly not yet existing) cache file.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{type(hamiltonian).__name__}:{hamiltonian.cache_key}".encode())
+    digest.update(array_hash(orbsa, orbsb).encode())
+    return os.path.join(cache_dir, f"half_rotated_{digest.hexdigest()}.h5")
+
+
+def write_half_rotated(cache_file: str, rot_1body, rot_chol) -> None:
+    """Write half-rotated integrals as returned by half_rotate_generic.
+
+    rot_chol holds either one array per spin or, for complex Hamiltonians, a
+    list of arrays per spin.
+    """
+    tmp_file = _tmp_filename(cache_file)
+    with h5py.File(tmp_file, "w") as fh5:
+        fh5["rH1a"], fh5["rH1b"] = rot_1body
+        fh5.attrs["is_list"] = isinstance(rot_chol[0], list)
+        for name, rchol in zip(("rchola", "rcholb"), rot_chol):
+            terms = rchol if isinstance(rchol, list) else [rchol]
+            for i, term in enumerate(terms):
+                fh5[f"{name}/{i}"] = term
+    os.replace(tmp_file, cache_file)
+
+
+def read_half_rotated(cache_file: str, comm) -> Optional[tuple]:
+    """Read half-rotated integrals into (node shared) memory.
+
+    The Cholesky index is split over the tasks of comm which read their block
+    directly into the shared arrays. Collective over comm.
+
+    Returns
+    -------
+    rot : tuple or None
+        (rH1a, rH1b), (rchola, rcholb) as returned by half_rotate_generic, or
+        None if there is no valid cache file.
+    """
+    rank, size = (0, 1) if comm is None else (comm.rank, comm.size)
+    header = None
+    if rank == 0 and os.path.exists(cache_file):
+        try:
+            with h5py.File(cache_file, "r") as fh5:
+                names = ["rH1a", "rH1b"]
+                for name in ("rchola", "rcholb"):
+                    names += [f"{name}/{i}" for i in range(len(fh5[name]))]
+                header = {
+                    "is_list": bool(fh5.attrs["is_list"]),
+                    "datasets": [(n, fh5[n].shape, fh5[n].dtype) for n in names],
+                }
+        except (OSError, KeyError):
+            header = None
+    if comm is not None:
+        header = comm.bcast(header, root=0)
+    if header is None:
+        return None
+    data = {}
+    with h5py.File(cache_file, "r") as fh5:
+        for name, shape, dtype in header["datasets"]:
+            data[name] = get_shared_array(comm, shape, dtype)
+            if name.startswith("rH1"):
+                if rank == 0:
+                    data[name][:] = fh5[name][()]
+                continue
+            nchol = shape[1]
+            start = rank * nchol // size
+            end = (rank + 1) * nchol // size
+            if end > start:
+                data[name][:, start:end] = fh5[name][:, start:end]
+    if comm is not None:
+        comm.barrier()
+    rchol = []
+    for name in ("rchola", "rcholb"):
+        terms = [data[n] for n, _, _ in header["datasets"] if n.startswith(f"{name}/")]
+        rchol.append(terms if header["is_list"] else terms[0])
+    return (data["rH1a"], data["rH1b"]), tuple(rchol)
@@ -17,6 +17,7 @@
 #
 
 import numpy
+from ipie.config import config
 from ipie.hamiltonians.generic_base import GenericBase
 from ipie.utils.pack_numba import pack_cholesky
 from ipie.utils.backend import arraylib as xp
@@ -24,6 +25,7 @@ from ipie.utils.backend import arraylib as xp
 from ipie.utils.io import (
     from_qmcpack_dense,
     from_qmcpack_sparse,
+    get_hamiltonian_format,
     read_hamiltonian,
 )
 
@@ -48,7 +50,9 @@ class GenericRealChol(GenericBase):
     Can be created by passing the one and two electron integrals directly.
     """
 
-    def __init__(self, h1e, chol, ecore=0.0, shmem=False, chol_packed=None, verbose=False):
+    def __init__(
+        self, h1e, chol, ecore=0.0, shmem=False, chol_packed=None, verbose=False, h1e_mod=None
+    ):
         assert (
             h1e.shape[0] == 2
         )  # assuming each spin component is given. this should be fixed for GHF...?
@@ -64,10 +68,13 @@ class GenericRealChol(GenericBase):
         self.sym_idx = numpy.triu_indices(self.nbasis)
         self.sym_idx_i = self.sym_idx[0].copy()
         self.sym_idx_j = self.sym_idx[1].copy()
-        if not shmem:
+        # The packed Cholesky vectors are only used to build the HS potential.
+        self.mixed_precision = config.get_option("mixed_precision")
+        if chol_packed is None:
             self.chol = self.chol.reshape((self.nbasis, self.nbasis, self.nchol))
             cp_shape = (self.nbasis * (self.nbasis + 1) // 2, self.chol.shape[-1])
-            self.chol_packed = numpy.zeros(cp_shape, dtype=self.chol.dtype)
+            cp_dtype = numpy.float32 if self.mixed_precision else self.chol.dtype
+            self.chol_packed = numpy.zeros(cp_shape, dtype=cp_dtype)
             pack_cholesky(self.sym_idx[0], self.sym_idx[1], self.chol_packed, self.chol)
             self.chol = self.chol.reshape((self.nbasis * self.nbasis, self.nchol))
         else:
@@ -77,8 +84,9 @@ class GenericRealChol(GenericBase):
         self.chunked = False
 
         # this is the one-body part that comes out of re-ordering the 2-body operators
-        h1e_mod = numpy.zeros(self.H1.shape, dtype=self.H1.dtype)
-        construct_h1e_mod(self.chol, self.H1, h1e_mod)
+        if h1e_mod is None:
+            h1e_mod = numpy.zeros(self.H1.shape, dtype=self.H1.dtype)
+            construct_h1e_mod(self.chol, self.H1, h1e_mod)
         self.h1e_mod = xp.array(h1e_mod)
 
         if verbose:
@@ -90,6 +98,8 @@ class GenericRealChol(GenericBase):
             print(f"# Approximate memory required total {mem_packed + mem:f} GB")
             print("# Number of Cholesky vectors: %d" % (self.nchol))
             print("# Number of fields: %d" % (self.nchol))
+            if self.mixed_precision:
+                print("# mixed_precision is used for the propagation")
             print("# Finished setting up GenericRealChol object.")
 
     def hijkl(self, i, j, k, l):  # (ik|jl) somehow physicist notation - terrible!!
@@ -150,29 +160,28 @@ class GenericComplexChol(GenericBase):
         return numpy.dot(chol_ik, chol_lj.conj())
 
 
-def Generic(h1e, chol, ecore=0.0, shmem=False, chol_packed=None, verbose=False):
+def Generic(h1e, chol, ecore=0.0, shmem=False, chol_packed=None, verbose=False, h1e_mod=None):
     if chol.dtype == numpy.dtype("complex128"):
         return GenericComplexChol(h1e, chol, ecore, verbose)
     elif chol.dtype == numpy.dtype("float64"):
-        return GenericRealChol(h1e, chol, ecore, shmem, chol_packed, verbose)
+        return GenericRealChol(h1e, chol, ecore, shmem, chol_packed, verbose, h1e_mod=h1e_mod)
 
 
 def read_integrals(integral_file):
     try:
+        fmt = get_hamiltonian_format(integral_file)
+    except KeyError:
+        return None
+    if fmt == "qmcpack_sparse":
         (h1e, schol_vecs, ecore, _, _, _) = from_qmcpack_sparse(integral_file)
         chol_vecs = schol_vecs.toarray()
         return h1e, chol_vecs, ecore
-    except KeyError:
-        pass
-    try:
+    elif fmt == "qmcpack_dense":
         (h1e, chol_vecs, ecore, _, _, _) = from_qmcpack_dense(integral_file)
         return h1e, chol_vecs, ecore
-    except KeyError:
-        pass
-    try:
+    elif fmt == "ipie":
         (h1e, chol_vecs, ecore) = read_hamiltonian(integral_file)
         naux = chol_vecs.shape[0]
         nbsf = chol_vecs.shape[-1]
         return h1e, chol_vecs.T.reshape((nbsf, nbsf, naux)), ecore
-    except KeyError:
-        return None
+    return None
@@ -0,0 +1,113 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import os
+import tempfile
+
+import numpy
+import pytest
+
+from ipie.analysis.extraction import extract_observable
+from ipie.config import config
+from ipie.hamiltonians.cache import get_cache_filename
+from ipie.hamiltonians.utils import get_hamiltonian
+from ipie.qmc.afqmc import AFQMC
+from ipie.utils.io import write_hamiltonian, write_wavefunction
+from ipie.utils.mpi import MPIHandler
+from ipie.utils.testing import generate_hamiltonian
+
+
+@pytest.mark.unit
+def test_hamiltonian_cache():
+    nmo = 8
+    numpy.random.seed(7)
+    h1e, chol, enuc, _ = generate_hamiltonian(nmo, (3, 3), cplx=False, sym=8)
+    scomm = MPIHandler().scomm
+    cache_dir = config.get_option("hamiltonian_cache_dir")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config.update_option("hamiltonian_cache_dir", os.path.join(tmpdir, "cache"))
+        try:
+            filename = os.path.join(tmpdir, "hamiltonian.h5")
+            write_hamiltonian(h1e, chol, enuc, filename=filename)
+            ref = get_hamiltonian(filename, scomm)
+            assert len(glob.glob(os.path.join(tmpdir, "cache", "hamiltonian_*.h5"))) == 1
+            ham = get_hamiltonian(filename, scomm)
+            assert isinstance(ham.chol, numpy.memmap)
+            assert not ham.chol_packed.flags.writeable
+            for name in ["H1", "h1e_mod", "chol", "chol_packed"]:
+                numpy.testing.assert_allclose(getattr(ham, name), getattr(ref, name))
+            assert ham.ecore == pytest.approx(enuc)
+            # Different integrals or processing options use a different entry.
+            key = get_cache_filename(filename, config.get_option("hamiltonian_cache_dir"))
+            config.update_option("mixed_precision", True)
+            try:
+                assert get_cache_filename(filename, os.path.join(tmpdir, "cache")) != key
+            finally:
+                config.update_option("mixed_precision", False)
+            assert (
+                get_cache_filename(filename, os.path.join(tmpdir, "cache"), pack_chol=False) != key
+            )
+            get_hamiltonian(filename, scomm, pack_chol=False)
+            assert len(glob.glob(os.path.join(tmpdir, "cache", "hamiltonian_*.h5"))) == 2
+            assert not glob.glob(os.path.join(tmpdir, "cache", "*.tmp"))
+            write_hamiltonian(h1e, 2 * chol, enuc, filename=filename)
+            assert get_cache_filename(filename, os.path.join(tmpdir, "cache")) != key
+            ham = get_hamiltonian(filename, scomm)
+            numpy.testing.assert_allclose(ham.chol, 2 * ref.chol)
+        finally:
+            config.update_option("hamiltonian_cache_dir", cache_dir)
+
+
+@pytest.mark.driver
+def test_hamiltonian_cache_driver():
+    nmo = 8
+    nelec = (3, 3)
+    numpy.random.seed(7)
+    h1e, chol, enuc, _ = generate_hamiltonian(nmo, nelec, cplx=False, sym=8)
+    wfn = [numpy.eye(nmo)[:, : nelec[0]], numpy.eye(nmo)[:, : nelec[1]]]
+    cache_dir = config.get_option("hamiltonian_cache_dir")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ham_file = os.path.join(tmpdir, "hamiltonian.h5")
+        wfn_file = os.path.join(tmpdir, "wavefunction.h5")
+        write_hamiltonian(h1e, chol, enuc, filename=ham_file)
+        write_wavefunction(wfn, filename=wfn_file)
+        energies = []
+        for directory in ["", os.path.join(tmpdir, "cache"), os.path.join(tmpdir, "cache")]:
+            config.update_option("hamiltonian_cache_dir", directory)
+            try:
+                afqmc = AFQMC.build_from_hdf5(
+                    nelec,
+                    ham_file,
+                    wfn_file,
+                    num_walkers=4,
+                    num_steps_per_block=2,
+                    num_blocks=2,
+                    seed=7,
+                    verbose=False,
+                )
+                estimates = os.path.join(tmpdir, "estimates.0.h5")
+                afqmc.run(verbose=False, estimator_filename=estimates)
+            finally:
+                config.update_option("hamiltonian_cache_dir", cache_dir)
+            energies.append(extract_observable(estimates, "energy")["ETotal"].values)
+        assert isinstance(afqmc.hamiltonian.chol, numpy.memmap)
+        assert len(glob.glob(os.path.join(tmpdir, "cache", "half_rotated_*.h5"))) == 1
+        numpy.testing.assert_allclose(energies[1], energies[0])
+        numpy.testing.assert_allclose(energies[2], energies[0])
+
+
+if __name__ == "__main__":
+    test_hamiltonian_cache()
+    test_hamiltonian_cache_driver()
@@ -0,0 +1,148 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+
+import numpy
+import pytest
+
+from ipie.analysis.extraction import extract_observable
+from ipie.estimators.energy import local_energy
+from ipie.hamiltonians.generic import GenericRealChol
+from ipie.hamiltonians.thc import GenericRealTHC
+from ipie.hamiltonians.utils import get_hamiltonian
+from ipie.propagation.phaseless_generic import PhaselessGeneric
+from ipie.qmc.afqmc import AFQMC
+from ipie.systems.generic import Generic
+from ipie.utils.io import write_hamiltonian, write_wavefunction
+from ipie.utils.mpi import MPIHandler
+from ipie.utils.testing import build_random_single_det_trial, generate_hamiltonian
+from ipie.utils.thc import convert_cholesky_to_thc, thc_from_cholesky
+from ipie.walkers.walkers_dispatch import UHFWalkersTrial
+
+
+def _build_hamiltonians(nmo, nelec, nthc):
+    numpy.random.seed(7)
+    h1e, chol, _, _ = generate_hamiltonian(nmo, nelec, cplx=False, tol=1e-6)
+    ham = GenericRealChol(numpy.array([h1e, h1e]), chol.reshape(-1, nmo * nmo).T.copy(), 0.0)
+    X, U, _ = thc_from_cholesky(chol, nthc)
+    thc = GenericRealTHC(numpy.array([h1e, h1e]), X, U, 0.0)
+    return ham, thc
+
+
+@pytest.mark.unit
+def test_thc_from_cholesky():
+    nmo = 8
+    numpy.random.seed(7)
+    _, chol, _, eri = generate_hamiltonian(nmo, (3, 3), cplx=False, tol=1e-6)
+    errors = [thc_from_cholesky(chol, nthc)[2] for nthc in (8, 16, 24)]
+    assert errors[0] > errors[1] > errors[2] > 0
+    # The Cholesky vectors are symmetric so nmo * (nmo + 1) / 2 rank one
+    # projectors are enough for an exact factorization.
+    X, U, error = thc_from_cholesky(chol, 100)
+    assert X.shape[1] == nmo * (nmo + 1) // 2
+    assert U.shape[1] <= chol.shape[0]
+    assert error < 1e-6
+    ham = GenericRealTHC(numpy.zeros((2, nmo, nmo)), X, U)
+    eri_thc = numpy.einsum("pqn,rsn->pqrs", *(2 * [ham.get_cholesky().reshape(nmo, nmo, -1)]))
+    numpy.testing.assert_allclose(eri_thc, eri, atol=1e-10)
+    assert ham.hijkl(1, 2, 3, 4) == pytest.approx(eri[1, 3, 2, 4])
+
+
+@pytest.mark.unit
+def test_thc_kernels():
+    nmo = 10
+    nelec = (4, 3)
+    nwalkers = 5
+    ham, thc = _build_hamiltonians(nmo, nelec, 100)
+    numpy.testing.assert_allclose(thc.h1e_mod, ham.h1e_mod, atol=1e-12)
+    system = Generic(nelec)
+    trial, init = build_random_single_det_trial(nelec, nmo)
+    trial.half_rotate(ham)
+    trial.calculate_energy(system, ham)
+    energy_chol = trial.energy
+    trial.half_rotate(thc)
+    trial.calculate_energy(system, thc)
+    assert trial.energy == pytest.approx(energy_chol)
+
+    walkers = UHFWalkersTrial(trial, init, nelec[0], nelec[1], nmo, nwalkers, MPIHandler())
+    walkers.build(trial)
+    prop = PhaselessGeneric(0.01)
+    prop.build(ham, trial, walkers)
+    prop_thc = PhaselessGeneric(0.01)
+    prop_thc.build(thc, trial, walkers)
+    numpy.testing.assert_allclose(prop_thc.expH1, prop.expH1, atol=1e-12)
+    for _ in range(4):
+        prop.propagate_walkers(walkers, ham, trial, trial.energy)
+        walkers.reortho()
+    trial.calc_greens_function(walkers)
+    numpy.testing.assert_allclose(
+        local_energy(system, thc, walkers, trial),
+        local_energy(system, ham, walkers, trial),
+        atol=1e-10,
+    )
+    # The fields differ between the two factorizations but sum_n v_n L^n does
+    # not.
+    vbias = trial.calc_force_bias(ham, walkers, MPIHandler())
+    vbias_thc = trial.calc_force_bias(thc, walkers, MPIHandler())
+    numpy.testing.assert_allclose(
+        prop_thc.construct_VHS(thc, vbias_thc.T.copy()),
+        prop.construct_VHS(ham, vbias.T.copy()),
+        atol=1e-12,
+    )
+
+
+@pytest.mark.driver
+def test_thc_driver():
+    nmo = 8
+    nelec = (3, 3)
+    numpy.random.seed(7)
+    h1e, chol, _, _ = generate_hamiltonian(nmo, nelec, cplx=False, tol=1e-6)
+    wfn = [numpy.eye(nmo)[:, : nelec[0]], numpy.eye(nmo)[:, : nelec[1]]]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ham_file = os.path.join(tmpdir, "hamiltonian.h5")
+        thc_file = os.path.join(tmpdir, "hamiltonian_thc.h5")
+        wfn_file = os.path.join(tmpdir, "wavefunction.h5")
+        write_hamiltonian(h1e, chol, 0.0, filename=ham_file)
+        write_wavefunction(wfn, filename=wfn_file)
+        error = convert_cholesky_to_thc(ham_file, thc_file, 100, verbose=False)
+        assert error < 1e-6
+        assert isinstance(get_hamiltonian(thc_file, MPIHandler().scomm), GenericRealTHC)
+        energies = []
+        for filename in (ham_file, thc_file):
+            afqmc = AFQMC.build_from_hdf5(
+                nelec,
+                filename,
+                wfn_file,
+                num_walkers=4,
+                num_steps_per_block=2,
+                num_blocks=2,
+                seed=7,
+                verbose=False,
+            )
+            # The planner does not model the THC footprint.
+            assert (afqmc.memory_plan is None) == isinstance(afqmc.hamiltonian, GenericRealTHC)
+            estimates = os.path.join(tmpdir, "estimates.0.h5")
+            afqmc.run(verbose=False, estimator_filename=estimates)
+            energies.append(extract_observable(estimates, "energy")["ETotal"].values)
+        # The first block is the trial energy.
+        assert energies[1][0] == pytest.approx(energies[0][0])
+        assert numpy.all(numpy.isfinite(energies[1]))
+
+
+if __name__ == "__main__":
+    test_thc_from_cholesky()
+    test_thc_kernels()
+    test_thc_driver()
@@ -0,0 +1,101 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy
+
+from ipie.hamiltonians.generic_base import GenericBase
+from ipie.utils.backend import arraylib as xp
+
+
+def thc_to_cholesky(X, U):
+    """Cholesky vectors L[pq, n] = sum_P X[p, P] X[q, P] U[P, n] of THC factors.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        Collocation matrix of shape (nbasis, nthc).
+    U : numpy.ndarray
+        Factor of the central tensor Z = U U^T, shape (nthc, nchol).
+
+    Returns
+    -------
+    chol : numpy.ndarray
+        Cholesky vectors of shape (nbasis * nbasis, nchol).
+    """
+    nbasis = X.shape[0]
+    return numpy.einsum("pP,qP,Pn->pqn", X, X, U, optimize=True).reshape(nbasis * nbasis, -1)
+
+
+class GenericRealTHC(GenericBase):
+    r"""Ab-initio Hamiltonian with tensor hypercontracted two electron integrals.
+
+    The integrals are stored as a collocation matrix X and central tensor
+    Z = U U^T,
+
+    .. math::
+
+        (pq|rs) = \sum_{PQ} X_{pP} X_{qP} Z_{PQ} X_{rQ} X_{sQ},
+
+    i.e. the Cholesky vectors are :math:`L_{pq,n} = \sum_P X_{pP} X_{qP}
+    U_{Pn}` but are never formed. Memory is O(M nthc + nthc^2) instead of
+    O(M^2 nchol), the VHS is applied as X diag(U x) X^T and the exchange
+    energy costs O(N nthc^2) per walker.
+
+    Parameters
+    ----------
+    h1e : numpy.ndarray
+        One-body Hamiltonian of shape (2, nbasis, nbasis).
+    X : numpy.ndarray
+        Real collocation matrix of shape (nbasis, nthc).
+    U : numpy.ndarray
+        Real factor of the central tensor, shape (nthc, nchol). Each column
+        defines one auxiliary field.
+    ecore : float
+        Constant energy.
+    """
+
+    def __init__(self, h1e, X, U, ecore=0.0, verbose=False):
+        assert h1e.shape[0] == 2
+        super().__init__(h1e, ecore, verbose)
+        self.X = numpy.asarray(X, dtype=numpy.float64)
+        self.U = numpy.asarray(U, dtype=numpy.float64)
+        assert self.X.shape[0] == self.nbasis
+        assert self.U.shape[0] == self.X.shape[1]
+        self.nthc = self.X.shape[1]
+        self.nchol = self.U.shape[1]
+        self.nfields = self.nchol
+        self.Z = self.U.dot(self.U.T)
+        self.chunked = False
+
+        # One-body part from re-ordering the two-body operators,
+        # v0 = 1/2 sum_n L_n L_n = 1/2 X (Z o X^T X) X^T.
+        v0 = 0.5 * self.X.dot((self.Z * self.X.T.dot(self.X)).dot(self.X.T))
+        self.h1e_mod = xp.array(self.H1 - numpy.array([v0, v0]))
+
+        if verbose:
+            mem = (self.X.nbytes + self.U.nbytes + self.Z.nbytes) / (1024.0**3)
+            print("# Number of orbitals: %d" % self.nbasis)
+            print("# Number of THC interpolation vectors: %d" % self.nthc)
+            print(f"# Approximate memory required by THC factors {mem:f} GB")
+            print("# Number of fields: %d" % (self.nfields))
+            print("# Finished setting up GenericRealTHC object.")
+
+    def hijkl(self, i, j, k, l):  # (ik|jl)
+        left = self.X[i] * self.X[k]
+        right = self.X[j] * self.X[l]
+        return left.dot(self.Z).dot(right)
+
+    def get_cholesky(self) -> numpy.ndarray:
+        """Dense Cholesky vectors (nbasis * nbasis, nchol) of the factorization."""
+        return thc_to_cholesky(self.X, self.U)
@@ -16,16 +16,26 @@
 #          Joonho Lee
 #
 
+import os
 import time
 
+import h5py
 import numpy
 
-from ipie.hamiltonians.generic import construct_h1e_mod, Generic, read_integrals
+from ipie.config import config, MPI
+from ipie.hamiltonians.cache import (
+    get_cache_key,
+    read_cached_hamiltonian,
+    write_cached_hamiltonian,
+)
+from ipie.hamiltonians.generic import construct_h1e_mod, Generic, GenericRealChol, read_integrals
+from ipie.hamiltonians.thc import GenericRealTHC
+from ipie.utils.io import get_hamiltonian_format, read_thc_hamiltonian
 from ipie.utils.mpi import get_shared_array, have_shared_mem
 from ipie.utils.pack_numba import pack_cholesky
 
 
-def get_hamiltonian(filename, scomm, verbose=False, pack_chol=True):
+def get_hamiltonian(filename, scomm, verbose=False, pack_chol=True, comm=None):
     """Wrapper to select hamiltonian class with integrals in shared memory.
 
     Parameters
@@ -38,13 +48,85 @@ def get_hamiltonian(filename, scomm, verbose=False, pack_chol=True):
         Only store minimum amount of information required by integrals.
     verbose : bool
         Output verbosity.
+    comm : MPI communicator
+        Communicator of all tasks reading the Hamiltonian. Its rank 0 alone
+        hashes the input and writes the Hamiltonian cache. Default
+        MPI.COMM_WORLD.
 
     Returns
     -------
     ham : object
-        Hamiltonian class.
+        Hamiltonian class. :class:`GenericRealTHC` if filename contains THC
+        factors (see ipie.utils.thc).
     """
     start = time.time()
+    fmt = get_hamiltonian_format(filename)
+    if fmt == "thc":
+        # THC factors are small so every task reads its own copy.
+        hcore, X, U, enuc = read_thc_hamiltonian(filename)
+        if verbose:
+            print(f"# Time to read THC factors: {time.time() - start:.6f}")
+        return GenericRealTHC(
+            h1e=numpy.array([hcore, hcore]), X=X, U=U, ecore=enuc, verbose=verbose
+        )
+    cache_dir = config.get_option("hamiltonian_cache_dir")
+    cache_key = None
+    if cache_dir:
+        if comm is None:
+            comm = MPI.COMM_WORLD
+        # A single task hashes the input and decides on a hit, so all nodes agree.
+        hit = False
+        if comm.rank == 0:
+            cache_key = get_cache_key(filename, cache_dir, pack_chol=pack_chol)
+            cache_file = os.path.join(cache_dir, f"hamiltonian_{cache_key}.h5")
+            hit = os.path.exists(cache_file)
+        cache_key, hit = comm.bcast((cache_key, hit), root=0)
+        cache_file = os.path.join(cache_dir, f"hamiltonian_{cache_key}.h5")
+        data = read_cached_hamiltonian(cache_file) if hit else None
+        if data is not None:
+            if verbose:
+                print(f"# Read processed integrals from cache: {cache_file}")
+                print(f"# Time to read cached integrals: {time.time() - start:.6f}")
+            ham = GenericRealChol(
+                data["H1"],
+                data["chol"],
+                data["ecore"],
+                chol_packed=data["chol_packed"],
+                verbose=verbose,
+                h1e_mod=data["h1e_mod"],
+            )
+            # Identifies the integrals for the half-rotation cache.
+            ham.cache_key = cache_key
+            return ham
+    ham = _read_cholesky_hamiltonian(filename, fmt, scomm, verbose=verbose, pack_chol=pack_chol)
+    if cache_key is not None:
+        ham.cache_key = cache_key
+        if not hit and isinstance(ham, GenericRealChol):
+            if comm.rank == 0:
+                write_cached_hamiltonian(cache_file, ham)
+                if verbose:
+                    print(f"# Wrote processed integrals to cache: {cache_file}")
+            comm.Barrier()
+    return ham
+
+
+def _read_cholesky_hamiltonian(filename, fmt, scomm, verbose=False, pack_chol=True):
+    start = time.time()
+    if fmt == "ipie":
+        hcore, chol, chol_packed, h1e_mod, enuc = read_cholesky_streaming(
+            filename, scomm, pack_chol=pack_chol, verbose=verbose
+        )
+        if verbose:
+            print(f"# Time to read and pack integrals: {time.time() - start:.6f}")
+        return Generic(
+            h1e=hcore,
+            chol=chol,
+            ecore=enuc,
+            shmem=chol_packed is not None,
+            chol_packed=chol_packed,
+            verbose=verbose,
+            h1e_mod=h1e_mod,
+        )
     hcore, chol, _, enuc = get_generic_integrals(filename, comm=scomm, verbose=verbose)
     if verbose:
         print(f"# Time to read integrals: {time.time() - start:.6f}")
@@ -56,12 +138,17 @@ def get_hamiltonian(filename, scomm, verbose=False, pack_chol=True):
     idx = numpy.triu_indices(nbsf)
 
     chol = chol.reshape((nbsf, nbsf, nchol))
+    # Packed Cholesky vectors are only used for the HS potential (see
+    # mixed_precision).
+    packed_dtype = chol.dtype
+    if config.get_option("mixed_precision") and numpy.isrealobj(chol):
+        packed_dtype = numpy.float32
 
     shmem = have_shared_mem(scomm)
     if shmem:
         if scomm.rank == 0:
             cp_shape = (nbsf * (nbsf + 1) // 2, nchol)
-            dtype = chol.dtype
+            dtype = packed_dtype
         else:
             cp_shape = None
             dtype = None
@@ -72,11 +159,8 @@ def get_hamiltonian(filename, scomm, verbose=False, pack_chol=True):
         if scomm.rank == 0 and pack_chol:
             pack_cholesky(idx[0], idx[1], chol_packed, chol)
         scomm.Barrier()
-        chol_pack_shmem = get_shared_array(scomm, shape, dtype)
-        if scomm.rank == 0:
-            chol_pack_shmem[:] = chol_packed[:]
     else:
-        dtype = chol.dtype
+        dtype = packed_dtype
         cp_shape = (nbsf * (nbsf + 1) // 2, nchol)
         chol_packed = numpy.zeros(cp_shape, dtype=dtype)
         if pack_chol:
@@ -87,9 +171,9 @@ def get_hamiltonian(filename, scomm, verbose=False, pack_chol=True):
     if verbose:
         print(f"# Time to pack Cholesky vectors: {time.time() - start:.6f}")
 
-    if shmem and pack_chol:
+    if pack_chol:
         ham = Generic(
-            h1e=hcore, chol=chol, ecore=enuc, shmem=True, chol_packed=chol_packed, verbose=verbose
+            h1e=hcore, chol=chol, ecore=enuc, shmem=shmem, chol_packed=chol_packed, verbose=verbose
         )
     else:
         ham = Generic(h1e=hcore, chol=chol, ecore=enuc, verbose=verbose)
@@ -97,6 +181,86 @@ def get_hamiltonian(filename, scomm, verbose=False, pack_chol=True):
     return ham
 
 
+def read_cholesky_streaming(filename, comm, pack_chol=True, verbose=False):
+    """Read integrals written by write_hamiltonian in chunks of Cholesky vectors.
+
+    Each chunk of LXmn is transposed and packed directly into (node shared)
+    memory, so the full unpacked tensor is never held twice. Chunks are
+    distributed over the tasks of comm, which also accumulate the one-body
+    correction h1e_mod.
+
+    Parameters
+    ----------
+    filename : str
+        Hamiltonian file.
+    comm : MPI communicator
+        Shared memory communicator. The integrals are read by all tasks
+        independently if shared memory is not available.
+    pack_chol : bool
+        Build the packed Cholesky vectors (real integrals only).
+    verbose : bool
+        Print information.
+
+    Returns
+    -------
+    hcore : :class:`numpy.ndarray`
+        One-body Hamiltonian of shape (2, nbasis, nbasis).
+    chol : :class:`numpy.ndarray`
+        Cholesky vectors of shape (nbasis * nbasis, nchol).
+    chol_packed : :class:`numpy.ndarray` or None
+        Packed Cholesky vectors of shape (nbasis * (nbasis + 1) / 2, nchol),
+        None if not packed.
+    h1e_mod : :class:`numpy.ndarray`
+        Modified one-body Hamiltonian.
+    enuc : float
+        Core energy.
+    """
+    shmem = have_shared_mem(comm)
+    rank, size = (comm.rank, comm.size) if shmem else (0, 1)
+    with h5py.File(filename, "r") as fh5:
+        hcore = fh5["hcore"][()]
+        enuc = float(fh5["e0"][()])
+        nchol, nbsf = fh5["LXmn"].shape[:2]
+        dtype = fh5["LXmn"].dtype
+    pack_chol = pack_chol and numpy.isrealobj(numpy.zeros(1, dtype=dtype))
+    # Packed Cholesky vectors are only used for the HS potential (see
+    # mixed_precision).
+    packed_dtype = numpy.float32 if config.get_option("mixed_precision") else dtype
+    npacked = nbsf * (nbsf + 1) // 2
+    if shmem:
+        chol = get_shared_array(comm, (nbsf * nbsf, nchol), dtype)
+        chol_packed = get_shared_array(comm, (npacked, nchol), packed_dtype) if pack_chol else None
+    else:
+        chol = numpy.zeros((nbsf * nbsf, nchol), dtype=dtype)
+        chol_packed = numpy.zeros((npacked, nchol), dtype=packed_dtype) if pack_chol else None
+    idx = numpy.triu_indices(nbsf)
+    max_memory = config.get_option("max_memory_hamiltonian_read") * 1024**3
+    chunk_size = max(1, min(nchol, int(max_memory // (nbsf * nbsf * numpy.dtype(dtype).itemsize))))
+    v0 = numpy.zeros((nbsf, nbsf), dtype=dtype)
+    with h5py.File(filename, "r") as fh5:
+        dset = fh5["LXmn"]
+        for ichunk, x0 in enumerate(range(0, nchol, chunk_size)):
+            if ichunk % size != rank:
+                continue
+            x1 = min(x0 + chunk_size, nchol)
+            chunk = dset[x0:x1]
+            chol[:, x0:x1] = chunk.reshape(x1 - x0, -1).T
+            if pack_chol:
+                chol_packed[:, x0:x1] = chunk[:, idx[0], idx[1]].T
+            # v0_ij = sum_xk L^x_ik L^x*_jk, see construct_h1e_mod.
+            for L in chunk:
+                v0 += L.dot(L.conj().T)
+    if shmem:
+        v0 = comm.allreduce(v0)
+        comm.Barrier()
+    h1 = numpy.array([hcore, hcore])
+    h1e_mod = h1 - 0.5 * numpy.array([v0, v0])
+    if verbose:
+        nchunks = (nchol + chunk_size - 1) // chunk_size
+        print(f"# Read Cholesky vectors in {nchunks} chunks of {chunk_size} vectors.")
+    return h1, chol, chol_packed, h1e_mod, enuc
+
+
 def get_generic_integrals(filename, comm=None, verbose=False):
     """Read generic integrals, potentially into shared memory.
 
@@ -21,7 +21,9 @@ import plum
 
 from ipie.utils.backend import arraylib as xp
 from ipie.utils.backend import synchronize
+from ipie.estimators.generic import thc_density_batch
 from ipie.hamiltonians.generic import GenericComplexChol, GenericRealChol
+from ipie.hamiltonians.thc import GenericRealTHC
 from ipie.walkers.uhf_walkers import UHFWalkers
 from ipie.walkers.ghf_walkers import GHFWalkers
 
@@ -151,6 +153,40 @@ def construct_force_bias_batch_single_det(
     return vbias_batch
 
 
+@plum.dispatch
+def construct_force_bias_batch_single_det(
+    hamiltonian: GenericRealTHC, walkers: UHFWalkers, rXa, rXb
+):
+    """Compute optimal force bias from THC factors.
+
+    The force bias is U^T applied to the walkers' densities at the
+    interpolation points so the cost is O(N M nthc + nthc nchol) per walker.
+
+    Parameters
+    ----------
+    hamiltonian : class
+        hamiltonian object.
+    walkers : class
+        walkers object.
+    rXa, rXb : :class:`numpy.ndarray`
+        Half-rotated collocation matrix for each spin.
+
+    Returns
+    -------
+    xbar : :class:`numpy.ndarray`
+        Force bias.
+    """
+    if walkers.rhf:
+        density = 2.0 * thc_density_batch(rXa, hamiltonian.X, walkers.Ghalfa)[1]
+    else:
+        density = thc_density_batch(rXa, hamiltonian.X, walkers.Ghalfa)[1]
+        if walkers.ndown > 0:
+            density += thc_density_batch(rXb, hamiltonian.X, walkers.Ghalfb)[1]
+    vbias_batch = density.dot(hamiltonian.U)
+    synchronize()
+    return vbias_batch
+
+
 @plum.dispatch
 def construct_force_bias_batch_single_det(hamiltonian: GenericRealChol, walkers: GHFWalkers):
     """Compute optimal force bias.
@@ -6,6 +6,7 @@ from ipie.propagation.continuous_base import ContinuousBase
 from ipie.propagation.operations import propagate_one_body
 from ipie.utils.backend import arraylib as xp
 from ipie.utils.backend import synchronize, cast_to_device
+from ipie.utils.profiler import profiler
 
 import plum
 from ipie.trial_wavefunction.wavefunction_base import TrialWavefunctionBase
@@ -15,6 +16,7 @@ from ipie.trial_wavefunction.single_det import SingleDet
 from ipie.trial_wavefunction.single_det_ghf import SingleDetGHF
 from ipie.hamiltonians.generic import GenericRealChol, GenericComplexChol
 from ipie.hamiltonians.generic_chunked import GenericRealCholChunked
+from ipie.hamiltonians.thc import GenericRealTHC
 from typing import Union
 
 try:
@@ -105,6 +107,53 @@ def construct_one_body_propagator(hamiltonian: GenericComplexChol, mf_shift: xp.
     return expH1
 
 
+@plum.dispatch
+def construct_one_body_propagator(hamiltonian: GenericRealTHC, mf_shift: xp.ndarray, dt: float):
+    r"""Construct mean-field shifted one-body propagator.
+
+    .. math::
+
+        H1 \rightarrow H1 - v0
+        v0_{ik} = \sum_P X_{iP} X_{kP} \sum_n U_{Pn} \bar{v}_n
+
+    Parameters
+    ----------
+    hamiltonian : hamiltonian class.
+        THC hamiltonian object.
+    mf_shift : xp.ndarray
+        Average value of Choleskies with respect to the trial wavefunction.
+    dt : float
+        Timestep.
+    """
+    X = hamiltonian.X
+    shift = xp.array(1j * (X * hamiltonian.U.dot(mf_shift)).dot(X.T))
+    H1 = hamiltonian.h1e_mod - xp.array([shift, shift])
+    if hasattr(H1, "get"):
+        H1_numpy = H1.get()
+    else:
+        H1_numpy = H1
+    expH1 = xp.array(
+        [scipy.linalg.expm(-0.5 * dt * H1_numpy[0]), scipy.linalg.expm(-0.5 * dt * H1_numpy[1])]
+    )
+    return expH1
+
+
+@plum.dispatch
+def construct_mean_field_shift(hamiltonian: GenericRealTHC, trial: SingleDet):
+    r"""Compute mean field shift.
+
+    .. math::
+
+        \bar{v}_n = \sum_P U_{Pn} \sum_{ik\sigma} X_{iP} X_{kP} G_{ik\sigma}
+
+    """
+    Gcharge = trial.G[0] + trial.G[1]
+    X = hamiltonian.X
+    density = numpy.einsum("iP,ik,kP->P", X, Gcharge, X, optimize=True)
+    mf_shift = 1j * hamiltonian.U.T.dot(density)
+    return xp.array(mf_shift)
+
+
 @plum.dispatch
 def construct_mean_field_shift(hamiltonian: GenericRealCholChunked, trial: TrialWavefunctionBase):
     r"""Compute mean field shift.
@@ -272,30 +321,28 @@ class PhaselessBase(ContinuousBase):
         #                         dtype=numpy.complex128)
 
     def propagate_walkers_one_body(self, walkers):
-        start_time = time.time()
-        walkers.phia = propagate_one_body(walkers.phia, self.expH1[0])
-        if walkers.ndown > 0 and not walkers.rhf:
-            walkers.phib = propagate_one_body(walkers.phib, self.expH1[1])
-        synchronize()
-        self.timer.tgemm += time.time() - start_time
+        with profiler.region("one_body"):
+            walkers.phia = propagate_one_body(walkers.phia, self.expH1[0])
+            if walkers.ndown > 0 and not walkers.rhf:
+                walkers.phib = propagate_one_body(walkers.phib, self.expH1[1])
 
-    def propagate_walkers_two_body(self, walkers, hamiltonian, trial):
+    def propagate_walkers_two_body(self, walkers, hamiltonian, trial, xi=None):
         # optimal force bias
         xbar = xp.zeros((walkers.nwalkers, hamiltonian.nfields))
 
-        start_time = time.time()
-        self.vbias = trial.calc_force_bias(hamiltonian, walkers, walkers.mpi_handler)
-        xbar = -self.sqrt_dt * (1j * self.vbias - self.mf_shift)
-        synchronize()
-        self.timer.tfbias += time.time() - start_time
+        with profiler.region("force_bias"):
+            self.vbias = trial.calc_force_bias(hamiltonian, walkers, walkers.mpi_handler)
+            xbar = -self.sqrt_dt * (1j * self.vbias - self.mf_shift)
 
         # force bias bounding
         xbar = self.apply_bound_force_bias(xbar, self.fbbound)
 
-        # Normally distrubted auxiliary fields.
-        xi = xp.random.normal(0.0, 1.0, hamiltonian.nfields * walkers.nwalkers).reshape(
-            walkers.nwalkers, hamiltonian.nfields
-        )
+        # Normally distrubted auxiliary fields (unless supplied, e.g. to
+        # correlate the propagation of two systems).
+        if xi is None:
+            xi = xp.random.normal(0.0, 1.0, hamiltonian.nfields * walkers.nwalkers).reshape(
+                walkers.nwalkers, hamiltonian.nfields
+            )
         xshifted = xi - xbar
 
         # Constant factor arising from force bias and mean field shift
@@ -309,33 +356,26 @@ class PhaselessBase(ContinuousBase):
         # xp._default_memory_pool.free_all_blocks()
         return (cmf, cfb)
 
-    def propagate_walkers(self, walkers, hamiltonian, trial, eshift):
-        synchronize()
-        start_time = time.time()
-        ovlp = trial.calc_greens_function(walkers)
-        synchronize()
-        self.timer.tgf += time.time() - start_time
+    def propagate_walkers(self, walkers, hamiltonian, trial, eshift, xi=None):
+        with profiler.region("greens_function"):
+            ovlp = trial.calc_greens_function(walkers)
 
         # 2. Update Slater matrix
         # 2.a Apply one-body
         self.propagate_walkers_one_body(walkers)
 
         # 2.b Apply two-body
-        (cmf, cfb) = self.propagate_walkers_two_body(walkers, hamiltonian, trial)
+        (cmf, cfb) = self.propagate_walkers_two_body(walkers, hamiltonian, trial, xi=xi)
 
         # 2.c Apply one-body
         self.propagate_walkers_one_body(walkers)
 
         # Now apply phaseless approximation
-        start_time = time.time()
-        ovlp_new = trial.calc_overlap(walkers)
-        synchronize()
-        self.timer.tovlp += time.time() - start_time
+        with profiler.region("overlap"):
+            ovlp_new = trial.calc_overlap(walkers)
 
-        start_time = time.time()
-        self.update_weight(walkers, ovlp, ovlp_new, cfb, cmf, eshift)
-        synchronize()
-        self.timer.tupdate += time.time() - start_time
+        with profiler.region("update_weight"):
+            self.update_weight(walkers, ovlp, ovlp_new, cfb, cmf, eshift)
 
     def update_weight(self, walkers, ovlp, ovlp_new, cfb, cmf, eshift):
         ovlp_ratio = ovlp_new / ovlp
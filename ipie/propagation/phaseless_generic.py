@@ -1,5 +1,4 @@
 import math
-import time
 
 import numpy
 
@@ -16,10 +15,17 @@ from ipie.config import config
 from ipie.hamiltonians.generic import GenericComplexChol, GenericRealChol
 from ipie.hamiltonians.generic_chunked import GenericRealCholChunked
 from ipie.hamiltonians.generic_base import GenericBase
-from ipie.propagation.operations import apply_exponential, apply_exponential_batch
+from ipie.hamiltonians.thc import GenericRealTHC
+from ipie.propagation.operations import (
+    apply_exponential_adaptive,
+    apply_exponential_batch,
+    apply_exponential_cpu,
+    apply_exponential_krylov,
+)
 from ipie.propagation.phaseless_base import PhaselessBase
 from ipie.utils.backend import arraylib as xp
 from ipie.utils.backend import synchronize
+from ipie.utils.profiler import profiler
 from ipie.walkers.uhf_walkers import UHFWalkers
 from ipie.walkers.ghf_walkers import GHFWalkers
 from typing import Union
@@ -31,31 +37,139 @@ class PhaselessGeneric(PhaselessBase):
     def __init__(self, time_step, exp_nmax=6, verbose=False):
         super().__init__(time_step, verbose=verbose)
         self.exp_nmax = exp_nmax
+        # Work buffers for the CPU two-body propagation.
+        self._phi_work = None
+        self._exp_work = None
+        # Number of matrix products and walker exponentials applied (see
+        # average_exp_products).
+        self.exp_products = 0
+        self.exp_calls = 0
 
     @plum.dispatch
     def apply_VHS(
         self, walkers: Union[UHFWalkers, GHFWalkers], hamiltonian: GenericBase, xshifted: xp.ndarray
     ):
-        start_time = time.time()
         assert walkers.nwalkers == xshifted.shape[-1]
-        VHS = self.construct_VHS(hamiltonian, xshifted)
-        synchronize()
-        self.timer.tvhs += time.time() - start_time
-        assert len(VHS.shape) == 3
-
-        start_time = time.time()
-        if config.get_option("use_gpu"):
-            walkers.phia = apply_exponential_batch(walkers.phia, VHS, self.exp_nmax)
-            if walkers.ndown > 0 and not walkers.rhf:
-                walkers.phib = apply_exponential_batch(walkers.phib, VHS, self.exp_nmax)
+        method = config.get_option("propagator_exponential")
+        nwalkers = walkers.nwalkers
+        # VHS is built for blocks of walkers and applied straight away so only
+        # one block of the (nwalkers, nbasis, nbasis) tensor is held at once.
+        block_size = config.get_option("vhs_walker_block_size")
+        if block_size <= 0:
+            block_size = nwalkers
+        nbasis, nocc = walkers.phia.shape[1:]
+        if walkers.ndown > 0 and not walkers.rhf:
+            nocc += walkers.phib.shape[-1]
+        for start in range(0, nwalkers, block_size):
+            block = slice(start, min(start + block_size, nwalkers))
+            with profiler.region("construct_vhs"):
+                VHS = self.construct_VHS(hamiltonian, xshifted[:, block])
+            assert len(VHS.shape) == 3
+            with profiler.region("apply_vhs"):
+                if config.get_option("use_gpu"):
+                    nproducts = self.apply_exponential_gpu(walkers, VHS, method, block)
+                else:
+                    nproducts = self.apply_exponential_cpu(walkers, VHS, method, block)
+            del VHS
+            # Complex multiply-adds of the products used, added to the region
+            # above once they are known.
+            profiler.add("apply_vhs", 0.0, calls=0, flops=8 * nproducts * nbasis**2 * nocc)
+            self.exp_products += nproducts
+        self.exp_calls += nwalkers
+
+    def apply_exponential_gpu(self, walkers, VHS, method, block=slice(None)):
+        """Apply exp(VHS) to each spin sector of a block of walkers.
+
+        The products are done in the precision of VHS. Returns the number of
+        products with VHS summed over walkers.
+        """
+        both_spins = walkers.ndown > 0 and not walkers.rhf
+        phia = walkers.phia[block].astype(VHS.dtype, copy=False)
+        if both_spins:
+            phib = walkers.phib[block].astype(VHS.dtype, copy=False)
+        if method == "taylor":
+            walkers.phia[block] = apply_exponential_batch(phia, VHS, self.exp_nmax)
+            if both_spins:
+                walkers.phib[block] = apply_exponential_batch(phib, VHS, self.exp_nmax)
+            return self.exp_nmax * VHS.shape[0]
+        if method != "adaptive":
+            raise ValueError(f"Exponential {method} is not available on the GPU.")
+        tol = config.get_option("propagator_exponential_tol")
+        walkers.phia[block], nproducts = apply_exponential_adaptive(phia, VHS, tol)
+        if both_spins:
+            walkers.phib[block], nproducts_b = apply_exponential_adaptive(phib, VHS, tol)
+            nproducts = xp.maximum(nproducts, nproducts_b)
+        return int(nproducts.sum())
+
+    def apply_exponential_cpu(self, walkers, VHS, method="taylor", block=slice(None)):
+        """Apply exp(VHS) to both spin sectors of the walkers in one pass.
+
+        Parameters
+        ----------
+        walkers : UHFWalkers or GHFWalkers
+            Walkers, updated in place.
+        VHS : numpy.ndarray
+            HS potential of the block of walkers, shape (nblock, nbasis, nbasis).
+        method : str
+            "taylor" (exp_nmax terms), "adaptive" (Taylor series truncated per
+            walker) or "krylov" (block Krylov). See propagator_exponential.
+        block : slice
+            Walkers VHS belongs to. Default all walkers.
+
+        Returns
+        -------
+        nproducts : int
+            Number of products with VHS summed over walkers.
+        """
+        phia = walkers.phia[block]
+        nblock, nbasis, nup = phia.shape
+        both_spins = walkers.ndown > 0 and not walkers.rhf
+        nocc = nup + (walkers.phib.shape[-1] if both_spins else 0)
+        # Products are done in the precision of VHS (complex64 with
+        # mixed_precision) and the walkers are converted back on the way out.
+        dtype = VHS.dtype
+        # Buffers are sized for the largest block seen and sliced for the rest.
+        work = self._phi_work
+        if (
+            work is None
+            or work.shape[0] < nblock
+            or work.shape[1:] != (nbasis, nocc)
+            or work.dtype != dtype
+        ):
+            self._phi_work = numpy.empty((nblock, nbasis, nocc), dtype=dtype)
+            self._exp_work = numpy.empty((2, nblock, nbasis, nocc), dtype=dtype)
+        phi = self._phi_work[:nblock]
+        phi[:, :, :nup] = phia
+        if both_spins:
+            phi[:, :, nup:] = walkers.phib[block]
+        VHS = numpy.ascontiguousarray(VHS)
+        tol = config.get_option("propagator_exponential_tol")
+        if method == "taylor":
+            apply_exponential_cpu(phi, VHS, self.exp_nmax, self._exp_work[:, :nblock])
+            nproducts = self.exp_nmax * nblock
+        elif method == "adaptive":
+            nproducts = int(apply_exponential_adaptive(phi, VHS, tol)[1].sum())
+        elif method == "krylov":
+            nproducts = int(apply_exponential_krylov(phi, VHS, tol)[1].sum())
         else:
-            for iw in range(walkers.nwalkers):
-                # 2.b Apply two-body
-                walkers.phia[iw] = apply_exponential(walkers.phia[iw], VHS[iw], self.exp_nmax)
-                if walkers.ndown > 0 and not walkers.rhf:
-                    walkers.phib[iw] = apply_exponential(walkers.phib[iw], VHS[iw], self.exp_nmax)
-        synchronize()
-        self.timer.tgemm += time.time() - start_time
+            raise ValueError(f"Unknown propagator exponential: {method}")
+        walkers.phia[block] = phi[:, :, :nup]
+        if both_spins:
+            walkers.phib[block] = phi[:, :, nup:]
+        return nproducts
+
+    def average_exp_products(self, comm=None) -> float:
+        """Average number of matrix products per walker exponential.
+
+        Parameters
+        ----------
+        comm : MPI communicator
+            If given the average is over all tasks (collective).
+        """
+        counts = numpy.array([self.exp_products, self.exp_calls], dtype=numpy.float64)
+        if comm is not None:
+            counts = comm.allreduce(counts)
+        return counts[0] / max(counts[1], 1)
 
     @plum.dispatch.abstract
     def construct_VHS(self, hamiltonian: GenericBase, xshifted: xp.ndarray) -> xp.ndarray:
@@ -67,9 +181,13 @@ class PhaselessGeneric(PhaselessBase):
     def construct_VHS(self, hamiltonian: GenericRealChol, xshifted: xp.ndarray) -> xp.ndarray:
         nwalkers = xshifted.shape[-1]
 
-        VHS_packed = hamiltonian.chol_packed.dot(xshifted.real).astype(xshifted.dtype)
-        VHS_packed += 1.0j * hamiltonian.chol_packed.dot(
-            xshifted.imag
+        # float32 packed Cholesky vectors (mixed_precision) give a complex64 VHS.
+        chol_packed = hamiltonian.chol_packed
+        real_dtype = chol_packed.dtype
+        cplx_dtype = numpy.result_type(real_dtype, numpy.complex64)
+        VHS_packed = chol_packed.dot(xshifted.real.astype(real_dtype)).astype(cplx_dtype)
+        VHS_packed += 1.0j * chol_packed.dot(
+            xshifted.imag.astype(real_dtype)
         )  # in-place operation reduce gpu mem
 
         # (nb, nb, nw) -> (nw, nb, nb)
@@ -110,6 +228,24 @@ class PhaselessGeneric(PhaselessBase):
 
         return VHS
 
+    @plum.dispatch
+    def construct_VHS(self, hamiltonian: GenericRealTHC, xshifted: xp.ndarray) -> xp.ndarray:
+        # VHS = X diag(U x) X^T: O(M^2 nthc) per walker and no (M^2, nchol)
+        # tensor.
+        coeffs = self.isqrt_dt * (
+            hamiltonian.U.dot(xshifted.real) + 1j * hamiltonian.U.dot(xshifted.imag)
+        )
+        nwalkers = xshifted.shape[-1]
+        nbasis, nthc = hamiltonian.X.shape
+        X = hamiltonian.X
+        XT = X.T.copy()
+        # (nw * nb, nthc) x (nthc, nb) so each product is a single gemm.
+        tmp = (X[None, :, :] * coeffs.T.real[:, None, :]).reshape(nwalkers * nbasis, nthc)
+        VHS = tmp.dot(XT).astype(coeffs.dtype)
+        tmp = (X[None, :, :] * coeffs.T.imag[:, None, :]).reshape(nwalkers * nbasis, nthc)
+        VHS += 1j * tmp.dot(XT)
+        return VHS.reshape(nwalkers, nbasis, nbasis)
+
 
 class PhaselessGenericChunked(PhaselessGeneric):
     """A class for performing phaseless propagation with real, generic, hamiltonian."""
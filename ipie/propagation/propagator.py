@@ -1,5 +1,6 @@
 from ipie.hamiltonians.generic import GenericRealChol, GenericComplexChol
 from ipie.hamiltonians.generic_chunked import GenericRealCholChunked
+from ipie.hamiltonians.thc import GenericRealTHC
 from ipie.propagation.phaseless_generic import PhaselessGeneric, PhaselessGenericChunked
 
 # Propagator = {GenericRealChol: PhaselessGeneric, GenericComplexChol: PhaselessGeneric}
@@ -7,4 +8,5 @@ Propagator = {
     GenericRealChol: PhaselessGeneric,
     GenericComplexChol: PhaselessGeneric,
     GenericRealCholChunked: PhaselessGenericChunked,
+    GenericRealTHC: PhaselessGeneric,
 }
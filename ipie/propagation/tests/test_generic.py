@@ -19,8 +19,11 @@
 import numpy
 import pytest
 
+from ipie.config import config
+from ipie.estimators.energy import local_energy
 from ipie.estimators.greens_function import greens_function_single_det_batch
 from ipie.propagation.overlap import calc_overlap_single_det_uhf
+from ipie.systems.generic import Generic
 from ipie.utils.legacy_testing import build_legacy_test_case_handlers
 from ipie.utils.misc import dotdict
 from ipie.utils.testing import build_test_case_handlers
@@ -328,6 +331,120 @@ def test_vhs():
         assert numpy.allclose(vhs_batch[iw], vhs_serial[iw])
 
 
+@pytest.mark.unit
+def test_propagator_exponential():
+    numpy.random.seed(7)
+    nmo = 10
+    nelec = (6, 5)
+    nwalkers = 4
+    qmc = dotdict(
+        {
+            "dt": 0.005,
+            "nstblz": 5,
+            "nwalkers": nwalkers,
+            "batched": True,
+            "hybrid": True,
+            "num_steps": 2,
+        }
+    )
+    data = build_test_case_handlers(nelec, nmo, num_dets=1, options=qmc, seed=7)
+    walkers = data.walkers
+    propagator = data.propagator
+    nfields = data.hamiltonian.nfields
+    xshifted = numpy.random.normal(0.0, 1.0, size=(nfields, nwalkers)) + 0.0j
+    phia, phib = walkers.phia.copy(), walkers.phib.copy()
+    current = config.get_option("propagator_exponential")
+    results = {}
+    try:
+        for method in ["taylor", "adaptive", "krylov"]:
+            config.update_option("propagator_exponential", method)
+            walkers.phia[...] = phia
+            walkers.phib[...] = phib
+            propagator.exp_products = propagator.exp_calls = 0
+            propagator.apply_VHS(walkers, data.hamiltonian, xshifted)
+            results[method] = (walkers.phia.copy(), walkers.phib.copy())
+            assert propagator.exp_calls == nwalkers
+            assert 0 < propagator.average_exp_products() <= 20
+    finally:
+        config.update_option("propagator_exponential", current)
+    assert propagator.average_exp_products() < propagator.exp_nmax
+    for method in ["adaptive", "krylov"]:
+        numpy.testing.assert_allclose(results[method][0], results["taylor"][0], atol=1e-7)
+        numpy.testing.assert_allclose(results[method][1], results["taylor"][1], atol=1e-7)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("block_size", [1, 3])
+def test_vhs_walker_blocks(block_size):
+    numpy.random.seed(7)
+    nmo = 10
+    nelec = (6, 5)
+    nwalkers = 8
+    qmc = dotdict(
+        {
+            "dt": 0.005,
+            "nstblz": 5,
+            "nwalkers": nwalkers,
+            "batched": True,
+            "hybrid": True,
+            "num_steps": 2,
+        }
+    )
+    data = build_test_case_handlers(nelec, nmo, num_dets=1, options=qmc, seed=7)
+    walkers = data.walkers
+    nfields = data.hamiltonian.nfields
+    xshifted = numpy.random.normal(0.0, 1.0, size=(nfields, nwalkers)) + 0.0j
+    phia, phib = walkers.phia.copy(), walkers.phib.copy()
+    data.propagator.apply_VHS(walkers, data.hamiltonian, xshifted)
+    phia_ref, phib_ref = walkers.phia.copy(), walkers.phib.copy()
+    walkers.phia[...] = phia
+    walkers.phib[...] = phib
+    current = config.get_option("vhs_walker_block_size")
+    config.update_option("vhs_walker_block_size", block_size)
+    try:
+        data.propagator.apply_VHS(walkers, data.hamiltonian, xshifted)
+    finally:
+        config.update_option("vhs_walker_block_size", current)
+    numpy.testing.assert_allclose(walkers.phia, phia_ref, atol=1e-12)
+    numpy.testing.assert_allclose(walkers.phib, phib_ref, atol=1e-12)
+
+
+@pytest.mark.unit
+def test_mixed_precision():
+    nmo = 10
+    nelec = (6, 5)
+    nwalkers = 8
+    qmc = dotdict(
+        {
+            "dt": 0.005,
+            "nstblz": 5,
+            "nwalkers": nwalkers,
+            "batched": True,
+            "hybrid": True,
+            "num_steps": 4,
+        }
+    )
+    ref = build_test_case_handlers(nelec, nmo, num_dets=1, options=qmc, seed=7)
+    config.update_option("mixed_precision", True)
+    try:
+        data = build_test_case_handlers(nelec, nmo, num_dets=1, options=qmc, seed=7)
+        nfields = data.hamiltonian.nfields
+        VHS = data.propagator.construct_VHS(data.hamiltonian, numpy.ones((nfields, 2)) + 0j)
+    finally:
+        config.update_option("mixed_precision", False)
+    assert data.hamiltonian.chol_packed.dtype == numpy.float32
+    assert VHS.dtype == numpy.complex64
+    # Walkers, overlaps and weights stay double.
+    assert data.walkers.phia.dtype == numpy.complex128
+    assert data.walkers.ovlp.dtype == numpy.complex128
+    numpy.testing.assert_allclose(data.walkers.phia, ref.walkers.phia, atol=1e-5)
+    numpy.testing.assert_allclose(data.walkers.weight, ref.walkers.weight, rtol=1e-4)
+    system = Generic(nelec)
+    energy = local_energy(system, data.hamiltonian, data.walkers, data.trial)
+    energy_ref = local_energy(system, ref.hamiltonian, ref.walkers, ref.trial)
+    numpy.testing.assert_allclose(energy, energy_ref, rtol=1e-4)
+
+
 if __name__ == "__main__":
     test_overlap_rhf_batch()
     test_overlap_batch()
@@ -336,3 +453,6 @@ if __name__ == "__main__":
     test_hybrid_rhf_batch()
     test_hybrid_batch()
     test_vhs()
+    test_propagator_exponential()
+    test_vhs_walker_blocks(3)
+    test_mixed_precision()
@@ -2,9 +2,13 @@ import numpy
 import pytest
 import scipy
 
+from ipie.config import config
 from ipie.propagation.operations import (
     apply_exponential,
+    apply_exponential_adaptive,
     apply_exponential_batch,
+    apply_exponential_cpu,
+    apply_exponential_krylov,
     propagate_one_body,
 )
 
@@ -61,6 +65,61 @@ def test_apply_exponential():
     numpy.testing.assert_allclose(phi1, phi_ref, atol=1e-10)
 
 
+@pytest.mark.unit
+@pytest.mark.parametrize("variant", ["loop", "batched", "numba", "auto"])
+def test_cpu_propagation_kernels(variant):
+    numpy.random.seed(7)
+    nwalkers = 6
+    nbasis = 12
+    nocc = 5
+    shape = (nwalkers, nbasis, nocc)
+    phi = numpy.random.randn(*shape) + 1.0j * numpy.random.randn(*shape)
+    VHS = 0.01 * (
+        numpy.random.randn(nwalkers, nbasis, nbasis)
+        + 1.0j * numpy.random.randn(nwalkers, nbasis, nbasis)
+    )
+    expH1 = numpy.random.randn(nbasis, nbasis)
+    phi_ref = numpy.copy(phi)
+    for iw in range(nwalkers):
+        phi_ref[iw] = apply_exponential(phi_ref[iw], VHS[iw], 6)
+    phi_ref = numpy.einsum("mn,wni->wmi", expH1, phi_ref)
+    current = config.get_option("cpu_propagation_kernel")
+    config.update_option("cpu_propagation_kernel", variant)
+    try:
+        phi = apply_exponential_cpu(phi, VHS, 6)
+        phi = propagate_one_body(phi, expH1)
+    finally:
+        config.update_option("cpu_propagation_kernel", current)
+    numpy.testing.assert_allclose(phi, phi_ref, atol=1e-12)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("nocc", [1, 5, 14])
+def test_adaptive_exponentials(nocc):
+    numpy.random.seed(7)
+    nwalkers = 4
+    nbasis = 12
+    phi = numpy.random.randn(nwalkers, nbasis, nocc) + 1.0j * numpy.random.randn(
+        nwalkers, nbasis, nocc
+    )
+    VHS = numpy.random.randn(nwalkers, nbasis, nbasis) + 1.0j * numpy.random.randn(
+        nwalkers, nbasis, nbasis
+    )
+    # Walkers with very different norms of VHS.
+    VHS *= numpy.array([0.001, 0.01, 0.05, 0.2])[:, None, None]
+    phi_ref = numpy.array([scipy.linalg.expm(VHS[iw]).dot(phi[iw]) for iw in range(nwalkers)])
+    for func in [apply_exponential_adaptive, apply_exponential_krylov]:
+        phi_exp, nproducts = func(phi.copy(), VHS, 1e-10)
+        numpy.testing.assert_allclose(phi_exp, phi_ref, atol=1e-8)
+        assert numpy.all(nproducts[:-1] <= nproducts[1:])
+        # Small potentials need fewer products than the fixed 6 term series.
+        assert nproducts[0] < 6
+    phi_exp, nproducts = apply_exponential_adaptive(phi.copy(), VHS, 1e-10, max_order=3)
+    assert numpy.all(nproducts <= 3)
+
+
 if __name__ == "__main__":
     test_propagate_one_body()
     test_apply_exponential()
+    test_cpu_propagation_kernels("auto")
+    test_adaptive_exponentials(5)
@@ -23,9 +23,12 @@ import time
 import uuid
 from typing import Dict, Optional, Tuple
 
+import numpy
+
 from ipie.config import config
 from ipie.estimators.estimator_base import EstimatorBase
 from ipie.estimators.handler import EstimatorHandler
+from ipie.hamiltonians.thc import GenericRealTHC
 from ipie.hamiltonians.utils import get_hamiltonian
 from ipie.propagation.propagator import Propagator
 from ipie.qmc.options import QMCParams
@@ -34,9 +37,18 @@ from ipie.systems.generic import Generic
 from ipie.trial_wavefunction.utils import get_trial_wavefunction
 from ipie.utils.backend import arraylib as xp
 from ipie.utils.backend import get_host_memory, synchronize
+from ipie.utils.checkpoint import CheckpointWriter, get_rng_state, read_checkpoint, set_rng_state
 from ipie.utils.io import to_json
+from ipie.utils.memory_planner import (
+    get_memory_budget,
+    memory_plan_options,
+    MemoryPlan,
+    plan_driver_memory,
+)
 from ipie.utils.misc import get_git_info, print_env_info
 from ipie.utils.mpi import MPIHandler
+from ipie.utils.philox import CounterRNG
+from ipie.utils.profiler import print_profile, profiler, write_chrome_trace, write_profile_hdf5
 from ipie.walkers.base_walkers import WalkerAccumulator
 from ipie.walkers.pop_controller import PopController
 from ipie.walkers.walkers_dispatch import get_initial_walker, UHFWalkersTrial
@@ -69,6 +81,13 @@ class AFQMCBase(metaclass=abc.ABCMeta):
         self.params = params
         self._init_time = time.time()
         self._parallel_rng_seed = set_rng_seed(params.rng_seed, self.mpi_handler.comm)
+        self.rng = None
+        if config.get_option("counter_based_rng"):
+            # Seed common to all tasks.
+            self.rng = CounterRNG(self._parallel_rng_seed - self.mpi_handler.comm.rank)
+        self.restart_file = None
+        # Print the block estimates to stdout.
+        self.print_estimates = True
 
     @abc.abstractmethod
     def run(
@@ -126,26 +145,41 @@ class AFQMCBase(metaclass=abc.ABCMeta):
             print(f"# MPI communicator : {type(self.mpi_handler.comm)}")
             print(f"# Available memory on the node is {mem_avail:4.3f} GB")
 
+    def get_walker_ids(self):
+        """Global IDs of the walkers on this task (numbered consecutively by rank)."""
+        comm = self.mpi_handler.comm
+        nwalkers = comm.gather(self.walkers.nwalkers, root=0)
+        offsets = None
+        if comm.rank == 0:
+            offsets = numpy.cumsum([0] + nwalkers[:-1])
+        offset = comm.scatter(offsets, root=0)
+        return numpy.arange(offset, offset + self.walkers.nwalkers)
+
     def setup_timers(self):
-        # TODO: Better timer
-        self.tsetup = 0
-        self.tortho = 0
-        self.tprop = 0
-
-        self.tprop_fbias = 0.0
-        self.tprop_ovlp = 0.0
-        self.tprop_update = 0.0
-        self.tprop_gf = 0.0
-        self.tprop_vhs = 0.0
-        self.tprop_gemm = 0.0
-        self.tprop_clip = 0.0
-        self.tprop_barrier = 0.0
-
-        self.testim = 0
-        self.tpopc = 0
-        self.tpopc_comm = 0
-        self.tpopc_non_comm = 0
-        self.tstep = 0
+        profiler.reset()
+        profiler.enabled = config.get_option("profile")
+        profiler.trace = len(config.get_option("profile_trace_file")) > 0
+        self.profile_summary = None
+
+    def collect_profile(self):
+        """Reduce profiling data over MPI tasks and write it to file.
+
+        The summary is appended to the estimator file under "profile" and,
+        if the profile_trace_file option is set, the individual region
+        events of all tasks are written in Chrome trace format.
+        """
+        if not profiler.enabled:
+            return
+        comm = self.mpi_handler.comm
+        self.profile_summary = profiler.gather(comm)
+        filename = getattr(self.estimators, "filename", None)
+        if comm.rank == 0 and filename is not None:
+            write_profile_hdf5(filename, self.profile_summary)
+        trace_file = config.get_option("profile_trace_file")
+        if profiler.trace:
+            events = profiler.gather_events(comm)
+            if comm.rank == 0:
+                write_chrome_trace(trace_file, events)
 
     def finalise(self, verbose=False):
         """Tidy up.
@@ -155,86 +189,12 @@ class AFQMCBase(metaclass=abc.ABCMeta):
         verbose : bool
             If true print out some information to stdout.
         """
-        nsteps = max(self.params.num_steps_per_block, 1)
-        nblocks = max(self.params.num_blocks, 1)
-        nstblz = max(nsteps // self.params.num_stblz, 1)
-        npcon = max(nsteps // self.params.pop_control_freq, 1)
         if self.mpi_handler.rank == 0:
             if verbose:
                 print(f"# End Time: {time.asctime():s}")
                 print(f"# Running time : {time.time() - self._init_time:.6f} seconds")
-                print("# Timing breakdown (per call, total calls per block, total blocks):")
-                print(f"# - Setup: {self.tsetup:.6f} s")
-                print(
-                    "# - Block: {:.6f} s / block for {} total blocks".format(
-                        self.tstep / (nblocks), nblocks
-                    )
-                )
-                print(
-                    "# - Propagation: {:.6f} s / call for {} call(s) in each of {} blocks".format(
-                        self.tprop / (nblocks * nsteps), nsteps, nblocks
-                    )
-                )
-                print(
-                    "#     -       Force bias: {:.6f} s / call for {} call(s) in each of {} blocks".format(
-                        self.tprop_fbias / (nblocks * nsteps), nsteps, nblocks
-                    )
-                )
-                print(
-                    "#     -              VHS: {:.6f} s / call for {} call(s) in each of {} blocks".format(
-                        self.tprop_vhs / (nblocks * nsteps), nsteps, nblocks
-                    )
-                )
-                print(
-                    "#     - Green's Function: {:.6f} s / call for {} call(s) in each of {} blocks".format(
-                        self.tprop_gf / (nblocks * nsteps), nsteps, nblocks
-                    )
-                )
-                print(
-                    "#     -          Overlap: {:.6f} s / call for {} call(s) in each of {} blocks".format(
-                        self.tprop_ovlp / (nblocks * nsteps), nsteps, nblocks
-                    )
-                )
-                print(
-                    "#     -   Weights Update: {:.6f} s / call for {} call(s) in each of {} blocks".format(
-                        (self.tprop_update + self.tprop_clip) / (nblocks * nsteps), nsteps, nblocks
-                    )
-                )
-                print(
-                    "#     -  GEMM operations: {:.6f} s / call for {} call(s) in each of {} blocks".format(
-                        self.tprop_gemm / (nblocks * nsteps), nsteps, nblocks
-                    )
-                )
-                print(
-                    "#     -          Barrier: {:.6f} s / call for {} call(s) in each of {} blocks".format(
-                        self.tprop_barrier / (nblocks * nsteps), nsteps, nblocks
-                    )
-                )
-                print(
-                    "# - Estimators: {:.6f} s / call for {} call(s)".format(
-                        self.testim / nblocks, nblocks
-                    )
-                )
-                print(
-                    "# - Orthogonalisation: {:.6f} s / call for {} call(s) in each of {} blocks".format(
-                        self.tortho / (nstblz * nblocks), nstblz, nblocks
-                    )
-                )
-                print(
-                    "# - Population control: {:.6f} s / call for {} call(s) in each of {} blocks".format(
-                        self.tpopc / (npcon * nblocks), npcon, nblocks
-                    )
-                )
-                print(
-                    "#       -     Commnication: {:.6f} s / call for {} call(s) in each of {} blocks".format(
-                        self.tpopc_comm / (npcon * nblocks), npcon, nblocks
-                    )
-                )
-                print(
-                    "#       - Non-Commnication: {:.6f} s / call for {} call(s) in each of {} blocks".format(
-                        self.tpopc_non_comm / (npcon * nblocks), npcon, nblocks
-                    )
-                )
+                if self.profile_summary is not None:
+                    print_profile(self.profile_summary)
 
     def determine_dtype(self, propagator, system):
         """Determine dtype for trial wavefunction and walkers.
@@ -271,6 +231,9 @@ class AFQMC(AFQMCBase):
         Parameters of simulation. See QMCParams for description.
     verbose : bool
         How much information to print.
+    memory_plan : MemoryPlan
+        Optional. Memory limits applied to the energy evaluation and
+        propagation while the calculation runs.
 
     Attributes
     ----------
@@ -289,10 +252,40 @@ class AFQMC(AFQMCBase):
         mpi_handler,
         params: QMCParams,
         verbose: int = 0,
+        memory_plan: Optional[MemoryPlan] = None,
     ):
         super().__init__(
             system, hamiltonian, trial, walkers, propagator, mpi_handler, params, verbose
         )
+        self.memory_plan = memory_plan
+
+    @staticmethod
+    def make_memory_plan(hamiltonian, trial, num_walkers, mpi_handler, verbose=True):
+        """Size memory limits of the energy evaluation from the memory budget.
+
+        The limits are not applied globally, see memory_plan_options. Warns if
+        the calculation is not predicted to fit into the budget given by the
+        max_memory_per_task option. Returns None for THC Hamiltonians, whose
+        footprint is not modelled.
+        """
+        comm = mpi_handler.comm
+        if isinstance(hamiltonian, GenericRealTHC):
+            if verbose and comm.rank == 0:
+                print("# Memory planner skipped for THC Hamiltonian.")
+            return None
+        budget = get_memory_budget(comm, config.get_option("max_memory_per_task"))
+        # Tasks may see slightly different free memory, use the smallest.
+        budgets = comm.gather(budget, root=0)
+        budget = comm.bcast(min(budgets) if comm.rank == 0 else None, root=0)
+        plan = plan_driver_memory(hamiltonian, trial, num_walkers, mpi_handler, budget)
+        if verbose and comm.rank == 0:
+            plan.print()
+            if getattr(trial, "num_det_chunks", plan.num_det_chunks) < plan.num_det_chunks:
+                print(
+                    f"# WARNING: Wick's intermediates are predicted to exceed the memory "
+                    f"budget. Consider using ndet_chunks = {plan.num_det_chunks}."
+                )
+        return plan
 
     @staticmethod
     # TODO: wavefunction type, trial type, hamiltonian type
@@ -310,6 +303,10 @@ class AFQMC(AFQMCBase):
         pop_control_freq=5,
         verbose=True,
         mpi_handler=None,
+        checkpoint_freq: int = 0,
+        online_reblock: bool = False,
+        target_error: float = 0.0,
+        max_wall_time: float = 0.0,
     ) -> "AFQMC":
         """Factory method to build AFQMC driver from hamiltonian and trial wavefunction.
 
@@ -340,6 +337,17 @@ class AFQMC(AFQMCBase):
                 steps.) Default 25.
         verbose : bool
             Log verbosity. Default True i.e. print information to stdout.
+        checkpoint_freq : int
+            Frequency (in units of blocks) at which restart checkpoints are
+                written. Default 0 (no checkpoints).
+        online_reblock : bool
+            Reblock the total energy on the fly and print the running error
+                bar. Default False.
+        target_error : float
+            Stop once the online error bar on the total energy is below this
+                value. Default 0 (run all blocks).
+        max_wall_time : float
+            Wall clock budget in seconds. Default 0 (no limit).
         """
         if mpi_handler is None:
             mpi_handler = MPIHandler()
@@ -355,12 +363,22 @@ class AFQMC(AFQMCBase):
             num_stblz=stabilize_freq,
             pop_control_freq=pop_control_freq,
             rng_seed=seed,
+            checkpoint_freq=checkpoint_freq,
+            online_reblock=online_reblock,
+            target_error=target_error,
+            max_wall_time=max_wall_time,
         )
         # 2. Calculation objects.
         system = Generic(num_elec)
+        memory_plan = None
+        if config.get_option("memory_planner") and hasattr(hamiltonian, "nchol"):
+            memory_plan = AFQMC.make_memory_plan(
+                hamiltonian, trial_wavefunction, num_walkers, mpi_handler, verbose
+            )
         # TODO: do logic and logging in the function.
         if trial_wavefunction.compute_trial_energy:
-            trial_wavefunction.calculate_energy(system, hamiltonian)
+            with memory_plan_options(memory_plan):
+                trial_wavefunction.calculate_energy(system, hamiltonian)
             trial_wavefunction.e1b = comm.bcast(trial_wavefunction.e1b, root=0)
             trial_wavefunction.e2b = comm.bcast(trial_wavefunction.e2b, root=0)
         comm.barrier()
@@ -391,6 +409,7 @@ class AFQMC(AFQMCBase):
             mpi_handler,
             params,
             verbose=(verbose and comm.rank == 0),
+            memory_plan=memory_plan,
         )
 
     @staticmethod
@@ -410,6 +429,11 @@ class AFQMC(AFQMCBase):
         num_dets_for_trial_props=100,
         pack_cholesky=True,
         verbose=True,
+        checkpoint_freq: int = 0,
+        restart_file: Optional[str] = None,
+        online_reblock: bool = False,
+        target_error: float = 0.0,
+        max_wall_time: float = 0.0,
     ) -> "AFQMC":
         """Factory method to build AFQMC driver from hamiltonian and trial wavefunction.
 
@@ -446,11 +470,28 @@ class AFQMC(AFQMCBase):
             Use symmetry to reduce memory consumption of integrals. Default True.
         verbose : bool
             Log verbosity. Default True i.e. print information to stdout.
+        checkpoint_freq : int
+            Frequency (in units of blocks) at which restart checkpoints are
+                written. Default 0 (no checkpoints).
+        restart_file : str
+            Checkpoint basename to resume the calculation from. Default None.
+        online_reblock : bool
+            Reblock the total energy on the fly and print the running error
+                bar. Default False.
+        target_error : float
+            Stop once the online error bar on the total energy is below this
+                value. Default 0 (run all blocks).
+        max_wall_time : float
+            Wall clock budget in seconds. Default 0 (no limit).
         """
         mpi_handler = MPIHandler()
         _verbose = verbose and mpi_handler.comm.rank == 0
         ham = get_hamiltonian(
-            ham_file, mpi_handler.scomm, verbose=_verbose, pack_chol=pack_cholesky
+            ham_file,
+            mpi_handler.scomm,
+            verbose=_verbose,
+            pack_chol=pack_cholesky,
+            comm=mpi_handler.comm,
         )
         trial = get_trial_wavefunction(
             num_elec,
@@ -461,7 +502,7 @@ class AFQMC(AFQMCBase):
             verbose=_verbose,
         )
         trial.half_rotate(ham, mpi_handler.scomm)
-        return AFQMC.build(
+        afqmc = AFQMC.build(
             trial.nelec,
             ham,
             trial,
@@ -474,10 +515,19 @@ class AFQMC(AFQMCBase):
             pop_control_freq=pop_control_freq,
             verbose=verbose,
             mpi_handler=mpi_handler,
+            checkpoint_freq=checkpoint_freq,
+            online_reblock=online_reblock,
+            target_error=target_error,
+            max_wall_time=max_wall_time,
         )
+        afqmc.restart_file = restart_file
+        return afqmc
 
     def setup_estimators(
-        self, filename, additional_estimators: Optional[Dict[str, EstimatorBase]] = None
+        self,
+        filename,
+        additional_estimators: Optional[Dict[str, EstimatorBase]] = None,
+        restart_block: Optional[int] = None,
     ):
         self.accumulators = WalkerAccumulator(
             ["Weight", "WeightFactor", "HybridEnergy"], self.params.num_steps_per_block
@@ -491,6 +541,8 @@ class AFQMC(AFQMCBase):
             walker_state=self.accumulators,
             verbose=(comm.rank == 0 and self.verbose),
             filename=filename,
+            online_reblock=(self.params.online_reblock or self.params.target_error > 0),
+            print_to_stdout=self.print_estimates,
         )
         if additional_estimators is not None:
             for k, v in additional_estimators.items():
@@ -500,19 +552,40 @@ class AFQMC(AFQMCBase):
         json_string = to_json(self)
         self.estimators.json_string = json_string
 
-        self.estimators.initialize(comm)
+        self.estimators.initialize(comm, restart_block=restart_block)
+        if restart_block is not None:
+            # Earlier blocks are already in the estimator file.
+            return
         # Calculate estimates for initial distribution of walkers.
         self.estimators.compute_estimators(self.system, self.hamiltonian, self.trial, self.walkers)
         self.accumulators.update(self.walkers)
         self.estimators.print_block(comm, 0, self.accumulators)
         self.accumulators.zero()
 
+    def get_checkpoint_state(self, block: int, eshift: float) -> dict:
+        """Gather everything required to resume the random walk after block."""
+        return {
+            "walkers": self.walkers.get_checkpoint_state(),
+            "pop_control": self.pcontrol.get_state(),
+            "rng": get_rng_state(),
+            "estimators": self.estimators.get_state(),
+            "driver": {
+                "block": numpy.array(block),
+                "eshift": numpy.array(eshift),
+                "accumulator_eshift": numpy.array(self.accumulators.eshift),
+                "nranks": numpy.array(self.mpi_handler.comm.size),
+                "num_walkers": numpy.array(self.walkers.nwalkers),
+            },
+        }
+
     def run(
         self,
         walkers=None,
         estimator_filename=None,
         verbose=True,
         additional_estimators: Optional[Dict[str, EstimatorBase]] = None,
+        checkpoint_file: Optional[str] = None,
+        restart_file: Optional[str] = None,
     ):
         """Perform AFQMC simulation on state object using open-ended random walk.
 
@@ -524,21 +597,67 @@ class AFQMC(AFQMCBase):
             File to write estimates to.
         additional_estimators : dict
             Dictionary of additional estimators to evaluate.
+        checkpoint_file : str
+            Basename of restart checkpoint files written every
+            params.checkpoint_freq blocks. Default "checkpoint".
+        restart_file : str
+            Basename of checkpoint files to resume the calculation from.
+            Defaults to the value set at build time (None = fresh start).
         """
+        with memory_plan_options(self.memory_plan):
+            self._run(
+                walkers=walkers,
+                estimator_filename=estimator_filename,
+                verbose=verbose,
+                additional_estimators=additional_estimators,
+                checkpoint_file=checkpoint_file,
+                restart_file=restart_file,
+            )
+
+    def _run(
+        self,
+        walkers=None,
+        estimator_filename=None,
+        verbose=True,
+        additional_estimators: Optional[Dict[str, EstimatorBase]] = None,
+        checkpoint_file: Optional[str] = None,
+        restart_file: Optional[str] = None,
+    ):
         self.setup_timers()
         tzero_setup = time.time()
         if walkers is not None:
             self.walkers = walkers
-        self.setup_timers()
         eshift = 0.0
-        self.walkers.orthogonalise()
+        comm = self.mpi_handler.comm
+        if restart_file is None:
+            restart_file = self.restart_file
+        checkpoint = None
+        if restart_file is not None:
+            checkpoint = read_checkpoint(restart_file, comm)
+            self.walkers.set_checkpoint_state(checkpoint["walkers"])
+            if self.verbose:
+                print(
+                    f"# Restarting from {restart_file} after block {checkpoint['driver']['block']}"
+                )
+        else:
+            self.walkers.orthogonalise()
 
+        load_balance = config.get_option("load_balance")
+        if config.get_option("shared_memory_walkers"):
+            if load_balance:
+                raise ValueError("Walkers in shared memory require a fixed number of walkers.")
+            self.walkers.share_memory(comm, verbose=self.verbose)
         self.pcontrol = PopController(
             self.params.num_walkers,
             self.params.num_steps_per_block,
             self.mpi_handler,
+            pop_control_method="distributed_comb" if load_balance else "pair_branch",
+            asynchronous=config.get_option("async_pop_control"),
+            load_balance=load_balance,
             verbose=self.verbose,
         )
+        if checkpoint is not None:
+            self.pcontrol.set_state(checkpoint["pop_control"])
 
         self.get_env_info()
         # self.distribute_hamiltonian()
@@ -547,7 +666,16 @@ class AFQMC(AFQMCBase):
         # from ipie.utils.backend import get_device_memory
         # used_bytes, total_bytes = get_device_memory()
         # print(f"# after distribute {comm.rank}: using {used_bytes/1024**3} GB out of {total_bytes/1024**3} GB memory on GPU")
-        self.setup_estimators(estimator_filename, additional_estimators=additional_estimators)
+        restart_block = None
+        if checkpoint is not None:
+            restart_block = int(checkpoint["driver"]["block"])
+        self.setup_estimators(
+            estimator_filename,
+            additional_estimators=additional_estimators,
+            restart_block=restart_block,
+        )
+        if checkpoint is not None:
+            self.estimators.set_state(checkpoint.get("estimators", {}))
 
         # TODO: This magic value of 2 is pretty much never controlled on input.
         # Moreover I'm not convinced having a two stage shift update actually
@@ -555,81 +683,159 @@ class AFQMC(AFQMCBase):
         num_eqlb_steps = 2.0 / self.params.timestep
 
         total_steps = self.params.num_steps_per_block * self.params.num_blocks
+        first_step = 1
+        if checkpoint is not None:
+            driver_state = checkpoint["driver"]
+            first_step = int(driver_state["block"]) * self.params.num_steps_per_block + 1
+            eshift = driver_state["eshift"][()]
+            self.accumulators.eshift = driver_state["accumulator_eshift"][()]
+            set_rng_state(checkpoint["rng"])
+        checkpoint_writer = None
+        if self.params.checkpoint_freq > 0:
+            if checkpoint_file is None:
+                checkpoint_file = "checkpoint"
+            checkpoint_writer = CheckpointWriter(checkpoint_file, comm, verbose=self.verbose)
+        checkpoint_steps = self.params.checkpoint_freq * self.params.num_steps_per_block
+
+        if self.rng is not None:
+            walker_ids = self.get_walker_ids()
+            num_rebalances = self.pcontrol.num_rebalances
+            if self.verbose:
+                print("# Using counter-based random numbers for the auxiliary fields.")
 
         synchronize()
-        comm = self.mpi_handler.comm
-        self.tsetup += time.time() - tzero_setup
-
-        for step in range(1, total_steps + 1):
-            synchronize()
-            start_step = time.time()
-            if step % self.params.num_stblz == 0:
-                start = time.time()
-                self.walkers.orthogonalise()
-                synchronize()
-                self.tortho += time.time() - start
-            start = time.time()
-
-            self.propagator.propagate_walkers(self.walkers, self.hamiltonian, self.trial, eshift)
-
-            self.tprop_fbias = self.propagator.timer.tfbias
-            self.tprop_ovlp = self.propagator.timer.tovlp
-            self.tprop_update = self.propagator.timer.tupdate
-            self.tprop_gf = self.propagator.timer.tgf
-            self.tprop_vhs = self.propagator.timer.tvhs
-            self.tprop_gemm = self.propagator.timer.tgemm
-
-            start_clip = time.time()
-            if step > 1:
-                wbound = self.pcontrol.total_weight * 0.10
-                xp.clip(
-                    self.walkers.weight, a_min=-wbound, a_max=wbound, out=self.walkers.weight
-                )  # in-place clipping
-
-            synchronize()
-            self.tprop_clip += time.time() - start_clip
-
-            start_barrier = time.time()
-            if step % self.params.pop_control_freq == 0:
-                comm.Barrier()
-            self.tprop_barrier += time.time() - start_barrier
-
-            self.tprop += time.time() - start
-            if step % self.params.pop_control_freq == 0:
-                start = time.time()
-                self.pcontrol.pop_control(self.walkers, comm)
-                synchronize()
-                self.tpopc += time.time() - start
-                self.tpopc_send = self.pcontrol.timer.send_time
-                self.tpopc_recv = self.pcontrol.timer.recv_time
-                self.tpopc_comm = self.pcontrol.timer.communication_time
-                self.tpopc_non_comm = self.pcontrol.timer.non_communication_time
-
-            # accumulate weight, hybrid energy etc. across block
-            start = time.time()
-            self.accumulators.update(self.walkers)
-            synchronize()
-            self.testim += time.time() - start  # we dump this time into estimator
-            # calculate estimators
-            start = time.time()
+        profiler.add("setup", time.time() - tzero_setup)
+        tzero_loop = time.time()
+
+        for step in range(first_step, total_steps + 1):
+            with profiler.region("step"):
+                if step % self.params.num_stblz == 0:
+                    with profiler.region("orthogonalise"):
+                        self.walkers.orthogonalise()
+
+                with profiler.region("propagate"):
+                    if self.rng is None:
+                        self.propagator.propagate_walkers(
+                            self.walkers, self.hamiltonian, self.trial, eshift
+                        )
+                    else:
+                        xi = self.rng.normal(walker_ids, step, self.hamiltonian.nfields)
+                        self.propagator.propagate_walkers(
+                            self.walkers, self.hamiltonian, self.trial, eshift, xi=xi
+                        )
+                    with profiler.region("clip"):
+                        if step > 1:
+                            wbound = self.pcontrol.total_weight * 0.10
+                            xp.clip(
+                                self.walkers.weight,
+                                a_min=-wbound,
+                                a_max=wbound,
+                                out=self.walkers.weight,
+                            )  # in-place clipping
+                    if step % self.params.pop_control_freq == 0 and not self.pcontrol.asynchronous:
+                        with profiler.region("barrier"):
+                            comm.Barrier()
+
+                if self.pcontrol.pending:
+                    # Branch using the weights posted at the previous step.
+                    with profiler.region("pop_control"):
+                        self.pcontrol.finish_pop_control(self.walkers, comm)
+                if step % self.params.pop_control_freq == 0:
+                    with profiler.region("pop_control"):
+                        self.pcontrol.start_pop_control(self.walkers, comm)
+                    if self.rng is not None and self.pcontrol.num_rebalances != num_rebalances:
+                        # Walkers moved between tasks.
+                        walker_ids = self.get_walker_ids()
+                        num_rebalances = self.pcontrol.num_rebalances
+
+                with profiler.region("estimators"):
+                    # accumulate weight, hybrid energy etc. across block
+                    self.accumulators.update(self.walkers)
+                    # calculate estimators
+                    if step % self.params.num_steps_per_block == 0:
+                        self.estimators.compute_estimators(
+                            self.system, self.hamiltonian, self.trial, self.walkers
+                        )
+                        self.estimators.print_block(
+                            comm, step // self.params.num_steps_per_block, self.accumulators
+                        )
+                        self.accumulators.zero()
+
+                if step < num_eqlb_steps:
+                    eshift = self.accumulators.eshift
+                else:
+                    eshift += self.accumulators.eshift - eshift
+
+                if checkpoint_writer is not None and step % checkpoint_steps == 0:
+                    with profiler.region("checkpoint"):
+                        self.pcontrol.finish_pop_control(self.walkers, comm)
+                        checkpoint_writer.write(
+                            self.get_checkpoint_state(
+                                step // self.params.num_steps_per_block, eshift
+                            )
+                        )
+
             if step % self.params.num_steps_per_block == 0:
-                self.estimators.compute_estimators(
-                    self.system, self.hamiltonian, self.trial, self.walkers
-                )
-                self.estimators.print_block(
-                    comm, step // self.params.num_steps_per_block, self.accumulators
-                )
-                self.accumulators.zero()
-            synchronize()
-            self.testim += time.time() - start
-
-            # restart write features disabled
-            # if self.walkers.write_restart and step % self.walkers.write_freq == 0:
-            #     self.walkers.write_walkers_batch(comm)
-
-            if step < num_eqlb_steps:
-                eshift = self.accumulators.eshift
-            else:
-                eshift += self.accumulators.eshift - eshift
-            synchronize()
-            self.tstep += time.time() - start_step
+                num_blocks_run = (step - first_step + 1) // self.params.num_steps_per_block
+                time_per_block = (time.time() - tzero_loop) / num_blocks_run
+                if self.check_early_stop(comm, time.time() - tzero_setup, time_per_block):
+                    self.pcontrol.finish_pop_control(self.walkers, comm)
+                    if checkpoint_writer is not None and step % checkpoint_steps != 0:
+                        checkpoint_writer.write(
+                            self.get_checkpoint_state(
+                                step // self.params.num_steps_per_block, eshift
+                            )
+                        )
+                    break
+
+        self.pcontrol.finish_pop_control(self.walkers, comm)
+        if checkpoint_writer is not None:
+            checkpoint_writer.close()
+        self.estimators.close()
+        self.collect_profile()
+        if config.get_option("propagator_exponential") != "taylor" and hasattr(
+            self.propagator, "average_exp_products"
+        ):
+            num_products = self.propagator.average_exp_products(comm)
+            if comm.rank == 0 and self.verbose:
+                print(f"# Average number of matrix products per exponential: {num_products:.3f}")
+        if self.estimators.reblocker is not None and comm.rank == 0 and self.verbose:
+            mean, error = self.estimators.reblocker.estimate()
+            print(
+                f"# Online reblocking: ETotal = {mean:.10f} +/- {error:.10f} "
+                f"(equilibrated after {self.estimators.reblocker.equilibration_index} blocks)"
+            )
+
+    def check_early_stop(self, comm, time_elapsed: float, time_per_block: float) -> bool:
+        """Decide whether to stop before all blocks have been run.
+
+        The decision is made on rank 0 and broadcast to all tasks.
+
+        Parameters
+        ----------
+        comm : MPI communicator
+            Communicator.
+        time_elapsed : float
+            Wall time elapsed since the start of run.
+        time_per_block : float
+            Average wall time per block.
+
+        Returns
+        -------
+        stop : bool
+            True if the target error has been reached or the next block would
+            exceed the wall time budget.
+        """
+        if self.params.target_error <= 0 and self.params.max_wall_time <= 0:
+            return False
+        stop = None
+        if comm.rank == 0:
+            stop = self.estimators.target_error_reached(self.params.target_error)
+            if stop and self.verbose:
+                print(f"# Target error {self.params.target_error} reached. Stopping.")
+            budget = self.params.max_wall_time
+            if not stop and budget > 0 and time_elapsed + time_per_block > budget:
+                stop = True
+                if self.verbose:
+                    print(f"# Wall time budget of {budget} s would be exceeded. Stopping.")
+        return comm.bcast(stop)
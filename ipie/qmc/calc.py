@@ -20,14 +20,24 @@
 # todo : handle more gracefully.
 import json
 
-from ipie.config import MPI
+from ipie.config import config, MPI
+from ipie.hamiltonians.thc import GenericRealTHC
 from ipie.hamiltonians.utils import get_hamiltonian
 from ipie.propagation.propagator import Propagator
 from ipie.qmc.afqmc import AFQMC
 from ipie.qmc.options import QMCParams
 from ipie.systems.utils import get_system
 from ipie.trial_wavefunction.utils import get_trial_wavefunction
-from ipie.utils.io import get_input_value
+from ipie.utils.io import get_hamiltonian_format, get_input_value
+from ipie.utils.memory_planner import (
+    get_memory_budget,
+    get_tasks_per_node,
+    memory_plan_options,
+    MemoryPlan,
+    plan_memory,
+    read_hamiltonian_header,
+    read_wavefunction_header,
+)
 from ipie.utils.mpi import MPIHandler
 from ipie.walkers.walkers_dispatch import get_initial_walker, UHFWalkersTrial
 
@@ -91,10 +101,16 @@ def get_driver(options: dict, comm: MPI.COMM_WORLD) -> AFQMC:
             ham_opts, "symmetry", True, alias=["pack_chol", "pack_cholesky"], verbose=verbosity
         )
         hamiltonian = get_hamiltonian(
-            ham_file, mpi_handler.scomm, pack_chol=pack_chol, verbose=verbosity
+            ham_file, mpi_handler.scomm, pack_chol=pack_chol, verbose=verbosity, comm=comm
         )
         wfn_file = get_input_value(twf_opt, "filename", default="", alias=["wfn_file"])
         num_elec = (system.nup, system.ndown)
+        ndet_chunks = get_input_value(twf_opt, "ndet_chunks", default=0, alias=["num_det_chunks"])
+        if ndet_chunks == 0:
+            ndet_chunks = 1
+            if config.get_option("memory_planner") and not isinstance(hamiltonian, GenericRealTHC):
+                plan = get_memory_plan(options, comm)
+                ndet_chunks = plan.num_det_chunks
         trial = get_trial_wavefunction(
             num_elec,
             hamiltonian.nbasis,
@@ -104,13 +120,17 @@ def get_driver(options: dict, comm: MPI.COMM_WORLD) -> AFQMC:
             ndets_props=get_input_value(
                 twf_opt, "ndets_props", default=1, alias=["num_dets_props"]
             ),
-            ndet_chunks=get_input_value(
-                twf_opt, "ndet_chunks", default=1, alias=["num_det_chunks"]
-            ),
+            ndet_chunks=ndet_chunks,
         )
         trial.half_rotate(hamiltonian, mpi_handler.scomm)
+        memory_plan = None
+        if config.get_option("memory_planner"):
+            memory_plan = AFQMC.make_memory_plan(
+                hamiltonian, trial, qmc.nwalkers, mpi_handler, verbose=verbosity > 0
+            )
         if trial.compute_trial_energy:
-            trial.calculate_energy(system, hamiltonian)
+            with memory_plan_options(memory_plan):
+                trial.calculate_energy(system, hamiltonian)
             trial.e1b = comm.bcast(trial.e1b, root=0)
             trial.e2b = comm.bcast(trial.e2b, root=0)
         comm.barrier()
@@ -134,6 +154,10 @@ def get_driver(options: dict, comm: MPI.COMM_WORLD) -> AFQMC:
             num_stblz=qmc.nstblz,
             pop_control_freq=qmc.npop_control,
             rng_seed=qmc.rng_seed,
+            checkpoint_freq=qmc.checkpoint_freq,
+            online_reblock=qmc.online_reblock,
+            target_error=qmc.target_error,
+            max_wall_time=qmc.max_wall_time,
         )
         propagator = Propagator[type(hamiltonian)](params.timestep)
         propagator.build(hamiltonian, trial, walkers, mpi_handler)
@@ -146,11 +170,72 @@ def get_driver(options: dict, comm: MPI.COMM_WORLD) -> AFQMC:
             mpi_handler,
             params,
             verbose=(verbosity and comm.rank == 0),
+            memory_plan=memory_plan,
         )
 
     return afqmc
 
 
+def get_memory_plan(options: dict, comm) -> MemoryPlan:
+    """Predict the memory footprint of a calculation from its input options.
+
+    Only the headers of the Hamiltonian and wavefunction files are read so this
+    is cheap enough to run before a job (see ipie --dry-run).
+
+    Parameters
+    ----------
+    options : dict
+        Input options (as returned by read_input).
+    comm : MPI communicator
+        Communicator the calculation will run on.
+
+    Returns
+    -------
+    plan : MemoryPlan
+        Predicted footprint and suggested chunking.
+    """
+    qmc_opts = get_input_value(options, "qmc", default={}, alias=["qmc_options"])
+    sys_opts = get_input_value(options, "system", default={}, alias=["model"])
+    ham_opts = get_input_value(options, "hamiltonian", default={})
+    twf_opt = get_input_value(options, "trial", default={}, alias=["trial_wavefunction"])
+    from ipie.qmc.options import QMCOpts
+
+    qmc = QMCOpts(qmc_opts, verbose=0)
+    nelec = (sys_opts.get("nup"), sys_opts.get("ndown"))
+    ham_file = get_input_value(ham_opts, "integrals", None)
+    if ham_file is None:
+        ham_file = get_input_value(sys_opts, "integrals", None)
+    if ham_file is None:
+        raise ValueError("Hamiltonian filename not specified.")
+    if get_hamiltonian_format(ham_file) == "thc":
+        raise ValueError("The memory planner does not support THC Hamiltonians.")
+    pack_chol = get_input_value(ham_opts, "symmetry", True, alias=["pack_chol", "pack_cholesky"])
+    wfn_file = get_input_value(twf_opt, "filename", default="", alias=["wfn_file"])
+    nbasis, nchol, complex_integrals = read_hamiltonian_header(ham_file)
+    trial_type, ndets, nact = read_wavefunction_header(wfn_file)
+    ndets_trial = get_input_value(twf_opt, "ndets", default=1, alias=["num_dets"])
+    if ndets_trial > 0:
+        ndets = min(ndets, ndets_trial)
+    nmembers = qmc_opts.get("nmembers", 1)
+    budget = get_memory_budget(comm, config.get_option("max_memory_per_task"))
+    return plan_memory(
+        nbasis,
+        nchol,
+        nelec,
+        qmc.nwalkers,
+        budget,
+        trial_type=trial_type,
+        ndets=ndets,
+        nact=nact,
+        nmembers=nmembers,
+        nshared=get_tasks_per_node(comm),
+        ntasks=comm.size,
+        pack_chol=pack_chol,
+        complex_integrals=complex_integrals,
+        use_gpu=config.get_option("use_gpu"),
+    )
+
+
 def build_afqmc_driver(
     comm,
     nelec: tuple,
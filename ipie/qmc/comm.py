@@ -46,9 +46,17 @@ class FakeComm:
     def gather(self, sendbuf, root=0):
         return [sendbuf]
 
+    def Igather(self, sendbuf, recvbuf, root=0):
+        recvbuf[:] = sendbuf
+        return FakeReq()
+
     def Allgather(self, sendbuf, recvbuf, root=0):
         recvbuf[:] = sendbuf
 
+    def Iallgather(self, sendbuf, recvbuf):
+        recvbuf[:] = sendbuf
+        return FakeReq()
+
     def Bcast(self, sendbuf, root=0):
         return sendbuf
 
@@ -69,18 +77,33 @@ class FakeComm:
         if self.buffer.get(tag) is not None:
             recvbuff[:] = self.buffer[tag].copy()
 
-    def Allreduce(self, sendbuf, recvbuf, root=0):
+    def Allreduce(self, sendbuf, recvbuf, op=None, root=0):
+        recvbuf[:] = sendbuf
+
+    def Iallreduce(self, sendbuf, recvbuf, op=None):
         recvbuf[:] = sendbuf
+        return FakeReq()
 
     def allreduce(self, sendbuf, op=None, root=0):
         return sendbuf.copy()
 
+    def Alltoallv(self, sendbuf, recvbuf):
+        recvbuf[0][:] = sendbuf[0]
+
     def Split(self, color: int = 0, key: int = 0):
         return self
 
     def Reduce(self, sendbuf, recvbuf, op=None, root=0):
         recvbuf[:] = sendbuf
 
+    def Ireduce(self, sendbuf, recvbuf, op=None, root=0):
+        recvbuf[:] = sendbuf
+        return FakeReq()
+
+    def Exscan(self, sendbuf, recvbuf, op=None):
+        # Receive buffer is undefined on the first task.
+        pass
+
     def Scatter(self, sendbuf, recvbuf, root=0):
         recvbuf[:] = sendbuf
 
@@ -99,6 +122,9 @@ class FakeReq:
     def wait(self):
         pass
 
+    def Wait(self):
+        pass
+
 
 @dataclass
 class MPI:
@@ -107,6 +133,7 @@ class MPI:
     COMM_SPLIT_TYPE_SHARED = None
     COMM_TYPE_SHARED = None
     DOUBLE = None
+    C_DOUBLE_COMPLEX = None
     INT64_T = None
     Win = None
     IntraComm = TypeVar("IntraComm")
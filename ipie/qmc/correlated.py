@@ -0,0 +1,348 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Correlated sampling of the energy difference between two Hamiltonians."""
+
+import time
+from typing import Sequence, Tuple
+
+from ipie.analysis.autocorr import reblock_by_autocorr
+from ipie.analysis.extraction import extract_observable
+from ipie.hamiltonians.generic import GenericRealChol
+from ipie.qmc.afqmc import AFQMC
+from ipie.utils.backend import arraylib as xp
+from ipie.utils.backend import synchronize
+from ipie.utils.profiler import profiler
+from ipie.walkers.pop_controller import correlated_comb, PopControllerTimer
+
+
+def get_system_filename(basename: str, system: str) -> str:
+    """Estimator filename of system A or B."""
+    if basename.endswith(".h5"):
+        basename = basename[:-3]
+    return f"{basename}.{system}.h5"
+
+
+class CorrelatedAFQMC(object):
+    """Correlated sampling of two systems differing only in their Hamiltonian.
+
+    Two walker populations, one per Hamiltonian, are propagated with the same
+    auxiliary fields and undergo the same branching (joint comb population
+    control, see correlated_comb). The statistical fluctuations of the two
+    total energies are then strongly correlated so that their difference
+    (e.g. a reaction or geometry energy difference) has a much smaller error
+    than the difference of two independent calculations.
+
+    Parameters
+    ----------
+    driver_a : AFQMC
+        Driver for system A.
+    driver_b : AFQMC
+        Driver for system B. Must use the same MPI communicator, basis size,
+        number of walkers and timestep as driver_a.
+    """
+
+    def __init__(self, driver_a: AFQMC, driver_b: AFQMC):
+        for driver in (driver_a, driver_b):
+            if not isinstance(driver.hamiltonian, GenericRealChol):
+                raise TypeError(
+                    "Correlated sampling requires GenericRealChol Hamiltonians, "
+                    f"found {type(driver.hamiltonian).__name__}."
+                )
+        if driver_a.hamiltonian.nbasis != driver_b.hamiltonian.nbasis:
+            raise ValueError(
+                "Correlated sampling requires Hamiltonians of the same basis size "
+                f"({driver_a.hamiltonian.nbasis} != {driver_b.hamiltonian.nbasis})."
+            )
+        params_a, params_b = driver_a.params, driver_b.params
+        for name in ("num_walkers", "timestep", "num_steps_per_block", "num_blocks"):
+            if getattr(params_a, name) != getattr(params_b, name):
+                raise ValueError(f"Correlated drivers must use the same {name}.")
+        if driver_a.mpi_handler.comm.size != driver_b.mpi_handler.comm.size:
+            raise ValueError("Correlated drivers must use the same communicator.")
+        self.drivers = (driver_a, driver_b)
+        self.mpi_handler = driver_a.mpi_handler
+        self.params = params_a
+        self.verbose = driver_a.verbose
+        self.results = None
+
+    @staticmethod
+    def build(
+        num_elec: Tuple[int, int],
+        hamiltonians: Sequence,
+        trial_wavefunctions: Sequence,
+        num_walkers: int = 100,
+        seed: int = None,
+        num_steps_per_block: int = 25,
+        num_blocks: int = 100,
+        timestep: float = 0.005,
+        stabilize_freq=5,
+        pop_control_freq=5,
+        verbose=True,
+        mpi_handler=None,
+    ) -> "CorrelatedAFQMC":
+        """Build correlated drivers from two hamiltonians and trial wavefunctions.
+
+        Parameters
+        ----------
+        num_elec: tuple(int, int)
+            Number of alpha and beta electrons.
+        hamiltonians : tuple
+            Hamiltonians of system A and B.
+        trial_wavefunctions : tuple
+            Trial wavefunctions of system A and B. Must already be half rotated.
+        num_walkers : int
+            Number of walkers per MPI process in each population.
+        seed : int
+            Random number seed shared by both populations.
+        num_steps_per_block : int
+            Number of Monte Carlo steps before estimators are evaluated.
+        num_blocks : int
+            Number of blocks to perform.
+        timestep : float
+            The timestep delta_t
+        stabilize_freq : float
+            Frequency at which to perform QR factorization of walkers.
+        pop_control_freq : int
+            Frequency at which to perform population control.
+        verbose : bool
+            Log verbosity.
+        mpi_handler : MPIHandler
+            MPI handler shared by both drivers. Default None (COMM_WORLD).
+        """
+        if len(hamiltonians) != 2 or len(trial_wavefunctions) != 2:
+            raise ValueError("Expected two Hamiltonians and two trial wavefunctions.")
+        drivers = []
+        for hamiltonian, trial in zip(hamiltonians, trial_wavefunctions):
+            driver = AFQMC.build(
+                num_elec,
+                hamiltonian,
+                trial,
+                num_walkers=num_walkers,
+                seed=seed,
+                num_steps_per_block=num_steps_per_block,
+                num_blocks=num_blocks,
+                timestep=timestep,
+                stabilize_freq=stabilize_freq,
+                pop_control_freq=pop_control_freq,
+                verbose=verbose,
+                mpi_handler=mpi_handler,
+            )
+            mpi_handler = driver.mpi_handler
+            drivers.append(driver)
+        return CorrelatedAFQMC(*drivers)
+
+    @staticmethod
+    def build_from_hdf5(
+        num_elec: Tuple[int, int],
+        ham_files: Sequence[str],
+        wfn_files: Sequence[str],
+        num_walkers: int = 100,
+        seed: int = None,
+        num_steps_per_block: int = 25,
+        num_blocks: int = 100,
+        timestep: float = 0.005,
+        stabilize_freq=5,
+        pop_control_freq=5,
+        num_dets_chunk=1,
+        num_dets_for_trial_props=100,
+        pack_cholesky=True,
+        verbose=True,
+    ) -> "CorrelatedAFQMC":
+        """Build correlated drivers from hamiltonian and trial files of A and B.
+
+        See CorrelatedAFQMC.build and AFQMC.build_from_hdf5 for a description
+        of the parameters.
+        """
+        if len(ham_files) != 2 or len(wfn_files) != 2:
+            raise ValueError("Expected two Hamiltonian and two wavefunction files.")
+        drivers = []
+        for ham_file, wfn_file in zip(ham_files, wfn_files):
+            driver = AFQMC.build_from_hdf5(
+                num_elec,
+                ham_file,
+                wfn_file,
+                num_walkers=num_walkers,
+                seed=seed,
+                num_steps_per_block=num_steps_per_block,
+                num_blocks=num_blocks,
+                timestep=timestep,
+                stabilize_freq=stabilize_freq,
+                pop_control_freq=pop_control_freq,
+                num_dets_chunk=num_dets_chunk,
+                num_dets_for_trial_props=num_dets_for_trial_props,
+                pack_cholesky=pack_cholesky,
+                verbose=verbose,
+            )
+            drivers.append(driver)
+        return CorrelatedAFQMC(*drivers)
+
+    def setup(self, estimator_filename: str):
+        comm = self.mpi_handler.comm
+        for driver, system in zip(self.drivers, ("A", "B")):
+            driver.setup_timers()
+            driver.walkers.orthogonalise()
+            driver.get_env_info()
+            driver.copy_to_gpu()
+            driver.setup_estimators(get_system_filename(estimator_filename, system))
+        self.timer = PopControllerTimer()
+        self.total_weight = self.params.num_walkers * comm.size
+
+    def run(self, estimator_filename: str = "estimates.h5", verbose=True):
+        """Run the correlated random walks of systems A and B.
+
+        Parameters
+        ----------
+        estimator_filename : str
+            Basename of estimator files. System A (B) writes to
+            basename.A.h5 (basename.B.h5).
+        verbose : bool
+            Print the energy difference at the end.
+
+        Returns
+        -------
+        results : dict
+            Total energies of A and B and their difference with errors.
+        """
+        tzero_setup = time.time()
+        self.estimator_filename = estimator_filename
+        self.setup(estimator_filename)
+        comm = self.mpi_handler.comm
+        params = self.params
+        nwalkers = self.drivers[0].walkers.nwalkers
+        nfields = [driver.hamiltonian.nfields for driver in self.drivers]
+        max_nfields = max(nfields)
+        eshifts = [0.0, 0.0]
+        num_eqlb_steps = 2.0 / params.timestep
+        total_steps = params.num_steps_per_block * params.num_blocks
+        rng = self.drivers[0].rng
+        if rng is not None:
+            walker_ids = self.drivers[0].get_walker_ids()
+
+        synchronize()
+        profiler.add("setup", time.time() - tzero_setup)
+
+        for step in range(1, total_steps + 1):
+            with profiler.region("step"):
+                if step % params.num_stblz == 0:
+                    with profiler.region("orthogonalise"):
+                        for driver in self.drivers:
+                            driver.walkers.orthogonalise()
+
+                with profiler.region("propagate"):
+                    # Common auxiliary fields. System with fewer Cholesky
+                    # vectors uses the leading fields.
+                    if rng is None:
+                        xi = xp.random.normal(0.0, 1.0, nwalkers * max_nfields).reshape(
+                            nwalkers, max_nfields
+                        )
+                    else:
+                        xi = rng.normal(walker_ids, step, max_nfields)
+                    for i, driver in enumerate(self.drivers):
+                        driver.propagator.propagate_walkers(
+                            driver.walkers,
+                            driver.hamiltonian,
+                            driver.trial,
+                            eshifts[i],
+                            xi=xi[:, : nfields[i]],
+                        )
+                    with profiler.region("clip"):
+                        if step > 1:
+                            wbound = self.total_weight * 0.10
+                            for driver in self.drivers:
+                                xp.clip(
+                                    driver.walkers.weight,
+                                    a_min=-wbound,
+                                    a_max=wbound,
+                                    out=driver.walkers.weight,
+                                )
+                    if step % params.pop_control_freq == 0:
+                        with profiler.region("barrier"):
+                            comm.Barrier()
+
+                if step % params.pop_control_freq == 0:
+                    with profiler.region("pop_control"):
+                        self.total_weight = correlated_comb(
+                            [driver.walkers for driver in self.drivers],
+                            comm,
+                            params.num_walkers * comm.size,
+                            self.timer,
+                        )
+
+                with profiler.region("estimators"):
+                    for i, driver in enumerate(self.drivers):
+                        driver.accumulators.update(driver.walkers)
+                        if step % params.num_steps_per_block == 0:
+                            driver.estimators.compute_estimators(
+                                driver.system, driver.hamiltonian, driver.trial, driver.walkers
+                            )
+                            driver.estimators.print_block(
+                                comm, step // params.num_steps_per_block, driver.accumulators
+                            )
+                            driver.accumulators.zero()
+                        if step < num_eqlb_steps:
+                            eshifts[i] = driver.accumulators.eshift
+                        else:
+                            eshifts[i] += driver.accumulators.eshift - eshifts[i]
+
+        for driver in self.drivers:
+            driver.estimators.close()
+            driver.collect_profile()
+        return self.analyse(verbose=verbose)
+
+    def analyse(self, equilibration_fraction: float = 0.1, verbose=False):
+        """Reblock the total energies of A and B and their difference.
+
+        The difference is formed block by block before reblocking so that the
+        error accounts for the correlation between the two systems.
+
+        Parameters
+        ----------
+        equilibration_fraction : float
+            Fraction of blocks discarded before analysing.
+        verbose : bool
+            Print the results.
+
+        Returns
+        -------
+        results : dict
+            Mean and error of ETotal of A ("A", "A_error"), B ("B", "B_error")
+            and of ETotal_A - ETotal_B ("difference", "difference_error").
+        """
+        comm = self.mpi_handler.comm
+        results = None
+        if comm.rank == 0:
+            energies = [
+                extract_observable(get_system_filename(self.estimator_filename, system), "energy")[
+                    "ETotal"
+                ].values.real
+                for system in ("A", "B")
+            ]
+            energies.append(energies[0] - energies[1])
+            results = {}
+            for name, energy in zip(("A", "B", "difference"), energies):
+                start = int(equilibration_fraction * len(energy))
+                reblocked = reblock_by_autocorr(energy[start:], name=name)
+                results[name] = float(reblocked[f"{name}_ac"].values[0])
+                results[f"{name}_error"] = float(reblocked[f"{name}_error_ac"].values[0])
+            if verbose:
+                print("# Correlated sampling summary:")
+                for name in ("A", "B", "difference"):
+                    print(f"# {name:>10s}: {results[name]:.8f} +/- {results[f'{name}_error']:.8f}")
+        self.results = comm.bcast(results, root=0)
+        return self.results
+
+    def finalise(self, verbose=False):
+        """Tidy up."""
+        self.drivers[0].finalise(verbose=verbose)
@@ -0,0 +1,321 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run several AFQMC calculations sharing one Hamiltonian in a single MPI job."""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy
+
+from ipie.analysis.autocorr import reblock_by_autocorr
+from ipie.analysis.extraction import extract_observable
+from ipie.analysis.extrapolation import extrapolate_timestep
+from ipie.config import MPI
+from ipie.hamiltonians.utils import get_hamiltonian
+from ipie.qmc.afqmc import AFQMC
+from ipie.trial_wavefunction.utils import get_trial_wavefunction
+from ipie.utils.mpi import get_shared_comm, MPIHandler
+
+
+def get_member_filename(basename: str, member: int) -> str:
+    """Estimator filename of ensemble member."""
+    if basename.endswith(".h5"):
+        basename = basename[:-3]
+    return f"{basename}.member{member}.h5"
+
+
+class AFQMCEnsemble(object):
+    """Ensemble of AFQMC calculations differing only in timestep and seed.
+
+    The MPI tasks are split into equally sized groups, one per member, each of
+    which runs an independent AFQMC calculation. The Hamiltonian and the half
+    rotated Cholesky vectors are built once and, if MPI shared memory is
+    available, stored once per node for all members. At the end the total
+    energies of the members are extrapolated to zero timestep.
+
+    Parameters
+    ----------
+    driver : AFQMC
+        Driver of the member this task belongs to.
+    member : int
+        Index of the member this task belongs to.
+    timesteps : list of float
+        Timestep of each member.
+    seeds : list of int or None
+        Random number seed of each member.
+    comm : MPI communicator
+        Communicator containing all members.
+    """
+
+    def __init__(self, driver: AFQMC, member: int, timesteps, seeds, comm):
+        self.driver = driver
+        self.member = member
+        self.timesteps = list(timesteps)
+        self.seeds = list(seeds)
+        self.comm = comm
+        self.member_comm = driver.mpi_handler.comm
+        self.results = None
+
+    @property
+    def num_members(self) -> int:
+        return len(self.timesteps)
+
+    @staticmethod
+    def split_members(
+        timesteps: Sequence[float], seeds: Optional[Sequence[int]] = None, seed_stride: int = 1
+    ) -> Tuple[List[float], List[Optional[int]]]:
+        """Expand timesteps and seeds to one entry per member.
+
+        A single timestep is repeated for every member. A single seed is
+        offset by seed_stride for each member so the members draw independent
+        random numbers (the member's rank is added to its seed, see
+        set_rng_seed, so seed_stride should be at least the number of tasks
+        per member).
+        """
+        timesteps = [float(dt) for dt in numpy.atleast_1d(timesteps)]
+        if seeds is None:
+            seeds = [None]
+        else:
+            seeds = [int(seed) for seed in numpy.atleast_1d(seeds)]
+        if len(timesteps) == 1:
+            timesteps = timesteps * len(seeds)
+        if len(seeds) == 1 and seeds[0] is not None:
+            seeds = [seeds[0] + i * seed_stride for i in range(len(timesteps))]
+        elif len(seeds) == 1:
+            seeds = seeds * len(timesteps)
+        if len(seeds) != len(timesteps):
+            raise ValueError("Expected the same number of timesteps and seeds.")
+        return timesteps, seeds
+
+    @staticmethod
+    def build(
+        num_elec: Tuple[int, int],
+        hamiltonian,
+        trial_wavefunction,
+        timesteps: Sequence[float],
+        seeds: Optional[Sequence[int]] = None,
+        num_walkers: int = 100,
+        num_steps_per_block: int = 25,
+        num_blocks: int = 100,
+        stabilize_freq=5,
+        pop_control_freq=5,
+        verbose=True,
+        comm=None,
+    ) -> "AFQMCEnsemble":
+        """Build ensemble from hamiltonian and (half rotated) trial wavefunction.
+
+        Parameters
+        ----------
+        num_elec: tuple(int, int)
+            Number of alpha and beta electrons.
+        hamiltonian :
+            Hamiltonian describing the system.
+        trial_wavefunction:
+            Trial wavefunction. Must already be half rotated.
+        timesteps : list of float
+            Timestep of each member of the ensemble.
+        seeds : list of int
+            Random number seed of each member. Default None, i.e. random seeds.
+            If a single timestep is given one member is run per seed. A single
+            seed is offset for each member, see split_members.
+        num_walkers : int
+            Number of walkers per MPI process in each member.
+        num_steps_per_block : int
+            Number of Monte Carlo steps before estimators are evaluated.
+        num_blocks : int
+            Number of blocks to perform.
+        stabilize_freq : float
+            Frequency at which to perform QR factorization of walkers.
+        pop_control_freq : int
+            Frequency at which to perform population control.
+        verbose : bool
+            Log verbosity. Only the first member prints to stdout.
+        comm : MPI communicator
+            Communicator to split between members. Default MPI.COMM_WORLD.
+        """
+        if comm is None:
+            comm = MPI.COMM_WORLD
+        if seeds is None:
+            # Members must not draw their seeds independently from the same
+            # global state.
+            seed = numpy.random.randint(0, 1e8) if comm.rank == 0 else None
+            seeds = comm.bcast(seed, root=0)
+        timesteps, seeds = AFQMCEnsemble.split_members(timesteps, seeds, seed_stride=comm.size)
+        num_members = len(timesteps)
+        if comm.size % num_members != 0:
+            raise ValueError(
+                f"Number of MPI tasks ({comm.size}) must be divisible by the number "
+                f"of ensemble members ({num_members})."
+            )
+        member = comm.rank // (comm.size // num_members)
+        member_comm = comm.Split(color=member, key=comm.rank)
+        mpi_handler = MPIHandler(comm=member_comm)
+        if verbose and comm.rank == 0:
+            print(f"# Running ensemble of {num_members} AFQMC calculations")
+            for i, (dt, seed) in enumerate(zip(timesteps, seeds)):
+                print(f"# Member {i}: timestep = {dt}, seed = {seed}")
+        driver = AFQMC.build(
+            num_elec,
+            hamiltonian,
+            trial_wavefunction,
+            num_walkers=num_walkers,
+            seed=seeds[member],
+            num_steps_per_block=num_steps_per_block,
+            num_blocks=num_blocks,
+            timestep=timesteps[member],
+            stabilize_freq=stabilize_freq,
+            pop_control_freq=pop_control_freq,
+            verbose=(verbose and comm.rank == 0),
+            mpi_handler=mpi_handler,
+        )
+        driver.print_estimates = member == 0
+        return AFQMCEnsemble(driver, member, timesteps, seeds, comm)
+
+    @staticmethod
+    def build_from_hdf5(
+        num_elec: Tuple[int, int],
+        ham_file: str,
+        wfn_file: str,
+        timesteps: Sequence[float],
+        seeds: Optional[Sequence[int]] = None,
+        num_walkers: int = 100,
+        num_steps_per_block: int = 25,
+        num_blocks: int = 100,
+        stabilize_freq=5,
+        pop_control_freq=5,
+        num_dets_chunk=1,
+        num_dets_for_trial_props=100,
+        pack_cholesky=True,
+        verbose=True,
+        comm=None,
+    ) -> "AFQMCEnsemble":
+        """Build ensemble reading the Hamiltonian and trial once for all members.
+
+        The integrals are read and packed, and the trial half rotated, once in
+        node shared memory (work split over all tasks on the node) before the
+        tasks are split into members. See AFQMCEnsemble.build and
+        AFQMC.build_from_hdf5 for a description of the parameters.
+        """
+        if comm is None:
+            comm = MPI.COMM_WORLD
+        shared_comm = get_shared_comm(comm)
+        if shared_comm is None:
+            shared_comm = comm
+        _verbose = verbose and comm.rank == 0
+        ham = get_hamiltonian(
+            ham_file, shared_comm, verbose=_verbose, pack_chol=pack_cholesky, comm=comm
+        )
+        trial = get_trial_wavefunction(
+            num_elec,
+            ham.nbasis,
+            wfn_file,
+            ndet_chunks=num_dets_chunk,
+            ndets_props=num_dets_for_trial_props,
+            verbose=_verbose,
+        )
+        trial.half_rotate(ham, shared_comm)
+        return AFQMCEnsemble.build(
+            trial.nelec,
+            ham,
+            trial,
+            timesteps,
+            seeds=seeds,
+            num_walkers=num_walkers,
+            num_steps_per_block=num_steps_per_block,
+            num_blocks=num_blocks,
+            stabilize_freq=stabilize_freq,
+            pop_control_freq=pop_control_freq,
+            verbose=verbose,
+            comm=comm,
+        )
+
+    def run(
+        self,
+        estimator_filename: str = "estimates.h5",
+        verbose=True,
+        equilibration_fraction: float = 0.1,
+        order: int = 1,
+    ):
+        """Run all members and extrapolate the total energy to zero timestep.
+
+        Parameters
+        ----------
+        estimator_filename : str
+            Basename of estimator files. Member i writes to
+            basename.member{i}.h5.
+        verbose : bool
+            Print output of the first member and the extrapolation.
+        equilibration_fraction : float
+            Fraction of blocks discarded before analysing each member.
+        order : int
+            Order of the polynomial in the timestep used for extrapolation.
+
+        Returns
+        -------
+        results : dict
+            Timesteps, seeds, energies and errors of the members and the
+            extrapolated energy (energy_dt0) and error (error_dt0).
+        """
+        self.estimator_filename = estimator_filename
+        filename = get_member_filename(estimator_filename, self.member)
+        self.driver.run(estimator_filename=filename, verbose=verbose and self.comm.rank == 0)
+        return self.analyse(equilibration_fraction=equilibration_fraction, order=order)
+
+    def analyse(self, equilibration_fraction: float = 0.1, order: int = 1):
+        """Collect member energies and extrapolate to zero timestep (collective)."""
+        estimate = None
+        if self.member_comm.rank == 0:
+            filename = get_member_filename(self.estimator_filename, self.member)
+            energy = extract_observable(filename, "energy")["ETotal"].values.real
+            start = int(equilibration_fraction * len(energy))
+            reblocked = reblock_by_autocorr(energy[start:])
+            estimate = (
+                self.member,
+                float(reblocked["ETotal_ac"].values[0]),
+                float(reblocked["ETotal_error_ac"].values[0]),
+            )
+        estimates = self.comm.gather(estimate, root=0)
+        results = None
+        if self.comm.rank == 0:
+            estimates = sorted(e for e in estimates if e is not None)
+            energies = [e[1] for e in estimates]
+            errors = [e[2] for e in estimates]
+            energy_dt0, error_dt0 = extrapolate_timestep(
+                self.timesteps, energies, errors, order=order
+            )
+            results = {
+                "timesteps": self.timesteps,
+                "seeds": self.seeds,
+                "energies": energies,
+                "errors": errors,
+                "energy_dt0": energy_dt0,
+                "error_dt0": error_dt0,
+            }
+        self.results = self.comm.bcast(results, root=0)
+        return self.results
+
+    def finalise(self, verbose=False):
+        """Print a summary of the members and the extrapolated energy."""
+        self.driver.finalise(verbose=verbose and self.comm.rank == 0)
+        if verbose and self.comm.rank == 0 and self.results is not None:
+            print("# Ensemble summary:")
+            print(f"# {'Member':>6s} {'Timestep':>12s} {'ETotal':>16s} {'Error':>12s}")
+            for i, (dt, e, err) in enumerate(
+                zip(self.results["timesteps"], self.results["energies"], self.results["errors"])
+            ):
+                print(f"# {i:>6d} {dt:>12.6f} {e:>16.8f} {err:>12.8f}")
+            print(
+                f"# Extrapolated dt -> 0 energy: {self.results['energy_dt0']:.8f} "
+                f"+/- {self.results['error_dt0']:.8f}"
+            )
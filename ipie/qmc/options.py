@@ -71,6 +71,14 @@ class QMCOpts(object):
         local energy bound when using phaseless approximation.
     rng_seed : int
         The random number seed.
+    checkpoint_freq : int
+        Frequency (in blocks) at which restart checkpoints are written.
+    online_reblock : bool
+        Reblock the total energy on the fly and print its error bar.
+    target_error : float
+        Stop once the online error bar on the total energy reaches this value.
+    max_wall_time : float
+        Wall clock budget (seconds) for the run.
     """
 
     # pylint: disable=dangerous-default-value
@@ -127,6 +135,22 @@ class QMCOpts(object):
             alias=["random_seed", "seed"],
             verbose=verbose,
         )
+        self.checkpoint_freq = get_input_value(
+            inputs,
+            "checkpoint_freq",
+            default=0,
+            alias=["restart_freq"],
+            verbose=verbose,
+        )
+        self.online_reblock = get_input_value(
+            inputs, "online_reblock", default=False, verbose=verbose
+        )
+        self.target_error = get_input_value(
+            inputs, "target_error", default=0.0, alias=["target_stat_error"], verbose=verbose
+        )
+        self.max_wall_time = get_input_value(
+            inputs, "max_wall_time", default=0.0, alias=["walltime"], verbose=verbose
+        )
 
     def __str__(self, verbose=0):
         _str = ""
@@ -158,6 +182,19 @@ class QMCParams:
     rng_seed : int
         The random number seed. If run in parallel the seeds on other cores /
         threads are determined from this.
+    checkpoint_freq : int
+        Frequency (in units of blocks) at which restart checkpoints are
+        written. Default 0, i.e. never.
+    online_reblock : bool
+        Reblock the total energy on the fly and print the running mean and
+        error bar every block. Default False.
+    target_error : float
+        Stop the simulation once the online error bar on the total energy
+        drops below this value (implies online_reblock). Default 0, i.e. run
+        all blocks.
+    max_wall_time : float
+        Wall clock budget in seconds. The simulation stops early if the next
+        block is not expected to finish within it. Default 0, i.e. no limit.
     """
 
     num_walkers: int
@@ -168,3 +205,7 @@ class QMCParams:
     num_stblz: int = 5
     pop_control_freq: int = 5
     rng_seed: Optional[int] = None
+    checkpoint_freq: int = 0
+    online_reblock: bool = False
+    target_error: float = 0.0
+    max_wall_time: float = 0.0
@@ -23,7 +23,7 @@ import numpy
 import pytest
 
 from ipie.analysis.extraction import extract_mixed_estimates, extract_observable
-from ipie.config import MPI
+from ipie.config import config, MPI
 from ipie.qmc.calc import AFQMC
 from ipie.utils.io import write_hamiltonian, write_wavefunction
 from ipie.utils.legacy_testing import build_legacy_driver_instance
@@ -254,6 +254,119 @@ def test_factory_method():
         AFQMC.build_from_hdf5(nelec, hamilf.name, wfnf.name)
 
 
+@pytest.mark.driver
+def test_checkpoint_restart():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        checkpoint_file = os.path.join(tmpdir, "checkpoint")
+        estimates = os.path.join(tmpdir, "estimates.0.h5")
+        qmc_options = {
+            "dt": 0.005,
+            "nwalkers": nwalkers,
+            "steps": 10,
+            "blocks": 4,
+            "pop_control_freq": pop_control_freq,
+            "stabilise_freq": stabilise_freq,
+            "rng_seed": seed,
+            "checkpoint_freq": 3,
+            "online_reblock": True,
+        }
+        driver_options = {"qmc": qmc_options}
+        afqmc = build_driver_test_instance(
+            nelec, nmo, trial_type="single_det", options=driver_options, seed=7
+        )
+        afqmc.run(verbose=False, estimator_filename=estimates, checkpoint_file=checkpoint_file)
+        assert os.path.isfile(checkpoint_file + ".0.h5")
+        reference = extract_observable(estimates, "energy")
+        qmc_options["checkpoint_freq"] = 0
+        restarted = build_driver_test_instance(
+            nelec, nmo, trial_type="single_det", options=driver_options, seed=7
+        )
+        restarted.run(verbose=False, estimator_filename=estimates, restart_file=checkpoint_file)
+        # Blocks before the checkpoint are kept in the estimator file.
+        assert numpy.allclose(extract_observable(estimates, "energy"), reference)
+        assert restarted.estimators.reblocker.num_pushed == afqmc.estimators.reblocker.num_pushed
+        assert restarted.estimators.reblocker.estimate() == afqmc.estimators.reblocker.estimate()
+        assert numpy.array_equal(afqmc.walkers.phia, restarted.walkers.phia)
+        assert numpy.array_equal(afqmc.walkers.phib, restarted.walkers.phib)
+        assert numpy.array_equal(afqmc.walkers.weight, restarted.walkers.weight)
+        assert numpy.array_equal(afqmc.walkers.ovlp, restarted.walkers.ovlp)
+        assert afqmc.pcontrol.total_weight == restarted.pcontrol.total_weight
+
+
+@pytest.mark.driver
+def test_async_estimator_output():
+    qmc_options = {
+        "dt": 0.005,
+        "nwalkers": nwalkers,
+        "steps": 10,
+        "blocks": 6,
+        "pop_control_freq": pop_control_freq,
+        "stabilise_freq": stabilise_freq,
+        "rng_seed": seed,
+    }
+    driver_options = {"qmc": qmc_options}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        energies = []
+        walkers = []
+        for async_output, shift_lag in ((False, False), (True, False), (True, True)):
+            config.update_option("estimator_async_output", async_output)
+            config.update_option("estimator_shift_lag", shift_lag)
+            try:
+                afqmc = build_driver_test_instance(
+                    nelec, nmo, trial_type="single_det", options=driver_options, seed=7
+                )
+                estimates = os.path.join(tmpdir, f"estimates.{async_output}.{shift_lag}.h5")
+                afqmc.run(verbose=False, estimator_filename=estimates)
+            finally:
+                config.update_option("estimator_async_output", False)
+                config.update_option("estimator_shift_lag", False)
+            energies.append(extract_observable(estimates, "energy"))
+            walkers.append(afqmc.walkers.phia.copy())
+        assert len(energies[0]) == qmc_options["blocks"] + 1
+        assert numpy.allclose(energies[0].values, energies[1].values)
+        assert numpy.array_equal(walkers[0], walkers[1])
+        # Lagging the shift changes the trajectory but not the amount of output.
+        assert len(energies[2]) == qmc_options["blocks"] + 1
+        assert not numpy.allclose(energies[0].values, energies[2].values)
+
+
+@pytest.mark.driver
+def test_early_stopping():
+    qmc_options = {
+        "dt": 0.005,
+        "nwalkers": nwalkers,
+        "steps": 1,
+        "blocks": 200,
+        "pop_control_freq": 1,
+        "stabilise_freq": stabilise_freq,
+        "rng_seed": seed,
+        "target_error": 1e3,
+    }
+    driver_options = {"qmc": qmc_options}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        estimates = os.path.join(tmpdir, "estimates.0.h5")
+        afqmc = build_driver_test_instance(
+            nelec, nmo, trial_type="single_det", options=driver_options, seed=7
+        )
+        afqmc.run(verbose=False, estimator_filename=estimates)
+        reblocker = afqmc.estimators.reblocker
+        assert reblocker.equilibrated
+        mean, error = reblocker.estimate()
+        assert error < 1e3
+        num_blocks = len(extract_observable(estimates, "energy")) - 1
+        assert reblocker.num_pushed == num_blocks
+        assert num_blocks < qmc_options["blocks"]
+        # Exhaust the wall time budget after the first block.
+        qmc_options["target_error"] = 0.0
+        qmc_options["max_wall_time"] = 1e-6
+        afqmc = build_driver_test_instance(
+            nelec, nmo, trial_type="single_det", options=driver_options, seed=7
+        )
+        afqmc.run(verbose=False, estimator_filename=estimates)
+        assert afqmc.estimators.reblocker is None
+        assert len(extract_observable(estimates, "energy")) == 2
+
+
 if __name__ == "__main__":
     test_generic_single_det_batch()
     test_generic_single_det_batch_density_diff()
@@ -0,0 +1,101 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+
+import numpy
+import pytest
+
+from ipie.config import MPI
+from ipie.qmc.correlated import CorrelatedAFQMC, get_system_filename
+from ipie.utils.io import write_hamiltonian, write_wavefunction
+from ipie.utils.mpi import MPIHandler
+from ipie.walkers.pop_controller import correlated_comb
+from ipie.walkers.uhf_walkers import UHFWalkers
+
+comm = MPI.COMM_WORLD
+
+
+@pytest.mark.unit
+def test_correlated_comb():
+    numpy.random.seed(7)
+    nmo, nelec, nwalkers = 6, (2, 2), 20
+    init = numpy.eye(nmo, dtype=numpy.complex128)[:, : sum(nelec)]
+    populations = [
+        UHFWalkers(init, nelec[0], nelec[1], nmo, nwalkers, MPIHandler()) for _ in range(2)
+    ]
+    # Tag walkers so we can track their parents.
+    for walkers in populations:
+        walkers.phase[:] = numpy.arange(nwalkers) + 1
+    weights_a = numpy.random.random(nwalkers)
+    weights_b = 2 * numpy.random.random(nwalkers)
+    populations[0].weight = weights_a.copy()
+    populations[1].weight = weights_b.copy()
+    total = correlated_comb(populations, comm, nwalkers * comm.size)
+    assert total == pytest.approx(comm.size * 0.5 * (weights_a + weights_b).sum())
+    # Both populations undergo the same branching.
+    parents = numpy.rint(populations[0].phase.real).astype(int) - 1
+    assert numpy.allclose(populations[1].phase, populations[0].phase)
+    # Walkers carry their weight relative to the joint weight.
+    joint = 0.5 * (weights_a + weights_b)
+    if comm.size == 1:
+        assert numpy.allclose(populations[0].weight, (weights_a / joint)[parents])
+        assert numpy.allclose(populations[1].weight, (weights_b / joint)[parents])
+
+
+@pytest.mark.driver
+def test_correlated_sampling():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        numpy.random.seed(7)
+        nelec = (3, 2)
+        nmo, naux = 8, 20
+        hcore = numpy.random.random((nmo, nmo))
+        hcore = hcore + hcore.T
+        LXmn = numpy.random.random((naux, nmo, nmo))
+        LXmn = 0.1 * (LXmn + LXmn.transpose((0, 2, 1)))
+        ham_files = []
+        # System B has slightly stronger interactions.
+        for i, scale in enumerate([1.0, 1.02]):
+            filename = os.path.join(tmpdir, f"ham{i}.h5")
+            write_hamiltonian(hcore, scale * LXmn, 0.0, filename=filename)
+            ham_files.append(filename)
+        wfn_file = os.path.join(tmpdir, "wfn.h5")
+        wfna = numpy.eye(nmo)[:, : nelec[0]]
+        wfnb = numpy.eye(nmo)[:, : nelec[1]]
+        write_wavefunction([wfna, wfnb], filename=wfn_file)
+        driver = CorrelatedAFQMC.build_from_hdf5(
+            nelec,
+            ham_files,
+            [wfn_file, wfn_file],
+            num_walkers=10,
+            seed=7,
+            num_steps_per_block=2,
+            num_blocks=40,
+            timestep=0.01,
+            verbose=False,
+        )
+        # Estimator files are written by rank 0 only.
+        basename = comm.bcast(os.path.join(tmpdir, "estimates.h5"), root=0)
+        results = driver.run(estimator_filename=basename, verbose=False)
+        if comm.rank == 0:
+            for system in ("A", "B"):
+                assert os.path.exists(get_system_filename(basename, system))
+    # Correlated fluctuations cancel in the difference.
+    assert results["difference_error"] < min(results["A_error"], results["B_error"])
+
+
+if __name__ == "__main__":
+    test_correlated_comb()
+    test_correlated_sampling()
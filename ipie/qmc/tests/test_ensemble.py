@@ -0,0 +1,83 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+
+import numpy
+import pytest
+
+from ipie.config import MPI
+from ipie.qmc.ensemble import AFQMCEnsemble, get_member_filename
+from ipie.utils.io import write_hamiltonian, write_wavefunction
+
+comm = MPI.COMM_WORLD
+
+
+@pytest.mark.unit
+def test_split_members():
+    timesteps, seeds = AFQMCEnsemble.split_members([0.02, 0.01], 7)
+    assert timesteps == [0.02, 0.01]
+    assert seeds == [7, 8]
+    # Seeds of tasks in different members do not overlap.
+    timesteps, seeds = AFQMCEnsemble.split_members([0.02, 0.01, 0.005], 7, seed_stride=4)
+    assert seeds == [7, 11, 15]
+    timesteps, seeds = AFQMCEnsemble.split_members(0.01, [1, 2, 3])
+    assert timesteps == [0.01] * 3
+    assert seeds == [1, 2, 3]
+    timesteps, seeds = AFQMCEnsemble.split_members([0.02, 0.01])
+    assert seeds == [None, None]
+    with pytest.raises(ValueError):
+        AFQMCEnsemble.split_members([0.02, 0.01], [1, 2, 3])
+
+
+@pytest.mark.driver
+def test_ensemble():
+    with tempfile.NamedTemporaryFile() as hamilf, tempfile.NamedTemporaryFile() as wfnf:
+        numpy.random.seed(7)
+        nelec = (3, 2)
+        nmo, naux = 8, 20
+        hcore = numpy.random.random((nmo, nmo))
+        hcore = hcore + hcore.T
+        LXmn = numpy.random.random((naux, nmo, nmo))
+        LXmn = 0.1 * (LXmn + LXmn.transpose((0, 2, 1)))
+        write_hamiltonian(hcore, LXmn, 0.0, filename=hamilf.name)
+        wfna = numpy.eye(nmo)[:, : nelec[0]]
+        wfnb = numpy.eye(nmo)[:, : nelec[1]]
+        write_wavefunction([wfna, wfnb], filename=wfnf.name)
+        timesteps = [0.01 * (i + 1) for i in range(comm.size)]
+        ensemble = AFQMCEnsemble.build_from_hdf5(
+            nelec,
+            hamilf.name,
+            wfnf.name,
+            timesteps,
+            seeds=7,
+            num_walkers=10,
+            num_steps_per_block=2,
+            num_blocks=20,
+            verbose=False,
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            basename = os.path.join(tmpdir, "estimates.h5")
+            results = ensemble.run(estimator_filename=basename, verbose=False)
+            assert os.path.exists(get_member_filename(basename, ensemble.member))
+        assert len(results["energies"]) == comm.size
+        assert len(set(results["seeds"])) == comm.size
+        assert numpy.isfinite(results["energy_dt0"])
+        if comm.size == 1:
+            assert results["energy_dt0"] == pytest.approx(results["energies"][0])
+
+
+if __name__ == "__main__":
+    test_ensemble()
@@ -22,10 +22,12 @@ import tempfile
 import numpy
 import pytest
 
-from ipie.config import MPI
+from ipie.config import config, MPI
 from ipie.hamiltonians.generic import Generic as HamGeneric
-from ipie.hamiltonians.utils import get_generic_integrals
+from ipie.hamiltonians.utils import get_generic_integrals, get_hamiltonian
 from ipie.systems.generic import Generic
+from ipie.utils.io import write_hamiltonian
+from ipie.utils.mpi import get_shared_comm
 from ipie.utils.testing import generate_hamiltonian
 
 
@@ -133,9 +135,40 @@ def test_shmem():
         assert numpy.linalg.norm(ham.chol - chol_) == pytest.approx(0.0)  # now two are transposed
 
 
+@pytest.mark.unit
+@pytest.mark.parametrize("cplx", [False, True])
+def test_read_streaming(cplx):
+    numpy.random.seed(7)
+    nmo = 13
+    nelec = (4, 3)
+    h1e, chol, enuc, _ = generate_hamiltonian(nmo, nelec, cplx=cplx, sym=4 if cplx else 8)
+    nchol = chol.shape[0]
+    ref = HamGeneric(numpy.array([h1e, h1e]), chol.reshape((nchol, -1)).T.copy(), enuc)
+    shared_comm = get_shared_comm(MPI.COMM_WORLD)
+    max_memory = config.get_option("max_memory_hamiltonian_read")
+    # Read 10 Cholesky vectors at a time.
+    config.update_option("max_memory_hamiltonian_read", 10.5 * nmo * nmo * chol.itemsize / 1024**3)
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "hamiltonian.h5")
+            write_hamiltonian(h1e, chol, enuc, filename=filename)
+            ham = get_hamiltonian(filename, shared_comm)
+    finally:
+        config.update_option("max_memory_hamiltonian_read", max_memory)
+    assert nchol > 10
+    assert type(ham) is type(ref)
+    assert ham.ecore == pytest.approx(enuc)
+    numpy.testing.assert_allclose(ham.chol, ref.chol)
+    numpy.testing.assert_allclose(ham.h1e_mod, ref.h1e_mod, atol=1e-12)
+    if not cplx:
+        numpy.testing.assert_allclose(ham.chol_packed, ref.chol_packed)
+
+
 if __name__ == "__main__":
     test_real()
     test_complex()
     # test_write()
     test_read()
+    test_read_streaming(False)
+    test_read_streaming(True)
     test_shmem()
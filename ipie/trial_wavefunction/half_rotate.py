@@ -2,6 +2,12 @@ from typing import Tuple
 
 import numpy as np
 
+from ipie.config import config
+from ipie.hamiltonians.cache import (
+    get_half_rotation_cache_filename,
+    read_half_rotated,
+    write_half_rotated,
+)
 from ipie.hamiltonians.generic import Generic, GenericComplexChol, GenericRealChol
 from ipie.hamiltonians.generic_chunked import GenericRealCholChunked
 from ipie.trial_wavefunction.wavefunction_base import TrialWavefunctionBase
@@ -17,6 +23,36 @@ def half_rotate_generic(
     ndets: int = 1,
     verbose: bool = False,
 ) -> Tuple[Tuple[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]]:
+    cache_dir = config.get_option("hamiltonian_cache_dir")
+    # Only Hamiltonians read through the Hamiltonian cache have a cheap key.
+    if not cache_dir or getattr(hamiltonian, "cache_key", None) is None:
+        return _half_rotate_generic(trial, hamiltonian, comm, orbsa, orbsb, ndets, verbose)
+    # Reuse the integrals from a previous run with the same Hamiltonian and
+    # trial orbitals.
+    rank = 0 if comm is None else comm.rank
+    cache_file = None
+    if rank == 0:
+        cache_file = get_half_rotation_cache_filename(hamiltonian, orbsa, orbsb, cache_dir)
+    if comm is not None:
+        cache_file = comm.bcast(cache_file, root=0)
+    rotated = read_half_rotated(cache_file, comm)
+    if rotated is not None:
+        if verbose:
+            print(f"# Read half rotated integrals from cache: {cache_file}")
+        return rotated
+    rot_1body, rot_chol = _half_rotate_generic(
+        trial, hamiltonian, comm, orbsa, orbsb, ndets, verbose
+    )
+    if rank == 0:
+        write_half_rotated(cache_file, rot_1body, rot_chol)
+        if verbose:
+            print(f"# Wrote half rotated integrals to cache: {cache_file}")
+    if comm is not None:
+        comm.barrier()
+    return rot_1body, rot_chol
+
+
+def _half_rotate_generic(trial, hamiltonian, comm, orbsa, orbsb, ndets, verbose):
     if verbose:
         print("# Constructing half rotated Cholesky vectors.")
     assert len(orbsa.shape) == 3
@@ -39,71 +75,48 @@ def half_rotate_generic(
     ctype = hamiltonian.chol.dtype
     ptype = orbsa.dtype
     integral_type = ctype if ctype.itemsize > ptype.itemsize else ptype
+    # Distribute the Cholesky vectors amongst the MPI tasks on this node. Each
+    # task writes its slab directly into the shared arrays.
+    if comm is not None:
+        start_n = comm.rank * nchol // comm.size
+        end_n = (comm.rank + 1) * nchol // comm.size
+    else:
+        start_n = 0
+        end_n = nchol
+    nchol_loc = end_n - start_n
+
+    chol_loc = chol[:, :, start_n:end_n]
     if isinstance(hamiltonian, GenericComplexChol):
-        cholbar = chol.transpose(1, 0, 2).conj().copy()
         A = hamiltonian.A.reshape((M, M, nchol))
         B = hamiltonian.B.reshape((M, M, nchol))
-        rchola = [get_shared_array(comm, shape_a, integral_type) for i in range(4)]
-        rcholb = [get_shared_array(comm, shape_b, integral_type) for i in range(4)]
+        # Only this task's slab of cholbar is formed.
+        L = [
+            chol_loc,
+            chol_loc.transpose(1, 0, 2).conj(),
+            A[:, :, start_n:end_n],
+            B[:, :, start_n:end_n],
+        ]
     elif isinstance(hamiltonian, GenericRealChol):
-        rchola = [get_shared_array(comm, shape_a, integral_type)]
-        rcholb = [get_shared_array(comm, shape_b, integral_type)]
+        L = [chol_loc]
+    rchola = [get_shared_array(comm, shape_a, integral_type) for i in range(len(L))]
+    rcholb = [get_shared_array(comm, shape_b, integral_type) for i in range(len(L))]
 
     rH1a = get_shared_array(comm, (ndets, na, M), integral_type)
     rH1b = get_shared_array(comm, (ndets, nb, M), integral_type)
 
-    rH1a[:] = np.einsum("Jpi,pq->Jiq", orbsa.conj(), hamiltonian.H1[0], optimize=True)
-    rH1b[:] = np.einsum("Jpi,pq->Jiq", orbsb.conj(), hamiltonian.H1[1], optimize=True)
+    if comm is None or comm.rank == 0:
+        rH1a[:] = np.einsum("Jpi,pq->Jiq", orbsa.conj(), hamiltonian.H1[0], optimize=True)
+        rH1b[:] = np.einsum("Jpi,pq->Jiq", orbsb.conj(), hamiltonian.H1[1], optimize=True)
 
     if verbose:
         print("# Half-Rotating Cholesky for determinant.")
-    # start = i*M*(na+nb)
-    start_a = 0  # determinant loops
-    start_b = 0
-    compute = True
-    # Distribute amongst MPI tasks on this node.
-    if comm is not None:
-        nwork_per_thread = hamiltonian.nchol // comm.size
-        if nwork_per_thread == 0:
-            start_n = 0
-            end_n = nchol
-            if comm.rank != 0:
-                # Just run on root processor if problem too small.
-                compute = False
-        else:
-            start_n = comm.rank * nwork_per_thread  # Cholesky work split
-            end_n = (comm.rank + 1) * nwork_per_thread
-            if comm.rank == comm.size - 1:
-                end_n = nchol
-    else:
-        start_n = 0
-        end_n = hamiltonian.nchol
-
-    nchol_loc = end_n - start_n
-    if compute:
-        if isinstance(hamiltonian, GenericComplexChol):
-            L = [chol, cholbar, A, B]
-        elif isinstance(hamiltonian, GenericRealChol):
-            L = [chol]
-
+    if nchol_loc > 0:
         for i in range(len(L)):
-            # Investigate whether these einsums are fast in the future
-            rup = np.einsum(
-                "Jmi,mnx->Jxin",
-                orbsa.conj(),
-                L[i][:, :, start_n:end_n],
-                optimize=True,
-            )
-            rup = rup.reshape((ndets, nchol_loc, na * M))
-            rdn = np.einsum(
-                "Jmi,mnx->Jxin",
-                orbsb.conj(),
-                L[i][:, :, start_n:end_n],
-                optimize=True,
-            )
-            rdn = rdn.reshape((ndets, nchol_loc, nb * M))
-            rchola[i][:, start_n:end_n, start_a : start_a + M * na] = rup[:]
-            rcholb[i][:, start_n:end_n, start_b : start_b + M * nb] = rdn[:]
+            # Contract straight into this task's slab of the shared arrays.
+            rup = rchola[i][:, start_n:end_n].reshape((ndets, nchol_loc, na, M))
+            rdn = rcholb[i][:, start_n:end_n].reshape((ndets, nchol_loc, nb, M))
+            np.einsum("Jmi,mnx->Jxin", orbsa.conj(), L[i], out=rup, optimize=True)
+            np.einsum("Jmi,mnx->Jxin", orbsb.conj(), L[i], out=rdn, optimize=True)
 
     if comm is not None:
         comm.barrier()
@@ -154,50 +167,15 @@ def half_rotate_chunked(
 
     if verbose:
         print("# Half-Rotating Cholesky for determinant.")
-    # start = i*M*(na+nb)
-    start_a = 0  # determinant loops
-    start_b = 0
-    compute = True
-    # Distribute amongst MPI tasks on this node.
-    if comm is not None:
-        nwork_per_thread = hamiltonian.nchol // comm.size
-        if nwork_per_thread == 0:
-            start_n = 0
-            end_n = nchol
-            if comm.rank != 0:
-                # Just run on root processor if problem too small.
-                compute = False
-        else:
-            start_n = comm.rank * nwork_per_thread  # Cholesky work split
-            end_n = (comm.rank + 1) * nwork_per_thread
-            if comm.rank == comm.size - 1:
-                end_n = nchol
-    else:
-        start_n = 0
-        end_n = hamiltonian.nchol
-
+    # Each task rotates the Cholesky vectors of its own chunk.
     start_n = hamiltonian.chunk_displacements[handler.srank]
     end_n = hamiltonian.chunk_displacements[handler.srank + 1]
 
     nchol_loc = end_n - start_n
-    if compute:
-        # Investigate whether these einsums are fast in the future
-        rup = np.einsum(
-            "Jmi,mnx->Jxin",
-            orbsa.conj(),
-            chol_chunk,
-            optimize=True,
-        )
-        rup = rup.reshape((ndets, nchol_loc, na * M))
-        rdn = np.einsum(
-            "Jmi,mnx->Jxin",
-            orbsb.conj(),
-            chol_chunk,
-            optimize=True,
-        )
-        rdn = rdn.reshape((ndets, nchol_loc, nb * M))
-        rchola_chunk[0][:, :, start_a : start_a + M * na] = rup[:]
-        rcholb_chunk[0][:, :, start_b : start_b + M * nb] = rdn[:]
+    rup = rchola_chunk[0].reshape((ndets, nchol_loc, na, M))
+    rdn = rcholb_chunk[0].reshape((ndets, nchol_loc, nb, M))
+    np.einsum("Jmi,mnx->Jxin", orbsa.conj(), chol_chunk, out=rup, optimize=True)
+    np.einsum("Jmi,mnx->Jxin", orbsb.conj(), chol_chunk, out=rdn, optimize=True)
 
     if comm is not None:
         comm.barrier()
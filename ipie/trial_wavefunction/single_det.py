@@ -14,6 +14,7 @@ from ipie.estimators.greens_function_single_det import (
 from ipie.estimators.utils import gab_spin
 from ipie.hamiltonians.generic import GenericComplexChol, GenericRealChol
 from ipie.hamiltonians.generic_chunked import GenericRealCholChunked
+from ipie.hamiltonians.thc import GenericRealTHC
 from ipie.propagation.force_bias import (
     construct_force_bias_batch_single_det,
     construct_force_bias_batch_single_det_chunked,
@@ -169,6 +170,20 @@ class SingleDet(TrialWavefunctionBase):
         self._rBb = rot_chol[1][3][0]
         self.half_rotated = True
 
+    @plum.dispatch
+    def half_rotate(
+        self: "SingleDet",
+        hamiltonian: GenericRealTHC,
+        comm: Optional[CommType] = MPIHandler().scomm,
+    ):
+        # The half-rotated collocation matrices are only (nocc, nthc) so every
+        # task builds its own copy.
+        self._rH1a = self.psi0a.conj().T.dot(hamiltonian.H1[0])
+        self._rH1b = self.psi0b.conj().T.dot(hamiltonian.H1[1])
+        self._rXa = self.psi0a.conj().T.dot(hamiltonian.X)
+        self._rXb = self.psi0b.conj().T.dot(hamiltonian.X)
+        self.half_rotated = True
+
     def calc_overlap(self, walkers) -> numpy.ndarray:
         return calc_overlap_single_det_uhf(walkers, self)
 
@@ -202,3 +217,12 @@ class SingleDet(TrialWavefunctionBase):
         return construct_force_bias_batch_single_det(
             hamiltonian, walkers, self._rAa, self._rAb, self._rBa, self._rBb
         )
+
+    @plum.dispatch
+    def calc_force_bias(
+        self,
+        hamiltonian: GenericRealTHC,
+        walkers: UHFWalkers,
+        mpi_handler: MPIHandler,
+    ) -> xp.ndarray:
+        return construct_force_bias_batch_single_det(hamiltonian, walkers, self._rXa, self._rXb)
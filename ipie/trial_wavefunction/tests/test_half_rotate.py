@@ -0,0 +1,66 @@
+import glob
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from ipie.config import config, MPI
+from ipie.hamiltonians.utils import get_hamiltonian
+from ipie.trial_wavefunction.half_rotate import half_rotate_generic
+from ipie.trial_wavefunction.single_det import SingleDet
+from ipie.utils.io import write_hamiltonian
+from ipie.utils.mpi import MPIHandler
+from ipie.utils.testing import get_random_nomsd, get_random_sys_ham
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("cmplx", [False, True])
+def test_half_rotation_cache(cmplx):
+    np.random.seed(7)
+    nbasis = 8
+    nalpha, nbeta = (3, 2)
+    ndets = 4
+    naux = 5 * nbasis
+    _, ham = get_random_sys_ham(nalpha, nbeta, nbasis, naux, cmplx=cmplx)
+    coeffs, wfn = get_random_nomsd(nalpha, nbeta, nbasis, ndet=ndets)
+    orbsa = wfn[:, :, :nalpha].copy()
+    orbsb = wfn[:, :, nalpha:].copy()
+    trial = SingleDet(wfn[0], (nalpha, nbeta), nbasis)
+    comm = MPI.COMM_WORLD
+    cache_dir = config.get_option("hamiltonian_cache_dir")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config.update_option("hamiltonian_cache_dir", tmpdir)
+        try:
+            # Hamiltonians without a key from the Hamiltonian cache are not cached.
+            half_rotate_generic(trial, ham, comm, orbsa, orbsb, ndets=ndets)
+            assert not glob.glob(os.path.join(tmpdir, "half_rotated_*.h5"))
+            filename = os.path.join(tmpdir, "hamiltonian.h5")
+            chol = ham.chol.T.reshape((naux, nbasis, nbasis))
+            write_hamiltonian(ham.H1[0], chol, 0.0, filename=filename)
+            ham = get_hamiltonian(filename, MPIHandler().scomm)
+            config.update_option("hamiltonian_cache_dir", "")
+            ref = half_rotate_generic(trial, ham, comm, orbsa, orbsb, ndets=ndets)
+            config.update_option("hamiltonian_cache_dir", tmpdir)
+            for _ in range(2):
+                rot = half_rotate_generic(trial, ham, comm, orbsa, orbsb, ndets=ndets)
+                assert len(glob.glob(os.path.join(tmpdir, "half_rotated_*.h5"))) == 1
+                for x, y in zip(rot[0], ref[0]):
+                    np.testing.assert_allclose(x, y)
+                for x, y in zip(rot[1], ref[1]):
+                    if cmplx:
+                        assert len(x) == 4
+                        for xi, yi in zip(x, y):
+                            np.testing.assert_allclose(xi, yi)
+                    else:
+                        np.testing.assert_allclose(x, y)
+            # Different trial orbitals use a different entry.
+            half_rotate_generic(trial, ham, comm, orbsa[:1], orbsb[:1], ndets=1)
+            assert len(glob.glob(os.path.join(tmpdir, "half_rotated_*.h5"))) == 2
+        finally:
+            config.update_option("hamiltonian_cache_dir", cache_dir)
+
+
+if __name__ == "__main__":
+    test_half_rotation_cache(False)
+    test_half_rotation_cache(True)
@@ -0,0 +1,118 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pick the fastest of several equivalent kernels at runtime."""
+
+import time
+from typing import Callable, Dict, Hashable, Tuple
+
+from ipie.utils.backend import synchronize
+
+
+class Autotuner(object):
+    """Cache of the fastest implementation of an operation per problem size.
+
+    The first time a key (e.g. the array shapes) is seen every candidate is
+    timed on fresh arguments and the fastest one is remembered.
+
+    Candidates may round differently, so with a communicator the selection is
+    made once, on the first key, by timing on rank 0 and broadcasting the
+    result. Every task then uses the same candidate for all keys, which keeps
+    results independent of the MPI decomposition and timing noise. select is
+    collective over comm the first time it is called.
+
+    Parameters
+    ----------
+    name : str
+        Name of the operation (for printing).
+    candidates : dict
+        Mapping from variant name to callable. All callables take the same
+        arguments and produce the same result.
+    repeats : int
+        Number of timed calls per candidate (the minimum is used). Default 2.
+    verbose : bool
+        Print the selected variant for each new key.
+    comm : MPI communicator
+        Optional. Tune on rank 0 and broadcast the selection (see above).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        candidates: Dict[str, Callable],
+        repeats: int = 2,
+        verbose: bool = False,
+        comm=None,
+    ):
+        self.name = name
+        self.candidates = candidates
+        self.repeats = repeats
+        self.verbose = verbose
+        self.comm = comm
+        self.cache: Dict[Hashable, str] = {}
+        self.timings: Dict[Hashable, Dict[str, float]] = {}
+
+    def select(self, key: Hashable, make_args: Callable[[], Tuple]) -> str:
+        """Name of the fastest candidate for key.
+
+        Parameters
+        ----------
+        key : hashable
+            Problem descriptor, usually the shapes and dtypes of the arguments.
+        make_args : callable
+            Returns a tuple of arguments for one call. Called before every
+            timed call so candidates modifying their arguments in place can be
+            timed on copies.
+        """
+        variant = self.cache.get(key)
+        if variant is not None:
+            return variant
+        if self.comm is not None:
+            if self.cache:
+                variant = next(iter(self.cache.values()))
+            else:
+                if self.comm.rank == 0:
+                    variant = self._tune(key, make_args)
+                variant = self.comm.bcast(variant, root=0)
+            self.cache[key] = variant
+            return variant
+        variant = self._tune(key, make_args)
+        self.cache[key] = variant
+        return variant
+
+    def _tune(self, key: Hashable, make_args: Callable[[], Tuple]) -> str:
+        timings = {}
+        for name, func in self.candidates.items():
+            best = float("inf")
+            # The first call also triggers compilation (e.g. numba) and is
+            # not timed.
+            for i in range(self.repeats + 1):
+                args = make_args()
+                synchronize()
+                start = time.perf_counter()
+                func(*args)
+                synchronize()
+                if i > 0:
+                    best = min(best, time.perf_counter() - start)
+            timings[name] = best
+        variant = min(timings, key=timings.get)
+        self.timings[key] = timings
+        if self.verbose:
+            times = ", ".join(f"{k} = {v:.3e} s" for k, v in timings.items())
+            print(f"# Autotune {self.name} {key}: using {variant} ({times})")
+        return variant
+
+    def __call__(self, key: Hashable, make_args: Callable[[], Tuple], *args):
+        """Call the fastest candidate for key with args."""
+        return self.candidates[self.select(key, make_args)](*args)
@@ -0,0 +1,312 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Checkpoint / restart helpers for the AFQMC driver."""
+import glob
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional
+
+import h5py
+import numpy
+
+from ipie.config import MPI
+
+
+def get_checkpoint_filename(basename: str, rank: int, block: Optional[int] = None) -> str:
+    """Per-rank checkpoint filename.
+
+    Each MPI task writes its own file so no parallel hdf5 is required.
+
+    Parameters
+    ----------
+    basename : str
+        Checkpoint file basename. A trailing .h5 extension is stripped.
+    rank : int
+        MPI rank.
+    block : int
+        Optional. Block of a checkpoint which is not yet known to be written
+        by all tasks.
+
+    Returns
+    -------
+    filename : str
+        basename.rank.h5 or basename.rank.block.h5
+    """
+    if basename.endswith(".h5"):
+        basename = basename[:-3]
+    if block is not None:
+        return f"{basename}.{rank}.{block}.h5"
+    return f"{basename}.{rank}.h5"
+
+
+def get_rng_state() -> Dict[str, numpy.ndarray]:
+    """Capture the state of numpy's global Mersenne twister."""
+    name, keys, pos, has_gauss, cached_gaussian = numpy.random.get_state()
+    assert name == "MT19937"
+    return {
+        "keys": keys.copy(),
+        "pos": numpy.array(pos),
+        "has_gauss": numpy.array(has_gauss),
+        "cached_gaussian": numpy.array(cached_gaussian),
+    }
+
+
+def set_rng_state(state: Dict[str, numpy.ndarray]) -> None:
+    """Restore the state of numpy's global Mersenne twister."""
+    numpy.random.set_state(
+        (
+            "MT19937",
+            numpy.asarray(state["keys"], dtype=numpy.uint32),
+            int(state["pos"]),
+            int(state["has_gauss"]),
+            float(state["cached_gaussian"]),
+        )
+    )
+
+
+def _write_group(group, state):
+    for k, v in state.items():
+        if isinstance(v, dict):
+            _write_group(group.create_group(k), v)
+        else:
+            group[k] = v
+
+
+def _read_group(group):
+    state = {}
+    for k, v in group.items():
+        if isinstance(v, h5py.Group):
+            state[k] = _read_group(v)
+        else:
+            state[k] = v[()]
+    return state
+
+
+def write_checkpoint(filename: str, state: dict) -> None:
+    """Write nested dictionary of arrays to file.
+
+    The data is first written to a temporary file which then atomically
+    replaces any existing checkpoint so a failure during the write never
+    destroys the previous checkpoint.
+    """
+    tmp_filename = filename + ".tmp"
+    with h5py.File(tmp_filename, "w") as fh5:
+        _write_group(fh5, state)
+    os.replace(tmp_filename, filename)
+
+
+def _read_block(filename: str) -> int:
+    try:
+        with h5py.File(filename, "r") as fh5:
+            return int(fh5["driver/block"][()])
+    except (OSError, KeyError):
+        # Incomplete or foreign file.
+        return -1
+
+
+def read_checkpoint(basename: str, comm) -> dict:
+    """Read this rank's checkpoint.
+
+    Tasks write their checkpoints independently, so after a failure they may
+    hold different blocks. The most recent block available on every task is
+    read. Collective.
+
+    Parameters
+    ----------
+    basename : str
+        Checkpoint file basename (see get_checkpoint_filename).
+    comm : MPI communicator
+        Communicator used when writing the checkpoint. Restarting on a
+        different number of tasks is not supported.
+
+    Returns
+    -------
+    state : dict
+        Nested dictionary of checkpoint data.
+    """
+    filename = get_checkpoint_filename(basename, comm.rank)
+    pattern = get_checkpoint_filename(glob.escape(basename), comm.rank, block="*")
+    candidates = {}
+    for f in [filename] + sorted(glob.glob(pattern)):
+        if os.path.isfile(f):
+            block = _read_block(f)
+            if block >= 0:
+                candidates.setdefault(block, f)
+    blocks = comm.allgather(sorted(candidates))
+    common = set(blocks[0]).intersection(*blocks[1:])
+    if not common:
+        raise ValueError(
+            f"No checkpoint block is available on all tasks (rank {comm.rank} has "
+            f"{sorted(candidates)})."
+        )
+    filename = candidates[max(common)]
+    with h5py.File(filename, "r") as fh5:
+        state = _read_group(fh5)
+    nranks = int(state["driver"]["nranks"])
+    if nranks != comm.size:
+        raise ValueError(
+            f"Checkpoint {filename} was written with {nranks} MPI tasks but "
+            f"{comm.size} are in use."
+        )
+    return state
+
+
+def _copy_state(dest, src):
+    for k, v in src.items():
+        if isinstance(v, dict):
+            _copy_state(dest[k], v)
+        elif isinstance(dest[k], numpy.ndarray) and dest[k].shape == numpy.shape(v):
+            numpy.copyto(dest[k], v)
+        else:
+            dest[k] = numpy.array(v, copy=True)
+
+
+def _allocate_state(src):
+    state = {}
+    for k, v in src.items():
+        if isinstance(v, dict):
+            state[k] = _allocate_state(v)
+        else:
+            state[k] = numpy.array(v, copy=True)
+    return state
+
+
+class CheckpointWriter:
+    """Write checkpoints on a background thread.
+
+    The state is copied into one of two host buffers and handed to a worker
+    thread, so the caller only blocks if both buffers are still being
+    written when the next checkpoint is requested.
+
+    Each block is first written to its own file (see
+    get_checkpoint_filename). Once every task has written a block it is moved
+    to basename.rank.h5 and older blocks are removed, so a failure leaves a
+    block which is available on all tasks.
+
+    Parameters
+    ----------
+    basename : str
+        Checkpoint file basename.
+    comm : MPI communicator
+        Communicator. write, commit and close are collective.
+    verbose : bool
+        Print timing information.
+    """
+
+    def __init__(self, basename: str, comm, verbose: bool = False):
+        self.basename = basename
+        self.comm = comm
+        self.filename = get_checkpoint_filename(basename, comm.rank)
+        self.verbose = verbose
+        self.num_written = 0
+        # Blocks written by this task which are not yet committed.
+        self._written = []
+        self.committed = -1
+        self.twait = 0.0
+        self.twrite = 0.0
+        self._buffers = [None, None]
+        self._free = [threading.Event(), threading.Event()]
+        for event in self._free:
+            event.set()
+        self._current = 0
+        self._error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def _worker(self):
+        while True:
+            ix = self._queue.get()
+            if ix is None:
+                self._queue.task_done()
+                return
+            start = time.time()
+            block = int(self._buffers[ix]["driver"]["block"])
+            try:
+                write_checkpoint(self._block_filename(block), self._buffers[ix])
+                self.num_written += 1
+                self._written.append(block)
+            except Exception as error:  # surfaced on the next call to write / wait
+                self._error = error
+            self.twrite += time.time() - start
+            self._free[ix].set()
+            self._queue.task_done()
+
+    def _block_filename(self, block):
+        return get_checkpoint_filename(self.basename, self.comm.rank, block=block)
+
+    def commit(self) -> None:
+        """Make the latest block written by all tasks the current checkpoint.
+
+        Collective.
+        """
+        written = list(self._written)
+        latest = written[-1] if written else -1
+        committed = self.comm.allreduce(latest, op=MPI.MIN)
+        if committed <= self.committed:
+            return
+        os.replace(self._block_filename(committed), self.filename)
+        for block in written:
+            if block <= committed:
+                self._written.remove(block)
+                if block < committed:
+                    os.remove(self._block_filename(block))
+        self.committed = committed
+
+    def _check_error(self):
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise RuntimeError(f"Failed to write checkpoint {self.filename}") from error
+
+    def write(self, state: dict) -> None:
+        """Queue state to be written.
+
+        Parameters
+        ----------
+        state : dict
+            Nested dictionary of host (numpy) arrays. The data is copied so
+            the caller is free to modify it as soon as this returns.
+        """
+        self._check_error()
+        self.commit()
+        ix = self._current
+        start = time.time()
+        self._free[ix].wait()
+        self.twait += time.time() - start
+        if self._buffers[ix] is None:
+            self._buffers[ix] = _allocate_state(state)
+        else:
+            _copy_state(self._buffers[ix], state)
+        self._free[ix].clear()
+        self._queue.put(ix)
+        self._current = (ix + 1) % 2
+
+    def wait(self) -> None:
+        """Block until all queued checkpoints are on disk."""
+        self._queue.join()
+        self._check_error()
+
+    def close(self) -> None:
+        self.wait()
+        self.commit()
+        self._queue.put(None)
+        self._thread.join()
+        if self.verbose:
+            print(f"# Wrote {self.num_written} checkpoints to {self.filename}")
+            print(f"# Time spent waiting for checkpoint buffers: {self.twait:.6f} s")
+            print(f"# Time spent writing checkpoints (background): {self.twrite:.6f} s")
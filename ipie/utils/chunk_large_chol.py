@@ -1,37 +1,68 @@
+from ipie.config import config
 from ipie.utils.mpi import make_splits_displacements
 import h5py
 import numpy as np
 
 
-def split_cholesky(ham_filename: str, nmembers: int, verbose=True):
+def split_cholesky(ham_filename: str, nmembers: int, verbose=True, comm=None, pack_chol=True):
     """
     This function calculates the splits and displacements needed to distribute the
     Cholesky vectors among the members and  splits the Cholesky decomposed Hamiltonian
     vectors stored in an HDF5 file among a given number of members
     (e.g., GPU cards to distribute total cholesky)
 
+    The Cholesky vectors are streamed in slabs bounded by the
+    max_memory_hamiltonian_read option, transposed and written to chol_{i}.h5
+    together with the packed vectors (chol_packed) of each member, so the full
+    tensor is never held in memory.
+
     Parameters
     ----------
     ham_filename : str
         The filename of the HDF5 file containing the total Cholesky (naux, nbas, nbas)
     nmembers : int
         The number of members among which the Cholesky vectors will be distributed.
+    verbose : bool
+        Print information.
+    comm : MPI communicator
+        Optional. Member files are distributed round robin over its tasks, one
+        writer per file.
+    pack_chol : bool
+        Also write the packed Cholesky vectors (real integrals only).
     """
+    rank, size = (0, 1) if comm is None else (comm.rank, comm.size)
     with h5py.File(ham_filename, "r") as source_file:
-        # for huge chol file, should read in slices at one time instead of this
-        dataset = np.array(source_file["LXmn"][:])
-        num_chol = dataset.shape[0]
+        num_chol, num_basis = source_file["LXmn"].shape[:2]
+        dtype = source_file["LXmn"].dtype
+    pack_chol = pack_chol and np.isrealobj(np.zeros(1, dtype=dtype))
     split_sizes, displacements = make_splits_displacements(num_chol, nmembers)
-    dataset = dataset.transpose(1, 2, 0).reshape(-1, num_chol)
+    sym_idx = np.triu_indices(num_basis)
+    max_memory = config.get_option("max_memory_hamiltonian_read") * 1024**3
+    slab_size = max(1, int(max_memory // (num_basis * num_basis * dtype.itemsize)))
 
-    for i, (size, displacement) in enumerate(zip(split_sizes, displacements)):
-        # Prepare row indices for slicing
-        row_start = displacement
-        row_end = displacement + size
-        with h5py.File(f"chol_{i}.h5", "w") as target_file:
-            target_file.create_dataset("chol", data=dataset[:, row_start:row_end])
-        if verbose:
-            print(f"# Split {i}: Size {size}, Displacement {displacement}")
+    with h5py.File(ham_filename, "r") as source_file:
+        source = source_file["LXmn"]
+        for i, (split_size, displacement) in enumerate(zip(split_sizes, displacements)):
+            if i % size != rank:
+                continue
+            with h5py.File(f"chol_{i}.h5", "w") as target_file:
+                chol = target_file.create_dataset(
+                    "chol", shape=(num_basis * num_basis, split_size), dtype=dtype
+                )
+                if pack_chol:
+                    chol_packed = target_file.create_dataset(
+                        "chol_packed", shape=(len(sym_idx[0]), split_size), dtype=dtype
+                    )
+                for x0 in range(0, split_size, slab_size):
+                    x1 = min(x0 + slab_size, split_size)
+                    slab = source[displacement + x0 : displacement + x1]
+                    chol[:, x0:x1] = slab.reshape(x1 - x0, -1).T
+                    if pack_chol:
+                        chol_packed[:, x0:x1] = slab[:, sym_idx[0], sym_idx[1]].T
+            if verbose:
+                print(f"# Split {i}: Size {split_size}, Displacement {displacement}")
 
-    if verbose:
+    if comm is not None:
+        comm.barrier()
+    if verbose and rank == 0:
         print("# Splitting complete.")
@@ -57,6 +57,59 @@ def read_hamiltonian(filename: str) -> Tuple[numpy.ndarray, numpy.ndarray, float
     return hcore, LXmn, e0
 
 
+def write_thc_hamiltonian(
+    hcore: numpy.ndarray,
+    X: numpy.ndarray,
+    U: numpy.ndarray,
+    e0: float,
+    filename: str = "hamiltonian_thc.h5",
+) -> None:
+    assert len(hcore.shape) == 2, "Incorrect shape for hcore, expected 2-dimensional array"
+    message = f"Incorrect shape for THC factors: found X {X.shape} and U {U.shape}"
+    assert X.shape[0] == hcore.shape[0] and X.shape[1] == U.shape[0], message
+    with h5py.File(filename, "w") as fh5:
+        fh5["hcore"] = hcore
+        fh5["thc_X"] = X
+        fh5["thc_U"] = U
+        fh5["e0"] = e0
+
+
+def read_thc_hamiltonian(
+    filename: str,
+) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, float]:
+    with h5py.File(filename, "r") as fh5:
+        hcore = numpy.array(fh5["hcore"])
+        X = numpy.array(fh5["thc_X"])
+        U = numpy.array(fh5["thc_U"])
+        e0 = float(fh5["e0"][()])
+    return hcore, X, U, e0
+
+
+def is_thc_hamiltonian(filename: str) -> bool:
+    return get_hamiltonian_format(filename) == "thc"
+
+
+def get_hamiltonian_format(filename: str) -> str:
+    """Format of a Hamiltonian file determined from the datasets it contains.
+
+    Returns
+    -------
+    fmt : str
+        "ipie" (write_hamiltonian), "thc" (write_thc_hamiltonian),
+        "qmcpack_dense" or "qmcpack_sparse".
+    """
+    with h5py.File(filename, "r") as fh5:
+        if "thc_X" in fh5:
+            return "thc"
+        if "LXmn" in fh5:
+            return "ipie"
+        if "Hamiltonian/DenseFactorized" in fh5:
+            return "qmcpack_dense"
+        if "Hamiltonian/Factorized" in fh5:
+            return "qmcpack_sparse"
+    raise KeyError(f"Unknown Hamiltonian format in {filename}.")
+
+
 def write_wavefunction(
     wfn: Union[tuple, numpy.ndarray, list],
     filename: str = "wavefunction.h5",
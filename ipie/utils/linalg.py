@@ -21,6 +21,8 @@ import time
 import numpy
 import scipy.linalg
 
+from ipie.utils.backend import arraylib as xp
+
 
 def minor_mask(A, i, j):
     r"""computing matrix minor, i-th row and j-th column removed"""
@@ -159,6 +161,57 @@ def reortho(A):
     return (Q, detR)
 
 
+def _cholesky_qr_step(A):
+    S = A.conj().transpose(0, 2, 1) @ A
+    # S = R^H R with R upper triangular.
+    R = xp.linalg.cholesky(S).conj().transpose(0, 2, 1)
+    Q = A @ xp.linalg.inv(R)
+    return Q, R
+
+
+def qr_batched(A, method="qr"):
+    """QR decomposition of a stack of tall matrices.
+
+    The diagonal of R is made real and positive so that Q is unique and
+    det(R) = prod_i R_ii > 0.
+
+    Parameters
+    ----------
+    A : :class:`numpy.ndarray`
+        Matrices of shape (nbatch, M, N) with M >= N.
+    method : str
+        "qr" for Householder QR, or "cholesky_qr2" for two passes of Cholesky
+        QR, which only needs the (N, N) Gram matrices and is therefore mostly
+        matrix multiplications. Cholesky QR falls back to Householder QR if
+        the Gram matrices are numerically singular (condition number of A
+        above ~1e7).
+
+    Returns
+    -------
+    Q : :class:`numpy.ndarray`
+        Matrices with orthonormal columns, shape (nbatch, M, N).
+    R_diag : :class:`numpy.ndarray`
+        Diagonal of R, shape (nbatch, N).
+    """
+    if method == "cholesky_qr2":
+        try:
+            Q, R1 = _cholesky_qr_step(A)
+            Q, R2 = _cholesky_qr_step(Q)
+            # R = R2 R1 is triangular so its diagonal is the product of diagonals.
+            R_diag = xp.einsum("wii->wi", R2) * xp.einsum("wii->wi", R1)
+            if bool(xp.all(xp.isfinite(R_diag))):
+                return Q, R_diag.real
+        except numpy.linalg.LinAlgError:
+            pass
+    elif method != "qr":
+        raise ValueError(f"Unknown QR method: {method}")
+    Q, R = xp.linalg.qr(A, mode="reduced")
+    R_diag = xp.einsum("wii->wi", R)
+    phases = R_diag / xp.abs(R_diag)
+    Q *= phases[:, None, :]
+    return Q, xp.abs(R_diag)
+
+
 def overlap(A, B):
     S = numpy.dot(A.conj().T, B)
     return S
@@ -0,0 +1,522 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Predict the memory footprint of a calculation and size chunks to fit it.
+
+The estimates only account for the largest arrays (integrals, walker Green's
+functions and the intermediates built during propagation and energy
+evaluation) and are meant to catch out-of-memory errors before a job starts,
+not to be exact.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from math import ceil
+from typing import Dict, Optional, Tuple
+
+import h5py
+import numpy
+
+from ipie.utils.backend import get_host_memory
+
+GB = 1024.0**3.0
+# Fraction of the budget the Hamiltonian and half rotated integrals may occupy
+# before splitting the integrals over group members is suggested.
+_MAX_INTEGRAL_FRACTION = 0.5
+# Smallest memory (GB) handed to chunked energy evaluation.
+_MIN_ENERGY_MEMORY = 1e-3
+
+
+def read_hamiltonian_header(filename: str) -> Tuple[int, int, bool]:
+    """Read the dimensions of a Hamiltonian file without loading the integrals.
+
+    Parameters
+    ----------
+    filename : str
+        Hamiltonian file in ipie (hcore / LXmn) or QMCPACK format.
+
+    Returns
+    -------
+    nbasis : int
+        Number of basis functions.
+    nchol : int
+        Number of Cholesky vectors.
+    complex_integrals : bool
+        True if the Cholesky vectors are complex.
+    """
+    with h5py.File(filename, "r") as fh5:
+        if "LXmn" in fh5:
+            nchol, nbasis, _ = fh5["LXmn"].shape
+            complex_integrals = numpy.issubdtype(fh5["LXmn"].dtype, numpy.complexfloating)
+            return int(nbasis), int(nchol), bool(complex_integrals)
+        dims = fh5["Hamiltonian/dims"][:]
+        nbasis = int(dims[3])
+        nchol = int(dims[7])
+        complex_integrals = False
+        if "Hamiltonian/DenseFactorized/L" in fh5:
+            shape = fh5["Hamiltonian/DenseFactorized/L"].shape
+            complex_integrals = len(shape) > 1 and shape[-1] == 2 * nchol
+        return nbasis, nchol, complex_integrals
+
+
+def read_wavefunction_header(filename: str) -> Tuple[str, int, int]:
+    """Read the type, number of determinants and active orbitals of a trial.
+
+    Parameters
+    ----------
+    filename : str
+        Wavefunction file in ipie or QMCPACK format.
+
+    Returns
+    -------
+    trial_type : str
+        single_det, particle_hole or noci.
+    ndets : int
+        Number of determinants in the file.
+    nact : int
+        Upper bound on the number of orbitals occupied in any determinant (0
+        if not a particle-hole expansion).
+    """
+    with h5py.File(filename, "r") as fh5:
+        if "occ_alpha" in fh5:
+            ndets = fh5["ci_coeffs"].shape[0]
+            occa = fh5["occ_alpha"][:]
+            occb = fh5["occ_beta"][:]
+            nact = max(numpy.max(occa, initial=0), numpy.max(occb, initial=0)) + 1
+            return "particle_hole", int(ndets), int(nact)
+        if "ci_coeffs" in fh5:
+            return "noci", int(fh5["ci_coeffs"].shape[0]), 0
+        if "psi_T_alpha" in fh5:
+            return "single_det", 1, 0
+        if "Wavefunction/PHMSD" in fh5:
+            dims = fh5["Wavefunction/PHMSD/dims"][:]
+            nmo, na, nb, ndets = int(dims[0]), int(dims[1]), int(dims[2]), int(dims[4])
+            occs = fh5["Wavefunction/PHMSD/occs"][:].reshape((ndets, na + nb))
+            nact = max(numpy.max(occs[:, :na], initial=0), numpy.max(occs[:, na:] - nmo, initial=0))
+            nact += 1
+            return "particle_hole", ndets, int(nact)
+        if "Wavefunction/NOMSD" in fh5:
+            ndets = int(fh5["Wavefunction/NOMSD/dims"][4])
+            return ("single_det" if ndets == 1 else "noci"), ndets, 0
+    raise RuntimeError(f"Could not determine wavefunction type of {filename}.")
+
+
+def get_memory_budget(comm=None, max_memory: float = 0.0) -> float:
+    """Memory available to each MPI task in GB.
+
+    Parameters
+    ----------
+    comm : MPI communicator
+        Used to determine how many tasks share a node.
+    max_memory : float
+        Explicit per-task budget in GB. If zero the node memory is divided
+        evenly between the tasks on the node.
+    """
+    if max_memory > 0:
+        return max_memory
+    return get_host_memory() / get_tasks_per_node(comm)
+
+
+def get_tasks_per_node(comm=None) -> int:
+    """Number of tasks of comm sharing a node (1 if unknown)."""
+    if comm is None:
+        return 1
+    try:
+        from ipie.config import MPI
+
+        return comm.Split_type(MPI.COMM_TYPE_SHARED).size
+    except Exception:
+        return 1
+
+
+@dataclass
+class MemoryPlan:
+    r"""Predicted memory footprint and chosen chunking for a calculation.
+
+    Attributes
+    ----------
+    budget : float
+        Memory budget per MPI task in GB.
+    nwalkers : int
+        Number of walkers per MPI task the plan was made for.
+    persistent : dict
+        Arrays alive for the whole run (GB per task).
+    transient : dict
+        Intermediates only alive during propagation or energy evaluation (GB
+        per task). Only the largest contributes to the peak.
+    num_det_chunks : int
+        Number of determinant chunks for Wick's energy evaluation.
+    max_memory_for_wicks : float
+        Memory (GB) available for Wick's intermediates.
+    max_memory_sd_energy_gpu : float
+        Memory (GB) available for the exchange intermediate of the single
+        determinant energy.
+    nmembers : int
+        Suggested number of tasks to split the half rotated integrals over.
+    max_walkers : int
+        Largest number of walkers per task expected to fit in the budget.
+    vhs_block_size : int
+        Number of walkers the HS potential is built for at once.
+    """
+
+    budget: float
+    nwalkers: int
+    persistent: Dict[str, float] = field(default_factory=dict)
+    transient: Dict[str, float] = field(default_factory=dict)
+    num_det_chunks: int = 1
+    max_memory_for_wicks: float = 2.0
+    max_memory_sd_energy_gpu: float = 2.0
+    nmembers: int = 1
+    max_walkers: int = 0
+    vhs_block_size: int = 0
+
+    @property
+    def peak(self) -> float:
+        transient = max(self.transient.values()) if self.transient else 0.0
+        return sum(self.persistent.values()) + transient
+
+    @property
+    def fits(self) -> bool:
+        return self.peak <= self.budget
+
+    def print(self) -> None:
+        print("# Memory plan (GB per MPI task):")
+        for name, size in self.persistent.items():
+            print(f"# {name:<24s} {size:>12.6f}")
+        for name, size in self.transient.items():
+            print(f"# {name + ' (transient)':<24s} {size:>12.6f}")
+        print(f"# {'Predicted peak':<24s} {self.peak:>12.6f}")
+        print(f"# {'Budget':<24s} {self.budget:>12.6f}")
+        print(f"# Determinant chunks for Wick's theorem: {self.num_det_chunks}")
+        print(f"# max_memory_for_wicks: {self.max_memory_for_wicks:.4f} GB")
+        print(f"# max_memory_sd_energy_gpu: {self.max_memory_sd_energy_gpu:.4f} GB")
+        print(f"# Suggested nmembers: {self.nmembers}")
+        print(f"# Walkers per VHS block: {self.vhs_block_size}")
+        print(f"# Maximum number of walkers per task: {self.max_walkers}")
+        if not self.fits:
+            print(
+                f"# WARNING: {self.nwalkers} walkers per task are predicted to exceed "
+                "the memory budget."
+            )
+
+
+def _footprint(
+    nbasis,
+    nchol,
+    nalpha,
+    nbeta,
+    nwalkers,
+    trial_type,
+    ndets,
+    nact,
+    num_det_chunks,
+    nmembers,
+    nshared,
+    pack_chol,
+    complex_integrals,
+    use_gpu,
+    max_memory_sd_energy_gpu,
+    vhs_block_size=None,
+    mixed_precision=False,
+):
+    """Memory (GB) of the largest arrays split into persistent and transient."""
+    nocc = nalpha + nbeta
+    npacked = nbasis * (nbasis + 1) // 2
+    isize = 16 if complex_integrals else 8
+    # With mixed precision the packed Cholesky vectors and VHS are single precision.
+    psize = 4 if mixed_precision and not complex_integrals else isize
+    vsize = 8 if mixed_precision and not complex_integrals else 16
+    nw = nwalkers
+    persistent = {}
+    transient = {}
+    # Integrals are held in node-shared memory.
+    persistent["chol"] = nbasis * nbasis * nchol * isize / nshared
+    if pack_chol:
+        persistent["chol_packed"] = npacked * nchol * psize / nshared
+    ndets_rot = ndets if trial_type == "noci" else 1
+    persistent["rchola"] = ndets_rot * nalpha * nbasis * nchol * isize / nmembers
+    persistent["rcholb"] = ndets_rot * nbeta * nbasis * nchol * isize / nmembers
+    if trial_type == "particle_hole":
+        persistent["rchola_act"] = nact * nbasis * nchol * isize / nmembers
+    persistent["walkers"] = nw * nbasis * nocc * 16
+    if trial_type == "noci":
+        persistent["Ga/Gb"] = 2 * ndets * nw * nbasis * nbasis * 16
+        persistent["Ghalf"] = ndets * nw * nocc * nbasis * 16
+    else:
+        persistent["Ga/Gb"] = 2 * nw * nbasis * nbasis * 16
+        persistent["Ghalf"] = nw * nocc * nbasis * 16
+    if trial_type == "particle_hole":
+        # G0a, G0b, Q0a, Q0b and CIa, CIb.
+        persistent["G0/Q0"] = 4 * nw * nbasis * nbasis * 16
+        persistent["CI"] = nw * nact * nocc * 16
+    # VHS is unpacked from chol_packed.dot(xshifted) one block of walkers at a
+    # time.
+    nblock = nw if vhs_block_size is None else min(vhs_block_size, nw)
+    vhs = nblock * nbasis * nbasis * vsize + 3 * nw * nchol * 16
+    if pack_chol:
+        vhs += nblock * npacked * vsize
+    transient["VHS"] = vhs
+    if trial_type == "particle_hole":
+        # Lvo_a, Lvo_b and their transposed copies plus opposite spin buffers.
+        ndets_chunk = ceil(ndets / num_det_chunks)
+        transient["wicks"] = (2 * nw * nchol * nact * nocc + 2 * nw * ndets_chunk * nchol) * 16
+    else:
+        max_nocc = max(nalpha, nbeta)
+        exx = 16 * nw * max_nocc * max_nocc * nchol
+        if use_gpu:
+            exx = min(exx, max_memory_sd_energy_gpu * GB)
+        else:
+            # Exchange is evaluated walker by walker on the CPU.
+            exx = exx / nw
+        transient["exchange"] = exx
+    return (
+        {k: v / GB for k, v in persistent.items()},
+        {k: v / GB for k, v in transient.items()},
+    )
+
+
+def plan_memory(
+    nbasis: int,
+    nchol: int,
+    nelec: Tuple[int, int],
+    nwalkers: int,
+    budget: float,
+    trial_type: str = "single_det",
+    ndets: int = 1,
+    nact: Optional[int] = None,
+    nmembers: int = 1,
+    nshared: int = 1,
+    ntasks: int = 1,
+    pack_chol: bool = True,
+    complex_integrals: bool = False,
+    use_gpu: bool = False,
+    mixed_precision: bool = False,
+) -> MemoryPlan:
+    """Predict the memory footprint and choose chunk sizes to fit a budget.
+
+    Parameters
+    ----------
+    nbasis : int
+        Number of basis functions.
+    nchol : int
+        Number of Cholesky vectors.
+    nelec : tuple
+        Number of alpha and beta electrons.
+    nwalkers : int
+        Number of walkers per MPI task.
+    budget : float
+        Memory budget per MPI task in GB.
+    trial_type : str
+        single_det, particle_hole or noci.
+    ndets : int
+        Number of determinants in the trial.
+    nact : int
+        Number of active orbitals of a particle-hole trial. Defaults to nbasis.
+    nmembers : int
+        Number of tasks the half rotated integrals are split over.
+    nshared : int
+        Number of tasks sharing the Cholesky vectors through shared memory.
+    ntasks : int
+        Total number of MPI tasks. The suggested nmembers divides ntasks.
+    pack_chol : bool
+        Whether the packed Cholesky vectors are stored.
+    complex_integrals : bool
+        Whether the Cholesky vectors are complex.
+    use_gpu : bool
+        Whether intermediates are allocated on the GPU.
+    mixed_precision : bool
+        Whether the packed Cholesky vectors and VHS are single precision.
+
+    Returns
+    -------
+    plan : MemoryPlan
+        Predicted footprint and chunking.
+    """
+    # Dimensions may be numpy integers which silently overflow.
+    nbasis, nchol, nwalkers = int(nbasis), int(nchol), int(nwalkers)
+    nalpha, nbeta = int(nelec[0]), int(nelec[1])
+    nact = nbasis if nact is None or trial_type != "particle_hole" else int(nact)
+    ndets = max(1, int(ndets))
+    if trial_type == "single_det":
+        ndets = 1
+
+    def footprint(nw, num_det_chunks, nmem, exx_mem=0.0, vhs_block_size=None):
+        return _footprint(
+            nbasis,
+            nchol,
+            nalpha,
+            nbeta,
+            nw,
+            trial_type,
+            ndets,
+            nact,
+            num_det_chunks,
+            nmem,
+            nshared,
+            pack_chol,
+            complex_integrals,
+            use_gpu,
+            exx_mem,
+            vhs_block_size,
+            mixed_precision,
+        )
+
+    # Integrals dominate the persistent memory, split them if they do not
+    # leave enough room for the walkers.
+    persistent, _ = footprint(nwalkers, 1, 1)
+    integrals = sum(v for k, v in persistent.items() if k.startswith("rchol"))
+    shared = persistent["chol"] + persistent.get("chol_packed", 0.0)
+    suggested_nmembers = nmembers
+    available = _MAX_INTEGRAL_FRACTION * budget - shared
+    if available <= 0:
+        suggested_nmembers = ntasks
+    else:
+        while integrals / suggested_nmembers > available and suggested_nmembers < ntasks:
+            suggested_nmembers += 1
+            while ntasks % suggested_nmembers != 0:
+                suggested_nmembers += 1
+
+    persistent, _ = footprint(nwalkers, 1, nmembers)
+    energy_budget = max(budget - sum(persistent.values()), _MIN_ENERGY_MEMORY)
+    num_det_chunks = 1
+    if trial_type == "particle_hole":
+        _, transient = footprint(nwalkers, num_det_chunks, nmembers)
+        while transient["wicks"] > energy_budget and num_det_chunks < ndets:
+            num_det_chunks = min(2 * num_det_chunks, ndets)
+            _, transient = footprint(nwalkers, num_det_chunks, nmembers)
+    # Build the HS potential for fewer walkers at a time until it fits.
+    vhs_block_size = nwalkers
+    _, transient = footprint(nwalkers, num_det_chunks, nmembers, energy_budget, vhs_block_size)
+    while transient["VHS"] > energy_budget and vhs_block_size > 1:
+        vhs_block_size = ceil(vhs_block_size / 2)
+        _, transient = footprint(nwalkers, num_det_chunks, nmembers, energy_budget, vhs_block_size)
+    persistent, transient = footprint(
+        nwalkers, num_det_chunks, nmembers, energy_budget, vhs_block_size
+    )
+    plan = MemoryPlan(
+        budget=budget,
+        nwalkers=nwalkers,
+        persistent=persistent,
+        transient=transient,
+        num_det_chunks=num_det_chunks,
+        max_memory_for_wicks=energy_budget,
+        max_memory_sd_energy_gpu=energy_budget,
+        nmembers=suggested_nmembers,
+        vhs_block_size=vhs_block_size,
+    )
+
+    # Largest number of walkers which fits when the energy intermediates and
+    # the HS potential are chunked as finely as possible (the peak is
+    # monotonic in nwalkers).
+    def peak(nw):
+        p, t = footprint(nw, ndets, nmembers, _MIN_ENERGY_MEMORY, 1)
+        return sum(p.values()) + max(t.values())
+
+    lo, hi = 0, 1
+    while peak(hi) <= budget:
+        lo, hi = hi, 2 * hi
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if peak(mid) <= budget:
+            lo = mid
+        else:
+            hi = mid
+    plan.max_walkers = lo
+    return plan
+
+
+def get_trial_type(trial) -> str:
+    """Map a trial wavefunction object onto the trial types of plan_memory."""
+    from ipie.trial_wavefunction.noci import NOCI
+    from ipie.trial_wavefunction.particle_hole import ParticleHole
+
+    if isinstance(trial, ParticleHole):
+        return "particle_hole"
+    elif isinstance(trial, NOCI):
+        return "noci"
+    return "single_det"
+
+
+def plan_driver_memory(hamiltonian, trial, nwalkers: int, mpi_handler, budget: float) -> MemoryPlan:
+    """Memory plan for already constructed Hamiltonian and trial objects.
+
+    Parameters
+    ----------
+    hamiltonian : Generic hamiltonian
+        Hamiltonian with Cholesky vectors.
+    trial : TrialWavefunctionBase
+        Trial wavefunction.
+    nwalkers : int
+        Number of walkers per MPI task.
+    mpi_handler : MPIHandler
+        MPI handler (the integrals are shared between group members).
+    budget : float
+        Memory budget per MPI task in GB.
+    """
+    from ipie.config import config
+
+    trial_type = get_trial_type(trial)
+    chol = getattr(hamiltonian, "chol", None)
+    return plan_memory(
+        hamiltonian.nbasis,
+        hamiltonian.nchol,
+        trial.nelec,
+        nwalkers,
+        budget,
+        trial_type=trial_type,
+        ndets=trial.num_dets,
+        nact=getattr(trial, "nact", None),
+        nmembers=mpi_handler.nmembers,
+        nshared=get_tasks_per_node(mpi_handler.comm),
+        ntasks=mpi_handler.size,
+        pack_chol=getattr(hamiltonian, "chol_packed", None) is not None,
+        complex_integrals=chol is not None and numpy.iscomplexobj(chol),
+        use_gpu=config.get_option("use_gpu"),
+        mixed_precision=config.get_option("mixed_precision"),
+    )
+
+
+@contextmanager
+def memory_plan_options(plan: Optional[MemoryPlan]):
+    """Set the memory options of a plan and restore the previous values on exit.
+
+    Options explicitly set by the user are kept. Otherwise sets
+    max_memory_for_wicks and max_memory_sd_energy_gpu, and
+    vhs_walker_block_size if the full VHS does not fit.
+
+    Parameters
+    ----------
+    plan : MemoryPlan
+        Memory plan. Nothing is changed if None.
+    """
+    from ipie.config import config
+
+    if plan is None:
+        yield
+        return
+    options = {
+        "max_memory_for_wicks": plan.max_memory_for_wicks,
+        "max_memory_sd_energy_gpu": plan.max_memory_sd_energy_gpu,
+    }
+    if plan.vhs_block_size < plan.nwalkers:
+        options["vhs_walker_block_size"] = plan.vhs_block_size
+    options = {key: val for key, val in options.items() if config.is_default(key)}
+    previous = {key: config.get_option(key) for key in options}
+    for key, val in options.items():
+        config.update_option(key, val)
+    try:
+        yield
+    finally:
+        for key, val in previous.items():
+            config.update_option(key, val)
@@ -143,7 +143,7 @@ def serialise(obj, verbose=0):
                 obj_dict[k] = str(v)
         elif k == "estimates" or k == "global_estimates":
             pass
-        elif k == "walkers":
+        elif k == "walkers" and isinstance(v, list):
             obj_dict[k] = [str(x) for x in v][0]
         elif isinstance(v, numpy.ndarray):
             if verbose == 3:
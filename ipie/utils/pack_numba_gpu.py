@@ -21,7 +21,12 @@ from numba import cuda
 
 # Note sure where this is coming from (no value for ndim?)
 # pylint: disable=no-value-for-parameter
-@cuda.jit("void(int32[:],int32[:],complex128[:,:],complex128[:,:,:])")
+@cuda.jit(
+    [
+        "void(int32[:],int32[:],complex128[:,:],complex128[:,:,:])",
+        "void(int32[:],int32[:],complex64[:,:],complex64[:,:,:])",
+    ]
+)
 def unpack_VHS_batch_gpu(idx_i, idx_j, VHS_packed, VHS):
     nwalkers = VHS.shape[0]
     nbsf = VHS.shape[1]
@@ -0,0 +1,129 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Counter-based random numbers (Philox4x32-10).
+
+Random numbers are a pure function of (seed, walker ID, step, stream), so
+walker trajectories do not depend on how walkers are distributed over MPI
+tasks or on whether the CPU or GPU path is used.
+
+See Salmon et al., "Parallel random numbers: as easy as 1, 2, 3", SC11.
+"""
+
+import numpy
+
+from ipie.utils.backend import arraylib as xp
+
+_MASK32 = 0xFFFFFFFF
+_PHILOX_M0 = 0xD2511F53
+_PHILOX_M1 = 0xCD9E8D57
+_PHILOX_W0 = 0x9E3779B9
+_PHILOX_W1 = 0xBB67AE85
+
+
+def _mulhilo(a, b):
+    prod = a * b
+    return prod >> 32, prod & _MASK32
+
+
+def philox4x32(counter, key, rounds=10):
+    """Philox4x32 block cipher, vectorized over counters and keys.
+
+    Parameters
+    ----------
+    counter : tuple of 4 arrays
+        Counter words. Values must fit in 32 bits. Arrays are broadcast
+        against each other and the key.
+    key : tuple of 2 arrays
+        Key words. Values must fit in 32 bits.
+    rounds : int
+        Number of rounds. Default 10.
+
+    Returns
+    -------
+    output : tuple of 4 arrays
+        Random 32 bit words (stored as uint64).
+    """
+    c0, c1, c2, c3 = (xp.asarray(c, dtype=xp.uint64) for c in counter)
+    k0, k1 = (xp.asarray(k, dtype=xp.uint64) for k in key)
+    m0 = xp.uint64(_PHILOX_M0)
+    m1 = xp.uint64(_PHILOX_M1)
+    for _ in range(rounds):
+        hi0, lo0 = _mulhilo(m0, c0)
+        hi1, lo1 = _mulhilo(m1, c2)
+        c0, c1, c2, c3 = hi1 ^ c1 ^ k0, lo1, hi0 ^ c3 ^ k1, lo0
+        k0 = (k0 + xp.uint64(_PHILOX_W0)) & xp.uint64(_MASK32)
+        k1 = (k1 + xp.uint64(_PHILOX_W1)) & xp.uint64(_MASK32)
+    return c0, c1, c2, c3
+
+
+def _to_uniform(hi, lo):
+    # 53 random bits -> double in the open interval (0, 1).
+    bits = ((hi << xp.uint64(32)) | lo) >> xp.uint64(11)
+    return (bits.astype(xp.float64) + 0.5) * (1.0 / 2**53)
+
+
+class CounterRNG(object):
+    """Normal random numbers keyed by walker ID and step.
+
+    Parameters
+    ----------
+    seed : int
+        Random number seed (same on all MPI tasks).
+    """
+
+    def __init__(self, seed: int):
+        self.seed = int(seed) & _MASK32
+
+    def normal(self, walker_ids, step: int, size: int, stream: int = 0):
+        """Standard normal random numbers for a batch of walkers.
+
+        Parameters
+        ----------
+        walker_ids : array of int
+            Global IDs of the walkers.
+        step : int
+            Step number.
+        size : int
+            Number of random numbers per walker.
+        stream : int
+            Independent stream for different uses within a step. Default 0.
+
+        Returns
+        -------
+        xi : array
+            Normal random numbers of shape (len(walker_ids), size).
+        """
+        walker_ids = xp.asarray(walker_ids, dtype=xp.uint64)
+        nblocks = (size + 1) // 2
+        step = int(step)
+        # Each counter yields four words, i.e. two uniforms and by Box-Muller
+        # two normal random numbers.
+        block = xp.arange(nblocks, dtype=xp.uint64)[None, :]
+        counter = (
+            block,
+            xp.uint64(step & _MASK32),
+            xp.uint64((step >> 32) & _MASK32),
+            xp.uint64(int(stream) & _MASK32),
+        )
+        key = (walker_ids[:, None] & xp.uint64(_MASK32), xp.uint64(self.seed))
+        r0, r1, r2, r3 = philox4x32(counter, key)
+        u1 = _to_uniform(r0, r1)
+        u2 = _to_uniform(r2, r3)
+        radius = xp.sqrt(-2.0 * xp.log(u1))
+        theta = 2.0 * numpy.pi * u2
+        xi = xp.empty((len(walker_ids), 2 * nblocks), dtype=xp.float64)
+        xi[:, 0::2] = radius * xp.cos(theta)
+        xi[:, 1::2] = radius * xp.sin(theta)
+        return xi[:, :size]
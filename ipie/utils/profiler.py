@@ -0,0 +1,313 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Lightweight hierarchical profiler.
+
+Regions are nested using a context manager and are identified by the path of
+region names from the outermost region, e.g. "step/propagate/force_bias"::
+
+    from ipie.utils.profiler import profiler
+
+    with profiler.region("propagate"):
+        with profiler.region("force_bias", flops=nflops):
+            ...
+
+When the profiler is disabled region() returns a shared no-op context manager
+so instrumentation can be left in hot loops.
+"""
+
+import json
+import threading
+import time
+from typing import Dict, Optional
+
+import h5py
+import numpy
+
+from ipie.utils.backend import synchronize as _synchronize
+
+
+class _NullRegion(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_REGION = _NullRegion()
+
+
+class _Region(object):
+    __slots__ = ("profiler", "name", "nbytes", "flops", "start")
+
+    def __init__(self, profiler, name, nbytes, flops):
+        self.profiler = profiler
+        self.name = name
+        self.nbytes = nbytes
+        self.flops = flops
+
+    def __enter__(self):
+        self.profiler._push(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        profiler = self.profiler
+        if profiler.synchronize:
+            _synchronize()
+        end = time.perf_counter()
+        profiler._pop(self.start, end, self.nbytes, self.flops)
+        return False
+
+
+class Profiler(object):
+    """Collect timings of nested code regions.
+
+    Parameters
+    ----------
+    enabled : bool
+        Record timings. If False all methods are (almost) no-ops.
+    synchronize : bool
+        Synchronize the device before closing a region so GPU timings are
+        meaningful.
+    trace : bool
+        Record individual region events for a Chrome trace.
+    max_trace_events : int
+        Maximum number of trace events stored per rank.
+
+    Attributes
+    ----------
+    stats : dict
+        Mapping from region path to [time, calls, bytes, flops].
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        synchronize: bool = True,
+        trace: bool = False,
+        max_trace_events: int = 100000,
+    ):
+        self.enabled = enabled
+        self.synchronize = synchronize
+        self.trace = trace
+        self.max_trace_events = max_trace_events
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        self.stats: Dict[str, list] = {}
+        self.events = []
+        # Order in which regions were first entered, used for printing.
+        self._order: Dict[str, int] = {}
+        self._epoch = time.perf_counter()
+
+    @property
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = []
+            self._local.stack = stack
+        return stack
+
+    def _path(self, name):
+        stack = self._stack
+        if len(stack) == 0:
+            return name
+        return stack[-1] + "/" + name
+
+    def _push(self, name):
+        path = self._path(name)
+        if path not in self._order:
+            self._order[path] = len(self._order)
+        self._stack.append(path)
+
+    def _pop(self, start, end, nbytes, flops):
+        path = self._stack.pop()
+        self._record(path, end - start, 1, nbytes, flops)
+        if self.trace and len(self.events) < self.max_trace_events:
+            self.events.append((path, start - self._epoch, end - start))
+
+    def _record(self, path, elapsed, calls, nbytes, flops):
+        if path not in self._order:
+            self._order[path] = len(self._order)
+        entry = self.stats.get(path)
+        if entry is None:
+            self.stats[path] = [elapsed, calls, nbytes, flops]
+        else:
+            entry[0] += elapsed
+            entry[1] += calls
+            entry[2] += nbytes
+            entry[3] += flops
+
+    def region(self, name: str, nbytes: int = 0, flops: int = 0):
+        """Context manager timing a named region.
+
+        Parameters
+        ----------
+        name : str
+            Region name. Nested regions are recorded as parent/name.
+        nbytes : int
+            Optional number of bytes moved in the region.
+        flops : int
+            Optional number of floating point operations in the region.
+        """
+        if not self.enabled:
+            return _NULL_REGION
+        return _Region(self, name, nbytes, flops)
+
+    def add(self, name: str, elapsed: float, calls: int = 1, nbytes: int = 0, flops: int = 0):
+        """Record an externally timed region relative to the current region."""
+        if not self.enabled:
+            return
+        self._record(self._path(name), elapsed, calls, nbytes, flops)
+
+    def total(self, name: str) -> float:
+        """Total time spent in all regions with path or leaf name name."""
+        suffix = "/" + name
+        return sum(v[0] for k, v in self.stats.items() if k == name or k.endswith(suffix))
+
+    def calls(self, name: str) -> int:
+        """Total number of calls of all regions with path or leaf name name."""
+        suffix = "/" + name
+        return sum(v[1] for k, v in self.stats.items() if k == name or k.endswith(suffix))
+
+    def gather(self, comm) -> Optional[Dict[str, Dict[str, float]]]:
+        """Reduce statistics over MPI tasks.
+
+        Parameters
+        ----------
+        comm : MPI communicator
+            Communicator to reduce over. Collective.
+
+        Returns
+        -------
+        summary : dict or None
+            On rank 0 a mapping from region path to per-rank min / max / mean
+            time, load imbalance (max / mean - 1), mean call count and total
+            bytes and flops. None on other ranks.
+        """
+        all_stats = comm.gather((self.stats, self._order), root=0)
+        if comm.rank != 0:
+            return None
+        order = {}
+        for _, rank_order in all_stats:
+            for k, v in rank_order.items():
+                order.setdefault(k, v)
+        all_stats = [stats for stats, _ in all_stats]
+
+        # Parents before children, siblings in the order they were entered.
+        def sort_key(path):
+            parts = path.split("/")
+            return tuple(order.get("/".join(parts[: i + 1]), 0) for i in range(len(parts)))
+
+        paths = sorted(order.keys(), key=sort_key)
+        summary = {}
+        for path in paths:
+            vals = numpy.array(
+                [stats.get(path, [0.0, 0, 0, 0]) for stats in all_stats], dtype=numpy.float64
+            )
+            times = vals[:, 0]
+            mean = times.mean()
+            summary[path] = {
+                "min": times.min(),
+                "max": times.max(),
+                "mean": mean,
+                "imbalance": times.max() / mean - 1.0 if mean > 0 else 0.0,
+                "calls": vals[:, 1].mean(),
+                "bytes": vals[:, 2].sum(),
+                "flops": vals[:, 3].sum(),
+            }
+        return summary
+
+    def gather_events(self, comm):
+        """Gather trace events from all tasks onto rank 0 (collective)."""
+        all_events = comm.gather(self.events, root=0)
+        if comm.rank != 0:
+            return None
+        trace = []
+        for rank, events in enumerate(all_events):
+            for path, start, elapsed in events:
+                trace.append(
+                    {
+                        "name": path.split("/")[-1],
+                        "cat": path,
+                        "ph": "X",
+                        "ts": start * 1e6,
+                        "dur": elapsed * 1e6,
+                        "pid": rank,
+                        "tid": 0,
+                    }
+                )
+        return trace
+
+
+def print_profile(summary: Dict[str, Dict[str, float]]) -> None:
+    """Print table of region timings returned by Profiler.gather."""
+    print("# Timing breakdown (seconds, min / mean / max over MPI tasks):")
+    header = (
+        f"# {'Region':<40s} {'Calls':>10s} {'Min':>12s} {'Mean':>12s} "
+        f"{'Max':>12s} {'Per call':>12s} {'Imbalance':>10s} {'GFLOP/s':>10s}"
+    )
+    print(header)
+    for path, s in summary.items():
+        depth = path.count("/")
+        name = "  " * depth + path.split("/")[-1]
+        per_call = s["mean"] / s["calls"] if s["calls"] > 0 else 0.0
+        gflops = ""
+        if s["flops"] > 0 and s["max"] > 0:
+            gflops = f"{s['flops'] / s['max'] / 1e9:10.3f}"
+        print(
+            f"# {name:<40s} {s['calls']:>10.0f} {s['min']:>12.6f} {s['mean']:>12.6f} "
+            f"{s['max']:>12.6f} {per_call:>12.6f} {100*s['imbalance']:>9.1f}% {gflops:>10s}"
+        )
+
+
+def write_profile_hdf5(filename: str, summary: Dict[str, Dict[str, float]], base="profile"):
+    """Append profile summary to hdf5 file (e.g. the estimator file)."""
+    paths = list(summary.keys())
+    with h5py.File(filename, "a") as fh5:
+        if base in fh5:
+            del fh5[base]
+        group = fh5.create_group(base)
+        group["regions"] = numpy.array(paths, dtype="S")
+        for key in ["min", "max", "mean", "imbalance", "calls", "bytes", "flops"]:
+            group[key] = numpy.array([summary[p][key] for p in paths])
+
+
+def read_profile_hdf5(filename: str, base="profile") -> Dict[str, Dict[str, float]]:
+    """Read profile summary written by write_profile_hdf5."""
+    with h5py.File(filename, "r") as fh5:
+        group = fh5[base]
+        paths = [p.decode("utf-8") for p in group["regions"][()]]
+        keys = [k for k in group.keys() if k != "regions"]
+        data = {k: group[k][()] for k in keys}
+    return {p: {k: data[k][i] for k in keys} for i, p in enumerate(paths)}
+
+
+def write_chrome_trace(filename: str, events) -> None:
+    """Write events from Profiler.gather_events in Chrome trace format.
+
+    The file can be loaded in chrome://tracing or https://ui.perfetto.dev.
+    Each MPI task is shown as a separate process.
+    """
+    with open(filename, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+# Global profiler used throughout ipie.
+profiler = Profiler()
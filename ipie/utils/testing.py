@@ -717,5 +717,9 @@ def build_driver_test_instance(
         timestep=qmc.dt,
         stabilize_freq=qmc.nstblz,
         pop_control_freq=qmc.npop_control,
+        checkpoint_freq=qmc.checkpoint_freq,
+        online_reblock=qmc.online_reblock,
+        target_error=qmc.target_error,
+        max_wall_time=qmc.max_wall_time,
     )
     return afqmc
@@ -0,0 +1,67 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+import numpy
+import pytest
+
+from ipie.config import MPI
+from ipie.utils.autotune import Autotuner
+
+
+@pytest.mark.unit
+def test_autotuner():
+    calls = []
+
+    def slow(x):
+        calls.append("slow")
+        time.sleep(2e-3)
+        x += 1
+
+    def fast(x):
+        calls.append("fast")
+        x += 1
+
+    tuner = Autotuner("test", {"slow": slow, "fast": fast}, repeats=2)
+    x = numpy.zeros(3)
+    tuner((3,), lambda: (x.copy(),), x)
+    assert tuner.cache[(3,)] == "fast"
+    assert set(tuner.timings[(3,)]) == {"slow", "fast"}
+    # Candidates are timed on copies of the arguments.
+    assert numpy.allclose(x, 1)
+    # Cached for subsequent calls.
+    ncalls = len(calls)
+    tuner((3,), lambda: (x.copy(),), x)
+    assert calls[ncalls:] == ["fast"]
+
+
+@pytest.mark.unit
+def test_autotuner_comm():
+    calls = []
+
+    def slow(x):
+        calls.append("slow")
+        time.sleep(2e-3)
+
+    def fast(x):
+        calls.append("fast")
+
+    # Tuned once on rank 0 and broadcast, then reused for every key.
+    tuner = Autotuner("test", {"slow": slow, "fast": fast}, repeats=1, comm=MPI.COMM_WORLD)
+    assert tuner.select((3,), lambda: (numpy.zeros(3),)) == "fast"
+    ncalls = len(calls)
+    assert tuner.select((4,), lambda: (numpy.zeros(4),)) == "fast"
+    assert len(calls) == ncalls
+    assert tuner.cache == {(3,): "fast", (4,): "fast"}
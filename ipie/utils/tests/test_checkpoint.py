@@ -0,0 +1,68 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+from ipie.config import MPI
+from ipie.utils.checkpoint import (
+    CheckpointWriter,
+    get_checkpoint_filename,
+    read_checkpoint,
+    write_checkpoint,
+)
+
+
+def _state(comm, block):
+    return {
+        "driver": {"block": np.array(block), "nranks": np.array(comm.size)},
+        "data": np.full(4, block + comm.rank, dtype=np.float64),
+    }
+
+
+@pytest.mark.unit
+def test_checkpoint_commit():
+    comm = MPI.COMM_WORLD
+    tmpdir = comm.bcast(tempfile.mkdtemp() if comm.rank == 0 else None, root=0)
+    basename = os.path.join(tmpdir, "checkpoint")
+    writer = CheckpointWriter(basename, comm)
+    for block in [3, 6, 9]:
+        writer.write(_state(comm, block))
+    writer.close()
+    assert writer.committed == 9
+    files = sorted(os.listdir(tmpdir))
+    assert get_checkpoint_filename("checkpoint", comm.rank) in files
+    assert not [f for f in files if f.startswith(f"checkpoint.{comm.rank}.") and f.count(".") > 2]
+    state = read_checkpoint(basename, comm)
+    assert int(state["driver"]["block"]) == 9
+    assert np.allclose(state["data"], 9 + comm.rank)
+    # Only the first task wrote the next block before failing.
+    if comm.rank == 0:
+        write_checkpoint(get_checkpoint_filename(basename, 0, block=12), _state(comm, 12))
+    comm.Barrier()
+    state = read_checkpoint(basename, comm)
+    expected = 12 if comm.size == 1 else 9
+    assert int(state["driver"]["block"]) == expected
+    assert np.allclose(state["data"], expected + comm.rank)
+    comm.Barrier()
+    if comm.rank == 0:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    test_checkpoint_commit()
@@ -21,6 +21,7 @@ import tempfile
 import numpy as np
 import pytest
 
+from ipie.config import config
 from ipie.utils.io import read_hamiltonian, read_wavefunction, write_hamiltonian, write_wavefunction
 from ipie.utils.testing import get_random_phmsd_opt
 import h5py
@@ -40,13 +41,23 @@ def test_split_cholesky():
         f.create_dataset("LXmn", data=mock_data)
 
     nmembers = 4
-    split_cholesky(temp_hdf5_filename, nmembers, verbose=False)
+    # Stream the vectors in several slabs per member.
+    max_memory = config.get_option("max_memory_hamiltonian_read")
+    config.update_option("max_memory_hamiltonian_read", 10 * nbas**2 * 8 / 1024**3)
+    try:
+        split_cholesky(temp_hdf5_filename, nmembers, verbose=False)
+    finally:
+        config.update_option("max_memory_hamiltonian_read", max_memory)
 
     collected_data = []
     total_elements = 0
+    idx = np.triu_indices(nbas)
     for i in range(nmembers):
         with h5py.File(f"chol_{i}.h5", "r") as f:
             chol_data = f["chol"][()]
+            chol_packed = f["chol_packed"][()]
+            chol_view = chol_data.reshape(nbas, nbas, -1)
+            assert np.allclose(chol_packed, chol_view[idx[0], idx[1]])
             collected_data.append(chol_data)
             assert chol_data.ndim == 2
             assert chol_data.shape[0] == nbas**2
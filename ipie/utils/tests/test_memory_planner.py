@@ -0,0 +1,154 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import tempfile
+
+import numpy as np
+import pytest
+
+from ipie.config import config, MPI
+from ipie.qmc.calc import get_memory_plan
+from ipie.utils.io import write_hamiltonian, write_wavefunction
+from ipie.utils.memory_planner import (
+    GB,
+    memory_plan_options,
+    plan_memory,
+    read_hamiltonian_header,
+    read_wavefunction_header,
+)
+from ipie.utils.testing import get_random_phmsd_opt
+
+
+@pytest.mark.unit
+def test_plan_memory_single_det():
+    nbasis, nchol, nelec, nwalkers = 100, 400, (10, 8), 50
+    plan = plan_memory(nbasis, nchol, nelec, nwalkers, 100.0)
+    assert plan.persistent["chol"] == pytest.approx(nbasis**2 * nchol * 8 / GB)
+    assert plan.persistent["chol_packed"] == pytest.approx(
+        nbasis * (nbasis + 1) // 2 * nchol * 8 / GB
+    )
+    assert plan.persistent["rchola"] == pytest.approx(nelec[0] * nbasis * nchol * 8 / GB)
+    assert plan.persistent["Ga/Gb"] == pytest.approx(2 * nwalkers * nbasis**2 * 16 / GB)
+    assert plan.fits
+    assert plan.num_det_chunks == 1
+    # The predicted peak grows linearly with the number of walkers so the
+    # largest number of walkers should exactly fit.
+    budget = plan.peak * 1.5
+    plan = plan_memory(nbasis, nchol, nelec, nwalkers, budget)
+    max_walkers = plan.max_walkers
+    assert max_walkers > nwalkers
+    assert plan_memory(nbasis, nchol, nelec, max_walkers, budget).fits
+    assert not plan_memory(nbasis, nchol, nelec, max_walkers + 1, budget).fits
+
+
+@pytest.mark.unit
+def test_plan_memory_node_shared():
+    nbasis, nchol, nelec, nwalkers, budget = 400, 2000, (50, 50), 20, 4.0
+    # The budget is per task so node shared integrals are charged per task.
+    plan = plan_memory(nbasis, nchol, nelec, nwalkers, budget, nshared=64, ntasks=128)
+    assert plan.persistent["chol"] == pytest.approx(nbasis**2 * nchol * 8 / GB / 64)
+    assert plan.nmembers == 1
+    assert plan.vhs_block_size == nwalkers
+    assert plan.max_memory_for_wicks > 1.0
+    assert plan.max_walkers > nwalkers
+    assert plan.fits
+    # Without sharing the integrals alone exceed the budget.
+    plan = plan_memory(nbasis, nchol, nelec, nwalkers, budget, nshared=1, ntasks=128)
+    assert not plan.fits
+
+
+@pytest.mark.unit
+def test_plan_memory_chunking():
+    nbasis, nchol, nelec, nwalkers, ndets = 50, 200, (5, 5), 20, 10000
+    kwargs = dict(trial_type="particle_hole", ndets=ndets, nact=20)
+    plan = plan_memory(nbasis, nchol, nelec, nwalkers, 100.0, **kwargs)
+    assert plan.num_det_chunks == 1
+    # Opposite spin buffers for all determinants at once need ~0.6 GB.
+    budget = plan.peak - 0.5 * plan.transient["wicks"]
+    plan = plan_memory(nbasis, nchol, nelec, nwalkers, budget, **kwargs)
+    assert plan.num_det_chunks > 1
+    assert plan.fits
+    persistent = sum(plan.persistent.values())
+    assert plan.max_memory_for_wicks == pytest.approx(budget - persistent)
+    # Integrals do not fit so should be split over members.
+    plan = plan_memory(nbasis, nchol, nelec, nwalkers, 0.01, ntasks=8, **kwargs)
+    assert plan.nmembers > 1
+    assert 8 % plan.nmembers == 0
+    assert not plan.fits
+
+
+@pytest.mark.unit
+def test_plan_memory_vhs_blocks():
+    nbasis, nchol, nelec, nwalkers = 200, 100, (5, 5), 64
+    plan = plan_memory(nbasis, nchol, nelec, nwalkers, 100.0)
+    assert plan.vhs_block_size == nwalkers
+    # Leave room for a quarter of the VHS of all walkers.
+    vhs = nwalkers * (nbasis**2 + nbasis * (nbasis + 1) // 2) * 16 / GB
+    budget = sum(plan.persistent.values()) + plan.transient["VHS"] - 0.75 * vhs
+    plan = plan_memory(nbasis, nchol, nelec, nwalkers, budget)
+    assert plan.vhs_block_size <= nwalkers // 4
+    assert plan.transient["VHS"] <= budget - sum(plan.persistent.values())
+    assert plan.fits
+
+
+@pytest.mark.unit
+def test_memory_plan_options():
+    nbasis, nchol, nelec, nwalkers = 200, 100, (5, 5), 64
+    plan = plan_memory(nbasis, nchol, nelec, nwalkers, 100.0)
+    plan.vhs_block_size = 16
+    names = ["max_memory_for_wicks", "max_memory_sd_energy_gpu", "vhs_walker_block_size"]
+    previous = [config.get_option(name) for name in names]
+    with memory_plan_options(plan):
+        assert config.get_option("max_memory_for_wicks") == plan.max_memory_for_wicks
+        assert config.get_option("max_memory_sd_energy_gpu") == plan.max_memory_sd_energy_gpu
+        assert config.get_option("vhs_walker_block_size") == 16
+    # The plan does not leak into later calculations.
+    assert [config.get_option(name) for name in names] == previous
+    with memory_plan_options(None):
+        assert [config.get_option(name) for name in names] == previous
+    # Options set by the user are kept.
+    config.update_option("max_memory_for_wicks", 7.0)
+    try:
+        with memory_plan_options(plan):
+            assert config.get_option("max_memory_for_wicks") == 7.0
+            assert config.get_option("max_memory_sd_energy_gpu") == plan.max_memory_sd_energy_gpu
+    finally:
+        config.update_option("max_memory_for_wicks", previous[0])
+
+
+@pytest.mark.unit
+def test_plan_from_input():
+    with tempfile.NamedTemporaryFile() as hamilf, tempfile.NamedTemporaryFile() as wfnf:
+        np.random.seed(7)
+        nmo, naux, nelec = 10, 30, (3, 2)
+        hcore = np.random.random((nmo, nmo))
+        LXmn = np.random.random((naux, nmo, nmo))
+        write_hamiltonian(hcore, LXmn, 0.0, filename=hamilf.name)
+        assert read_hamiltonian_header(hamilf.name) == (nmo, naux, False)
+        wfn, _ = get_random_phmsd_opt(nelec[0], nelec[1], nmo, ndet=7)
+        write_wavefunction(wfn, filename=wfnf.name)
+        trial_type, ndets, nact = read_wavefunction_header(wfnf.name)
+        assert trial_type == "particle_hole"
+        assert ndets == 7
+        assert nact == max(np.max(wfn[1]), np.max(wfn[2])) + 1
+        options = {
+            "system": {"nup": nelec[0], "ndown": nelec[1]},
+            "qmc": {"nwalkers": 10},
+            "hamiltonian": {"integrals": hamilf.name},
+            "trial": {"filename": wfnf.name, "ndets": 5},
+        }
+        plan = get_memory_plan(options, MPI.COMM_WORLD)
+        assert plan.nwalkers == 10
+        assert plan.persistent["chol"] == pytest.approx(nmo**2 * naux * 8 / GB)
+        assert plan.fits
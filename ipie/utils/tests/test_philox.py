@@ -0,0 +1,64 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from ipie.utils.philox import CounterRNG, philox4x32
+
+
+@pytest.mark.unit
+def test_philox_known_answers():
+    # Known answer tests from Random123.
+    mask = 0xFFFFFFFF
+    tests = [
+        ((0, 0, 0, 0), (0, 0), (0x6627E8D5, 0xE169C58D, 0xBC57AC4C, 0x9B00DBD8)),
+        ((mask,) * 4, (mask,) * 2, (0x408F276D, 0x41C83B0E, 0xA20BC7C6, 0x6D5451FD)),
+        (
+            (0x243F6A88, 0x85A308D3, 0x13198A2E, 0x03707344),
+            (0xA4093822, 0x299F31D0),
+            (0xD16CFE09, 0x94FDCCEB, 0x5001E420, 0x24126EA1),
+        ),
+    ]
+    for counter, key, ref in tests:
+        assert [int(x) for x in philox4x32(counter, key)] == list(ref)
+
+
+@pytest.mark.unit
+def test_counter_rng_decomposition():
+    rng = CounterRNG(7)
+    nwalkers, nfields = 12, 17
+    xi = rng.normal(np.arange(nwalkers), 3, nfields)
+    assert xi.shape == (nwalkers, nfields)
+    # Same numbers however the walkers are split over tasks.
+    split = [rng.normal(ids, 3, nfields) for ids in np.array_split(np.arange(nwalkers), 5)]
+    assert np.array_equal(np.vstack(split), xi)
+    # Reversing walker order permutes rows.
+    assert np.array_equal(rng.normal(np.arange(nwalkers)[::-1], 3, nfields), xi[::-1])
+    # Extra fields do not change the leading ones.
+    assert np.array_equal(rng.normal(np.arange(nwalkers), 3, nfields + 3)[:, :nfields], xi)
+    assert not np.allclose(rng.normal(np.arange(nwalkers), 4, nfields), xi)
+    assert not np.allclose(rng.normal(np.arange(nwalkers), 3, nfields, stream=1), xi)
+    assert not np.allclose(CounterRNG(8).normal(np.arange(nwalkers), 3, nfields), xi)
+    assert len(np.unique(xi)) == xi.size
+
+
+@pytest.mark.unit
+def test_counter_rng_moments():
+    xi = CounterRNG(11).normal(np.arange(2000), 1, 500)
+    assert np.mean(xi) == pytest.approx(0.0, abs=5e-3)
+    assert np.var(xi) == pytest.approx(1.0, abs=5e-3)
+    assert np.mean(xi**4) == pytest.approx(3.0, abs=3e-2)
+    corr = np.mean(xi[:, 1:] * xi[:, :-1])
+    assert corr == pytest.approx(0.0, abs=5e-3)
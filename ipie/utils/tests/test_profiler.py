@@ -0,0 +1,93 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import tempfile
+
+import pytest
+
+from ipie.config import MPI
+from ipie.utils.profiler import (
+    Profiler,
+    read_profile_hdf5,
+    write_chrome_trace,
+    write_profile_hdf5,
+)
+
+
+@pytest.mark.unit
+def test_profiler_regions():
+    profiler = Profiler(trace=True)
+    for _ in range(3):
+        with profiler.region("step"):
+            with profiler.region("propagate", flops=10):
+                with profiler.region("force_bias"):
+                    pass
+                profiler.add("communication", 0.5)
+            with profiler.region("estimators"):
+                pass
+    assert list(profiler.stats.keys()) == [
+        "step/propagate/force_bias",
+        "step/propagate/communication",
+        "step/propagate",
+        "step/estimators",
+        "step",
+    ]
+    assert profiler.calls("force_bias") == 3
+    assert profiler.stats["step/propagate"][3] == 30
+    assert profiler.total("communication") == pytest.approx(1.5)
+    assert profiler.total("step") >= profiler.total("propagate")
+    assert len(profiler.events) == 3 * 4
+    comm = MPI.COMM_WORLD
+    summary = profiler.gather(comm)
+    if comm.rank == 0:
+        # Parents are listed before their children.
+        assert list(summary.keys()) == [
+            "step",
+            "step/propagate",
+            "step/propagate/force_bias",
+            "step/propagate/communication",
+            "step/estimators",
+        ]
+        assert summary["step"]["calls"] == 3
+        assert summary["step"]["min"] <= summary["step"]["mean"] <= summary["step"]["max"]
+        assert summary["step/propagate"]["flops"] == 30 * comm.size
+    events = profiler.gather_events(comm)
+    if comm.rank == 0:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "profile.h5")
+            write_profile_hdf5(filename, summary)
+            read = read_profile_hdf5(filename)
+            assert list(read.keys()) == list(summary.keys())
+            for k, v in summary.items():
+                for stat, val in v.items():
+                    assert read[k][stat] == pytest.approx(val)
+            trace_file = os.path.join(tmpdir, "trace.json")
+            write_chrome_trace(trace_file, events)
+            with open(trace_file) as f:
+                trace = json.load(f)["traceEvents"]
+            assert len(trace) == 3 * 4 * comm.size
+            assert all(e["ph"] == "X" for e in trace)
+
+
+@pytest.mark.unit
+def test_profiler_disabled():
+    profiler = Profiler(enabled=False)
+    with profiler.region("step"):
+        with profiler.region("propagate"):
+            profiler.add("communication", 0.5)
+    assert len(profiler.stats) == 0
+    assert profiler.total("step") == 0.0
+    assert profiler.region("a") is profiler.region("b")
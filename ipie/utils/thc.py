@@ -0,0 +1,185 @@
+# Copyright 2022 The ipie Developers. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tensor hypercontraction factors from Cholesky vectors.
+
+There is no real-space grid for molecular integrals read from file, so
+instead of ISDF the interpolation vectors are selected from the eigenvectors
+of the Cholesky vectors (their double factorization) by pivoted Cholesky on
+the Gram matrix of the rank one projectors, and the central tensor is then
+fitted by least squares.
+"""
+
+import time
+from typing import Tuple
+
+import numpy
+import scipy.linalg
+
+from ipie.utils.io import read_hamiltonian, write_thc_hamiltonian
+
+
+def _select_interpolation_vectors(vecs, weights, nthc, tol):
+    """Greedy pivoted Cholesky on G_kl = w_k w_l (v_k . v_l)^2.
+
+    Columns of G are built on the fly so the (ncand, ncand) Gram matrix is
+    never stored.
+    """
+    ncand = vecs.shape[1]
+    nthc = min(nthc, ncand)
+    residual = weights**2
+    max_diag = residual.max()
+    factors = numpy.zeros((nthc, ncand))
+    pivots = []
+    for k in range(nthc):
+        pivot = int(numpy.argmax(residual))
+        if residual[pivot] <= tol * max_diag:
+            break
+        col = weights * weights[pivot] * vecs.T.dot(vecs[:, pivot]) ** 2
+        col -= factors[:k].T.dot(factors[:k, pivot])
+        factors[k] = col / numpy.sqrt(residual[pivot])
+        residual -= factors[k] ** 2
+        residual[pivot] = 0.0
+        pivots.append(pivot)
+    return numpy.array(pivots, dtype=int)
+
+
+def fit_thc_factors(
+    X: numpy.ndarray, chol: numpy.ndarray, rcond: float = 1e-12
+) -> Tuple[numpy.ndarray, float]:
+    """Least-squares fit of U given the collocation matrix X.
+
+    Minimises sum_n || L^n - X diag(U[:, n]) X^T ||_F^2.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        Collocation matrix of shape (nbasis, nthc).
+    chol : numpy.ndarray
+        Cholesky vectors of shape (nchol, nbasis, nbasis).
+    rcond : float
+        Cutoff for small singular values of the normal equations.
+
+    Returns
+    -------
+    U : numpy.ndarray
+        Fitted factor of shape (nthc, nchol).
+    error : float
+        Relative Frobenius norm error of the fitted two electron integrals.
+    """
+    XX = X.T.dot(X)
+    S = XX * XX
+    B = numpy.einsum("pP,npq,qP->Pn", X, chol, X, optimize=True)
+    U = scipy.linalg.lstsq(S, B, cond=rcond)[0]
+    # ||V - V'||^2 = ||L^T L||^2 - 2 ||L^T L'||^2 + ||L'^T L'||^2 with V = L L^T.
+    nchol = chol.shape[0]
+    LL = chol.reshape(nchol, -1)
+    LL = LL.dot(LL.T)
+    LLp = B.T.dot(U)
+    LpLp = U.T.dot(S).dot(U)
+    norm = numpy.sum(LL**2)
+    error = norm - 2 * numpy.sum(LLp**2) + numpy.sum(LpLp**2)
+    return U, float(numpy.sqrt(max(error, 0.0) / norm))
+
+
+def thc_from_cholesky(
+    chol: numpy.ndarray,
+    nthc: int,
+    thresh: float = 1e-10,
+    verbose: bool = False,
+) -> Tuple[numpy.ndarray, numpy.ndarray, float]:
+    r"""Build THC factors from (real) Cholesky vectors.
+
+    .. math::
+
+        L^n_{pq} \approx \sum_P X_{pP} X_{qP} U_{Pn}
+
+    Parameters
+    ----------
+    chol : numpy.ndarray
+        Cholesky vectors of shape (nchol, nbasis, nbasis).
+    nthc : int
+        Maximum number of interpolation vectors. Fewer are used if the
+        selection converges earlier.
+    thresh : float
+        Eigenvalues of the Cholesky vectors and pivots below thresh (relative
+        to the largest) are discarded.
+    verbose : bool
+        Print fit information.
+
+    Returns
+    -------
+    X : numpy.ndarray
+        Collocation matrix of shape (nbasis, nthc).
+    U : numpy.ndarray
+        Factor of the central tensor Z = U U^T of shape (nthc, nfields) with
+        nfields <= min(nthc, nchol).
+    error : float
+        Relative error of the two electron integrals.
+    """
+    start = time.time()
+    assert numpy.isrealobj(chol), "THC factorization requires real Cholesky vectors."
+    nbasis = chol.shape[-1]
+    evals, evecs = numpy.linalg.eigh(chol)
+    evals = evals.ravel()
+    vecs = evecs.transpose(1, 0, 2).reshape(nbasis, -1)
+    keep = numpy.abs(evals) > thresh * numpy.abs(evals).max()
+    weights = numpy.abs(evals[keep])
+    vecs = vecs[:, keep]
+    pivots = _select_interpolation_vectors(vecs, weights, nthc, thresh)
+    X = vecs[:, pivots].copy()
+    U, error = fit_thc_factors(X, chol)
+    # Z = U U^T only depends on the left singular vectors so compress the
+    # number of fields to the rank of U.
+    W, sigma, _ = numpy.linalg.svd(U, full_matrices=False)
+    rank = int(numpy.sum(sigma > thresh * sigma[0]))
+    U = W[:, :rank] * sigma[:rank]
+    if verbose:
+        print(f"# Number of THC candidate vectors: {vecs.shape[1]}")
+        print(f"# Number of THC interpolation vectors: {X.shape[1]}")
+        print(f"# Number of THC fields: {U.shape[1]} (nchol = {chol.shape[0]})")
+        print(f"# Relative error in THC two electron integrals: {error:13.8e}")
+        print(f"# Time to build THC factors: {time.time() - start:.6f} s")
+    return X, U, error
+
+
+def convert_cholesky_to_thc(
+    ham_filename: str,
+    thc_filename: str,
+    nthc: int,
+    thresh: float = 1e-10,
+    verbose: bool = True,
+) -> float:
+    """Write THC factors for the Hamiltonian in ham_filename to thc_filename.
+
+    Parameters
+    ----------
+    ham_filename : str
+        Cholesky Hamiltonian written by write_hamiltonian.
+    thc_filename : str
+        Output file read by get_hamiltonian.
+    nthc : int
+        Maximum number of interpolation vectors.
+    thresh : float
+        See thc_from_cholesky.
+
+    Returns
+    -------
+    error : float
+        Relative error of the two electron integrals.
+    """
+    hcore, chol, e0 = read_hamiltonian(ham_filename)
+    X, U, error = thc_from_cholesky(chol, nthc, thresh=thresh, verbose=verbose)
+    write_thc_hamiltonian(hcore, X, U, e0, filename=thc_filename)
+    return error
@@ -24,9 +24,12 @@ from abc import ABCMeta, abstractmethod
 import h5py
 import numpy
 
+from ipie.config import config
 from ipie.utils.backend import arraylib as xp
 from ipie.utils.backend import to_host
+from ipie.utils.checkpoint import get_checkpoint_filename, write_checkpoint
 from ipie.utils.io import format_fixed_width_floats
+from ipie.utils.mpi import get_shared_array, get_shared_comm
 
 
 class WalkerAccumulator:
@@ -134,8 +137,21 @@ class BaseWalkers(metaclass=ABCMeta):
             "sgn_ovlp",
             "log_ovlp",
         ]
+        # Additional (non-communicated) data required for restarts.
+        self.checkpoint_names = ["detR_shift", "log_shift"]
+        # Remaining per-walker data (e.g. scratch Green's functions) which is
+        # reallocated by resize.
+        self.walker_names = ["eloc", "detR", "log_detR", "log_detR_shift"]
         self.buff_size = None
         self.walker_buffer = None
+        self._buffer_layout = None
+        # Axis indexing walkers of per-walker arrays, if not the first.
+        self.walker_axes = {}
+        # Node shared memory (see share_memory).
+        self.node_comm = None
+        self.node_arrays = None
+        self.node_ids = None
+        self.node_ranks = None
         self.write_file = None
         self.read_file = None
 
@@ -163,6 +179,181 @@ class BaseWalkers(metaclass=ABCMeta):
                         size += 1
         return size
 
+    @property
+    def buffer_layout(self):
+        """Location of the communicated fields in a walker buffer.
+
+        Returns
+        -------
+        layout : list of tuple
+            (name, offset, size) of each field in buff_names which is not None.
+        """
+        if self._buffer_layout is None:
+            layout = []
+            offset = 0
+            for name in self.buff_names:
+                data = getattr(self, name)
+                if data is None:
+                    continue
+                assert isinstance(data, (numpy.ndarray, xp.ndarray)), f"Cannot pack {name}"
+                size = data.size // self.nwalkers
+                layout.append((name, offset, size))
+                offset += size
+            assert offset == self.buff_size
+            self._buffer_layout = layout
+        return self._buffer_layout
+
+    def _select_layout(self, names):
+        if names is None:
+            return self.buffer_layout, self.buff_size
+        layout = []
+        offset = 0
+        for name, _, size in self.buffer_layout:
+            if name in names:
+                layout.append((name, offset, size))
+                offset += size
+        return layout, offset
+
+    def pack_buffers(self, indices, names=None):
+        """Pack several walkers into one contiguous buffer for communication.
+
+        Parameters
+        ----------
+        indices : numpy.ndarray
+            Local indices of walkers to pack.
+        names : list of str
+            Subset of buff_names to pack. Default None, i.e. all.
+
+        Returns
+        -------
+        buff : numpy.ndarray
+            Walker data of shape (len(indices), buff_size).
+        """
+        nwalkers = len(indices)
+        layout, buff_size = self._select_layout(names)
+        buff = xp.empty((nwalkers, buff_size), dtype=numpy.complex128)
+        for name, offset, size in layout:
+            data = xp.asarray(getattr(self, name)[indices])
+            buff[:, offset : offset + size] = data.reshape(nwalkers, size)
+        return to_host(buff)
+
+    def unpack_buffers(self, indices, buff, names=None):
+        """Overwrite walkers with data packed by pack_buffers.
+
+        Parameters
+        ----------
+        indices : numpy.ndarray
+            Local indices of walkers to overwrite.
+        buff : numpy.ndarray
+            Walker data of shape (len(indices), buff_size).
+        names : list of str
+            Subset of buff_names packed. Default None, i.e. all.
+        """
+        nwalkers = len(indices)
+        if nwalkers == 0:
+            return
+        layout, _ = self._select_layout(names)
+        for name, offset, size in layout:
+            data = getattr(self, name)
+            values = buff[:, offset : offset + size].reshape((nwalkers,) + data.shape[1:])
+            if not numpy.iscomplexobj(data):
+                values = values.real
+            if isinstance(data, numpy.ndarray):
+                data[indices] = to_host(values)
+            else:
+                data[indices] = xp.asarray(values)
+
+    def __setattr__(self, name, value):
+        node_arrays = self.__dict__.get("node_arrays")
+        if node_arrays is not None and name in node_arrays:
+            # Keep walkers in node shared memory.
+            self.__dict__[name][...] = value
+        else:
+            super().__setattr__(name, value)
+
+    def share_memory(self, comm, verbose=False):
+        """Store the walker matrices in node shared memory.
+
+        The per-walker matrices in buff_names (e.g. phia, phib) of all tasks
+        on a node are allocated in one MPI shared memory window, so walkers
+        moved between tasks on the same node by population control are
+        copied directly (see exchange_walkers). Assigning to these
+        attributes copies into the window. Collective. Not available on GPU
+        or if all tasks on a node do not have the same number of walkers.
+
+        Parameters
+        ----------
+        comm : MPI communicator
+
+        Returns
+        -------
+        shared : bool
+            True if the walkers are in shared memory.
+        """
+        if config.get_option("use_gpu"):
+            return False
+        node_comm = get_shared_comm(comm, verbose=verbose)
+        if node_comm is None:
+            return False
+        counts = numpy.empty(node_comm.size, dtype=numpy.int64)
+        node_comm.Allgather(numpy.array([self.nwalkers], dtype=numpy.int64), counts)
+        if numpy.any(counts != self.nwalkers):
+            return False
+        # Node of each task (labelled by its first task) and rank within it.
+        leader = node_comm.bcast(comm.rank, root=0)
+        info = numpy.empty((comm.size, 2), dtype=numpy.int64)
+        comm.Allgather(numpy.array([leader, node_comm.rank], dtype=numpy.int64), info)
+        node_arrays = {}
+        for name, _, size in self.buffer_layout:
+            if size == 1:
+                continue
+            data = numpy.asarray(getattr(self, name))
+            shared = get_shared_array(node_comm, (node_comm.size,) + data.shape, data.dtype)
+            shared[node_comm.rank] = data
+            node_arrays[name] = shared
+        node_comm.Barrier()
+        for name, shared in node_arrays.items():
+            self.__dict__[name] = shared[node_comm.rank]
+        self.node_comm = node_comm
+        self.node_ids = info[:, 0]
+        self.node_ranks = info[:, 1]
+        self.node_arrays = node_arrays
+        if verbose:
+            print(f"# Walkers in node shared memory: {', '.join(node_arrays)}.")
+        return True
+
+    def resize(self, nwalkers):
+        """Change the number of walkers.
+
+        The per-walker data named in buff_names, checkpoint_names and
+        walker_names is reallocated. The first min(nwalkers, self.nwalkers)
+        walkers are kept and new walkers are zero.
+
+        Parameters
+        ----------
+        nwalkers : int
+            New number of walkers.
+        """
+        if nwalkers == self.nwalkers:
+            return
+        if self.node_arrays is not None:
+            raise RuntimeError("Cannot resize walkers in node shared memory.")
+        nkeep = min(nwalkers, self.nwalkers)
+        names = dict.fromkeys(self.buff_names + self.checkpoint_names + self.walker_names)
+        for name in names:
+            data = self.__dict__.get(name)
+            axis = self.walker_axes.get(name, 0)
+            if isinstance(data, list):
+                setattr(self, name, data[:nkeep] + [0.0] * (nwalkers - nkeep))
+            elif isinstance(data, (numpy.ndarray, xp.ndarray)):
+                shape = data.shape[:axis] + (nwalkers,) + data.shape[axis + 1 :]
+                lib = numpy if isinstance(data, numpy.ndarray) else xp
+                resized = lib.zeros(shape, dtype=data.dtype)
+                keep = (slice(None),) * axis + (slice(0, nkeep),)
+                resized[keep] = data[keep]
+                setattr(self, name, resized)
+        self.nwalkers = nwalkers
+
     def orthogonalise(self, free_projection=False):
         """Orthogonalise all walkers.
 
@@ -178,42 +369,70 @@ class BaseWalkers(metaclass=ABCMeta):
             self.phase *= cmath.exp(1j * dtheta)
         return detR
 
-    def get_write_buffer(self):
-        buff = numpy.concatenate(
-            [
-                [self.weight],
-                [self.phase],
-                [self.ovlp],
-                self.phi.ravel(),
-            ]
-        )
-        return buff
+    def get_checkpoint_state(self):
+        """Copy of the per-walker data required to restart the random walk.
 
-    def set_walkers_from_buffer(self, buff):
-        self.weight = buff[0 : self.nwalkers]
-        self.phase = buff[self.nwalkers : self.nwalkers * 2]
-        self.ovlp = buff[self.nwalkers * 2 : self.nwalkers * 3]
-        self.phi = buff[self.nwalkers * 3 :].reshape(self.phi.shape)
+        Returns
+        -------
+        state : dict
+            Host (numpy) arrays keyed by attribute name.
+        """
+        state = {}
+        for name in self.buff_names + self.checkpoint_names:
+            data = getattr(self, name)
+            if data is None:
+                continue
+            state[name] = to_host(xp.asarray(data)).copy()
+        return state
+
+    def set_checkpoint_state(self, state):
+        """Restore walkers from the output of get_checkpoint_state.
+
+        Parameters
+        ----------
+        state : dict
+            Arrays keyed by attribute name.
+        """
+        if "weight" in state:
+            # The number of walkers per task changes with load balancing.
+            self.resize(len(state["weight"]))
+        for name in self.buff_names + self.checkpoint_names:
+            if name not in state:
+                continue
+            data = numpy.asarray(state[name])
+            assert data.shape[0] == self.nwalkers, f"Inconsistent walker data for {name}"
+            current = getattr(self, name)
+            same_layout = isinstance(current, (numpy.ndarray, xp.ndarray)) and (
+                current.shape == data.shape and current.dtype == data.dtype
+            )
+            if same_layout:
+                current[...] = xp.asarray(data)
+            else:
+                setattr(self, name, xp.array(data))
 
     def write_walkers_batch(self, comm):
+        """Synchronously write walkers to self.write_file (one file per rank)."""
         start = time.time()
         assert self.write_file is not None
-        raise NotImplementedError("This is not tested. Please implement.")
-        with h5py.File(self.write_file, "r+", driver="mpio", comm=comm) as fh5:
-            # for (i,w) in enumerate(self.walkers):
-            # ix = i + self.nwalkers*comm.rank
-            fh5["walker_%d" % comm.rank][:] = self.get_write_buffer()
+        write_checkpoint(
+            get_checkpoint_filename(self.write_file, comm.rank),
+            {"walkers": self.get_checkpoint_state()},
+        )
         if comm.rank == 0:
             print(" # Writing walkers to file.")
             print(f" # Time to write restart: {time.time() - start:13.8e} s")
 
     def read_walkers_batch(self, comm):
-        assert self.write_file is not None
-        with h5py.File(self.read_file, "r") as fh5:
+        """Read walkers written by write_walkers_batch from self.read_file."""
+        assert self.read_file is not None
+        filename = get_checkpoint_filename(self.read_file, comm.rank)
+        with h5py.File(filename, "r") as fh5:
             try:
-                self.set_walkers_from_buffer(fh5["walker_%d" % comm.rank][:])
+                state = {k: v[()] for k, v in fh5["walkers"].items()}
             except KeyError:
-                print(f" # Could not read walker data from: {self.read_file}")
+                print(f" # Could not read walker data from: {filename}")
+                return
+        self.set_checkpoint_state(state)
 
     @abstractmethod
     def reortho(self):
@@ -73,6 +73,7 @@ class GHFWalkers(BaseWalkers):
         self.rhf = None
 
         self.buff_names += ["phi"]
+        self.walker_names += ["G", "Ghalf"]
         self.buff_size = round(self.set_buff_size_single_walker() / float(self.nwalkers))
         self.walker_buffer = numpy.zeros(self.buff_size, dtype=numpy.complex128)
 
@@ -128,6 +129,7 @@ class GHFWalkers(BaseWalkers):
         self.rhf = None
 
         self.buff_names += ["phi"]
+        self.walker_names += ["G", "Ghalf"]
         self.buff_size = round(self.set_buff_size_single_walker() / float(self.nwalkers))
         self.walker_buffer = numpy.zeros(self.buff_size, dtype=numpy.complex128)
 
@@ -4,30 +4,56 @@ import numpy
 
 from ipie.config import MPI
 from ipie.utils.backend import arraylib as xp
+from ipie.utils.profiler import profiler
+
+# Message tags of point-to-point population control communication.
+_COMB_TAG = 101
+_EXCHANGE_TAG = 102
 
 
 class PopControllerTimer:
+    """Split population control time into communication / computation.
+
+    Times are also recorded as regions of the global profiler relative to
+    the currently open region.
+    """
+
     def __init__(self):
         self.start_time_const = 0.0
         self.communication_time = 0.0
         self.non_communication_time = 0.0
         self.recv_time = 0.0
         self.send_time = 0.0
+        # Time blocked waiting for non-blocking (asynchronous) communication.
+        self.wait_time = 0.0
 
     def start_time(self):
         self.start_time_const = time.time()
 
     def add_non_communication(self):
-        self.non_communication_time += time.time() - self.start_time_const
+        elapsed = time.time() - self.start_time_const
+        self.non_communication_time += elapsed
+        profiler.add("non_communication", elapsed)
 
     def add_communication(self):
-        self.communication_time += time.time() - self.start_time_const
+        elapsed = time.time() - self.start_time_const
+        self.communication_time += elapsed
+        profiler.add("communication", elapsed)
 
     def add_recv_time(self):
-        self.recv_time += time.time() - self.start_time_const
+        elapsed = time.time() - self.start_time_const
+        self.recv_time += elapsed
+        profiler.add("recv", elapsed)
 
     def add_send_time(self):
-        self.send_time += time.time() - self.start_time_const
+        elapsed = time.time() - self.start_time_const
+        self.send_time += elapsed
+        profiler.add("send", elapsed)
+
+    def add_wait_time(self):
+        elapsed = time.time() - self.start_time_const
+        self.wait_time += elapsed
+        profiler.add("wait", elapsed)
 
 
 class PopController:
@@ -40,6 +66,9 @@ class PopController:
         min_weight=0.1,
         max_weight=4,
         reconfiguration_freq=50,
+        asynchronous=False,
+        load_balance=False,
+        load_balance_tol=0.05,
         verbose=False,
     ):
         self.verbose = verbose
@@ -51,6 +80,24 @@ class PopController:
         self.method = pop_control_method
         if verbose:
             print(f"# Using {self.method} population control " "algorithm.")
+        # Overlap the weight reduction with the next propagation step (see
+        # start_pop_control). Stochastic reconfiguration is always synchronous.
+        self.asynchronous = asynchronous and self.method in ("comb", "pair_branch")
+        self._pending = None
+        if verbose and self.asynchronous:
+            print("# Using asynchronous population control.")
+        # Move walkers towards faster tasks after branching (see balance_load).
+        # Requires a method which allows a different number of walkers per task.
+        self.load_balance = load_balance
+        if load_balance and self.method != "distributed_comb":
+            raise ValueError("Load balancing requires distributed_comb population control.")
+        self.load_balance_tol = load_balance_tol
+        self.max_walkers_local = 2 * num_walkers_local
+        self.num_rebalances = 0
+        self._last_work = 0.0
+        self._last_steps = 0
+        if verbose and self.load_balance:
+            print("# Balancing the number of walkers per task.")
 
         self.min_weight = min_weight
         self.max_weight = max_weight
@@ -75,6 +122,17 @@ class PopController:
 
         self.timer = PopControllerTimer()
 
+    def get_state(self):
+        """Data required to restart population control."""
+        return {
+            "total_weight": numpy.array(self.total_weight, dtype=numpy.float64),
+            "reconfiguration_counter": numpy.array(self.reconfiguration_counter),
+        }
+
+    def set_state(self, state):
+        self.total_weight = float(state["total_weight"])
+        self.reconfiguration_counter = int(state["reconfiguration_counter"])
+
     def pop_control(self, walkers, comm):
         self.timer.start_time()
         if self.ntot_walkers == 1:
@@ -115,6 +173,13 @@ class PopController:
             comb(walkers, comm, global_weights, self.target_weight, self.timer)
         elif self.method == "pair_branch":
             pair_branch(walkers, comm, self.max_weight, self.min_weight, self.timer)
+        elif self.method == "distributed_comb":
+            self.timer.add_non_communication()
+            distributed_comb(
+                walkers, comm, self.target_weight, self.timer, total_weight=self.target_weight
+            )
+            if self.load_balance:
+                self.balance_load(walkers, comm)
         elif self.method == "stochastic_reconfiguration":
             self.reconfiguration_counter += 1
             if self.reconfiguration_counter % self.reconfiguration_freq == 0:
@@ -124,6 +189,246 @@ class PopController:
             if comm.rank == 0:
                 print("Unknown population control method.")
 
+    def get_step_time(self, walkers) -> float:
+        """Propagation time per walker and step since the last call.
+
+        Measured with the global profiler from the propagate and
+        orthogonalise regions, excluding barriers. Returns zero if no steps
+        were recorded (e.g. the profiler is disabled).
+        """
+        work = (
+            profiler.total("propagate")
+            + profiler.total("orthogonalise")
+            - profiler.total("barrier")
+        )
+        steps = profiler.calls("propagate")
+        delta_work = work - self._last_work
+        delta_steps = steps - self._last_steps
+        self._last_work = work
+        self._last_steps = steps
+        if delta_steps <= 0 or delta_work <= 0 or walkers.nwalkers == 0:
+            return 0.0
+        return delta_work / (delta_steps * walkers.nwalkers)
+
+    def balance_load(self, walkers, comm) -> bool:
+        """Redistribute walkers in proportion to the speed of each task.
+
+        The total number of walkers is unchanged. Walkers are only moved if
+        the predicted time per step, set by the slowest task, decreases by
+        more than a fraction load_balance_tol.
+
+        Returns
+        -------
+        moved : bool
+            True if walkers were redistributed (identical on all tasks).
+        """
+        self.timer.start_time()
+        local = numpy.array([self.get_step_time(walkers), walkers.nwalkers], dtype=numpy.float64)
+        global_data = numpy.empty((comm.size, 2), dtype=numpy.float64)
+        self.timer.add_non_communication()
+        self.timer.start_time()
+        comm.Allgather(local, global_data)
+        self.timer.add_communication()
+        step_times = global_data[:, 0]
+        counts = numpy.rint(global_data[:, 1]).astype(numpy.int64)
+        if numpy.any(step_times <= 0):
+            return False
+        new_counts = get_balanced_counts(
+            step_times, self.ntot_walkers, min_count=1, max_count=self.max_walkers_local
+        )
+        current = numpy.max(counts * step_times)
+        predicted = numpy.max(new_counts * step_times)
+        if predicted > (1.0 - self.load_balance_tol) * current:
+            return False
+        redistribute_walkers(walkers, comm, counts, new_counts, self.timer)
+        self.num_rebalances += 1
+        if self.verbose:
+            print(f"# Rebalanced walkers per task: {counts.min()}-{counts.max()} -> ", end="")
+            print(f"{new_counts.min()}-{new_counts.max()}")
+        return True
+
+    @property
+    def pending(self) -> bool:
+        return self._pending is not None
+
+    def start_pop_control(self, walkers, comm):
+        """Post the weight reduction of asynchronous population control.
+
+        The walkers can be propagated while the reduction is in flight. The
+        branching decisions are based on the current weights and applied by
+        finish_pop_control, with the weights of all copies of a walker scaled
+        by the change of its weight since this call. Falls back to pop_control
+        if not asynchronous.
+        """
+        if not self.asynchronous:
+            self.pop_control(walkers, comm)
+            return
+        assert self._pending is None
+        if self.ntot_walkers == 1:
+            return
+        self.timer.start_time()
+        weights = numpy.abs(xp.array(walkers.weight))
+        if hasattr(weights, "get"):
+            weights = weights.get()
+        sum_weights = numpy.array([numpy.sum(weights)])
+        total_weight = numpy.empty(1, dtype=numpy.float64)
+        if self.method == "comb":
+            global_weights = numpy.empty(len(weights) * comm.size)
+        elif comm.rank == 0:
+            global_weights = numpy.empty([comm.size, walkers.nwalkers], dtype=numpy.float64)
+        else:
+            global_weights = None
+        self.timer.add_non_communication()
+        self.timer.start_time()
+        reqs = [comm.Iallreduce(sum_weights, total_weight, op=MPI.SUM)]
+        if self.method == "comb":
+            reqs.append(comm.Iallgather(weights, global_weights))
+        else:
+            reqs.append(comm.Igather(weights, global_weights, root=0))
+        self.timer.add_communication()
+        # Send buffers must stay alive until the requests complete.
+        self._pending = {
+            "reqs": reqs,
+            "weights": weights,
+            "sum_weights": sum_weights,
+            "total_weight": total_weight,
+            "global_weights": global_weights,
+        }
+
+    def finish_pop_control(self, walkers, comm):
+        """Complete asynchronous population control started by start_pop_control."""
+        if self._pending is None:
+            return
+        pending = self._pending
+        self._pending = None
+        self.timer.start_time()
+        for req in pending["reqs"]:
+            req.Wait()
+        self.timer.add_wait_time()
+
+        self.timer.start_time()
+        total_weight = pending["total_weight"][0]
+        scale = total_weight / self.target_weight
+        if total_weight < 1e-8:
+            if comm.rank == 0:
+                print(f"# Warning: Total weight is {total_weight:13.8e}")
+                print("# Something is seriously wrong.")
+            raise ValueError
+        self.total_weight = total_weight
+        # Change of weight since the weights were posted.
+        old_weights = xp.array(pending["weights"])
+        nonzero = old_weights > 0
+        weight_factor = xp.where(nonzero, walkers.weight / xp.where(nonzero, old_weights, 1.0), 0.0)
+        walkers.unscaled_weight = walkers.weight
+        global_weights = pending["global_weights"]
+        if global_weights is not None:
+            global_weights = global_weights / scale
+        self.timer.add_non_communication()
+        if self.method == "comb":
+            self.timer.start_time()
+            parent_ix = get_comb_parents(comm, global_weights, self.target_weight)
+            self.timer.add_communication()
+            self.timer.start_time()
+            walkers.weight = weight_factor
+            self.timer.add_non_communication()
+            comb(
+                walkers,
+                comm,
+                global_weights,
+                self.target_weight,
+                self.timer,
+                parent_ix=parent_ix,
+                reset_weight=False,
+            )
+        else:
+            if hasattr(weight_factor, "get"):
+                weight_factor = weight_factor.get()
+            pair_branch(
+                walkers,
+                comm,
+                self.max_weight,
+                self.min_weight,
+                self.timer,
+                gather_weights=False,
+                global_weights=global_weights,
+                weight_factor=weight_factor,
+            )
+
+
+def get_balanced_counts(step_times, total, min_count=1, max_count=None):
+    """Number of walkers per task which best balances the time per step.
+
+    Parameters
+    ----------
+    step_times : numpy.ndarray
+        Time per walker and step of each task.
+    total : int
+        Total number of walkers.
+    min_count, max_count : int
+        Bounds on the number of walkers per task. Default 1 and total.
+
+    Returns
+    -------
+    counts : numpy.ndarray
+        Number of walkers per task, summing to total.
+    """
+    if max_count is None:
+        max_count = total
+    ntasks = len(step_times)
+    assert ntasks * min_count <= total <= ntasks * max_count
+    rates = 1.0 / numpy.asarray(step_times, dtype=numpy.float64)
+    ideal = total * rates / numpy.sum(rates)
+    counts = numpy.clip(numpy.floor(ideal), min_count, max_count).astype(numpy.int64)
+    # Largest remainder, respecting the bounds.
+    while counts.sum() < total:
+        deficit = numpy.where(counts < max_count, ideal - counts, -numpy.inf)
+        counts[numpy.argmax(deficit)] += 1
+    while counts.sum() > total:
+        excess = numpy.where(counts > min_count, ideal - counts, numpy.inf)
+        counts[numpy.argmin(excess)] -= 1
+    return counts
+
+
+def redistribute_walkers(walkers, comm, counts, new_counts, timer=None):
+    """Change the number of walkers on each task, preserving their global order.
+
+    Walkers are numbered consecutively over the tasks in rank order. Each
+    task keeps the walkers which fall in its new range and exchanges the rest
+    point-to-point with the tasks owning them before / after.
+
+    Parameters
+    ----------
+    comm : MPI communicator
+    counts : numpy.ndarray
+        Current number of walkers on each task.
+    new_counts : numpy.ndarray
+        Number of walkers on each task afterwards (same total).
+    """
+    if timer is None:
+        timer = PopControllerTimer()
+    timer.start_time()
+    assert counts.sum() == new_counts.sum()
+    end = numpy.cumsum(counts)
+    new_end = numpy.cumsum(new_counts)
+    rank = comm.rank
+    # Global walker indices before and after.
+    index = end[rank] - counts[rank] + numpy.arange(counts[rank])
+    new_index = new_end[rank] - new_counts[rank] + numpy.arange(new_counts[rank])
+    dest = numpy.searchsorted(new_end, index, side="right")
+    source = numpy.searchsorted(end, new_index, side="right")
+    keep = numpy.where(dest == rank)[0]
+    send = numpy.where(dest != rank)[0]
+    recv = numpy.where(source != rank)[0]
+    keep_buff = walkers.pack_buffers(keep)
+    send_buff = walkers.pack_buffers(send)
+    timer.add_non_communication()
+    recv_buff = exchange_buffers(comm, send_buff, dest[send], source[recv], timer, collective=False)
+    timer.start_time()
+    walkers.resize(int(new_counts[rank]))
+    walkers.unpack_buffers(index[keep] - (new_end[rank] - new_counts[rank]), keep_buff)
+    walkers.unpack_buffers(recv, recv_buff)
+    timer.add_non_communication()
+
 
 def get_buffer(walkers, iw):
     """Get iw-th walker buffer for MPI communication
@@ -196,20 +501,22 @@ def set_buffer(walkers, iw, buff):
             s += 1
 
 
-def comb(walkers, comm, weights, target_weight, timer=PopControllerTimer()):
-    """Apply the comb method of population control / branching.
-
-    See Booth & Gubernatis PRE 80, 046704 (2009).
+def get_comb_parents(comm, weights, target_weight):
+    """Number of copies of each walker selected by the comb.
 
     Parameters
     ----------
     comm : MPI communicator
+    weights : numpy.ndarray
+        Weights of all walkers across all tasks.
+    target_weight : int
+        Number of comb teeth (total number of walkers).
+
+    Returns
+    -------
+    parent_ix : numpy.ndarray
+        Number of copies of each walker (identical on all tasks).
     """
-    # Need make a copy to since the elements in psi are only references to
-    # walker objects in memory. We don't want future changes in a given
-    # element of psi having unintended consequences.
-    # todo : add phase to walker for free projection
-    timer.start_time()
     if comm.rank == 0:
         parent_ix = numpy.zeros(len(weights), dtype="i")
     else:
@@ -230,78 +537,462 @@ def comb(walkers, comm, weights, target_weight, timer=PopControllerTimer()):
         data = {"ix": parent_ix}
     else:
         data = None
+    data = comm.bcast(data, root=0)
+    return data["ix"]
 
-    timer.add_non_communication()
 
+def exchange_walkers(walkers, comm, send_ix, dest, recv_ix, source, timer=None, collective=True):
+    """Copy walkers between tasks in a single all-to-all exchange.
+
+    All walkers going from one task to another are packed into one
+    contiguous buffer. Walkers sent from task A to task B overwrite the
+    walkers received by B from A in the order given. If the walkers are in
+    node shared memory (see BaseWalkers.share_memory), walkers moved within
+    a node only send their index and scalar data, and their matrices are
+    copied directly between the shared slots.
+
+    Parameters
+    ----------
+    comm : MPI communicator
+    send_ix : numpy.ndarray
+        Local indices of walkers to send.
+    dest : numpy.ndarray
+        Destination rank of each walker sent.
+    recv_ix : numpy.ndarray
+        Local indices of walkers to overwrite.
+    source : numpy.ndarray
+        Source rank of each walker received.
+    collective : bool
+        Use a collective Alltoallv. Otherwise only tasks exchanging walkers
+        communicate, with point-to-point messages. Default True.
+    """
+    if timer is None:
+        timer = PopControllerTimer()
+    if walkers.node_arrays is None:
+        _exchange_packed(walkers, comm, send_ix, dest, recv_ix, source, timer, collective)
+        return
+    node_ids = walkers.node_ids
+    local_send = node_ids[dest] == node_ids[comm.rank]
+    local_recv = node_ids[source] == node_ids[comm.rank]
+    _exchange_packed(
+        walkers,
+        comm,
+        send_ix[~local_send],
+        dest[~local_send],
+        recv_ix[~local_recv],
+        source[~local_recv],
+        timer,
+        collective,
+    )
+    scalars = [name for name, _, _ in walkers.buffer_layout if name not in walkers.node_arrays]
+    recv_ix, source, parent_ix = _exchange_packed(
+        walkers,
+        comm,
+        send_ix[local_send],
+        dest[local_send],
+        recv_ix[local_recv],
+        source[local_recv],
+        timer,
+        collective,
+        names=scalars,
+        send_index=True,
+    )
     timer.start_time()
-    data = comm.bcast(data, root=0)
+    # Parents must be up to date before and unchanged while they are copied.
+    walkers.node_comm.Barrier()
+    node_rank = walkers.node_ranks[comm.rank]
+    parent_node_rank = walkers.node_ranks[source]
+    for data in walkers.node_arrays.values():
+        data[node_rank, recv_ix] = data[parent_node_rank, parent_ix]
+    walkers.node_comm.Barrier()
     timer.add_communication()
+
+
+def _exchange_packed(
+    walkers,
+    comm,
+    send_ix,
+    dest,
+    recv_ix,
+    source,
+    timer,
+    collective,
+    names=None,
+    send_index=False,
+):
     timer.start_time()
-    parent_ix = data["ix"]
-    # Keep total weight saved for capping purposes.
-    # where returns a tuple (array,), selecting first element.
-    kill = numpy.where(parent_ix == 0)[0]
-    clone = numpy.where(parent_ix > 1)[0]
-    reqs = []
-    # First initiate non-blocking sends of walkers.
+    # Stable sort to group walkers by rank while keeping their order.
+    send_order = numpy.argsort(dest, kind="stable")
+    recv_order = numpy.argsort(source, kind="stable")
+    send_buff = walkers.pack_buffers(send_ix[send_order], names=names)
+    if send_index:
+        index = send_ix[send_order].astype(numpy.complex128)
+        send_buff = numpy.hstack([index[:, None], send_buff])
     timer.add_non_communication()
+    recv_buff = exchange_buffers(
+        comm, send_buff, dest[send_order], source[recv_order], timer, collective=collective
+    )
     timer.start_time()
-    comm.barrier()
+    if send_index:
+        parent_ix = numpy.rint(recv_buff[:, 0].real).astype(numpy.int64)
+        recv_buff = recv_buff[:, 1:]
+    walkers.unpack_buffers(recv_ix[recv_order], recv_buff, names=names)
+    timer.add_non_communication()
+    if send_index:
+        return recv_ix[recv_order], source[recv_order], parent_ix
+
+
+def exchange_buffers(comm, send_buff, dest, source, timer=None, collective=True):
+    """Exchange packed walker buffers between tasks.
+
+    Parameters
+    ----------
+    comm : MPI communicator
+    send_buff : numpy.ndarray
+        Packed walkers (see BaseWalkers.pack_buffers) sorted by destination.
+    dest : numpy.ndarray
+        Destination rank of each walker sent (sorted).
+    source : numpy.ndarray
+        Source rank of each walker received (sorted).
+    collective : bool
+        Use a collective Alltoallv. Otherwise only tasks exchanging walkers
+        communicate, with point-to-point messages. Default True.
+
+    Returns
+    -------
+    recv_buff : numpy.ndarray
+        Packed walkers received, sorted by source.
+    """
+    if timer is None:
+        timer = PopControllerTimer()
+    timer.start_time()
+    buff_size = send_buff.shape[1]
+    send_counts = numpy.bincount(dest, minlength=comm.size) * buff_size
+    recv_counts = numpy.bincount(source, minlength=comm.size) * buff_size
+    send_displ = numpy.concatenate([[0], numpy.cumsum(send_counts)[:-1]])
+    recv_displ = numpy.concatenate([[0], numpy.cumsum(recv_counts)[:-1]])
+    recv_buff = numpy.empty((len(source), buff_size), dtype=numpy.complex128)
+    timer.add_non_communication()
+    timer.start_time()
+    if collective:
+        comm.Alltoallv(
+            [send_buff, (send_counts, send_displ), MPI.C_DOUBLE_COMPLEX],
+            [recv_buff, (recv_counts, recv_displ), MPI.C_DOUBLE_COMPLEX],
+        )
+    else:
+        reqs = []
+        for rank in numpy.nonzero(send_counts)[0]:
+            start = send_displ[rank] // buff_size
+            end = start + send_counts[rank] // buff_size
+            reqs.append(comm.Isend(send_buff[start:end], dest=rank, tag=_EXCHANGE_TAG))
+        for rank in numpy.nonzero(recv_counts)[0]:
+            start = recv_displ[rank] // buff_size
+            end = start + recv_counts[rank] // buff_size
+            comm.Recv(recv_buff[start:end], source=rank, tag=_EXCHANGE_TAG)
+        for req in reqs:
+            req.Wait()
     timer.add_communication()
-    for i, (c, k) in enumerate(zip(clone, kill)):
-        # Sending from current processor?
-        if c // walkers.nwalkers == comm.rank:
-            timer.start_time()
-            # Location of walker to clone in local list.
-            clone_pos = c % walkers.nwalkers
-            # copying walker data to intermediate buffer to avoid issues
-            # with accessing walker data during send. Might not be
-            # necessary.
-            dest_proc = k // walkers.nwalkers
-            buff = get_buffer(walkers, clone_pos)
-            timer.add_non_communication()
-            timer.start_time()
-            reqs.append(comm.Isend(buff, dest=dest_proc, tag=i))
-            timer.add_send_time()
-    # Now receive walkers on processors where walkers are to be killed.
-    for i, (c, k) in enumerate(zip(clone, kill)):
-        # Receiving to current processor?
-        if k // walkers.nwalkers == comm.rank:
-            timer.start_time()
-            # Processor we are receiving from.
-            source_proc = c // walkers.nwalkers
-            # Location of walker to kill in local list of walkers.
-            kill_pos = k % walkers.nwalkers
-            timer.add_non_communication()
-            timer.start_time()
-            comm.Recv(walkers.walker_buffer, source=source_proc, tag=i)
-            # with h5py.File('walkers_recv.h5', 'w') as fh5:
-            # fh5['walk_{}'.format(k)] = walkers.walker_buffer.copy()
-            timer.add_recv_time()
-            timer.start_time()
-            set_buffer(walkers, kill_pos, walkers.walker_buffer)
-            timer.add_non_communication()
-            # with h5py.File('after_{}.h5'.format(comm.rank), 'a') as fh5:
-            # fh5['walker_{}_{}_{}'.format(c,k,comm.rank)] = walkers.walkers[kill_pos].get_buffer()
-    timer.start_time()
-    # Complete non-blocking send.
-    for rs in reqs:
-        rs.wait()
-    # Necessary?
-    # if len(kill) > 0 or len(clone) > 0:
-    # sys.exit()
-    comm.Barrier()
+    return recv_buff
+
+
+def comb(
+    walkers,
+    comm,
+    weights,
+    target_weight,
+    timer=None,
+    parent_ix=None,
+    reset_weight=True,
+):
+    """Apply the comb method of population control / branching.
+
+    See Booth & Gubernatis PRE 80, 046704 (2009).
+
+    Parameters
+    ----------
+    comm : MPI communicator
+    parent_ix : numpy.ndarray
+        Precomputed comb selection (see get_comb_parents), e.g. to apply the
+        same branching to two correlated populations. Default None.
+    reset_weight : bool
+        Set the walker weights to one after branching. Default True.
+    """
+    if timer is None:
+        timer = PopControllerTimer()
+    # Need make a copy to since the elements in psi are only references to
+    # walker objects in memory. We don't want future changes in a given
+    # element of psi having unintended consequences.
+    # todo : add phase to walker for free projection
+    timer.start_time()
+    if parent_ix is None:
+        parent_ix = get_comb_parents(comm, weights, target_weight)
     timer.add_communication()
+    timer.start_time()
+    # where returns a tuple (array,), selecting first element.
+    kill = numpy.where(parent_ix == 0)[0]
+    # Walkers selected n > 1 times are cloned n - 1 times.
+    clone = numpy.repeat(numpy.arange(len(parent_ix)), numpy.maximum(parent_ix - 1, 0))
+    # Clone i overwrites killed walker i.
+    clone, kill = clone[: len(kill)], kill[: len(clone)]
+    nw = walkers.nwalkers
+    send = clone // nw == comm.rank
+    recv = kill // nw == comm.rank
+    timer.add_non_communication()
+    exchange_walkers(
+        walkers,
+        comm,
+        clone[send] % nw,
+        kill[send] // nw,
+        kill[recv] % nw,
+        clone[recv] // nw,
+        timer,
+    )
     # Reset walker weight.
     # TODO: check this.
     # for w in walkers.walkers:
     # w.weight = 1.0
+    if reset_weight:
+        timer.start_time()
+        walkers.weight.fill(1.0)
+        timer.add_non_communication()
+
+
+def get_comb_copies(weights, offset, total_weight, target_weight, r, lower=None, upper=None):
+    """Number of copies selected by the comb for a contiguous block of walkers.
+
+    Comb tooth k sits at (k + r) * total_weight / target_weight along the
+    cumulative weight of all walkers. A walker is copied once for every
+    tooth within its interval of the cumulative weight, so that applying
+    this to consecutive blocks of walkers reproduces get_comb_parents.
+
+    Parameters
+    ----------
+    weights : numpy.ndarray
+        Weights of the walkers in the block.
+    offset : float
+        Total weight of all walkers preceding the block.
+    total_weight : float
+        Total weight of all walkers.
+    target_weight : int
+        Number of comb teeth (total number of walkers).
+    r : float
+        Uniform random number in [0, 1) shared by all tasks.
+    lower : int
+        Number of teeth preceding the block. Default computed from offset.
+    upper : int
+        Number of teeth up to the end of the block. Default computed from the
+        weights. Passing the value computed by the next block guarantees the
+        blocks split the teeth exactly despite rounding of the offsets.
+
+    Returns
+    -------
+    copies : numpy.ndarray
+        Number of copies of each walker in the block.
+    """
+    spacing = total_weight / target_weight
+
+    def num_teeth(x):
+        # Number of teeth strictly below x.
+        return numpy.clip(numpy.ceil(x / spacing - r), 0, target_weight).astype(numpy.int64)
+
+    if lower is None:
+        lower = num_teeth(offset)
+    teeth = num_teeth(offset + numpy.cumsum(weights))
+    if upper is not None and len(teeth) > 0:
+        teeth[-1] = upper
+    teeth = numpy.clip(teeth, lower, teeth[-1] if len(teeth) > 0 else lower)
+    return numpy.diff(teeth, prepend=lower)
+
+
+def distributed_comb(walkers, comm, target_weight, timer=None, total_weight=None):
+    """Comb population control without gathering weights on a single task.
+
+    Statistically equivalent to comb, but each task only needs the total
+    weight of the walkers on preceding tasks (an exclusive scan), so no task
+    holds the weights of all walkers. Clones replace killed walkers on the
+    same task first, and only the surplus clones migrate, with point-to-point
+    messages between the tasks involved.
+
+    Parameters
+    ----------
+    comm : MPI communicator
+    target_weight : int
+        Number of comb teeth (total number of walkers).
+    total_weight : float
+        Total weight of all walkers. Default None, i.e. computed with an
+        Allreduce.
+    """
+    if timer is None:
+        timer = PopControllerTimer()
+    timer.start_time()
+    weights = numpy.abs(xp.array(walkers.weight))
+    if hasattr(weights, "get"):
+        weights = weights.get()
+    local_weight = numpy.array([numpy.sum(weights)], dtype=numpy.float64)
+    offset = numpy.zeros(1, dtype=numpy.float64)
+    timer.add_non_communication()
+    timer.start_time()
+    comm.Exscan(local_weight, offset, op=MPI.SUM)
+    if comm.rank == 0:
+        # The receive buffer of Exscan is undefined on the first task.
+        offset[0] = 0.0
+    if total_weight is None:
+        total = numpy.empty(1, dtype=numpy.float64)
+        comm.Allreduce(local_weight, total, op=MPI.SUM)
+        total_weight = total[0]
+    if comm.rank == 0:
+        r = numpy.array([numpy.random.random()])
+    else:
+        r = numpy.empty(1, dtype=numpy.float64)
+    comm.Bcast(r, root=0)
+    timer.add_communication()
+    timer.start_time()
+    spacing = total_weight / target_weight
+    lower = int(numpy.clip(numpy.ceil(offset[0] / spacing - r[0]), 0, target_weight))
+    lower = numpy.array([lower], dtype=numpy.int64)
+    upper = numpy.array([target_weight], dtype=numpy.int64)
+    timer.add_non_communication()
+    timer.start_time()
+    # The teeth preceding the next task bound the teeth of this task.
+    reqs = []
+    if comm.rank > 0:
+        reqs.append(comm.Isend(lower, dest=comm.rank - 1, tag=_COMB_TAG))
+    if comm.rank < comm.size - 1:
+        comm.Recv(upper, source=comm.rank + 1, tag=_COMB_TAG)
+    for req in reqs:
+        req.Wait()
+    timer.add_communication()
+    timer.start_time()
+    copies = get_comb_copies(
+        weights, offset[0], total_weight, target_weight, r[0], lower=lower[0], upper=upper[0]
+    )
+    kill = numpy.where(copies == 0)[0]
+    clone = numpy.repeat(numpy.arange(len(copies)), numpy.maximum(copies - 1, 0))
+    # Branch locally as far as possible.
+    nlocal = min(len(kill), len(clone))
+    if nlocal > 0:
+        walkers.unpack_buffers(kill[:nlocal], walkers.pack_buffers(clone[:nlocal]))
+    surplus = clone[nlocal:]
+    deficit = kill[nlocal:]
+    counts = numpy.array([len(surplus), len(deficit)], dtype=numpy.int64)
+    global_counts = numpy.empty((comm.size, 2), dtype=numpy.int64)
+    timer.add_non_communication()
+    timer.start_time()
+    comm.Allgather(counts, global_counts)
+    timer.add_communication()
+    timer.start_time()
+    # Match the i-th surplus clone with the i-th vacancy, both counted over
+    # all tasks in rank order.
+    surplus_end = numpy.cumsum(global_counts[:, 0])
+    deficit_end = numpy.cumsum(global_counts[:, 1])
+    assert surplus_end[-1] == deficit_end[-1]
+    send_pos = surplus_end[comm.rank] - len(surplus) + numpy.arange(len(surplus))
+    recv_pos = deficit_end[comm.rank] - len(deficit) + numpy.arange(len(deficit))
+    dest = numpy.searchsorted(deficit_end, send_pos, side="right")
+    source = numpy.searchsorted(surplus_end, recv_pos, side="right")
+    timer.add_non_communication()
+    exchange_walkers(walkers, comm, surplus, dest, deficit, source, timer, collective=False)
     timer.start_time()
     walkers.weight.fill(1.0)
     timer.add_non_communication()
 
 
-def pair_branch(walkers, comm, max_weight, min_weight, timer=PopControllerTimer()):
+def correlated_comb(walkers_list, comm, target_weight, timer=None):
+    """Apply the same comb to several populations propagated in lockstep.
+
+    The walkers are selected according to the joint weight, i.e. the mean of
+    the absolute weights of the populations, and keep their weight relative
+    to the joint weight afterwards. Estimates of each population therefore
+    remain unbiased while all populations share the same branching history,
+    which preserves the correlation between them.
+
+    Parameters
+    ----------
+    walkers_list : list
+        Walkers of each population. Walker i of every population must have
+        been propagated with the same auxiliary fields.
+    comm : MPI communicator
+    target_weight : int
+        Total number of walkers per population.
+
+    Returns
+    -------
+    total_weight : float
+        Total joint weight before branching.
+    """
+    if timer is None:
+        timer = PopControllerTimer()
+    timer.start_time()
+    weights = [numpy.abs(xp.array(walkers.weight)) for walkers in walkers_list]
+    joint_weight = sum(weights) / len(weights)
+    if hasattr(joint_weight, "get"):
+        joint_weight = joint_weight.get()
+    global_weights = numpy.empty(len(joint_weight) * comm.size)
+    timer.add_non_communication()
+    timer.start_time()
+    comm.Allgather(joint_weight, global_weights)
+    total_weight = sum(global_weights)
+    timer.add_communication()
+    if total_weight < 1e-8:
+        if comm.rank == 0:
+            print(f"# Warning: Total weight is {total_weight:13.8e}")
+            print("# Something is seriously wrong.")
+        raise ValueError
+    timer.start_time()
+    nonzero = xp.array(joint_weight > 0)
+    joint_weight = xp.array(numpy.where(joint_weight > 0, joint_weight, 1.0))
+    for walkers in walkers_list:
+        walkers.unscaled_weight = walkers.weight
+        walkers.weight = xp.where(nonzero, walkers.weight / joint_weight, 0.0)
+    timer.add_non_communication()
+    timer.start_time()
+    parent_ix = get_comb_parents(comm, global_weights, target_weight)
+    timer.add_communication()
+    for walkers in walkers_list:
+        comb(
+            walkers,
+            comm,
+            global_weights,
+            target_weight,
+            timer,
+            parent_ix=parent_ix,
+            reset_weight=False,
+        )
+    return total_weight
+
+
+def pair_branch(
+    walkers,
+    comm,
+    max_weight,
+    min_weight,
+    timer=None,
+    gather_weights=True,
+    global_weights=None,
+    weight_factor=None,
+):
+    """Apply pair branching population control.
+
+    Parameters
+    ----------
+    comm : MPI communicator
+    max_weight : float
+        Walkers with weights above this value are split.
+    min_weight : float
+        Walkers with weights below this value are combined.
+    gather_weights : bool
+        Gather the absolute weights of all walkers on the root. If False they
+        must be supplied through global_weights. Default True.
+    global_weights : numpy.ndarray
+        Absolute weights of all walkers (comm.size x nwalkers) on the root if
+        already gathered (None on other tasks). Default None.
+    weight_factor : numpy.ndarray
+        Factor multiplying the weights set by branching for each local walker,
+        e.g. to account for propagation since global_weights were gathered.
+        Default None.
+    """
+    if timer is None:
+        timer = PopControllerTimer()
     timer.start_time()
     walker_info_0 = xp.array(xp.abs(walkers.weight))
     timer.add_non_communication()
@@ -326,11 +1017,14 @@ def pair_branch(walkers, comm, max_weight, min_weight, timer=PopControllerTimer(
     timer.add_non_communication()
 
     timer.start_time()
-    if hasattr(walker_info_0, "get"):
-        walker_info_0 = walker_info_0.get()
-    comm.Gather(
-        walker_info_0, glob_inf_0, root=0
-    )  # gather |w_i| from all processors (comm.size x nwalkers)
+    if not gather_weights:
+        glob_inf_0 = global_weights
+    else:
+        if hasattr(walker_info_0, "get"):
+            walker_info_0 = walker_info_0.get()
+        comm.Gather(
+            walker_info_0, glob_inf_0, root=0
+        )  # gather |w_i| from all processors (comm.size x nwalkers)
     timer.add_communication()
 
     # Want same random number seed used on all processors
@@ -400,37 +1094,25 @@ def pair_branch(walkers, comm, max_weight, min_weight, timer=PopControllerTimer(
     comm.Scatter(glob_inf, data, root=0)
 
     timer.add_communication()
-    # Keep total weight saved for capping purposes.
-    reqs = []
-    for iw, walker in enumerate(data):
-        if walker[1] > 1:
-            timer.start_time()
-            tag = comm.rank * walkers.nwalkers + walker[3]
-            walkers.weight[iw] = walker[0]
-            buff = get_buffer(walkers, iw)
-            timer.add_non_communication()
-            timer.start_time()
-            reqs.append(comm.Isend(buff, dest=int(round(walker[3])), tag=tag))
-            timer.add_send_time()
-    for iw, walker in enumerate(data):
-        if walker[1] == 0:
-            timer.start_time()
-            tag = walker[3] * walkers.nwalkers + comm.rank
-            timer.add_non_communication()
-            timer.start_time()
-            comm.Recv(walkers.walker_buffer, source=int(round(walker[3])), tag=tag)
-            timer.add_recv_time()
-            timer.start_time()
-            set_buffer(walkers, iw, walkers.walker_buffer)
-            timer.add_non_communication()
-    timer.start_time()
-    for r in reqs:
-        r.wait()
-    timer.add_communication()
+    if weight_factor is not None:
+        timer.start_time()
+        walkers.weight = xp.array(data[:, 0] * weight_factor)
+        timer.add_non_communication()
+    timer.start_time()
+    status = data[:, 1]
+    ranks = numpy.rint(data[:, 3]).astype(numpy.int64)
+    send = numpy.where(status > 1)[0]
+    recv = numpy.where(status == 0)[0]
+    if weight_factor is None:
+        walkers.weight[send] = data[send, 0]
+    timer.add_non_communication()
+    exchange_walkers(walkers, comm, send, ranks[send], recv, ranks[recv], timer)
 
 
-def stochastic_reconfiguration(walkers, comm, timer=PopControllerTimer()):
+def stochastic_reconfiguration(walkers, comm, timer=None):
     # gather all walker information on the root
+    if timer is None:
+        timer = PopControllerTimer()
     timer.start_time()
     nwalkers = walkers.nwalkers
     local_buffer = xp.array([get_buffer(walkers, i) for i in range(nwalkers)])
@@ -243,7 +243,41 @@ def test_walker_energy():
     # assert e[:,0] == pytest.approx(energies[0])
 
 
+@pytest.mark.unit
+@pytest.mark.parametrize("trial_type", ["noci", "particle_hole_naive"])
+def test_resize_multi_det(trial_type):
+    numpy.random.seed(7)
+    nbasis, nelec, ndets, nwalkers = 8, (3, 2), 4, 4
+    if trial_type == "noci":
+        wfn = get_random_wavefunction(nelec, nbasis)
+        psi = numpy.array([wfn[:, : sum(nelec)] for _ in range(ndets)])
+        psi += 0.1 * numpy.random.random(psi.shape)
+        coeffs = numpy.random.random(ndets) + 0j
+        trial = NOCI((coeffs, psi), nelec, nbasis)
+        init = psi[0]
+    else:
+        oa = [c for c in itertools.combinations(range(nbasis), nelec[0])][:ndets]
+        ob = [c for c in itertools.combinations(range(nbasis), nelec[1])][:ndets]
+        coeffs = numpy.random.random(ndets) + 0j
+        trial = ParticleHoleNaive((coeffs, oa, ob), nelec, nbasis)
+        init = get_random_wavefunction(nelec, nbasis)
+    walkers = UHFWalkersTrial(trial, init, nelec[0], nelec[1], nbasis, nwalkers, MPIHandler())
+    walkers.build(trial)
+    walkers.phia += 0.1 * numpy.random.random(walkers.phia.shape)
+    walkers.phib += 0.1 * numpy.random.random(walkers.phib.shape)
+    ovlp = trial.calc_greens_function(walkers)
+    walkers.resize(6)
+    walkers.unpack_buffers(numpy.arange(4, 6), walkers.pack_buffers(numpy.arange(2)))
+    new_ovlp = trial.calc_greens_function(walkers)
+    assert numpy.allclose(new_ovlp[:4], ovlp)
+    assert numpy.allclose(new_ovlp[4:], ovlp[:2])
+    walkers.resize(3)
+    assert numpy.allclose(trial.calc_greens_function(walkers), ovlp[:3])
+
+
 if __name__ == "__main__":
     test_walker_overlap_nomsd()
     test_walker_overlap_phmsd()
     test_walker_energy()
+    test_resize_multi_det("noci")
+    test_resize_multi_det("particle_hole_naive")
@@ -25,6 +25,15 @@ from ipie.utils.legacy_testing import build_legacy_test_case_handlers_mpi
 from ipie.utils.misc import dotdict
 from ipie.utils.mpi import MPIHandler
 from ipie.utils.testing import build_test_case_handlers_mpi
+from ipie.utils.profiler import profiler
+from ipie.walkers.pop_controller import (
+    get_balanced_counts,
+    get_buffer,
+    get_comb_copies,
+    PopController,
+    redistribute_walkers,
+)
+from ipie.walkers.uhf_walkers import UHFWalkers
 
 
 @pytest.mark.unit
@@ -174,7 +183,242 @@ def test_stochastic_reconfiguration_batch():
     assert pytest.approx(batched_data.walkers.phia[0][0, 0]) == 0.0305067 + 0.01438442j
 
 
+@pytest.mark.unit
+@pytest.mark.parametrize("method", ["pair_branch", "comb"])
+def test_async_pop_control(method):
+    mpi_handler = MPIHandler()
+    comm = mpi_handler.comm
+    nelec = (2, 2)
+    nmo = 6
+    nwalkers = 12
+    init = numpy.eye(nmo, dtype=numpy.complex128)[:, : sum(nelec)]
+    numpy.random.seed(7 + comm.rank)
+    weights = 3.0 * numpy.random.random(nwalkers)
+    weights[0] = 0.01
+    weights[1] = 7.0
+    # Change of weight during the propagation overlapping the communication.
+    factors = numpy.random.random(nwalkers) + 0.5
+    results = []
+    for asynchronous in [False, True]:
+        walkers = UHFWalkers(init, nelec[0], nelec[1], nmo, nwalkers, mpi_handler)
+        # Tag walkers to track their parents.
+        walkers.phase[:] = comm.rank * nwalkers + numpy.arange(nwalkers) + 1
+        walkers.weight = weights.copy()
+        pcontrol = PopController(
+            nwalkers, 10, mpi_handler, pop_control_method=method, asynchronous=asynchronous
+        )
+        numpy.random.seed(11)
+        pcontrol.start_pop_control(walkers, comm)
+        assert pcontrol.pending == asynchronous
+        if asynchronous:
+            walkers.weight = walkers.weight * factors
+            pcontrol.finish_pop_control(walkers, comm)
+            assert not pcontrol.pending
+        results.append((walkers.phase.copy(), walkers.weight.copy()))
+    # Delayed branching is equivalent to branching first and then propagating.
+    parents = numpy.rint(results[0][0].real).astype(int) - 1
+    all_parents = numpy.empty(comm.size * nwalkers, dtype=parents.dtype)
+    comm.Allgather(parents, all_parents)
+    assert len(numpy.unique(all_parents)) < comm.size * nwalkers
+    assert numpy.array_equal(results[0][0], results[1][0])
+    all_factors = numpy.empty(comm.size * nwalkers)
+    comm.Allgather(factors, all_factors)
+    assert numpy.allclose(results[1][1], results[0][1] * all_factors[parents])
+
+
+@pytest.mark.unit
+def test_pack_buffers():
+    numpy.random.seed(7)
+    nelec = (2, 2)
+    nmo = 6
+    nwalkers = 5
+    init = numpy.eye(nmo, dtype=numpy.complex128)[:, : sum(nelec)]
+    walkers = UHFWalkers(init, nelec[0], nelec[1], nmo, nwalkers, MPIHandler())
+    walkers.phia = walkers.phia + numpy.random.random(walkers.phia.shape)
+    walkers.phib = walkers.phib + 1j * numpy.random.random(walkers.phib.shape)
+    walkers.weight = numpy.random.random(nwalkers)
+    walkers.phase = numpy.exp(1j * numpy.random.random(nwalkers))
+    buff = walkers.pack_buffers(numpy.array([3, 1]))
+    assert buff.shape == (2, walkers.buff_size)
+    assert numpy.allclose(buff[0], get_buffer(walkers, 3))
+    assert numpy.allclose(buff[1], get_buffer(walkers, 1))
+    walkers.unpack_buffers(numpy.array([0, 4]), buff)
+    for dst, src in [(0, 3), (4, 1)]:
+        assert numpy.allclose(walkers.phia[dst], walkers.phia[src])
+        assert numpy.allclose(walkers.phib[dst], walkers.phib[src])
+        assert walkers.weight[dst] == walkers.weight[src]
+        assert walkers.phase[dst] == walkers.phase[src]
+    assert walkers.weight.dtype == numpy.float64
+
+
+@pytest.mark.unit
+def test_distributed_comb():
+    mpi_handler = MPIHandler()
+    comm = mpi_handler.comm
+    nelec = (2, 2)
+    nmo = 6
+    nwalkers = 12
+    init = numpy.eye(nmo, dtype=numpy.complex128)[:, : sum(nelec)]
+    numpy.random.seed(7 + comm.rank)
+    weights = 3.0 * numpy.random.random(nwalkers)
+    weights[:3] = 0.0
+    weights[3] = 9.0
+    copies = []
+    for method in ["comb", "distributed_comb"]:
+        walkers = UHFWalkers(init, nelec[0], nelec[1], nmo, nwalkers, mpi_handler)
+        # Tag walkers to track their parents.
+        walkers.phase[:] = comm.rank * nwalkers + numpy.arange(nwalkers) + 1
+        walkers.phia = walkers.phia * walkers.phase[:, None, None]
+        walkers.weight = weights.copy()
+        pcontrol = PopController(nwalkers, 10, mpi_handler, pop_control_method=method)
+        numpy.random.seed(11)
+        pcontrol.pop_control(walkers, comm)
+        assert numpy.allclose(walkers.weight, 1.0)
+        parents = numpy.rint(walkers.phase.real).astype(int) - 1
+        all_parents = numpy.empty(comm.size * nwalkers, dtype=parents.dtype)
+        comm.Allgather(parents, all_parents)
+        copies.append(numpy.bincount(all_parents, minlength=comm.size * nwalkers))
+        # Copies are complete walkers.
+        assert numpy.allclose(walkers.phia[:, 0, 0], walkers.phase)
+    # The same comb selects the same number of copies of each walker.
+    assert numpy.array_equal(copies[0], copies[1])
+    assert copies[1].sum() == comm.size * nwalkers
+    assert copies[1][3] > 1
+
+
+@pytest.mark.unit
+def test_comb_copies():
+    numpy.random.seed(7)
+    weights = numpy.random.random(20)
+    weights[5] = 0.0
+    weights[6] = 4.0
+    target = 20
+    r = 0.3
+    spacing = weights.sum() / target
+    teeth = (numpy.arange(target) + r) * spacing
+    expected = numpy.bincount(
+        numpy.searchsorted(numpy.cumsum(weights), teeth, side="right"), minlength=len(weights)
+    )
+    copies = get_comb_copies(weights, 0.0, weights.sum(), target, r)
+    assert numpy.array_equal(copies, expected)
+    # Blocks of walkers reproduce the comb over all walkers.
+    blocks = numpy.split(numpy.arange(20), [4, 4, 11])
+    offsets = [weights[: b[0]].sum() if len(b) > 0 else 0.0 for b in blocks]
+    copies = numpy.concatenate(
+        [get_comb_copies(weights[b], o, weights.sum(), target, r) for b, o in zip(blocks, offsets)]
+    )
+    assert numpy.array_equal(copies, expected)
+
+
+@pytest.mark.unit
+def test_balanced_counts():
+    counts = get_balanced_counts(numpy.array([1.0, 1.0, 2.0, 4.0]), 30)
+    assert counts.sum() == 30
+    assert numpy.array_equal(counts, [11, 11, 5, 3])
+    # Bounds on the number of walkers per task.
+    counts = get_balanced_counts(numpy.array([1.0, 100.0, 100.0]), 30, min_count=2, max_count=20)
+    assert numpy.array_equal(counts, [20, 5, 5])
+
+
+@pytest.mark.unit
+def test_redistribute_walkers():
+    mpi_handler = MPIHandler()
+    comm = mpi_handler.comm
+    nelec = (2, 2)
+    nmo = 6
+    nwalkers = 6
+    init = numpy.eye(nmo, dtype=numpy.complex128)[:, : sum(nelec)]
+    walkers = UHFWalkers(init, nelec[0], nelec[1], nmo, nwalkers, mpi_handler)
+    walkers.phase[:] = comm.rank * nwalkers + numpy.arange(nwalkers) + 1
+    walkers.phia = walkers.phia * walkers.phase[:, None, None]
+    counts = numpy.full(comm.size, nwalkers)
+    new_counts = get_balanced_counts(numpy.arange(1, comm.size + 1), comm.size * nwalkers)
+    redistribute_walkers(walkers, comm, counts, new_counts)
+    assert walkers.nwalkers == new_counts[comm.rank]
+    assert walkers.phia.shape[0] == new_counts[comm.rank]
+    # Walkers keep their global order.
+    start = numpy.cumsum(new_counts)[comm.rank] - new_counts[comm.rank]
+    assert numpy.allclose(walkers.phase, start + numpy.arange(walkers.nwalkers) + 1)
+    assert numpy.allclose(walkers.phia[:, 0, 0], walkers.phase)
+
+
+@pytest.mark.unit
+def test_load_balance():
+    mpi_handler = MPIHandler()
+    comm = mpi_handler.comm
+    nelec = (2, 2)
+    nmo = 6
+    nwalkers = 12
+    init = numpy.eye(nmo, dtype=numpy.complex128)[:, : sum(nelec)]
+    walkers = UHFWalkers(init, nelec[0], nelec[1], nmo, nwalkers, mpi_handler)
+    with pytest.raises(ValueError):
+        PopController(nwalkers, 10, mpi_handler, pop_control_method="comb", load_balance=True)
+    pcontrol = PopController(
+        nwalkers, 10, mpi_handler, pop_control_method="distributed_comb", load_balance=True
+    )
+    profiler.reset()
+    # Task i takes (i + 1) times longer per walker.
+    nsteps = 5
+    profiler.add("propagate", (comm.rank + 1) * 1e-3 * nsteps * nwalkers, calls=nsteps)
+    numpy.random.seed(7)
+    walkers.weight = numpy.random.random(nwalkers) + 0.5
+    pcontrol.pop_control(walkers, comm)
+    counts = numpy.array(comm.gather(walkers.nwalkers, root=0))
+    counts = comm.bcast(counts, root=0)
+    assert counts.sum() == comm.size * nwalkers
+    assert pcontrol.num_rebalances == (1 if comm.size > 1 else 0)
+    assert numpy.all(numpy.diff(counts) <= 0)
+    assert numpy.allclose(walkers.weight, 1.0)
+    profiler.reset()
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("method", ["pair_branch", "comb", "distributed_comb"])
+def test_shared_memory_walkers(method):
+    mpi_handler = MPIHandler()
+    comm = mpi_handler.comm
+    nelec = (2, 2)
+    nmo = 6
+    nwalkers = 12
+    init = numpy.eye(nmo, dtype=numpy.complex128)[:, : sum(nelec)]
+    numpy.random.seed(7 + comm.rank)
+    weights = 3.0 * numpy.random.random(nwalkers)
+    weights[:3] = 0.01
+    weights[3] = 9.0
+    results = []
+    for shared in [False, True]:
+        walkers = UHFWalkers(init, nelec[0], nelec[1], nmo, nwalkers, mpi_handler)
+        walkers.phase[:] = comm.rank * nwalkers + numpy.arange(nwalkers) + 1
+        if shared and not walkers.share_memory(comm):
+            pytest.skip("MPI shared memory not available.")
+        # Assignment keeps the walkers in shared memory.
+        walkers.phia = walkers.phia * walkers.phase[:, None, None]
+        walkers.phib = walkers.phib + walkers.phase[:, None, None]
+        walkers.weight = weights.copy()
+        if shared:
+            node_rank = walkers.node_ranks[comm.rank]
+            assert numpy.shares_memory(walkers.phia, walkers.node_arrays["phia"])
+            assert numpy.allclose(walkers.node_arrays["phia"][node_rank], walkers.phia)
+        pcontrol = PopController(nwalkers, 10, mpi_handler, pop_control_method=method)
+        numpy.random.seed(11)
+        pcontrol.pop_control(walkers, comm)
+        results.append(walkers)
+    for name in ["phia", "phib", "weight", "phase", "ovlp"]:
+        assert numpy.allclose(getattr(results[0], name), getattr(results[1], name))
+    parents = numpy.rint(results[1].phase.real).astype(int)
+    assert numpy.allclose(results[1].phia[:, 0, 0], parents)
+
+
 if __name__ == "__main__":
     test_pair_branch_batch()
     test_comb_batch()
     test_stochastic_reconfiguration_batch()
+    test_async_pop_control("pair_branch")
+    test_async_pop_control("comb")
+    test_pack_buffers()
+    test_distributed_comb()
+    test_comb_copies()
+    test_balanced_counts()
+    test_redistribute_walkers()
+    test_load_balance()
+    test_shared_memory_walkers("pair_branch")
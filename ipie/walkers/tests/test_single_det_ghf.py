@@ -169,7 +169,26 @@ def test_reortho_batch():
     numpy.testing.assert_allclose(detR, detR_ghf, atol=1e-10)
 
 
+@pytest.mark.unit
+def test_resize():
+    nelec = (7, 5)
+    nwalkers = 10
+    nmo = 10
+    qmc = dotdict({"dt": 0.005, "nstblz": 5, "nwalkers": nwalkers, "hybrid": True, "num_steps": 2})
+    batched_data = build_test_case_handlers(
+        nelec, nmo, num_dets=1, complex_trial=True, options=qmc, seed=7, reortho=False
+    )
+    ghf_walkers = GHFWalkers(batched_data.walkers)
+    phi = ghf_walkers.phi.copy()
+    ghf_walkers.resize(3)
+    assert ghf_walkers.phi.shape == (3,) + phi.shape[1:]
+    assert ghf_walkers.G.shape[0] == 3
+    numpy.testing.assert_allclose(ghf_walkers.phia, phi[:3, :nmo, : nelec[0]])
+    assert len(ghf_walkers.reortho()) == 3
+
+
 if __name__ == "__main__":
     test_overlap_greens_function()
     test_ghf_walkers_from_uhf_walkers()
     test_reortho_batch()
+    test_resize()
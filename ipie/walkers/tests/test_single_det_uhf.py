@@ -19,9 +19,11 @@
 import numpy
 import pytest
 
+from ipie.config import config
 from ipie.estimators.greens_function import greens_function_single_det
 from ipie.utils.legacy_testing import build_legacy_test_case_handlers
 from ipie.utils.misc import dotdict
+from ipie.utils.profiler import profiler
 from ipie.utils.testing import build_test_case_handlers
 
 
@@ -127,7 +129,111 @@ def test_reortho_batch():
     assert numpy.allclose(detR_legacy, detR)
 
 
+@pytest.mark.unit
+def test_reortho_methods():
+    nelec = (5, 4)
+    nwalkers = 10
+    nmo = 10
+    qmc = dotdict({"dt": 0.005, "nstblz": 5, "nwalkers": nwalkers, "hybrid": True, "num_steps": 5})
+    batched_data = build_test_case_handlers(
+        nelec, nmo, num_dets=1, complex_trial=True, options=qmc, seed=7
+    )
+    walkers = batched_data.walkers
+    trial = batched_data.trial
+    phia, phib, ovlp = walkers.phia.copy(), walkers.phib.copy(), walkers.ovlp.copy()
+    Ga = walkers.Ga.copy()
+    method = config.get_option("reortho_method")
+    thresh = config.get_option("reortho_cond_thresh")
+    results = {}
+    try:
+        for variant in ["loop", "qr", "cholesky_qr2"]:
+            config.update_option("reortho_method", variant)
+            walkers.phia, walkers.phib, walkers.ovlp = phia.copy(), phib.copy(), ovlp.copy()
+            detR = walkers.reortho()
+            results[variant] = (walkers.phia.copy(), walkers.phib.copy(), numpy.array(detR))
+            assert numpy.allclose(walkers.ovlp, ovlp / results[variant][2])
+            trial.calc_greens_function(walkers)
+            assert numpy.allclose(walkers.Ga, Ga)
+        for variant in ["qr", "cholesky_qr2"]:
+            for ref, res in zip(results["loop"], results[variant]):
+                assert numpy.allclose(ref, res)
+        # Orthonormal walkers are skipped in the adaptive mode.
+        config.update_option("reortho_cond_thresh", 10.0)
+        walkers.phia[:3] *= numpy.array([1.0, 1.0, 1.0, 1.0, 100.0])
+        walkers.phib[5] *= 1e-3
+        profiler.reset()
+        detR = walkers.reortho()
+        assert profiler.calls("reortho_walkers") == 4
+        assert numpy.allclose(detR[[0, 1, 2]], 100.0)
+        assert numpy.allclose(detR[5], 1e-12)
+        assert numpy.allclose(numpy.delete(detR, [0, 1, 2, 5]), 1.0)
+        assert numpy.allclose(walkers.phia, results["loop"][0])
+        assert numpy.allclose(walkers.phib, results["loop"][1])
+    finally:
+        config.update_option("reortho_method", method)
+        config.update_option("reortho_cond_thresh", thresh)
+
+
+@pytest.mark.unit
+def test_resize():
+    nelec = (5, 5)
+    nwalkers = 10
+    nmo = 10
+    qmc = dotdict({"dt": 0.005, "nstblz": 5, "nwalkers": nwalkers, "hybrid": True, "num_steps": 2})
+    batched_data = build_test_case_handlers(
+        nelec, nmo, num_dets=1, complex_trial=True, options=qmc, seed=7
+    )
+    walkers = batched_data.walkers
+    trial = batched_data.trial
+    phia = walkers.phia.copy()
+    ovlp = walkers.ovlp.copy()
+    walkers.resize(4)
+    assert walkers.nwalkers == 4
+    assert walkers.phia.shape == (4,) + phia.shape[1:]
+    assert walkers.Ghalfa.shape[0] == 4
+    assert len(walkers.detR) == 4
+    assert numpy.allclose(walkers.phia, phia[:4])
+    walkers.resize(12)
+    assert walkers.weight.shape == (12,)
+    assert numpy.allclose(walkers.phia[:4], phia[:4])
+    assert numpy.allclose(walkers.phia[4:], 0.0)
+    walkers.unpack_buffers(numpy.arange(4, 12), walkers.pack_buffers(numpy.arange(8) % 4))
+    # Scratch arrays are consistent with the new number of walkers.
+    new_ovlp = trial.calc_greens_function(walkers)
+    assert numpy.allclose(new_ovlp[:4], ovlp[:4])
+    assert numpy.allclose(new_ovlp[4:], ovlp[numpy.arange(8) % 4])
+
+
+@pytest.mark.unit
+def test_resize_metadata():
+    nelec = (5, 5)
+    nmo = 10
+    # Metadata lists with the same length as the number of walkers are left alone.
+    nwalkers = 9
+    qmc = dotdict({"dt": 0.005, "nstblz": 5, "nwalkers": nwalkers, "hybrid": True, "num_steps": 2})
+    batched_data = build_test_case_handlers(
+        nelec, nmo, num_dets=1, complex_trial=True, options=qmc, seed=7
+    )
+    walkers = batched_data.walkers
+    assert len(walkers.buff_names) == nwalkers
+    buff_names = list(walkers.buff_names)
+    checkpoint_names = list(walkers.checkpoint_names)
+    layout = list(walkers.buffer_layout)
+    walkers.resize(10)
+    assert walkers.buff_names == buff_names
+    assert walkers.checkpoint_names == checkpoint_names
+    assert walkers.buffer_layout == layout
+    buff = walkers.pack_buffers(numpy.arange(10))
+    assert buff.shape == (10, walkers.buff_size)
+    walkers.resize(len(checkpoint_names))
+    assert walkers.checkpoint_names == checkpoint_names
+    assert walkers.get_checkpoint_state()["weight"].shape == (len(checkpoint_names),)
+
+
 if __name__ == "__main__":
     test_overlap_batch()
     test_greens_function_batch()
     test_reortho_batch()
+    test_reortho_methods()
+    test_resize()
+    test_resize_metadata()
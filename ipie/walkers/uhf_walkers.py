@@ -16,11 +16,15 @@
 #          Joonho Lee
 #
 
+import time
+
 import numpy
 
 from ipie.config import config
 from ipie.utils.backend import arraylib as xp
 from ipie.utils.backend import cast_to_device, qr, qr_mode, synchronize
+from ipie.utils.linalg import qr_batched
+from ipie.utils.profiler import profiler
 from ipie.walkers.base_walkers import BaseWalkers
 
 
@@ -92,6 +96,7 @@ class UHFWalkers(BaseWalkers):
         )
 
         self.buff_names += ["phia", "phib"]
+        self.walker_names += ["Ga", "Gb", "Ghalfa", "Ghalfb"]
 
         self.buff_size = round(self.set_buff_size_single_walker() / float(self.nwalkers))
         self.walker_buffer = numpy.zeros(self.buff_size, dtype=numpy.complex128)
@@ -107,8 +112,9 @@ class UHFWalkers(BaseWalkers):
 
     def reortho(self):
         """reorthogonalise walkers."""
-        if config.get_option("use_gpu"):
+        if config.get_option("use_gpu") or config.get_option("reortho_method") != "loop":
             return self.reortho_batched()
+        start = time.perf_counter()
         ndown = self.ndown
         detR = []
         for iw in range(self.nwalkers):
@@ -140,26 +146,80 @@ class UHFWalkers(BaseWalkers):
             self.ovlp[iw] = self.ovlp[iw] / detR[iw]
 
         synchronize()
+        profiler.add("reortho_walkers", time.perf_counter() - start, calls=self.nwalkers)
         return detR
 
     def reortho_batched(self):
-        """reorthogonalise walkers."""
-        assert config.get_option("use_gpu")
-        (self.phia, Rup) = qr(self.phia, mode=qr_mode)
-        Rup_diag = xp.einsum("wii->wi", Rup)
-        log_det = xp.einsum("wi->w", xp.log(abs(Rup_diag)))
-
+        """reorthogonalise walkers using batched factorizations.
+
+        If reortho_cond_thresh is set only walkers whose orbitals are badly
+        conditioned (or whose norm has drifted) are reorthogonalised. The
+        number of processed walkers is recorded as the number of calls of the
+        reortho_walkers profiler region.
+        """
+        start = time.perf_counter()
+        method = config.get_option("reortho_method")
+        if method == "loop":
+            method = "qr"
+        thresh = config.get_option("reortho_cond_thresh")
+        walkers = None
+        if thresh > 0:
+            needs_reortho = self._needs_reortho(self.phia, thresh)
+            if self.ndown > 0:
+                needs_reortho |= self._needs_reortho(self.phib, thresh)
+            walkers = xp.nonzero(needs_reortho)[0]
+            nprocessed = int(walkers.size)
+            if nprocessed == self.nwalkers:
+                walkers = None
+        else:
+            nprocessed = self.nwalkers
+        if nprocessed == 0:
+            self.detR = xp.ones(self.nwalkers)
+            profiler.add("reortho_walkers", time.perf_counter() - start, calls=0)
+            return self.detR
+
+        phia = self.phia if walkers is None else self.phia[walkers]
+        phia, Rup_diag = qr_batched(phia, method=method)
+        log_det = xp.sum(xp.log(Rup_diag), axis=1)
         if self.ndown > 0:
-            (self.phib, Rdn) = qr(self.phib, mode=qr_mode)
-            Rdn_diag = xp.einsum("wii->wi", Rdn)
-            log_det += xp.einsum("wi->w", xp.log(abs(Rdn_diag)))
-        self.detR = xp.exp(log_det - self.detR_shift)
+            phib = self.phib if walkers is None else self.phib[walkers]
+            phib, Rdn_diag = qr_batched(phib, method=method)
+            log_det += xp.sum(xp.log(Rdn_diag), axis=1)
+        if walkers is None:
+            self.phia[...] = phia
+            if self.ndown > 0:
+                self.phib[...] = phib
+            self.detR = xp.exp(log_det - self.detR_shift)
+        else:
+            self.phia[walkers] = phia
+            if self.ndown > 0:
+                self.phib[walkers] = phib
+            self.detR = xp.ones(self.nwalkers)
+            self.detR[walkers] = xp.exp(log_det - self.detR_shift[walkers])
         self.ovlp = self.ovlp / self.detR
 
         synchronize()
+        profiler.add("reortho_walkers", time.perf_counter() - start, calls=nprocessed)
 
         return self.detR
 
+    @staticmethod
+    def _needs_reortho(phi, thresh):
+        # The diagonal of the Cholesky factor of phi^H phi (i.e. of R in phi =
+        # QR) is a cheap proxy for the singular values of phi. It is the
+        # identity for orthonormal walkers so the norm drifting towards
+        # over/underflow is also caught.
+        S = phi.conj().transpose(0, 2, 1) @ phi
+        try:
+            R_diag = xp.einsum("wii->wi", xp.linalg.cholesky(S)).real
+        except numpy.linalg.LinAlgError:
+            return xp.ones(phi.shape[0], dtype=bool)
+        rmax = R_diag.max(axis=1)
+        rmin = R_diag.min(axis=1)
+        # Written so that NaNs from a failed factorization count as ill-conditioned.
+        well_conditioned = (rmax <= thresh * rmin) & (rmax <= thresh) & (thresh * rmin >= 1.0)
+        return ~well_conditioned
+
 
 class UHFWalkersParticleHole(UHFWalkers):
     """UHF style walker specialized for its use with ParticleHole trial.
@@ -221,6 +281,7 @@ class UHFWalkersParticleHole(UHFWalkers):
             shape=(self.nwalkers, self.nbasis, self.nbasis),
             dtype=numpy.complex128,
         )  # reference 1-GF
+        self.walker_names += ["G0a", "G0b", "Q0a", "Q0b", "CIa", "CIb"]
 
     def build(self, trial):
         self.num_dets = trial.num_dets
@@ -264,6 +325,8 @@ class UHFWalkersNOCI(UHFWalkers):
 
     def build(self, trial):
         self.num_dets = trial.num_dets
+        self.walker_axes = {"Gia": 1, "Gib": 1, "Ghalfa": 1, "Ghalfb": 1}
+        self.walker_names += ["Gia", "Gib", "det_ovlpas", "det_ovlpbs"]
         # will be built only on request
         self.Gia = numpy.zeros(
             shape=(trial.num_dets, self.nwalkers, self.nbasis, self.nbasis),
@@ -327,6 +390,15 @@ class UHFWalkersParticleHoleNaive(UHFWalkersParticleHole):
 
     def build(self, trial):
         self.num_dets = trial.num_dets
+        self.walker_names += [
+            "det_weights",
+            "det_ovlpas",
+            "det_ovlpbs",
+            "Gia",
+            "Gib",
+            "Gihalfa",
+            "Gihalfb",
+        ]
         # TODO: RENAME to something less like weight
         # This stores an array of overlap matrices with the various elements of
         # the trial wavefunction.
@@ -0,0 +1,63 @@
+"""Time half-rotating the integrals of a multi-determinant trial against
+reading them back from the half-rotation cache (hamiltonian_cache_dir).
+
+Run with mpirun to split the rotation and the read over the tasks of a node.
+The Hamiltonian is read through get_hamiltonian, whose cache key identifies
+the integrals.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+import numpy
+
+from ipie.config import config, MPI
+from ipie.hamiltonians.utils import get_hamiltonian
+from ipie.trial_wavefunction.half_rotate import half_rotate_generic
+from ipie.trial_wavefunction.single_det import SingleDet
+from ipie.utils.io import write_hamiltonian
+from ipie.utils.mpi import get_shared_comm
+from ipie.utils.testing import get_random_nomsd, get_random_sys_ham
+
+nbasis = 120
+nalpha, nbeta = (10, 10)
+naux = 4 * nbasis
+ndets = 20
+
+comm = MPI.COMM_WORLD
+scomm = get_shared_comm(comm)
+numpy.random.seed(7)
+_, wfn = get_random_nomsd(nalpha, nbeta, nbasis, ndet=ndets, cplx=False)
+orbsa = wfn[:, :, :nalpha].copy()
+orbsb = wfn[:, :, nalpha:].copy()
+trial = SingleDet(wfn[0], (nalpha, nbeta), nbasis)
+tmpdir = comm.bcast(tempfile.mkdtemp() if comm.rank == 0 else None, root=0)
+filename = os.path.join(tmpdir, "hamiltonian.h5")
+if comm.rank == 0:
+    _, ham = get_random_sys_ham(nalpha, nbeta, nbasis, naux)
+    chol = ham.chol.T.reshape((naux, nbasis, nbasis))
+    write_hamiltonian(ham.H1[0], chol, 0.0, filename=filename)
+    del ham, chol
+comm.Barrier()
+config.update_option("hamiltonian_cache_dir", os.path.join(tmpdir, "cache"))
+ham = get_hamiltonian(filename, scomm)
+
+if comm.rank == 0:
+    print(f"# nbasis = {nbasis}, nchol = {naux}, ndets = {ndets}, {comm.size} tasks")
+    print(f"{'mode':>10s} {'time (s)':>10s}")
+cache_dir = os.path.join(tmpdir, "cache")
+for name, cache_dir in (("rotate", ""), ("write", cache_dir), ("cached", cache_dir)):
+    config.update_option("hamiltonian_cache_dir", cache_dir)
+    comm.Barrier()
+    start = time.perf_counter()
+    half_rotate_generic(trial, ham, scomm, orbsa, orbsb, ndets=ndets)
+    comm.Barrier()
+    elapsed = time.perf_counter() - start
+    if comm.rank == 0:
+        print(f"{name:>10s} {elapsed:10.3f}")
+config.update_option("hamiltonian_cache_dir", "")
+comm.Barrier()
+if comm.rank == 0:
+    shutil.rmtree(tmpdir)
@@ -0,0 +1,90 @@
+"""Time and peak memory of reading a Cholesky Hamiltonian from file.
+
+Compares reading the whole LXmn dataset (read_integrals, then packing) with
+the chunked loader used by get_hamiltonian for files written by
+write_hamiltonian, and with reading the processed integrals from the
+Hamiltonian cache. Run with mpirun to distribute the chunks over the tasks of
+a node.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy
+
+from ipie.config import config, MPI
+from ipie.hamiltonians.generic import construct_h1e_mod, read_integrals
+from ipie.hamiltonians.utils import get_hamiltonian, read_cholesky_streaming
+from ipie.utils.io import write_hamiltonian
+from ipie.utils.mpi import get_shared_comm
+from ipie.utils.pack_numba import pack_cholesky
+
+nbasis = 150
+nchol = 600
+# About 50 Cholesky vectors per chunk.
+config.update_option("max_memory_hamiltonian_read", 0.01)
+
+comm = MPI.COMM_WORLD
+scomm = get_shared_comm(comm)
+tmpdir = tempfile.mkdtemp() if comm.rank == 0 else None
+tmpdir = comm.bcast(tmpdir, root=0)
+filename = os.path.join(tmpdir, "hamiltonian.h5")
+if comm.rank == 0:
+    numpy.random.seed(7)
+    chol = numpy.random.normal(size=(nchol, nbasis, nbasis))
+    chol = chol + chol.transpose(0, 2, 1)
+    write_hamiltonian(numpy.eye(nbasis), chol, 0.0, filename=filename)
+    del chol
+comm.Barrier()
+
+
+def read_all():
+    hcore, chol, _ = read_integrals(filename)
+    h1 = numpy.array([hcore, hcore])
+    h1e_mod = numpy.zeros_like(h1)
+    construct_h1e_mod(chol, h1, h1e_mod)
+    idx = numpy.triu_indices(nbasis)
+    chol_packed = numpy.zeros((len(idx[0]), nchol))
+    pack_cholesky(idx[0], idx[1], chol_packed, chol)
+    return chol, chol_packed
+
+
+def read_chunked():
+    return read_cholesky_streaming(filename, scomm)
+
+
+def read_cached():
+    return get_hamiltonian(filename, scomm)
+
+
+# Populate the cache.
+config.update_option("hamiltonian_cache_dir", os.path.join(tmpdir, "cache"))
+get_hamiltonian(filename, scomm)
+
+
+size = nbasis * nbasis * nchol * 8 / 1024**2
+if comm.rank == 0:
+    print(f"# nbasis = {nbasis}, nchol = {nchol}, LXmn = {size:.1f} MB, {comm.size} tasks")
+    print(f"{'loader':>10s} {'time (s)':>10s} {'peak (MB)':>10s}")
+for name, func in (("full", read_all), ("chunked", read_chunked), ("cached", read_cached)):
+    comm.Barrier()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    # Shared memory windows and memory-mapped files are not seen by
+    # tracemalloc. Count the shared arrays once per node.
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if name == "chunked" and scomm.size > 1:
+        peak += (result[1].nbytes + result[2].nbytes) / scomm.size
+    peak = comm.allreduce(peak, op=MPI.MAX) / 1024**2
+    if comm.rank == 0:
+        print(f"{name:>10s} {elapsed:10.3f} {peak:10.1f}")
+    del result
+comm.Barrier()
+if comm.rank == 0:
+    shutil.rmtree(tmpdir)
@@ -0,0 +1,78 @@
+"""Memory, throughput and accuracy of the mixed precision propagation on the CPU.
+
+The same walkers are propagated with the same auxiliary fields with and
+without the mixed_precision option.
+"""
+
+import time
+
+import numpy
+
+from ipie.config import config
+from ipie.estimators.energy import local_energy
+from ipie.hamiltonians.generic import GenericRealChol
+from ipie.propagation.phaseless_generic import PhaselessGeneric
+from ipie.systems.generic import Generic
+from ipie.trial_wavefunction.single_det import SingleDet
+from ipie.utils.mpi import MPIHandler
+from ipie.utils.profiler import profiler
+from ipie.walkers.walkers_dispatch import UHFWalkersTrial
+
+nbasis = 120
+nchol = 480
+nelec = (20, 20)
+nwalkers = 20
+nsteps = 10
+dt = 0.005
+
+numpy.random.seed(7)
+chol = numpy.random.normal(size=(nchol, nbasis, nbasis))
+chol = (chol + chol.transpose(0, 2, 1)) / (2 * nbasis)
+chol = chol.reshape(nchol, -1).T.copy()
+# A gapped one-body Hamiltonian so that the lowest orbitals are a reasonable
+# trial and the walker weights stay well behaved.
+h1e = numpy.random.normal(scale=0.01, size=(nbasis, nbasis))
+h1e = 0.5 * (h1e + h1e.T) + numpy.diag(numpy.linspace(-2, 2, nbasis))
+occ = numpy.eye(nbasis)[:, : nelec[0]]
+wfn = numpy.hstack([occ, occ])
+xi = numpy.random.normal(size=(nsteps + 1, nwalkers, nchol))
+
+results = {}
+for mixed in (False, True):
+    config.update_option("mixed_precision", mixed)
+    system = Generic(nelec)
+    ham = GenericRealChol(numpy.array([h1e, h1e]), chol, 0.0)
+    trial = SingleDet(wfn, nelec, nbasis)
+    trial.half_rotate(ham)
+    trial.calculate_energy(system, ham)
+    walkers = UHFWalkersTrial(trial, wfn + 0j, nelec[0], nelec[1], nbasis, nwalkers, MPIHandler())
+    walkers.build(trial)
+    prop = PhaselessGeneric(dt)
+    prop.build(ham, trial, walkers)
+    # Warm up (numba compilation and kernel autotuning).
+    prop.propagate_walkers(walkers, ham, trial, trial.energy, xi=xi[0])
+    profiler.reset()
+    start = time.perf_counter()
+    for step in range(1, nsteps + 1):
+        prop.propagate_walkers(walkers, ham, trial, trial.energy, xi=xi[step])
+    elapsed = time.perf_counter() - start
+    trial.calc_greens_function(walkers)
+    energy = local_energy(system, ham, walkers, trial)[:, 0]
+    results[mixed] = {
+        "chol_packed": ham.chol_packed.nbytes / 1024**2,
+        "VHS": nwalkers * nbasis**2 * numpy.dtype(ham.chol_packed.dtype).itemsize * 2 / 1024**2,
+        "step": elapsed / nsteps,
+        "vhs": (profiler.total("construct_vhs") + profiler.total("apply_vhs")) / nsteps,
+        "energy": numpy.sum(walkers.weight * energy) / numpy.sum(walkers.weight),
+        "weight": walkers.weight.copy(),
+    }
+config.update_option("mixed_precision", False)
+
+print(f"# nbasis = {nbasis}, nchol = {nchol}, nelec = {nelec}, nwalkers = {nwalkers}")
+print(f"{'':16s} {'double':>12s} {'mixed':>12s}")
+for key, unit in (("chol_packed", "MB"), ("VHS", "MB"), ("step", "s"), ("vhs", "s")):
+    print(f"{key + ' (' + unit + ')':16s} {results[False][key]:12.4e} {results[True][key]:12.4e}")
+de = abs(results[True]["energy"] - results[False]["energy"])
+dw = numpy.max(numpy.abs(results[True]["weight"] - results[False]["weight"]))
+print(f"# Mixed energy estimate error after {nsteps} steps: {de:.3e}")
+print(f"# Maximum weight difference: {dw:.3e}")
@@ -0,0 +1,56 @@
+"""Compare population control methods as a function of the number of MPI tasks.
+
+Usage: mpirun -np N python population_control_scaling.py [nwalkers] [nbasis] [shared]
+
+Pass "shared" to keep the walkers in node shared memory.
+"""
+
+import sys
+import time
+
+import numpy
+
+from ipie.config import MPI
+from ipie.utils.mpi import MPIHandler
+from ipie.walkers.pop_controller import PopController
+from ipie.walkers.uhf_walkers import UHFWalkers
+
+comm = MPI.COMM_WORLD
+mpi_handler = MPIHandler()
+
+nwalkers = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+nbasis = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+shared = len(sys.argv) > 3 and sys.argv[3] == "shared"
+nelec = (10, 10)
+ncalls = 20
+
+init = numpy.eye(nbasis, dtype=numpy.complex128)[:, : sum(nelec)]
+methods = ["pair_branch", "comb", "stochastic_reconfiguration", "distributed_comb"]
+if comm.rank == 0:
+    print(f"# ntasks = {comm.size}, nwalkers per task = {nwalkers}, nbasis = {nbasis}")
+    print(f"# walkers in shared memory: {shared}")
+    print(f"# {'method':>26s} {'total (s)':>12s} {'comm (s)':>12s} {'non-comm (s)':>12s}")
+for method in methods:
+    walkers = UHFWalkers(init, nelec[0], nelec[1], nbasis, nwalkers, mpi_handler)
+    if shared:
+        walkers.share_memory(comm)
+    pcontrol = PopController(
+        nwalkers, ncalls, mpi_handler, pop_control_method=method, reconfiguration_freq=1
+    )
+    numpy.random.seed(7 + comm.rank)
+    total = 0.0
+    for _ in range(ncalls):
+        # Log-normal weights typical of a walker population between branching steps.
+        walkers.weight = numpy.exp(0.5 * numpy.random.normal(size=nwalkers))
+        comm.Barrier()
+        start = time.perf_counter()
+        pcontrol.pop_control(walkers, comm)
+        comm.Barrier()
+        total += time.perf_counter() - start
+    timer = pcontrol.timer
+    times = numpy.array([total, timer.communication_time, timer.non_communication_time])
+    max_times = numpy.empty_like(times)
+    comm.Reduce(times, max_times, op=MPI.MAX, root=0)
+    if comm.rank == 0:
+        max_times /= ncalls
+        print(f"  {method:>26s} {max_times[0]:12.6f} {max_times[1]:12.6f} {max_times[2]:12.6f}")
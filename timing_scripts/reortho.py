@@ -0,0 +1,87 @@
+"""Cost of the walker reorthogonalisation methods on the CPU.
+
+First times the per-walker QR loop against batched Householder QR and
+CholeskyQR2, then propagates walkers reorthogonalising every step with the
+adaptive threshold and reports how many walkers actually needed it.
+"""
+
+import time
+
+import numpy
+
+from ipie.config import config
+from ipie.hamiltonians.generic import GenericRealChol
+from ipie.propagation.phaseless_generic import PhaselessGeneric
+from ipie.systems.generic import Generic
+from ipie.trial_wavefunction.single_det import SingleDet
+from ipie.utils.mpi import MPIHandler
+from ipie.utils.profiler import profiler
+from ipie.walkers.uhf_walkers import UHFWalkers
+from ipie.walkers.walkers_dispatch import UHFWalkersTrial
+
+nwalkers = 20
+repeats = 5
+methods = ["loop", "qr", "cholesky_qr2"]
+
+
+def random_walkers(nbasis, nelec):
+    init = numpy.random.normal(size=(nbasis, 2 * nelec))
+    walkers = UHFWalkers(init, nelec, nelec, nbasis, nwalkers, MPIHandler())
+    walkers.phia += 0.1j * numpy.random.normal(size=walkers.phia.shape)
+    walkers.phib += 0.1j * numpy.random.normal(size=walkers.phib.shape)
+    return walkers
+
+
+print(f"{'M':>5s} {'N':>4s} " + " ".join(f"{m:>13s}" for m in methods))
+for nbasis, nelec in ((50, 10), (100, 20), (200, 40), (400, 80)):
+    numpy.random.seed(7)
+    walkers = random_walkers(nbasis, nelec)
+    phia, phib = walkers.phia.copy(), walkers.phib.copy()
+    times = []
+    for method in methods:
+        config.update_option("reortho_method", method)
+        best = numpy.inf
+        for _ in range(repeats):
+            walkers.phia[...] = phia
+            walkers.phib[...] = phib
+            start = time.perf_counter()
+            walkers.reortho()
+            best = min(best, time.perf_counter() - start)
+        times.append(best)
+    print(f"{nbasis:5d} {nelec:4d} " + " ".join(f"{t:13.4e}" for t in times))
+
+nbasis = 100
+nchol = 400
+nelec = (20, 20)
+nsteps = 50
+dt = 0.005
+numpy.random.seed(7)
+chol = numpy.random.normal(size=(nchol, nbasis, nbasis))
+chol = (chol + chol.transpose(0, 2, 1)) / (2 * nbasis)
+chol = chol.reshape(nchol, -1).T.copy()
+h1e = numpy.random.normal(scale=0.01, size=(nbasis, nbasis))
+h1e = 0.5 * (h1e + h1e.T) + numpy.diag(numpy.linspace(-2, 2, nbasis))
+occ = numpy.eye(nbasis)[:, : nelec[0]]
+wfn = numpy.hstack([occ, occ])
+system = Generic(nelec)
+ham = GenericRealChol(numpy.array([h1e, h1e]), chol, 0.0)
+trial = SingleDet(wfn, nelec, nbasis)
+trial.half_rotate(ham)
+trial.calculate_energy(system, ham)
+config.update_option("reortho_method", "qr")
+print(f"# Reorthogonalising every step for {nsteps} steps (M = {nbasis}, N = {nelec[0]})")
+print(f"{'threshold':>10s} {'processed':>10s} {'time (s)':>10s}")
+for thresh in (0.0, 1.01, 1.1, 2.0):
+    config.update_option("reortho_cond_thresh", thresh)
+    walkers = UHFWalkersTrial(trial, wfn + 0j, nelec[0], nelec[1], nbasis, nwalkers, MPIHandler())
+    walkers.build(trial)
+    prop = PhaselessGeneric(dt)
+    prop.build(ham, trial, walkers)
+    profiler.reset()
+    for step in range(nsteps):
+        walkers.reortho()
+        prop.propagate_walkers(walkers, ham, trial, trial.energy)
+    processed = profiler.calls("reortho_walkers") / (nsteps * nwalkers)
+    print(f"{thresh:10.2f} {100 * processed:9.1f}% {profiler.total('reortho_walkers'):10.4e}")
+config.update_option("reortho_method", "qr")
+config.update_option("reortho_cond_thresh", 0.0)
@@ -0,0 +1,95 @@
+"""Compare Cholesky and THC kernels as the basis grows.
+
+The number of Cholesky vectors and THC interpolation vectors both grow
+linearly with the basis size M, so the exchange energy costs O(M^4) per walker
+with Cholesky vectors but O(M^3) with THC factors. The force bias and VHS have
+the same scaling and only differ in prefactor.
+"""
+
+import time
+
+import numpy
+
+from ipie.estimators.generic import thc_density_batch, thc_jk_batch_uhf
+from ipie.estimators.local_energy_sd import (
+    ecoul_kernel_batch_real_rchol_uhf,
+    exx_kernel_batch_real_rchol,
+)
+from ipie.hamiltonians.thc import GenericRealTHC, thc_to_cholesky
+from ipie.propagation.phaseless_generic import PhaselessGeneric
+
+nwalkers = 10
+repeats = 3
+basis_sizes = [20, 40, 60, 80, 100, 120]
+prop = PhaselessGeneric(time_step=1.0)
+
+
+def best_time(func, *args):
+    func(*args)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def cholesky_energy(rchola, rcholb, Ghalfa, Ghalfb):
+    ecoul_kernel_batch_real_rchol_uhf(rchola, rcholb, Ghalfa, Ghalfb)
+    exx_kernel_batch_real_rchol(rchola, Ghalfa) + exx_kernel_batch_real_rchol(rcholb, Ghalfb)
+
+
+def cholesky_force_bias(rchola, rcholb, Ghalfa, Ghalfb):
+    nw = Ghalfa.shape[0]
+    return rchola.dot(Ghalfa.reshape(nw, -1).T) + rcholb.dot(Ghalfb.reshape(nw, -1).T)
+
+
+def thc_force_bias(ham, rXa, rXb, Ghalfa, Ghalfb):
+    density = thc_density_batch(rXa, ham.X, Ghalfa)[1]
+    density += thc_density_batch(rXb, ham.X, Ghalfb)[1]
+    return density.dot(ham.U)
+
+
+def cholesky_vhs(chol, x):
+    return x.T.dot(chol.T)
+
+
+def thc_vhs(prop, ham, x):
+    return prop.construct_VHS(ham, x)
+
+
+print(
+    f"{'M':>5s} {'nchol':>6s} {'nthc':>6s} "
+    f"{'E_chol':>10s} {'E_thc':>10s} {'vbias_chol':>10s} {'vbias_thc':>10s} "
+    f"{'VHS_chol':>10s} {'VHS_thc':>10s}"
+)
+for nbasis in basis_sizes:
+    numpy.random.seed(7)
+    nocc = max(nbasis // 5, 2)
+    nchol = 4 * nbasis
+    nthc = 6 * nbasis
+    X = numpy.random.randn(nbasis, nthc) / nbasis**0.5
+    U = numpy.random.randn(nthc, nchol) / nthc**0.5
+    ham = GenericRealTHC(numpy.zeros((2, nbasis, nbasis)), X, U)
+    chol = thc_to_cholesky(X, U)
+    orbs = numpy.linalg.qr(numpy.random.randn(nbasis, nocc))[0]
+    # rchol[n, i*M+q] = sum_p orbs[p, i] L[pq, n]
+    rchol = numpy.einsum("pi,pqn->niq", orbs, chol.reshape(nbasis, nbasis, nchol)).reshape(
+        nchol, -1
+    )
+    rX = orbs.T.dot(X)
+    Ghalf = numpy.random.randn(nwalkers, nocc, nbasis) + 1j * numpy.random.randn(
+        nwalkers, nocc, nbasis
+    )
+    x = numpy.random.randn(nchol, nwalkers) + 0j
+    t_e_chol = best_time(cholesky_energy, rchol, rchol, Ghalf, Ghalf)
+    t_e_thc = best_time(thc_jk_batch_uhf, ham, rX, rX, Ghalf, Ghalf)
+    t_fb_chol = best_time(cholesky_force_bias, rchol, rchol, Ghalf, Ghalf)
+    t_fb_thc = best_time(thc_force_bias, ham, rX, rX, Ghalf, Ghalf)
+    t_vhs_chol = best_time(cholesky_vhs, chol, x)
+    t_vhs_thc = best_time(thc_vhs, prop, ham, x)
+    print(
+        f"{nbasis:5d} {nchol:6d} {nthc:6d} "
+        f"{t_e_chol:10.3e} {t_e_thc:10.3e} {t_fb_chol:10.3e} {t_fb_thc:10.3e} "
+        f"{t_vhs_chol:10.3e} {t_vhs_thc:10.3e}"
+    )